@@ -0,0 +1,248 @@
+import os
+import tempfile
+import time
+
+import numpy as np
+
+
+class AngularScan:
+    """
+    Angle-interrogated acquisition: moves a rotation stage through a list of angles and records a
+    (angle, H, W) float32 cube, like SpectralScan does for wavelengths.
+
+    Two modes are supported:
+
+    - 'step': stop-and-go. The stage moves to every angle, `discard_frames` frames are dropped and
+      `frames_per_step` frames are averaged. The next move is commanded before the step is reduced and written.
+    - 'continuous': the stage sweeps once from the first to the last angle at constant velocity while the camera
+      grabs freely. Every frame is tagged with the stage position interpolated at its arrival time from the
+      motor's streamed position buffer, and averaged into the bin of the nearest requested angle. No settling
+      per angle.
+
+    Parameters
+    ----------
+    camera : Camera
+        Camera to acquire from.
+    motor : KinesisMotor
+        Stage to move (a MotionControl providing get_speed() and set_speed()), its `positions` buffer is used
+        to tag frames in continuous mode.
+    angles : array_like
+        Angles to visit, in stage units. In continuous mode the sweep goes from the first to the last angle and
+        the angles are the centres of the bins frames are averaged into.
+    mode : str
+        'step' or 'continuous'.
+    frames_per_step : int
+        Frames averaged per angle in step mode, target number of frames per bin in continuous mode.
+    discard_frames : int
+        Frames dropped after each move in step mode.
+    velocity : float, optional
+        Sweep velocity in continuous mode [units/s]. Derived from the camera frame rate and `frames_per_step`
+        if not given.
+    frame_latency : float
+        Time between the middle of the exposure and the arrival of the frame [s], subtracted from arrival
+        timestamps in continuous mode.
+    poll_interval : float, optional
+        Position streaming period of the motor during the continuous sweep [s], the motor's own if not given.
+    output_path : str, optional
+        .npy file for the cube. A temporary file is used if not given, deleted with its sidecar files by close().
+    """
+
+    def __init__(self, camera, motor, angles, mode='step', frames_per_step=1, discard_frames=1, velocity=None,
+                 frame_latency=0.0, poll_interval=None, output_path=None):
+        if mode not in ('step', 'continuous'):
+            raise ValueError(f"Unknown scan mode {mode}")
+        self.camera = camera
+        self.motor = motor
+        self.angles = np.asarray(angles, dtype=np.float64)
+        self.mode = mode
+        self.frames_per_step = max(1, int(frames_per_step))
+        self.discard_frames = max(0, int(discard_frames))
+        self.velocity = velocity
+        self.frame_latency = frame_latency
+        self.poll_interval = poll_interval
+
+        self.temporary = output_path is None
+        if output_path is None:
+            handle, output_path = tempfile.mkstemp(suffix='.npy', prefix='angular_scan_')
+            os.close(handle)
+        self.output_path = output_path
+
+        self.cube = None
+        self.counts = None  # Frames averaged per angle
+        self.frame_angles = None  # Continuous mode: interpolated angle of every frame
+        self._stop = False
+
+    def stop(self):
+        """Requests the scan to stop after the current step or frame."""
+        self._stop = True
+
+    def sidecar_paths(self):
+        """The files saved next to the cube: requested angles and, in continuous mode, the angle of every frame."""
+        base = os.path.splitext(self.output_path)[0]
+        return [base + '_angles.npy', base + '_frame_angles.npy']
+
+    def close(self):
+        """
+        Releases the cube. A temporary cube is deleted with its sidecar files, so the cube returned by run() must
+        not be used anymore.
+        """
+        self.cube = None
+        if not self.temporary:
+            return
+        for path in [self.output_path] + self.sidecar_paths():
+            if os.path.exists(path):
+                os.remove(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _grab(self, timeout=5.0):
+        """Returns the next frame, waiting for the camera to start grabbing if needed."""
+        deadline = time.monotonic() + timeout
+        while True:
+            image = self.camera.acquire_image()
+            if image is not None:
+                return image
+            if time.monotonic() > deadline:
+                raise TimeoutError("Camera did not deliver a frame")
+
+    def _open_cube(self, height, width):
+        self.cube = np.lib.format.open_memmap(self.output_path, mode='w+', dtype=np.float32,
+                                              shape=(len(self.angles), height, width))
+        self.counts = np.zeros(len(self.angles), dtype=np.int64)
+        np.save(self.sidecar_paths()[0], self.angles)
+
+    def run(self, progress=None):
+        """
+        Runs the scan.
+
+        Parameters
+        ----------
+        progress : callable, optional
+            Called as progress(step, angle, averaged_frame) for every finished angle in step mode, and as
+            progress(frame_index, angle, frame) for every frame in continuous mode.
+
+        Returns
+        -------
+        numpy.memmap
+            The (angle, H, W) cube. Angles without frames stay at zero, see `counts`.
+        """
+        self._stop = False
+        if len(self.angles) == 0:
+            raise ValueError("No angles to scan")
+
+        try:
+            if self.mode == 'step':
+                self._run_step(progress)
+            else:
+                self._run_continuous(progress)
+        finally:
+            self.camera.pause()  # The camera started grabbing on the first frame
+
+        self.cube.flush()
+        return self.cube
+
+    def _run_step(self, progress):
+        self.motor.move_to(self.angles[0], wait=False)
+        first = self._grab()
+        self._open_cube(*first.shape)
+
+        accumulator = np.empty(first.shape, dtype=np.float32)
+        scale = np.float32(1.0 / self.frames_per_step)
+
+        for step, angle in enumerate(self.angles):
+            self.motor.wait_move()
+            if self._stop:
+                break
+
+            # === Drop frames exposed during the move ===
+            self.camera.flush()
+            for _ in range(self.discard_frames):
+                self._grab()
+
+            # === Average frames_per_step frames ===
+            accumulator.fill(0)
+            for _ in range(self.frames_per_step):
+                np.add(accumulator, self._grab(), out=accumulator)
+
+            # === Start moving to the next angle, then reduce/write this step during the move ===
+            if step + 1 < len(self.angles):
+                self.motor.move_to(self.angles[step + 1], wait=False)
+
+            np.multiply(accumulator, scale, out=self.cube[step])
+            self.counts[step] = self.frames_per_step
+
+            if progress is not None:
+                progress(step, angle, self.cube[step])
+
+    def _sweep_velocity(self):
+        if self.velocity is not None:
+            return self.velocity
+        # Spread frames_per_step frames over the mean angle spacing
+        spacing = np.abs(np.diff(self.angles)).mean() if len(self.angles) > 1 else 1.0
+        return spacing * self.camera.get_frame_rate() / self.frames_per_step
+
+    def _run_continuous(self, progress):
+        start, end = self.angles[0], self.angles[-1]
+        order = np.argsort(self.angles)
+        sorted_angles = self.angles[order]
+        edges = 0.5 * (sorted_angles[1:] + sorted_angles[:-1])  # Bin boundaries between neighbouring angles
+        half_spacing = 0.5 * (np.abs(np.diff(sorted_angles)).max() if len(sorted_angles) > 1 else np.inf)
+
+        # === Go to the start at full speed, then set the sweep velocity ===
+        speed, acceleration = self.motor.get_speed()
+        self.motor.move_to(start, wait=True)
+        self.motor.set_speed(self._sweep_velocity())
+
+        first = self._grab()
+        self._open_cube(*first.shape)
+        frame_angles = []
+
+        positions = self.motor.positions
+        streaming_interval = self.motor.poll_interval
+        if self.poll_interval is not None:
+            self.motor.poll_interval = self.poll_interval
+        pending = []  # (timestamp, frame) waiting for a position sample after their timestamp
+
+        def tag():
+            latest = positions.latest_time()
+            while pending and pending[0][0] <= latest:
+                timestamp, frame = pending.pop(0)
+                angle = float(positions.interpolate(timestamp))
+                frame_angles.append(angle)
+                index = order[np.searchsorted(edges, angle)]
+                if abs(angle - self.angles[index]) <= half_spacing:
+                    np.add(self.cube[index], frame, out=self.cube[index])
+                    self.counts[index] += 1
+                if progress is not None:
+                    progress(len(frame_angles) - 1, angle, frame)
+
+        try:
+            self.camera.flush()
+            self.motor.move_to(end, wait=False)
+
+            while self.motor.is_moving() and not self._stop:
+                frame = self._grab()
+                pending.append((time.perf_counter() - self.frame_latency, frame.copy()))
+                tag()
+        finally:
+            if self._stop:
+                self.motor.stop()
+            # === Tag the last frames once the stream has passed them ===
+            deadline = time.perf_counter() + 1.0
+            while pending and positions.latest_time() < pending[-1][0] and time.perf_counter() < deadline:
+                time.sleep(self.motor.poll_interval)
+            pending[:] = [(min(t, positions.latest_time()), frame) for t, frame in pending]
+            tag()
+            self.motor.poll_interval = streaming_interval
+            self.motor.set_speed(speed, acceleration)
+
+        # === Sums to means ===
+        for index in np.flatnonzero(self.counts):
+            self.cube[index] *= np.float32(1.0 / self.counts[index])
+
+        self.frame_angles = np.asarray(frame_angles)
+        np.save(self.sidecar_paths()[1], self.frame_angles)
@@ -0,0 +1,144 @@
+"""
+Software auto exposure driven by the histogram of the ROIs.
+
+The camera's own auto exposure regulates the mean of the whole frame, so the bright background around a dark SPR
+dip, or a spot outside the ROIs, can saturate. Here a high percentile of the ROI pixels is held at a fraction of
+full scale. The histogram is one np.bincount over the integer pixel values of a decimated frame. Pixel values are
+linear in exposure above the black level, so one step exposure * (target - black) / (level - black) lands on the
+target unless the percentile was saturated. Exposure is changed while grabbing, without restarting the stream.
+"""
+import numpy as np
+
+from source.acquisition.measurements import crop_rois
+
+
+def frame_histogram(frame, max_value, decimation=4, rois=None):
+    """
+    Histogram of the integer values 0..max_value of every `decimation`-th pixel (in both directions) of the frame,
+    or of the ROIs ({id: {x, y, width, height}}) if given. Float frames are rounded and clipped.
+    """
+    step = max(1, int(decimation))
+    samples = [crop[::step, ::step].ravel() for _, crop in crop_rois(frame, rois)]
+    values = np.concatenate(samples) if len(samples) > 1 else samples[0]
+    if values.dtype.kind == 'f':
+        values = np.clip(np.rint(values), 0, max_value)
+    values = values.astype(np.intp, copy=False)
+    return np.bincount(values, minlength=max_value + 1)[:max_value + 1]
+
+
+def histogram_percentile(counts, percentile):
+    """Smallest value below which `percentile` % of the histogram lies."""
+    cumulative = np.cumsum(counts)
+    if cumulative[-1] == 0:
+        return 0
+    return int(np.searchsorted(cumulative, percentile / 100.0 * cumulative[-1]))
+
+
+class AutoExposure:
+    """
+    Closed-loop exposure control holding a percentile of the ROI pixels at a target level.
+
+    Frames grabbed right after a change may still carry the old exposure (they were in flight), so `settle_frames`
+    frames are skipped after every change before the next step.
+
+    Parameters
+    ----------
+    camera : Camera
+        Camera whose exposure (ms) is set with set_exposure_live().
+    target : float
+        Target level of the percentile as a fraction of full scale.
+    percentile : float
+        Percentile of the ROI pixels regulated, high enough that the brightest features stay below saturation.
+    tolerance : float
+        Relative deviation of the percentile from the target accepted as converged.
+    decimation : int
+        Pixel step of the histogram in both directions.
+    rois : dict, optional
+        {id: {x, y, width, height}} the histogram is restricted to, the whole frame if empty or None. A copy is kept:
+        update() runs in the camera thread, ROIs edited in the GUI are passed again with set_rois().
+    black_level : float
+        Pixel value at zero exposure (black level offset plus dark signal), e.g. the mean of a master dark frame.
+    max_step : float
+        Largest exposure ratio of one step, also the step down from a saturated percentile.
+    settle_frames : int
+        Frames skipped after every exposure change.
+    continuous : bool
+        Keep regulating after convergence; otherwise the loop stops (`active` turns False) once converged.
+    max_exposure : float, optional
+        Upper exposure limit (ms), e.g. to keep a frame rate; the camera limit if not given.
+    """
+
+    def __init__(self, camera, target=0.8, percentile=99.5, tolerance=0.05, decimation=4, rois=None,
+                 black_level=0.0, max_step=8.0, settle_frames=2, continuous=True, max_exposure=None):
+        self.camera = camera
+        self.target = target
+        self.percentile = percentile
+        self.tolerance = tolerance
+        self.decimation = decimation
+        self.rois = None
+        self.set_rois(rois)
+        self.black_level = black_level
+        self.max_step = max_step
+        self.settle_frames = settle_frames
+        self.continuous = continuous
+
+        self.max_value = 2 ** camera.get_bitdepth() - 1
+        self.exposure_min, self.exposure_max = camera.get_exposure_min_max()
+        if max_exposure is not None:
+            self.exposure_max = min(self.exposure_max, max_exposure)
+        self.exposure = camera.get_exposure()
+
+        self.active = True
+        self.converged = False
+        self.level = None  # Last percentile value
+        self.steps = 0
+        self._skip = 0
+
+    def set_rois(self, rois):
+        """Restricts the histogram to a copy of `rois`, the whole frame if empty or None."""
+        # A new dict is swapped in, a frame being measured keeps the one it started with
+        self.rois = {roi_id: dict(region) for roi_id, region in rois.items()} if rois else None
+
+    def update(self, frame):
+        """Feeds a raw frame. Returns the new exposure (ms) if it was changed, else None."""
+        if not self.active:
+            return None
+        if self._skip > 0:
+            self._skip -= 1
+            return None
+
+        counts = frame_histogram(frame, self.max_value, self.decimation, self.rois)
+        self.level = histogram_percentile(counts, self.percentile)
+        target = self.target * self.max_value
+
+        if self.level >= self.max_value:
+            ratio = 1.0 / self.max_step  # Saturated: the true level is unknown
+        else:
+            ratio = (target - self.black_level) / max(self.level - self.black_level, 1.0)
+        self.converged = abs(self.level - target) <= self.tolerance * target
+        if self.converged:
+            if not self.continuous:
+                self.active = False
+            return None
+
+        exposure = self.exposure * float(np.clip(ratio, 1.0 / self.max_step, self.max_step))
+        exposure = min(max(exposure, self.exposure_min), self.exposure_max)
+        if np.isclose(exposure, self.exposure, rtol=1e-3):
+            return None  # At an exposure limit
+        self.camera.set_exposure_live(exposure)
+        self.exposure = exposure
+        self.steps += 1
+        self._skip = self.settle_frames
+        return exposure
+
+    def run(self, grab, max_frames=50):
+        """
+        Regulates until converged, grabbing frames with `grab()`. Returns the exposure (ms); raises RuntimeError
+        if the loop did not converge within `max_frames` frames.
+        """
+        for _ in range(max_frames):
+            self.update(grab())
+            if self.converged:
+                return self.exposure
+        raise RuntimeError(f"Auto exposure did not converge in {max_frames} frames (level {self.level}, "
+                           f"exposure {self.exposure:.4f} ms)")
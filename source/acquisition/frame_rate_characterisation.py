@@ -0,0 +1,319 @@
+import json
+import time
+
+import numpy as np
+
+LIMITING_FACTORS = ('exposure', 'readout', 'bandwidth')
+
+# Bytes per pixel on the link
+PIXEL_FORMAT_BYTES = {
+    'Mono8': 1.0,
+    'Mono10': 2.0,
+    'Mono10p': 1.25,
+    'Mono12': 2.0,
+    'Mono12p': 1.5,
+    'Mono12Packed': 1.5,
+    'Mono16': 2.0,
+}
+
+
+def pixel_format_bytes(pixel_format):
+    """Bytes per pixel of a pixel format name ('Mono12p') or bit depth (12, unpacked)."""
+    if isinstance(pixel_format, str):
+        if pixel_format not in PIXEL_FORMAT_BYTES:
+            raise ValueError(f"Unknown pixel format {pixel_format}")
+        return PIXEL_FORMAT_BYTES[pixel_format]
+    return 1.0 if pixel_format <= 8 else 2.0
+
+
+class ReadoutModel:
+    """
+    Analytical frame period of a camera with overlapped exposure and readout:
+
+        period = max(exposure + exposure_overhead,            exposure limited
+                     row_offset + row_time * height,          sensor readout limited
+                     width * height * bytes_per_pixel / bandwidth)   link limited
+
+    All times are in seconds, the bandwidth in bytes/s. A bandwidth of None (no link-limited point was seen)
+    disables the third term.
+    """
+
+    def __init__(self, exposure_overhead=0.0, row_offset=0.0, row_time=0.0, bandwidth=None):
+        self.exposure_overhead = float(exposure_overhead)
+        self.row_offset = float(row_offset)
+        self.row_time = float(row_time)
+        self.bandwidth = bandwidth
+
+    def terms(self, exposure, width, height, bytes_per_pixel=1):
+        """(3, N) array of the three period terms [s] for exposures in ms."""
+        exposure, width, height, bytes_per_pixel = np.broadcast_arrays(
+            np.asarray(exposure, dtype=np.float64) / 1e3, np.asarray(width, dtype=np.float64),
+            np.asarray(height, dtype=np.float64), np.asarray(bytes_per_pixel, dtype=np.float64))
+        return self._terms(exposure, height, width * height * bytes_per_pixel)
+
+    def period(self, exposure, width, height, bytes_per_pixel=1):
+        """Frame period [s] for exposures in ms."""
+        return self.terms(exposure, width, height, bytes_per_pixel).max(axis=0)
+
+    def predict(self, exposure, width, height, bytes_per_pixel=1):
+        """
+        Achievable frame rate and what limits it.
+
+        Parameters
+        ----------
+        exposure : float or array_like
+            Exposure time [ms].
+        width, height : int or array_like
+            Window of interest [px].
+        bytes_per_pixel : float
+            1 for Mono8, 2 for unpacked Mono12.
+
+        Returns
+        -------
+        (fps, limiting_factor)
+            Scalars for scalar inputs, arrays otherwise; limiting_factor is one of LIMITING_FACTORS.
+        """
+        terms = self.terms(exposure, width, height, bytes_per_pixel)
+        fps = 1.0 / terms.max(axis=0)
+        factor = np.asarray(LIMITING_FACTORS)[terms.argmax(axis=0)]
+        if fps.ndim == 0:
+            return float(fps), str(factor)
+        return fps, factor
+
+    def max_exposure(self, width, height, bytes_per_pixel=1):
+        """Longest exposure [ms] that does not lower the frame rate below the readout/link limit."""
+        terms = self.terms(0.0, width, height, bytes_per_pixel)
+        return float(max(terms[1].max(), terms[2].max()) - self.exposure_overhead) * 1e3
+
+    @classmethod
+    def fit(cls, exposure, width, height, bytes_per_pixel, period, iterations=50):
+        """
+        Fits the model to measured periods [s] by alternating between a linear least-squares fit of every term
+        to the points it limits and re-assigning every point to its largest term (max-affine regression).
+
+        The alternation only finds a local optimum, so it is started from several initial assignments: points
+        well above the fastest period of their WOI are exposure limited, the rest is readout limited, link
+        limited, or link limited from the widest WOI on. The start giving the smallest relative error wins.
+        """
+        exposure = np.asarray(exposure, dtype=np.float64) / 1e3
+        height = np.asarray(height, dtype=np.float64)
+        pixels = np.asarray(width, dtype=np.float64) * height * np.asarray(bytes_per_pixel, dtype=np.float64)
+        period = np.asarray(period, dtype=np.float64)
+        if period.size < 2:
+            raise ValueError("At least two measured points are needed to fit the readout model")
+
+        # Fastest period of every WOI: the readout or link floor
+        _, group = np.unique(np.column_stack([pixels, height]), axis=0, return_inverse=True)
+        group = group.ravel()
+        floor = np.full(group.max() + 1, np.inf)
+        np.minimum.at(floor, group, period)
+        exposed = period > 1.2 * floor[group]
+
+        line_rate = pixels / height
+        starts = [np.where(exposed, 0, 1), np.where(exposed, 0, 2)]
+        for threshold in np.unique(line_rate[~exposed])[1:]:
+            starts.append(np.where(exposed, 0, np.where(line_rate >= threshold, 2, 1)))
+
+        best, best_error = None, np.inf
+        for labels in starts:
+            model = cls()
+            for _ in range(iterations):
+                model._fit_terms(labels, exposure, height, pixels, period)
+                new_labels = model._terms(exposure, height, pixels).argmax(axis=0)
+                if np.array_equal(labels, new_labels):
+                    break
+                labels = new_labels
+            error = np.sum((model._terms(exposure, height, pixels).max(axis=0) / period - 1.0) ** 2)
+            if error < best_error:
+                best, best_error = model, error
+        return best
+
+    def _terms(self, exposure, height, pixels):
+        """terms() for exposure in s and link bytes per frame."""
+        link = pixels / self.bandwidth if self.bandwidth else np.zeros(exposure.shape)
+        return np.stack([exposure + self.exposure_overhead, self.row_offset + self.row_time * height, link])
+
+    def _fit_terms(self, labels, exposure, height, pixels, period):
+        """Least-squares fit of every term to the points assigned to it, unassigned terms being kept or disabled."""
+        selected = labels == 0
+        if selected.any():
+            self.exposure_overhead = max(0.0, float(np.mean(period[selected] - exposure[selected])))
+
+        selected = labels == 1
+        if selected.any():
+            row_offset, row_time = float(np.mean(period[selected])), 0.0
+            if np.unique(height[selected]).size > 1:
+                design = np.column_stack([np.ones(selected.sum()), height[selected]])
+                (offset, slope), *_ = np.linalg.lstsq(design, period[selected], rcond=None)
+                if slope >= 0:
+                    row_offset, row_time = float(offset), float(slope)
+            self.row_offset, self.row_time = row_offset, row_time
+        else:
+            self.row_offset, self.row_time = 0.0, 0.0
+
+        selected = labels == 2
+        if selected.any():
+            byte_time = np.dot(pixels[selected], period[selected]) / np.dot(pixels[selected], pixels[selected])
+            self.bandwidth = float(1.0 / byte_time)
+        else:
+            self.bandwidth = None
+
+    def residuals(self, exposure, width, height, bytes_per_pixel, period):
+        """Relative error of the modelled period at measured points."""
+        return self.period(exposure, width, height, bytes_per_pixel) / np.asarray(period) - 1.0
+
+    def to_dict(self):
+        return {'exposure_overhead': self.exposure_overhead, 'row_offset': self.row_offset,
+                'row_time': self.row_time, 'bandwidth': self.bandwidth}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['exposure_overhead'], data['row_offset'], data['row_time'], data.get('bandwidth'))
+
+    def __repr__(self):
+        bandwidth = f"{self.bandwidth / 1e6:.1f} MB/s" if self.bandwidth else "not limiting"
+        return (f"ReadoutModel(exposure overhead {self.exposure_overhead * 1e6:.1f} us, "
+                f"readout {self.row_offset * 1e6:.1f} us + {self.row_time * 1e6:.3f} us/row, link {bandwidth})")
+
+
+class FrameRateCharacterisation:
+    """
+    Measures the camera frame rate over an exposure x height x width grid and fits a ReadoutModel.
+
+    Every point is a short burst timed with the camera's hardware timestamps, the period being the median
+    timestamp difference, so one point takes `frames` frame periods instead of seconds of wall-clock averaging.
+    After the grid, exposures are refined where the limiting factor changes (the readout-limited knee) or the
+    model does not describe the measurement, `refine_levels` times, bisecting in log exposure.
+
+    Parameters
+    ----------
+    camera : Camera
+        Camera providing acquire_timestamps().
+    exposures : array_like
+        Exposure times [ms].
+    heights : array_like
+        WOI heights [px].
+    widths : array_like
+        WOI widths [px].
+    frames : int
+        Frames per burst.
+    refine_levels : int
+        Refinement passes after the grid.
+    tolerance : float
+        Relative model error above which an interval is refined.
+    on_point : callable, optional
+        Called with every measured point (dict), from the measuring thread.
+    """
+
+    def __init__(self, camera, exposures, heights, widths, frames=50, refine_levels=2, tolerance=0.03,
+                 on_point=None):
+        self.camera = camera
+        self.exposures = np.sort(np.asarray(exposures, dtype=np.float64))
+        self.heights = [int(h) for h in heights]
+        self.widths = [int(w) for w in widths]
+        self.frames = max(3, int(frames))
+        self.refine_levels = int(refine_levels)
+        self.tolerance = tolerance
+        self.on_point = on_point
+
+        self.points = []
+        self.model = None
+        self.duration = None
+        self._stop = False
+
+    def stop(self):
+        """Requests the characterisation to stop after the current point."""
+        self._stop = True
+
+    def measure(self, exposure, width, height):
+        """Applies the settings, times one burst and returns the point, the actual camera values being recorded."""
+        self.camera.pause()
+        self.camera.set_woi((0, 0, width, height))
+        self.camera.set_exposure(exposure)
+
+        timestamps = self.camera.acquire_timestamps(self.frames)
+        if len(timestamps) < 3:
+            raise RuntimeError(f"Only {len(timestamps)} frames received at exposure {exposure} ms, {width}x{height}")
+        period = float(np.median(np.diff(timestamps)))
+
+        point = {
+            'exposure': self.camera.get_exposure(),
+            'width': self.camera.get_width(),
+            'height': self.camera.get_height(),
+            'bytes_per_pixel': pixel_format_bytes(self.camera.get_pixel_format()),  # 1.5 for packed Mono12p
+            'period': period,
+            'fps': 1.0 / period,
+            'frames': len(timestamps),
+        }
+        self.points.append(point)
+        if self.on_point is not None:
+            self.on_point(point)
+        return point
+
+    def arrays(self):
+        """Measured points as a dict of numpy arrays."""
+        return {key: np.array([point[key] for point in self.points])
+                for key in ('exposure', 'width', 'height', 'bytes_per_pixel', 'period', 'fps')}
+
+    def fit(self):
+        a = self.arrays()
+        self.model = ReadoutModel.fit(a['exposure'], a['width'], a['height'], a['bytes_per_pixel'], a['period'])
+        return self.model
+
+    def refinement_exposures(self):
+        """[(exposure, width, height), ...] midpoints of intervals that contain a knee or fit badly."""
+        a = self.arrays()
+        _, factors = self.model.predict(a['exposure'], a['width'], a['height'], a['bytes_per_pixel'])
+        errors = np.abs(self.model.residuals(a['exposure'], a['width'], a['height'], a['bytes_per_pixel'],
+                                             a['period']))
+        todo = []
+        for width, height in sorted(set(zip(a['width'].tolist(), a['height'].tolist()))):
+            selected = np.flatnonzero((a['width'] == width) & (a['height'] == height))
+            if selected.size < 2:
+                continue
+            selected = selected[np.argsort(a['exposure'][selected])]
+            for left, right in zip(selected[:-1], selected[1:]):
+                if a['exposure'][right] / a['exposure'][left] < 1.05:
+                    continue  # Already resolved
+                if factors[left] != factors[right] or max(errors[left], errors[right]) > self.tolerance:
+                    todo.append((float(np.sqrt(a['exposure'][left] * a['exposure'][right])), int(width), int(height)))
+        return todo
+
+    def run(self):
+        """Measures the grid, refines and returns the fitted ReadoutModel (None if stopped before two points)."""
+        self._stop = False
+        start = time.perf_counter()
+        try:
+            for width in self.widths:
+                for height in self.heights:
+                    for exposure in self.exposures:
+                        if self._stop:
+                            return self.fit() if len(self.points) >= 2 else None
+                        self.measure(exposure, width, height)
+
+            self.fit()
+            for _ in range(self.refine_levels):
+                todo = self.refinement_exposures()
+                if not todo:
+                    break
+                for exposure, width, height in todo:
+                    if self._stop:
+                        return self.fit()
+                    self.measure(exposure, width, height)
+                self.fit()
+        finally:
+            self.camera.pause()
+        self.duration = time.perf_counter() - start
+        return self.model
+
+    def save(self, path):
+        """Writes the points and the model to a JSON file."""
+        with open(path, 'w') as file:
+            json.dump({'points': self.points, 'model': self.model.to_dict() if self.model else None}, file, indent=2)
+
+    @staticmethod
+    def load(path):
+        """(points, ReadoutModel or None) from a file written by save()."""
+        with open(path, 'r') as file:
+            data = json.load(file)
+        return data['points'], ReadoutModel.from_dict(data['model']) if data['model'] else None
@@ -0,0 +1,363 @@
+"""
+Camera measurements without any GUI dependency.
+
+The classes only talk to a Camera (and optionally the DeviceManager settings API) and return numpy results,
+so the same code runs behind the project views and in the headless runner (source/main_headless.py).
+"""
+import csv
+import time
+
+import numpy as np
+
+from source.processing.analysis_pool import AnalysisPool, FrameStatisticsStage, RegistrationStage, ROIMeansStage
+from source.processing.registration import DriftTracker, ROIPlan
+
+
+def grab(camera, timeout=5.0):
+    """Returns the next frame, waiting for the camera to start grabbing if needed."""
+    deadline = time.monotonic() + timeout
+    while True:
+        image = camera.acquire_image()
+        if image is not None:
+            return image
+        if time.monotonic() > deadline:
+            raise TimeoutError("Camera did not deliver a frame")
+
+
+def crop_rois(image, rois):
+    """[(roi_id, crop), ...] of `rois` ({id: {x, y, width, height}}), the whole image as 'full_image' if empty."""
+    if not rois:
+        return [("full_image", image)]
+    crops = []
+    for roi_id, region in rois.items():
+        x1, y1 = max(0, region["x"]), max(0, region["y"])
+        x2 = min(image.shape[1], region["x"] + region["width"])
+        y2 = min(image.shape[0], region["y"] + region["height"])
+        crops.append((roi_id, image[y1:y2, x1:x2]))
+    return crops
+
+
+class NoiseStatistics:
+    """
+    Streaming per-pixel mean and variance (Welford) of ROI crops, in electrons.
+
+    Memory does not grow with the number of frames, unlike stacking all frames. The history of one pixel per
+    ROI is kept for the intensity histogram.
+
+    Parameters
+    ----------
+    full_well_capacity : float
+        Electrons at the maximum grey level.
+    max_value : int
+        Maximum grey level (4095 for 12 bit).
+    histogram_pixel : (int, int), optional
+        (y, x) of the pixel whose values are kept, inside every ROI. Random if not given.
+    """
+
+    def __init__(self, full_well_capacity=182000, max_value=4095, histogram_pixel=None, seed=None):
+        self.scale = np.float32(full_well_capacity / max_value)
+        self.histogram_pixel = histogram_pixel
+        self._rng = np.random.default_rng(seed)
+        self.count = 0
+        self._mean = {}
+        self._m2 = {}
+        self._pixel = {}
+        self.pixel_values = {}
+
+    def add(self, crops):
+        """Adds one frame, given as [(roi_id, crop), ...]."""
+        self.count += 1
+        for roi_id, crop in crops:
+            electrons = crop.astype(np.float64) * self.scale
+            if roi_id not in self._mean:
+                self._mean[roi_id] = np.zeros(crop.shape, dtype=np.float64)
+                self._m2[roi_id] = np.zeros(crop.shape, dtype=np.float64)
+                if self.histogram_pixel is not None:
+                    self._pixel[roi_id] = self.histogram_pixel
+                else:
+                    self._pixel[roi_id] = (int(self._rng.integers(crop.shape[0])), int(self._rng.integers(crop.shape[1])))
+                self.pixel_values[roi_id] = []
+
+            mean = self._mean[roi_id]
+            delta = electrons - mean
+            mean += delta / self.count
+            self._m2[roi_id] += delta * (electrons - mean)
+            self.pixel_values[roi_id].append(electrons[self._pixel[roi_id]])
+
+    def result(self):
+        """{roi_id: (mean image, variance image)} in electrons."""
+        if self.count < 2:
+            raise ValueError("At least two frames are needed for the variance")
+        return {roi_id: (self._mean[roi_id], self._m2[roi_id] / self.count) for roi_id in self._mean}
+
+    def write_project(self, project, prefix='noise'):
+        """Stores the mean/variance images and histogram pixel values of every ROI under `prefix`/<roi_id>/."""
+        for roi_id, (mean, variance) in self.result().items():
+            attrs = {'frames': self.count, 'pixel': list(self._pixel[roi_id])}
+            project.write_array(f"{prefix}/{roi_id}/mean", mean, attrs)
+            project.write_array(f"{prefix}/{roi_id}/variance", variance, attrs)
+            project.write_array(f"{prefix}/{roi_id}/pixel_values", np.asarray(self.pixel_values[roi_id]), attrs)
+
+
+def read_noise_statistics(project, prefix='noise'):
+    """{roi_id: (mean, variance, pixel values)} as LazyArrays, stored by NoiseStatistics.write_project()."""
+    roi_ids = sorted({name[len(prefix) + 1:].rsplit('/', 1)[0] for name in project.names(f"{prefix}/")})
+    return {roi_id: tuple(project[f"{prefix}/{roi_id}/{kind}"] for kind in ('mean', 'variance', 'pixel_values'))
+            for roi_id in roi_ids}
+
+
+class NoiseMeasurement:
+    """
+    Photon transfer measurement: per-pixel mean and temporal variance over `max_frames` frames.
+
+    Parameters
+    ----------
+    camera : Camera
+        Camera to acquire from.
+    max_frames : int
+        Number of frames.
+    rois : dict, optional
+        {roi_id: {x, y, width, height}}; the whole frame if not given.
+    full_well_capacity : float
+        Electrons at the maximum grey level.
+    """
+
+    def __init__(self, camera, max_frames=200, rois=None, full_well_capacity=182000):
+        self.camera = camera
+        self.max_frames = int(max_frames)
+        self.rois = rois or {}
+        self.statistics = NoiseStatistics(full_well_capacity, 2 ** camera.get_bitdepth() - 1)
+
+    def run(self):
+        for _ in range(self.max_frames):
+            self.statistics.add(crop_rois(grab(self.camera), self.rois))
+        self.camera.pause()
+        return self.statistics.result()
+
+    def save(self, path):
+        """Writes mean/variance images and the histogram pixel values of every ROI to an .npz file."""
+        arrays = {}
+        for roi_id, (mean, variance) in self.statistics.result().items():
+            arrays[f"{roi_id}_mean"] = mean
+            arrays[f"{roi_id}_variance"] = variance
+            arrays[f"{roi_id}_pixel_values"] = np.asarray(self.statistics.pixel_values[roi_id])
+        np.savez(path, **arrays)
+
+    def write_project(self, project):
+        self.statistics.write_project(project)
+
+
+class FrameRateMeasurement:
+    """
+    Measured frame rate for a list of camera settings.
+
+    Parameters
+    ----------
+    device_manager : DeviceManager
+        Used to apply settings like the GUI does.
+    serial : str
+        Camera serial number.
+    settings_list : list of dict
+        Camera settings per point, e.g. [{'exposure': {'value': 1.0}, 'height': {'value': 512}}, ...].
+    frames : int
+        Frames timed per point.
+    """
+
+    def __init__(self, device_manager, serial, settings_list, frames=100):
+        self.device_manager = device_manager
+        self.serial = serial
+        self.camera = device_manager.loaded_devices[serial]
+        self.settings_list = list(settings_list)
+        self.frames = int(frames)
+        self.results = []
+
+    def run(self):
+        self.results = []
+        for settings in self.settings_list:
+            self.camera.pause()
+            self.device_manager.set_device_settings(self.serial, settings)
+            grab(self.camera)  # Starts grabbing, first frame not timed
+            start = time.perf_counter()
+            for _ in range(self.frames):
+                grab(self.camera)
+            fps = self.frames / (time.perf_counter() - start)
+            self.results.append((settings, fps))
+        self.camera.pause()
+        return self.results
+
+    def save(self, path):
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['exposure', 'width', 'height', 'fps'])
+            for settings, fps in self.results:
+                writer.writerow([settings.get(key, {}).get('value', '') for key in ('exposure', 'width', 'height')]
+                                + [fps])
+
+
+class SensorgramMeasurement:
+    """
+    ROI mean intensity over time, written row by row to a CSV file as it is acquired.
+
+    Parameters
+    ----------
+    camera : Camera
+        Camera to acquire from.
+    rois : dict
+        {roi_id: {x, y, width, height}}; the whole frame if empty.
+    duration : float
+        Length of the recording [s].
+    frames_per_point : int
+        Frames averaged per sensorgram point.
+    drift_interval : int
+        If > 0, the ROIs follow the drift of the sample, registered every `drift_interval` frames against the
+        first frame, and the offset is written as two extra columns.
+    server : FrameServer, optional
+        Streams the frames and the points to local clients while recording.
+    project : ProjectFile, optional
+        Also records the points (array 'sensorgram', one row per point) and, if `record_frames`, every frame
+        (array 'frames' and their times 'frame_times') into the project.
+    record_frames : bool
+        Record the raw frames into the project.
+    """
+
+    def __init__(self, camera, rois, duration, frames_per_point=1, drift_interval=0, server=None, project=None,
+                 record_frames=False):
+        self.camera = camera
+        self.rois = rois or {}
+        self.duration = float(duration)
+        self.frames_per_point = max(1, int(frames_per_point))
+        self.drift_tracker = DriftTracker(drift_interval) if drift_interval > 0 else None
+        self.server = server
+        self.project = project
+        self.record_frames = record_frames
+        self._stop = False
+
+    def stop(self):
+        self._stop = True
+
+    def run(self, path):
+        """Records until `duration` elapsed or stop(), returns the number of points written."""
+        self._stop = False
+        points = 0
+        plan = ROIPlan(self.rois)
+        offset = (0.0, 0.0)
+        if self.server is not None:
+            self.server.set_rois(self.rois)
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            first = grab(self.camera)
+            ids = [roi_id for roi_id, _ in crop_rois(first, self.rois)]
+            columns = ['time'] + ids + (['drift_y', 'drift_x'] if self.drift_tracker else [])
+            writer.writerow(columns)
+            sensorgram, frames, frame_times = None, None, None
+            if self.project is not None:
+                self.project.metadata['rois'] = self.rois
+                sensorgram = self.project.create_array('sensorgram', (len(columns),), np.float64,
+                                                       {'columns': columns, 'frames_per_point': self.frames_per_point})
+                if self.record_frames:
+                    frames = self.project.create_array('frames', first.shape, first.dtype,
+                                                       {'woi': self.camera.get_woi(),
+                                                        'exposure': self.camera.get_exposure()})
+                    frame_times = self.project.create_array('frame_times', (), np.float64)
+
+            start = time.perf_counter()
+            while not self._stop and time.perf_counter() - start < self.duration:
+                sums = np.zeros(len(ids))
+                for _ in range(self.frames_per_point):
+                    image = grab(self.camera)
+                    if frames is not None:
+                        frames.append(image)
+                        frame_times.append(time.perf_counter() - start)
+                    if self.server is not None:
+                        self.server.publish_frame(image)
+                    if self.drift_tracker is not None:
+                        offset = self.drift_tracker.update(image)
+                    if self.drift_tracker is not None and self.rois:
+                        sums += plan.means(image, offset)
+                    else:
+                        sums += [crop.mean() for _, crop in crop_rois(image, self.rois)]
+                elapsed = time.perf_counter() - start
+                row = list(sums / self.frames_per_point) + (list(offset) if self.drift_tracker else [])
+                writer.writerow([f"{elapsed:.6f}"] + row)
+                if sensorgram is not None:
+                    sensorgram.append([elapsed] + row)
+                if self.server is not None:
+                    self.server.publish_values(dict(zip(ids, sums / self.frames_per_point)), points)
+                points += 1
+                if points % 100 == 0:
+                    file.flush()
+                    if self.project is not None:
+                        self.project.flush()
+        self.camera.pause()
+        if self.project is not None:
+            self.project.flush()
+        return points
+
+
+def flatten_result(result, prefix=''):
+    """{'stage': {'key': v}, 'other': (a, b)} -> {'stage.key': v, 'other.0': a, 'other.1': b}."""
+    flat = {}
+    for key, value in result.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_result(value, f"{name}."))
+        elif isinstance(value, (tuple, list)):
+            flat.update({f"{name}.{i}": v for i, v in enumerate(value)})
+        else:
+            flat[name] = value
+    return flat
+
+
+class AnalysisMeasurement:
+    """
+    Frames analysed on an AnalysisPool of worker processes while acquiring, one CSV row per analysed frame.
+
+    Parameters
+    ----------
+    camera : Camera
+        Camera to acquire from.
+    frames : int
+        Frames to acquire.
+    rois : dict, optional
+        {roi_id: {x, y, width, height}} whose means are computed.
+    registration : bool
+        Register every frame against the first one (dy, dx, confidence).
+    workers : int, optional
+        Worker processes, see AnalysisPool.
+    """
+
+    def __init__(self, camera, frames, rois=None, registration=False, workers=None):
+        self.camera = camera
+        self.frames = int(frames)
+        self.rois = rois or {}
+        self.registration = registration
+        self.workers = workers
+        self.dropped = 0
+
+    def stages(self, first_frame):
+        stages = [FrameStatisticsStage(2 ** self.camera.get_bitdepth() - 1)]
+        if self.rois:
+            stages.append(ROIMeansStage(self.rois))
+        if self.registration:
+            stages.append(RegistrationStage(first_frame))
+        return stages
+
+    def run(self, path):
+        """Acquires and analyses the frames, writes the results ordered by frame and returns their number."""
+        image = grab(self.camera)
+        pool = AnalysisPool(image.shape, image.dtype, self.stages(image), self.workers)
+        try:
+            pool.submit(image)
+            for _ in range(self.frames - 1):
+                pool.submit(grab(self.camera))
+            self.camera.pause()
+        finally:
+            pool.close()
+        self.dropped = pool.dropped
+
+        rows = [flatten_result(result) for result in sorted(pool.results(), key=lambda r: r['frame'])]
+        with open(path, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=list(rows[0]) if rows else ['frame'])
+            writer.writeheader()
+            writer.writerows(rows)
+        return len(rows)
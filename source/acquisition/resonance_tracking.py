@@ -0,0 +1,213 @@
+import time
+from collections import deque
+
+import numpy as np
+
+
+class AngleActuator:
+    """Moves the angle stage (a MotionControl, e.g. KinesisMotor) for ResonanceTracker."""
+
+    def __init__(self, motor):
+        self.motor = motor
+
+    def position(self):
+        return self.motor.get_position()
+
+    def move(self, target):
+        """Starts a move, returns a Future resolving when the stage stopped."""
+        return self.motor.move_to_async(target)
+
+
+class WavelengthActuator:
+    """Tunes the PE filter (PEDevice) for ResonanceTracker."""
+
+    def __init__(self, filter_device):
+        self.filter_device = filter_device
+
+    def position(self):
+        wavelength = self.filter_device.wavelength
+        if wavelength is None:
+            raise RuntimeError("The PE filter wavelength is unknown, initialize the filter or set a wavelength first")
+        return wavelength
+
+    def move(self, target):
+        """Starts tuning, returns a Future resolving when the filter settled."""
+        low, high = self.filter_device.wavelength_range
+        return self.filter_device.set_wavelength_async(float(np.clip(target, low, high)))
+
+
+def tracking_rois(rois, width, height):
+    """
+    The ROIs ({id: {x, y, width, height}}) lying entirely inside a `width` x `height` frame, e.g. ROIs saved at
+    another WOI; the whole frame as ROI "frame" if `rois` is empty.
+    """
+    if not rois:
+        return {"frame": {"x": 0, "y": 0, "width": width, "height": height}}
+    return {roi_id: region for roi_id, region in rois.items()
+            if region["x"] >= 0 and region["y"] >= 0 and region["width"] > 0 and region["height"] > 0
+            and region["x"] + region["width"] <= width and region["y"] + region["height"] <= height}
+
+
+class ResonanceTracker:
+    """
+    Closed-loop tracking of the SPR working point.
+
+    The tracker is fed live frames through process_frame(). It first dithers the actuator by +-`dither` around
+    the current position to measure the reflectivity slope of every ROI and takes the mid intensity as the
+    setpoint. It then converts the intensity error of each ROI into a position error through its slope and
+    moves the actuator by `gain` times the median error, so the working point stays on the linear part of the
+    resonance curve. Slopes are refined from the response to the corrections.
+
+    Only every `decimation`-th pixel of each ROI is read and one update is made per `frames_per_update`
+    frames, so most frames cost a few strided sums. Frames arriving while the actuator moves, and
+    `settle_frames` frames after it stopped, are dropped.
+
+    Parameters
+    ----------
+    actuator : AngleActuator or WavelengthActuator
+        What to move.
+    rois : dict
+        {roi_id: {"x": x, "y": y, "width": w, "height": h}}, as kept by ROIController.
+    dither : float
+        Calibration step in actuator units [deg or nm].
+    gain : float
+        Fraction of the estimated position error corrected per update.
+    max_step : float
+        Largest correction per update in actuator units.
+    deadband : float
+        Corrections smaller than this are not applied.
+    slope_update : float
+        Weight of the slope measured from a correction in the running slope estimate, 0 to keep the calibration.
+    decimation : int
+        Pixel stride inside the ROIs.
+    frames_per_update : int
+        Frames averaged per control update.
+    settle_frames : int
+        Frames dropped after every move.
+    on_update : callable, optional
+        Called as on_update(position, position_error, intensities) after every tracking update.
+    history_length : int
+        Tracking updates kept in `history`, the oldest are dropped.
+    """
+
+    def __init__(self, actuator, rois, dither, gain=0.5, max_step=None, deadband=0.0, slope_update=0.2,
+                 decimation=4, frames_per_update=5, settle_frames=1, on_update=None, history_length=10000):
+        if not rois:
+            raise ValueError("Resonance tracking needs at least one ROI")
+        self.actuator = actuator
+        self.rois = dict(rois)
+        self.dither = float(dither)
+        self.gain = gain
+        self.max_step = max_step if max_step is not None else 2 * self.dither
+        self.deadband = deadband
+        self.slope_update = slope_update
+        self.decimation = max(1, int(decimation))
+        self.frames_per_update = max(1, int(frames_per_update))
+        self.settle_frames = max(0, int(settle_frames))
+        self.on_update = on_update
+
+        self.state = 'idle'
+        self.centre = None
+        self.slopes = None
+        self.setpoints = None
+        self.history = deque(maxlen=history_length)  # (time, position, position error) of the last updates
+
+        self._slices = [(slice(r["y"], r["y"] + r["height"], self.decimation),
+                         slice(r["x"], r["x"] + r["width"], self.decimation)) for r in self.rois.values()]
+        self._sums = np.zeros(len(self._slices), dtype=np.float64)
+        self._count = 0
+        self._skip = 0
+        self._move = None
+        self._calibration = {}
+        self._last_correction = None  # (step, intensities before) for the slope refinement
+
+    ################################################ CONTROL ###########################################################
+
+    def start(self):
+        """Starts calibration around the current position, tracking follows automatically."""
+        self.centre = self.actuator.position()
+        self._calibration = {}
+        self._last_correction = None
+        self._move_to(self.centre - self.dither)
+        self.state = 'calibrate_low'
+
+    def stop(self):
+        self.state = 'idle'
+
+    def _move_to(self, target):
+        self._move = self.actuator.move(target)
+        self._skip = self.settle_frames
+        self._sums[:] = 0
+        self._count = 0
+
+    def _roi_means(self, image):
+        return np.fromiter((image[rows, cols].mean() for rows, cols in self._slices), dtype=np.float64,
+                           count=len(self._slices))
+
+    def process_frame(self, image):
+        """Feeds one frame, moves the actuator when an update is due."""
+        if self.state == 'idle':
+            return
+
+        # === Ignore frames while moving and settling ===
+        if self._move is not None:
+            if not self._move.done():
+                return
+            self._move.result()  # Re-raises actuator errors
+            self._move = None
+        if self._skip > 0:
+            self._skip -= 1
+            return
+
+        # === Accumulate decimated ROI means ===
+        self._sums += self._roi_means(image)
+        self._count += 1
+        if self._count < self.frames_per_update:
+            return
+        intensities = self._sums / self._count
+        self._sums[:] = 0
+        self._count = 0
+
+        if self.state == 'calibrate_low':
+            self._calibration['low'] = intensities
+            self._move_to(self.centre + self.dither)
+            self.state = 'calibrate_high'
+
+        elif self.state == 'calibrate_high':
+            low = self._calibration['low']
+            self.slopes = (intensities - low) / (2 * self.dither)
+            self.setpoints = 0.5 * (intensities + low)
+            self._move_to(self.centre)
+            self.state = 'tracking'
+
+        else:
+            self._track(intensities)
+
+    def _track(self, intensities):
+        # === Refine slopes from the response to the previous correction ===
+        if self._last_correction is not None and self.slope_update > 0:
+            step, before = self._last_correction
+            measured = (intensities - before) / step
+            same_sign = np.sign(measured) == np.sign(self.slopes)
+            self.slopes = np.where(same_sign, (1 - self.slope_update) * self.slopes + self.slope_update * measured,
+                                   self.slopes)
+            self._last_correction = None
+
+        # === Position error from the intensity error of every ROI with a usable slope ===
+        usable = np.abs(self.slopes) > 1e-12
+        if not np.any(usable):
+            raise RuntimeError("Reflectivity slope is zero in all ROIs, the working point is off resonance")
+        errors = (self.setpoints[usable] - intensities[usable]) / self.slopes[usable]
+        position_error = float(np.median(errors))
+
+        position = self.centre
+        step = float(np.clip(self.gain * position_error, -self.max_step, self.max_step))
+        if abs(step) > self.deadband:
+            self.centre = position + step
+            self._move_to(self.centre)
+            if abs(step) >= 0.1 * self.dither:  # Big enough to measure the slope against noise
+                self._last_correction = (step, intensities)
+
+        self.history.append((time.monotonic(), position, position_error))
+        if self.on_update is not None:
+            self.on_update(position, position_error, intensities)
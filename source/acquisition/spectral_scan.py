@@ -0,0 +1,148 @@
+import os
+import tempfile
+import time
+
+import numpy as np
+
+
+class SpectralScan:
+    """
+    Wavelength-interrogated acquisition: steps a tunable filter through a list of wavelengths and records the
+    average of `frames_per_step` camera frames at each step into a (wavelength, H, W) float32 cube.
+
+    The cube is a preallocated memory-mapped .npy file, so scans larger than RAM are written straight to disk.
+    The filter is commanded to the next wavelength as soon as the last frame of a step is read out, and the
+    averaging/writing of that step runs while the filter moves and settles.
+
+    Parameters
+    ----------
+    camera : Camera
+        Camera to acquire from.
+    filter_device : PEDevice
+        Tunable filter, must provide set_wavelength_async().
+    wavelengths : array_like
+        Wavelengths to visit [nm], in acquisition order.
+    frames_per_step : int
+        Number of frames averaged per wavelength.
+    discard_frames : int
+        Frames dropped after the filter settled, their exposure may have started while the filter was moving.
+    output_path : str, optional
+        .npy file for the cube. A temporary file is used if not given, deleted with its sidecar file by close().
+    """
+
+    def __init__(self, camera, filter_device, wavelengths, frames_per_step=1, discard_frames=1, output_path=None):
+        self.camera = camera
+        self.filter_device = filter_device
+        self.wavelengths = np.asarray(wavelengths, dtype=np.float64)
+        self.frames_per_step = max(1, int(frames_per_step))
+        self.discard_frames = max(0, int(discard_frames))
+
+        self.temporary = output_path is None
+        if output_path is None:
+            handle, output_path = tempfile.mkstemp(suffix='.npy', prefix='spectral_scan_')
+            os.close(handle)
+        self.output_path = output_path
+
+        self.cube = None
+        self._stop = False
+
+    def stop(self):
+        """Requests the scan to stop after the current step."""
+        self._stop = True
+
+    def wavelengths_path(self):
+        """The file of the wavelengths saved next to the cube."""
+        return os.path.splitext(self.output_path)[0] + '_wavelengths.npy'
+
+    def close(self):
+        """
+        Releases the cube. A temporary cube is deleted with its wavelengths file, so the cube returned by run()
+        must not be used anymore.
+        """
+        self.cube = None
+        if not self.temporary:
+            return
+        for path in (self.output_path, self.wavelengths_path()):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _grab(self, timeout=5.0):
+        """Returns the next frame, waiting for the camera to start grabbing if needed."""
+        deadline = time.monotonic() + timeout
+        while True:
+            image = self.camera.acquire_image()
+            if image is not None:
+                return image
+            if time.monotonic() > deadline:
+                raise TimeoutError("Camera did not deliver a frame")
+
+    def run(self, progress=None):
+        """
+        Runs the scan.
+
+        Parameters
+        ----------
+        progress : callable, optional
+            Called as progress(step, wavelength, averaged_frame) after each step.
+
+        Returns
+        -------
+        numpy.memmap
+            The (wavelength, H, W) cube. Steps not acquired because of stop() stay at zero.
+        """
+        self._stop = False
+        if len(self.wavelengths) == 0:
+            raise ValueError("No wavelengths to scan")
+
+        try:
+            self._run(progress)
+        finally:
+            self.camera.pause()  # The camera started grabbing on the first frame
+
+        self.cube.flush()
+        return self.cube
+
+    def _run(self, progress):
+        n_steps = len(self.wavelengths)
+
+        # === Tune to the first wavelength while the camera starts grabbing ===
+        move = self.filter_device.set_wavelength_async(self.wavelengths[0])
+        first = self._grab()
+        height, width = first.shape
+
+        self.cube = np.lib.format.open_memmap(self.output_path, mode='w+', dtype=np.float32,
+                                              shape=(n_steps, height, width))
+        np.save(self.wavelengths_path(), self.wavelengths)
+
+        accumulator = np.empty((height, width), dtype=np.float32)
+        scale = np.float32(1.0 / self.frames_per_step)
+
+        for step, wavelength in enumerate(self.wavelengths):
+            move.result()  # Filter tuned and settled
+            if self._stop:
+                break
+
+            # === Drop frames exposed during the move ===
+            self.camera.flush()
+            for _ in range(self.discard_frames):
+                self._grab()
+
+            # === Average frames_per_step frames ===
+            accumulator.fill(0)
+            for _ in range(self.frames_per_step):
+                np.add(accumulator, self._grab(), out=accumulator)
+
+            # === Start moving to the next wavelength, then reduce/write this step during the move ===
+            if step + 1 < n_steps:
+                move = self.filter_device.set_wavelength_async(self.wavelengths[step + 1])
+
+            np.multiply(accumulator, scale, out=self.cube[step])
+
+            if progress is not None:
+                progress(step, wavelength, self.cube[step])
@@ -0,0 +1,274 @@
+"""Vectorised SPR resonance (reflectivity minimum) localisation over spectral or angular cubes.
+
+All methods operate on a (N, P) block of N samples (wavelengths or angles) for P pixels at once; there is no
+per-pixel Python loop. :func:`fit_resonance_map` additionally splits large cubes into row tiles processed by a
+process pool, with the cube and the result shared between processes instead of pickled.
+"""
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+METHODS = ('polynomial', 'lorentzian', 'centroid', 'linear_regression')
+
+
+def find_resonance(cube, axis_values, method='polynomial', window=7, threshold=0.5):
+    """
+    Finds the resonance position of every pixel of a cube.
+
+    Parameters
+    ----------
+    cube : numpy.ndarray
+        (N, H, W) or (N, P) reflectivity stack, N samples along the scanned axis.
+    axis_values : array_like
+        The N wavelengths or angles, monotonically increasing.
+    method : str
+        'polynomial'        - quadratic least-squares fit around the sampled minimum,
+        'lorentzian'        - Lorentzian dip, fitted as a quadratic to the inverse dip depth,
+        'centroid'          - centroid of the part of the dip below `threshold`,
+        'linear_regression' - zero crossing of a line fitted to the derivative around the minimum.
+    window : int
+        Number of samples used by the fitting methods (odd, at least 3).
+    threshold : float
+        Relative level (0 = minimum, 1 = maximum) below which the dip contributes to the centroid.
+
+    Returns
+    -------
+    numpy.ndarray
+        float32 resonance positions in the units of `axis_values`, shaped like the cube without axis 0.
+        NaN where no dip could be located.
+    """
+    cube = np.asarray(cube)
+    x = np.asarray(axis_values, dtype=np.float64)
+    n = cube.shape[0]
+    if x.shape != (n,):
+        raise ValueError(f"Expected {n} axis values, got {x.shape}")
+    if method not in METHODS:
+        raise ValueError(f"Unknown method {method}, expected one of {METHODS}")
+
+    out_shape = cube.shape[1:]
+    data = cube.reshape(n, -1)
+
+    if method == 'centroid':
+        positions = _centroid(data, x, threshold)
+    else:
+        positions = _windowed_fit(data, x, method, window)
+
+    return positions.astype(np.float32).reshape(out_shape)
+
+
+def _window_indices(data, window):
+    """Per pixel sample indices (window, P) of a window centred on the minimum, shifted to stay inside the data."""
+    n = data.shape[0]
+    window = int(min(max(window, 3), n))
+    half = window // 2
+    minimum = np.argmin(data, axis=0)
+    start = np.clip(minimum - half, 0, n - window)
+    return start + np.arange(window)[:, None], minimum
+
+
+def _solve_weighted_polynomial(x, y, weights, degree):
+    """Batched weighted least squares y ~ sum(c_k x^k); x, y, weights are (M, P), returns (P, degree + 1)."""
+    powers = [np.ones_like(x)]
+    for _ in range(2 * degree):
+        powers.append(powers[-1] * x)
+    moments = [np.sum(weights * p, axis=0) for p in powers]
+    rhs = [np.sum(weights * y * powers[k], axis=0) for k in range(degree + 1)]
+
+    # Normal equations, one (degree + 1) x (degree + 1) system per pixel
+    a = np.stack([np.stack([moments[i + j] for j in range(degree + 1)], axis=-1)
+                  for i in range(degree + 1)], axis=-2)
+    b = np.stack(rhs, axis=-1)
+
+    # Singular systems (flat or NaN data) produce NaN instead of aborting the whole block
+    determinant = np.linalg.det(a)
+    singular = ~np.isfinite(determinant) | (np.abs(determinant) < 1e-300)
+    a[singular] = np.eye(degree + 1)
+    coefficients = np.linalg.solve(a, b[..., None])[..., 0]
+    coefficients[singular] = np.nan
+    return coefficients
+
+
+def _windowed_fit(data, x, method, window):
+    indices, minimum = _window_indices(data, window)
+    y = np.take_along_axis(data, indices, axis=0).astype(np.float64)
+
+    # Fit in coordinates centred on the sampled minimum for numerical conditioning
+    centre = x[minimum]
+    xw = x[indices] - centre
+
+    if method == 'polynomial':
+        c = _solve_weighted_polynomial(xw, y, np.ones_like(y), 2)
+        vertex = -c[:, 1] / (2 * c[:, 2])
+        valid = c[:, 2] > 0  # Must open upwards to be a minimum
+
+    elif method == 'lorentzian':
+        # R = baseline - A / (1 + ((x - x0) / g)^2)  =>  1 / (baseline - R) is a parabola with its minimum at x0.
+        # Weighting with depth^2 compensates the noise amplification of the inversion.
+        baseline = np.max(data, axis=0).astype(np.float64)
+        depth = baseline - y
+        depth_min = 1e-6 * np.maximum(np.abs(baseline), 1e-12)
+        positive = depth > depth_min
+        inverse = np.where(positive, 1.0 / np.where(positive, depth, 1.0), 0.0)
+        c = _solve_weighted_polynomial(xw, inverse, np.where(positive, depth ** 2, 0.0), 2)
+        vertex = -c[:, 1] / (2 * c[:, 2])
+        valid = c[:, 2] > 0
+
+    else:  # linear_regression
+        # Derivative of the reflectivity, zero crossing of a line fitted around the minimum
+        derivative = np.gradient(data.astype(np.float64), x, axis=0)
+        dy = np.take_along_axis(derivative, indices, axis=0)
+        c = _solve_weighted_polynomial(xw, dy, np.ones_like(dy), 1)
+        vertex = -c[:, 0] / c[:, 1]
+        valid = c[:, 1] > 0  # Derivative must go from negative to positive
+
+    # Keep only vertices inside the fitted window
+    lower = x[indices[0]] - centre
+    upper = x[indices[-1]] - centre
+    valid &= (vertex >= lower) & (vertex <= upper)
+    return np.where(valid, vertex + centre, np.nan)
+
+
+def _centroid(data, x, threshold):
+    data = data.astype(np.float32, copy=False)
+    low = np.min(data, axis=0)
+    high = np.max(data, axis=0)
+    level = low + threshold * (high - low)
+    weights = np.clip(level - data, 0, None)
+    total = np.sum(weights, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(total > 0, (x.astype(np.float32) @ weights) / total, np.nan)
+
+
+def roi_spectra(cube, rois):
+    """
+    Reduces a cube to the mean spectrum of each ROI.
+
+    Parameters
+    ----------
+    cube : numpy.ndarray
+        (N, H, W) stack.
+    rois : dict
+        {roi_id: {"x": x, "y": y, "width": w, "height": h}}, as kept by ROIController.
+
+    Returns
+    -------
+    (list, numpy.ndarray)
+        ROI ids and the (N, n_rois) mean spectra, which can be passed to find_resonance().
+    """
+    ids = list(rois)
+    spectra = np.empty((cube.shape[0], len(ids)), dtype=np.float32)
+    for i, roi_id in enumerate(ids):
+        region = rois[roi_id]
+        x, y, w, h = region["x"], region["y"], region["width"], region["height"]
+        spectra[:, i] = cube[:, y:y + h, x:x + w].mean(axis=(1, 2))
+    return ids, spectra
+
+
+def resonance_to_refractive_index(positions, reference_position, sensitivity, reference_index=1.333):
+    """
+    Converts resonance positions to refractive index with a linear calibration.
+
+    `sensitivity` is the bulk sensitivity in axis units per refractive index unit (nm/RIU or deg/RIU) and
+    `reference_position` the resonance measured with a medium of index `reference_index`.
+    """
+    return reference_index + (np.asarray(positions) - reference_position) / sensitivity
+
+
+############################################## PROCESS POOL TILING #####################################################
+
+_worker = {}
+
+
+def _attach(spec):
+    """Returns an array described by `spec`, backed by shared memory or a .npy memmap, without copying."""
+    if spec['kind'] == 'memmap':
+        return np.load(spec['path'], mmap_mode='r'), None
+    shm = shared_memory.SharedMemory(name=spec['name'])
+    return np.ndarray(spec['shape'], dtype=spec['dtype'], buffer=shm.buf), shm
+
+
+def _whole_npy_memmap(cube):
+    """
+    The .npy file of `cube` if it is a memmap of the whole stored array, which the workers can map again
+    themselves, else None (e.g. a slice of the file).
+    """
+    path = getattr(cube, 'filename', None)
+    if not isinstance(cube, np.memmap) or not path or not str(path).endswith('.npy') or cube._mmap is None:
+        return None
+    with open(path, 'rb') as file:
+        version = np.lib.format.read_magic(file)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+        header = file.tell()
+    # np.memmap maps from the offset rounded down to the allocation granularity
+    start = cube.offset - cube.offset % mmap.ALLOCATIONGRANULARITY
+    position = cube.ctypes.data - np.frombuffer(cube._mmap, dtype=np.uint8).ctypes.data + start
+    if shape != cube.shape or dtype != cube.dtype or fortran_order or not cube.flags.c_contiguous \
+            or position != header:
+        return None
+    return str(path)
+
+
+def _init_worker(cube_spec, out_spec, axis_values, method, window, threshold):
+    cube, cube_shm = _attach(cube_spec)
+    out, out_shm = _attach(out_spec)
+    _worker.update(cube=cube, out=out, handles=(cube_shm, out_shm), axis_values=axis_values, method=method,
+                   window=window, threshold=threshold)
+
+
+def _fit_tile(rows):
+    start, stop = rows
+    _worker['out'][start:stop] = find_resonance(_worker['cube'][:, start:stop], _worker['axis_values'],
+                                                _worker['method'], _worker['window'], _worker['threshold'])
+    return stop - start
+
+
+def fit_resonance_map(cube, axis_values, method='polynomial', window=7, threshold=0.5, tile_rows=None, workers=None):
+    """
+    Resonance map of a (N, H, W) cube, computed in row tiles on a process pool.
+
+    A cube opened whole with ``np.load(..., mmap_mode='r')`` (e.g. the output of SpectralScan) is opened again by
+    each worker, any other array, slices of such a memmap included, is copied once into shared memory. Workers write straight into a shared result.
+    Parameters are those of find_resonance(); `workers` defaults to the number of CPUs.
+    """
+    n, height, width = cube.shape
+    workers = workers or os.cpu_count() or 1
+    if tile_rows is None:
+        # ~1M samples per tile keeps the temporaries of the fit in cache-friendly sizes
+        tile_rows = max(1, (1 << 20) // max(1, n * width))
+
+    if workers == 1 or height <= tile_rows:
+        return find_resonance(cube, axis_values, method, window, threshold)
+
+    shms = []
+    try:
+        path = _whole_npy_memmap(cube)
+        if path is not None:
+            cube_spec = {'kind': 'memmap', 'path': str(path)}
+        else:
+            shm = shared_memory.SharedMemory(create=True, size=cube.nbytes)
+            shms.append(shm)
+            np.ndarray(cube.shape, dtype=cube.dtype, buffer=shm.buf)[:] = cube
+            cube_spec = {'kind': 'shm', 'name': shm.name, 'shape': cube.shape, 'dtype': cube.dtype.str}
+
+        out_shm = shared_memory.SharedMemory(create=True, size=height * width * 4)
+        shms.append(out_shm)
+        out_spec = {'kind': 'shm', 'name': out_shm.name, 'shape': (height, width), 'dtype': np.float32().dtype.str}
+
+        tiles = [(start, min(start + tile_rows, height)) for start in range(0, height, tile_rows)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(cube_spec, out_spec, np.asarray(axis_values), method, window,
+                                           threshold)) as pool:
+            for _ in pool.map(_fit_tile, tiles):
+                pass
+
+        return np.ndarray((height, width), dtype=np.float32, buffer=out_shm.buf).copy()
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
@@ -0,0 +1,43 @@
+"""
+Runs the benchmarks, stores the results as JSON and optionally compares them with a baseline.
+
+    python -m source.benchmarks --output results.json
+    python -m source.benchmarks --baseline results.json --threshold 0.1 -k filter_intensities -k process_ROI
+
+The exit code is 1 if any case is slower than the baseline by more than the threshold.
+"""
+import argparse
+import sys
+
+import source.benchmarks.frame_processing  # noqa: F401  Registers the benchmarks
+from source.benchmarks.harness import run_benchmarks, save_results, load_results, compare
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Frame-processing micro-benchmarks.")
+    parser.add_argument('-k', dest='selection', action='append', help="Only cases containing this string")
+    parser.add_argument('--output', help="Write results to this JSON file")
+    parser.add_argument('--baseline', help="Compare against this JSON file")
+    parser.add_argument('--threshold', type=float, default=0.10, help="Relative slowdown counted as regression")
+    parser.add_argument('--min-time', type=float, default=0.2, help="Timing budget per case [s]")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.selection, min_time=args.min_time)
+    if args.output:
+        save_results(results, args.output)
+
+    if not args.baseline:
+        return 0
+
+    regressions = 0
+    print(f"\n{'case':70s} {'baseline':>12s} {'current':>12s} {'change':>8s}")
+    for case, reference, current, change, regression in compare(results, load_results(args.baseline),
+                                                                args.threshold):
+        regressions += regression
+        flag = "  REGRESSION" if regression else ""
+        print(f"{case:70s} {reference * 1e3:9.3f} ms {current * 1e3:9.3f} ms {change:+8.1%}{flag}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
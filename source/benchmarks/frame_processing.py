@@ -0,0 +1,154 @@
+"""Benchmarks of the per-frame hot paths on synthetic Mono8/Mono12 frames."""
+import os
+
+import numpy as np
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")  # Widgets are benchmarked without a display
+
+from PySide6.QtCore import QObject, Signal
+from PySide6.QtWidgets import QApplication
+
+from source.acquisition.measurements import NoiseStatistics
+from source.benchmarks.harness import benchmark
+from source.processing.calibration import FlatFieldCorrection
+from source.processing.defect_pixels import DefectCorrection
+from source.controller.widgets.ROI_controller import ROIController
+from source.hardware.camera.pixel_formats import FrameUnpacker, PackedFrame, pack_mono12
+from source.view.widgets.image_display import filter_intensities, ImageDisplay
+from source.view.widgets.plotting_widgets import PlotWidget
+
+# (width, height): VGA, SXGA, WUXGA and the full 5 MP sensor
+FRAME_SIZES = ['640x480', '1280x1024', '1920x1200', '2448x2048']
+PIXEL_FORMATS = ['Mono8', 'Mono12']
+ROI_COUNTS = [1, 10, 100, 500]
+
+
+def synthetic_frame(size, pixel_format, seed=0):
+    """Noisy frame with a smooth intensity gradient, the format's full range being used."""
+    width, height = (int(v) for v in size.split('x'))
+    max_value = 255 if pixel_format == 'Mono8' else 4095
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(0.2, 0.8, width)[None, :] * np.linspace(0.5, 1.0, height)[:, None]
+    frame = gradient * max_value + rng.normal(0, 0.02 * max_value, (height, width))
+    return np.clip(frame, 0, max_value).astype(np.uint8 if pixel_format == 'Mono8' else np.uint16)
+
+
+def roi_grid(width, height, count, roi_size=32):
+    """`count` ROIs on a regular grid, in ROIController format."""
+    columns = int(np.ceil(np.sqrt(count * width / height)))
+    rows = int(np.ceil(count / columns))
+    rois = {}
+    for i in range(count):
+        x = (i % columns) * (width - roi_size) // max(1, columns - 1) if columns > 1 else 0
+        y = (i // columns) * (height - roi_size) // max(1, rows - 1) if rows > 1 else 0
+        rois[str(i)] = {"x": x, "y": y, "width": roi_size, "height": roi_size}
+    return rois
+
+
+def application():
+    return QApplication.instance() or QApplication([])
+
+
+class _ROIWidgetStandIn(QObject):
+    """Provides the signals ROIController connects to, without building the table widget."""
+    delete_ROI = Signal(str)
+    delete_all_ROI = Signal()
+    modify_ROI = Signal(object)
+    apply_changes = Signal()
+    detect_spots = Signal()
+
+    def refresh_list(self, rois):
+        pass
+
+
+class _ImageDisplayStandIn(QObject):
+    add_ROI = Signal(list)
+
+    def __init__(self, width, height):
+        super().__init__()
+        self.width = width
+        self.height = height
+        self.current_woi = (0, 0, width, height)
+
+    def update_ROI_dict(self, rois):
+        pass
+
+
+@benchmark('filter_intensities', size=FRAME_SIZES, pixel_format=PIXEL_FORMATS)
+def bench_filter_intensities(size, pixel_format):
+    frame = synthetic_frame(size, pixel_format)
+    return (lambda: filter_intensities(frame, True, True)), frame.size
+
+
+@benchmark('ImageDisplay.display_image', size=FRAME_SIZES, rois=[0, 100])
+def bench_display_image(size, rois):
+    application()
+    frame = synthetic_frame(size, 'Mono12')
+    height, width = frame.shape
+    display = ImageDisplay(width, height)
+    display.timer.stop()  # Timed explicitly instead
+    display.current_image = filter_intensities(frame)
+    if rois:
+        display.update_ROI_dict(roi_grid(width, height, rois))
+    return display.display_image, frame.size
+
+
+@benchmark('ROIController.process_ROI', size=['2448x2048'], rois=ROI_COUNTS)
+def bench_process_roi(size, rois):
+    application()
+    frame = synthetic_frame(size, 'Mono12')
+    height, width = frame.shape
+    controller = ROIController(None, None, _ROIWidgetStandIn(), _ImageDisplayStandIn(width, height))
+    controller.rois = roi_grid(width, height, rois)
+    return (lambda: controller.process_ROI(frame)), frame.size
+
+
+@benchmark('noise_statistics', size=['640x480', '2448x2048'], rois=[1, 100])
+def bench_noise_statistics(size, rois):
+    """The per-frame work of CameraNoiseController.process_frame: ROI crops into the streaming statistics."""
+    application()
+    frame = synthetic_frame(size, 'Mono12')
+    height, width = frame.shape
+    controller = ROIController(None, None, _ROIWidgetStandIn(), _ImageDisplayStandIn(width, height))
+    controller.rois = roi_grid(width, height, rois, roi_size=64)
+    statistics = NoiseStatistics()
+    pixels = sum(r["width"] * r["height"] for r in controller.rois.values())
+    return (lambda: statistics.add(controller.process_ROI(frame))), pixels
+
+
+@benchmark('PlotWidget.plot_data', points=[1000, 100000, 1000000])
+def bench_plot_data(points):
+    application()
+    widget = PlotWidget()
+    rng = np.random.default_rng(0)
+    x, y = rng.random(points), rng.random(points)
+    return (lambda: widget.plot_data(x, y, scatter_plot=True, clear=True)), 0
+
+
+@benchmark('FlatFieldCorrection.process', size=FRAME_SIZES, maps=['dark', 'dark+flat', 'naive'])
+def bench_flat_field(size, maps):
+    frame = synthetic_frame(size, 'Mono12')
+    rng = np.random.default_rng(1)
+    dark = rng.normal(100, 5, frame.shape).astype(np.float32)
+    gain = rng.uniform(0.8, 1.2, frame.shape).astype(np.float32)
+    if maps == 'naive':  # Reference: temporaries allocated per frame
+        return (lambda: (frame.astype(np.float32) - dark) * gain), frame.size
+    stage = FlatFieldCorrection(dark, gain if maps == 'dark+flat' else None)
+    return (lambda: stage.process(frame)), frame.size
+
+
+@benchmark('DefectCorrection.process', size=['2448x2048'], defects=[100, 10000], neighbours=[1, 4])
+def bench_defect_correction(size, defects, neighbours):
+    frame = synthetic_frame(size, 'Mono12')
+    mask = np.zeros(frame.shape, dtype=bool)
+    mask.flat[np.random.default_rng(1).choice(frame.size, defects, replace=False)] = True
+    stage = DefectCorrection(mask, neighbours)
+    return (lambda: stage.process(frame)), defects
+
+
+@benchmark('FrameUnpacker.unpack', size=FRAME_SIZES, pixel_format=['Mono12p', 'Mono12Packed'])
+def bench_unpack(size, pixel_format):
+    frame = synthetic_frame(size, 'Mono12')
+    packed = PackedFrame(pack_mono12(frame, pixel_format), frame.shape, pixel_format)
+    unpacker = FrameUnpacker()
+    return (lambda: unpacker.unpack(packed)), frame.size
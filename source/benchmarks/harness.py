@@ -0,0 +1,115 @@
+"""
+Minimal micro-benchmark harness: registry, timing, JSON results and baseline comparison.
+
+A benchmark is a function decorated with @benchmark(name, **parameter_lists). It is called once per
+combination of parameters and returns (run, pixels): `run` is the zero-argument callable that is timed and
+`pixels` the number of pixels one call processes, used for ns/pixel. Everything done before returning `run`
+is setup and is not timed.
+"""
+import itertools
+import json
+import platform
+import time
+
+import numpy as np
+
+BENCHMARKS = []
+
+
+def benchmark(name, **parameters):
+    """Registers a benchmark over the cartesian product of the `parameters` lists."""
+    def decorator(function):
+        BENCHMARKS.append((name, function, parameters))
+        return function
+    return decorator
+
+
+def case_name(name, parameters):
+    return name + ''.join(f"[{key}={value}]" for key, value in parameters.items())
+
+
+def time_callable(run, min_time=0.2, repeats=5):
+    """
+    Median and minimum seconds per call. The number of calls per repeat is chosen so that one repeat takes
+    about `min_time` / `repeats` seconds.
+    """
+    run()  # Warm-up: caches, lazy initialisation
+    start = time.perf_counter()
+    run()
+    single = max(time.perf_counter() - start, 1e-9)
+    number = max(1, int(min_time / repeats / single))
+
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        samples.append((time.perf_counter() - start) / number)
+    return float(np.median(samples)), float(np.min(samples))
+
+
+def run_benchmarks(selection=None, min_time=0.2, repeats=5, progress=print):
+    """
+    Runs the registered benchmarks whose case name contains any string of `selection` (all if None).
+
+    Returns:
+        dict: {'machine': {...}, 'results': {case: {median_s, min_s, ns_per_pixel, fps}}}
+    """
+    results = {}
+    for name, function, parameters in BENCHMARKS:
+        keys = list(parameters)
+        for values in itertools.product(*(parameters[key] for key in keys)):
+            case_parameters = dict(zip(keys, values))
+            case = case_name(name, case_parameters)
+            if selection and not any(s in case for s in selection):
+                continue
+
+            run, pixels = function(**case_parameters)
+            median, minimum = time_callable(run, min_time, repeats)
+            results[case] = {
+                'median_s': median,
+                'min_s': minimum,
+                'ns_per_pixel': median / pixels * 1e9 if pixels else None,
+                'fps': 1.0 / median,
+            }
+            if progress is not None:
+                per_pixel = f"{results[case]['ns_per_pixel']:8.3f} ns/px" if pixels else " " * 14
+                progress(f"{case:70s} {median * 1e3:10.3f} ms {per_pixel} {1.0 / median:10.1f} fps")
+
+    return {
+        'machine': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'processor': platform.processor(),
+            'system': platform.platform(),
+        },
+        'results': results,
+    }
+
+
+def save_results(results, path):
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2)
+
+
+def load_results(path):
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def compare(results, baseline, threshold=0.10):
+    """
+    Compares the median times of the cases present in both runs.
+
+    Returns:
+        list: (case, baseline median, current median, relative change, is_regression), relative change > 0
+              meaning slower; is_regression when slower by more than `threshold`.
+    """
+    rows = []
+    for case, current in results['results'].items():
+        reference = baseline['results'].get(case)
+        if reference is None:
+            continue
+        change = current['median_s'] / reference['median_s'] - 1.0
+        rows.append((case, reference['median_s'], current['median_s'], change, change > threshold))
+    return rows
@@ -3,12 +3,16 @@ from threading import Lock
 
 from PySide6.QtCore import QThread, Signal
 
+from source.utilities.telemetry import telemetry
+
 class CameraWorkerThread(QThread):
     fps_updated = Signal(float)
     frame_received = Signal(object)
     frame_received_6FPS = Signal(object)
+    exposure_changed = Signal(float)
 
-    def __init__(self, camera, target_fps = 60, FPS_averaging = 1.0):
+    def __init__(self, camera, target_fps = 60, FPS_averaging = 1.0, pipeline = None, auto_exposure = None,
+                 analysis_pool = None, frame_server = None, logger = None):
         super().__init__()
         self.camera = camera
         self.start_time = time.time()
@@ -17,6 +21,11 @@ class CameraWorkerThread(QThread):
         self._stop_flag = False
         self._lock = Lock()  # New: Lock for thread-safe flag access
         self.FPS_averaging = FPS_averaging
+        self.pipeline = pipeline  # Optional FramePipeline applied to every frame before it is emitted
+        self.auto_exposure = auto_exposure  # Optional AutoExposure fed with the raw frames
+        self.analysis_pool = analysis_pool  # Optional AnalysisPool the processed frames are handed to
+        self.frame_server = frame_server  # Optional FrameServer streaming the processed frames to local clients
+        self.logger = logger  # Optional Logging, errors of the hooks are printed without it
 
     def run(self):
         """Override the run method to execute code in the thread."""
@@ -31,10 +40,51 @@ class CameraWorkerThread(QThread):
                     break
 
             # Acquire the frame from the camera
+            grab_start = time.perf_counter()
             image = self.camera.acquire_image()
             if image is not None:
+                telemetry.record('camera.grab', time.perf_counter() - grab_start)
+                raw = image
+                auto_exposure = self.auto_exposure
+                if auto_exposure is not None:
+                    try:
+                        with telemetry.measure('auto_exposure'):
+                            exposure = auto_exposure.update(image)
+                    except Exception as e:
+                        # E.g. an SDK error setting the exposure: reported once, the exposure stays where it is
+                        self.auto_exposure = None
+                        self.report(f"Auto exposure detached: {e}")
+                        exposure = None
+                    if exposure is not None:
+                        self.exposure_changed.emit(exposure)
+                if self.pipeline is not None and len(self.pipeline):
+                    try:
+                        image = self.pipeline.process(image)
+                    except ValueError as e:
+                        # E.g. maps not matching a new WOI: reported once, the raw frames are emitted until the
+                        # controller attaches a pipeline again
+                        self.pipeline = None
+                        self.report(f"Frame pipeline detached: {e}")
+                analysis_pool = self.analysis_pool
+                if analysis_pool is not None:
+                    try:
+                        analysis_pool.submit(image)
+                    except ValueError as e:
+                        # E.g. frames of a new WOI: reported once, no analysis until a pool of that shape is attached
+                        self.analysis_pool = None
+                        self.report(f"Frame analysis detached: {e}")
+                frame_server = self.frame_server
+                if frame_server is not None:
+                    frame_server.publish_frame(image)
                 #images = self.camera.process_ROI(image.copy())
-                self.frame_received.emit(image)
+                # Frames of the pipeline stages and of the unpacker live in ring buffers reused a few frames later,
+                # while the queued signal may wait longer in the GUI event loop: the slots get a frame of their own
+                if image is not raw or self.camera.reuses_buffer(image):
+                    with telemetry.measure('camera.copy'):
+                        image = image.copy()
+                telemetry.frame_sent('frame_received', image)
+                with telemetry.measure('camera.emit'):
+                    self.frame_received.emit(image)
 
             # FPS calculation
             current_time = time.time()
@@ -49,7 +99,9 @@ class CameraWorkerThread(QThread):
 
             if current_time - self._last_emit_6fps >= 1 / 6:
                 if image is not None:
-                    self.frame_received_6FPS.emit(image.copy())
+                    # The emitted frame is already the slots' own, the preview shares it
+                    telemetry.frame_sent('frame_received_6FPS', image)
+                    self.frame_received_6FPS.emit(image)
                 self._last_emit_6fps = current_time
 
             # Calculate the time taken to acquire the frame and adjust to hit target FPS
@@ -57,6 +109,13 @@ class CameraWorkerThread(QThread):
             sleep_time = max(0.0, frame_time - frame_duration)  # Ensure we don’t sleep for a negative duration
             self.interruptible_sleep(sleep_time)
 
+    def report(self, message):
+        """Reports an error of a hook, through the logger if there is one."""
+        if self.logger is not None:
+            self.logger.error(message)
+        else:
+            print(message)
+
     def interruptible_sleep(self, duration):
         """Sleep in small chunks and check stop_flag to allow fast thread termination."""
         sleep_interval = 0.01  # 10 ms
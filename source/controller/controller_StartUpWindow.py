@@ -1,13 +1,22 @@
-from PySide6.QtCore import Signal
+from PySide6.QtCore import Signal, QTimer
 from PySide6.QtGui import QImage
 from PySide6.QtWidgets import QMessageBox, QPushButton, QListWidget, QLabel, QVBoxLayout, QDialog
 
+from source.controller.projects.controller_angular_scan import AngularScanController
 from source.controller.projects.controller_camera_FPS import CameraFPSController
 from source.controller.projects.controller_camera_noise import CameraNoiseController
+from source.controller.projects.controller_imaging import ImagingController
+from source.controller.projects.controller_slm import SLMController
+from source.controller.projects.controller_spectroscopy import SpectroscopyController
 from source.controller.settings.controller_settings_camera import CameraSettingsController
+from source.view.tabs.view_angular_scan import AngularScanView
 from source.view.tabs.view_camera_FPS import CameraFPSView
 from source.view.tabs.view_camera_noise import CameraNoiseView
 from source.view.tabs.view_imaging import ImagingView
+from source.view.tabs.view_slm import SLMView
+from source.view.tabs.view_spectroscopy import SpectroscopyView
+from source.utilities.project_file import ProjectFile
+from source.utilities.telemetry import telemetry
 
 
 class StartUpWindowController:
@@ -27,12 +36,18 @@ class StartUpWindowController:
         # Initialize devices
         self.reload_devices()
 
+        # Refresh the pipeline telemetry table once per second
+        self.telemetry_timer = QTimer()
+        self.telemetry_timer.timeout.connect(lambda: self.view.update_telemetry(telemetry.snapshot()))
+        self.telemetry_timer.start(1000)
+
     def _connect_signals(self) -> None:
         """Set up signal connections."""
         self.view.device_activate_click.connect(self.on_device_activated)
         self.view.on_settings_clicked.connect(self.open_settings_window)
         self.view.new_project.connect(self.new_project)
-        self.logger.update.connect(self.view.add_log)
+        self.view.open_project.connect(self.open_project)
+        self.logger.records.connect(self.view.add_logs)
 
     def reload_devices(self) -> None:
         """Reload and refresh device list."""
@@ -73,8 +88,39 @@ class StartUpWindowController:
             case "Imaging":
                 self.imaging_view = ImagingView()
                 self.imaging_view.show()
+                self.imaging_controller = ImagingController(self.model, self.imaging_view)
             case "Spectroscopy":
-                pass
+                camera_dialog = CameraSelectorDialog(self.model)
+                if camera_dialog.exec() != QDialog.Accepted:
+                    print("Camera selection canceled.")
+                    return
+                filter_dialog = CameraSelectorDialog(self.model, device_type='filter')
+                if filter_dialog.exec() != QDialog.Accepted:
+                    print("Filter selection canceled.")
+                    return
+
+                self.spectroscopy_view = SpectroscopyView()
+                self.spectroscopy_view.show()
+                self.spectroscopy_controller = SpectroscopyController(self.model, self.spectroscopy_view,
+                                                                      camera_serial=camera_dialog.get_selected_serial(),
+                                                                      filter_serial=filter_dialog.get_selected_serial(),
+                                                                      logger=self.logger)
+            case "Angular_scan":
+                camera_dialog = CameraSelectorDialog(self.model)
+                if camera_dialog.exec() != QDialog.Accepted:
+                    print("Camera selection canceled.")
+                    return
+                motor_dialog = CameraSelectorDialog(self.model, device_type='k_cube_KDC')
+                if motor_dialog.exec() != QDialog.Accepted:
+                    print("Rotation stage selection canceled.")
+                    return
+
+                self.angular_scan_view = AngularScanView()
+                self.angular_scan_view.show()
+                self.angular_scan_controller = AngularScanController(self.model, self.angular_scan_view,
+                                                                     camera_serial=camera_dialog.get_selected_serial(),
+                                                                     motor_serial=motor_dialog.get_selected_serial(),
+                                                                     logger=self.logger)
             case "Camera_FPS_meter":
                 self.camera_FPS_view = CameraFPSView()
                 self.camera_FPS_view.show()
@@ -82,26 +128,44 @@ class StartUpWindowController:
             case "Camera_noise":
                 dialog = CameraSelectorDialog(self.model)
                 if dialog.exec() == QDialog.Accepted:
-                    selected_serial = dialog.get_selected_serial()
-
-                    camera = self.model.device_manager.loaded_devices[selected_serial]
-                    width = camera.get_width_min_max()[1]
-                    height = camera.get_height_min_max()[1]
-                    camera.set_width(width)
-                    camera.set_height(height)
-                    camera.set_bitdepth(12)
-
-                    self.camera_noise_view = CameraNoiseView(width, height)
-                    self.camera_noise_view.show()
-                    self.camera_noise_view.show()
-                    self.camera_noise_controller = CameraNoiseController(self.model, self.camera_noise_view,
-                                                                         serial=selected_serial)
-
+                    self.open_camera_noise(dialog.get_selected_serial())
                 else:
                     print("Camera selection canceled.")
 
             case "SLM":
-                pass
+                self.slm_view = SLMView(SLMController.available_screens(), SLMController.available_models())
+                self.slm_view.show()
+                self.slm_controller = SLMController(self.slm_view, logger=self.logger)
+
+    def open_camera_noise(self, serial):
+        camera = self.model.device_manager.loaded_devices[serial]
+        width = camera.get_width_min_max()[1]
+        height = camera.get_height_min_max()[1]
+        camera.set_width(width)
+        camera.set_height(height)
+        camera.set_bitdepth(12)
+
+        self.camera_noise_view = CameraNoiseView(width, height)
+        self.camera_noise_view.show()
+        self.camera_noise_controller = CameraNoiseController(self.model, self.camera_noise_view, serial=serial)
+
+    def open_project(self, path):
+        """Opens the project window of a project file and restores it. Only the file metadata is read here."""
+        with ProjectFile(path) as project:
+            project_type = project.metadata.get('type')
+            serial = project.metadata.get('serial')
+        match project_type:
+            case "Imaging":
+                self.new_project("Imaging")
+                self.imaging_controller.load_project(path)
+            case "Camera_noise":
+                if not self.model.device_manager.is_device_loaded(serial):
+                    print(f"Camera {serial} of the project is not loaded")
+                    return
+                self.open_camera_noise(serial)
+                self.camera_noise_controller.load_project(path)
+            case _:
+                print(f"Projects of type {project_type} cannot be opened")
 
     def select_camera(self):
         dialog = CameraSelectorDialog(self.model, self)
@@ -112,13 +176,14 @@ class StartUpWindowController:
             print("Camera selection cancelled.")
 
 class CameraSelectorDialog(QDialog):
-    def __init__(self, model, parent=None):
+    def __init__(self, model, parent=None, device_type='camera'):
         super().__init__(parent)
-        self.setWindowTitle("Select Camera")
+        self.setWindowTitle(f"Select {device_type.capitalize()}")
         self.setModal(True)
         self.setMinimumSize(300, 200)
 
         self.model = model
+        self.device_type = device_type
         self.selected_serial = None
 
         self._setup_ui()
@@ -127,7 +192,7 @@ class CameraSelectorDialog(QDialog):
     def _setup_ui(self):
         layout = QVBoxLayout()
 
-        label = QLabel("Select camera:")
+        label = QLabel(f"Select {self.device_type}:")
         self.device_list = QListWidget()
 
         self.ok_button = QPushButton("OK")
@@ -143,13 +208,13 @@ class CameraSelectorDialog(QDialog):
         connected_devices = self.model.device_manager.list_connected_devices()
         for serial, info in connected_devices.items():
             device_type = info.get('type', None)
-            if device_type == 'camera' and self.model.device_manager.is_device_loaded(serial):
+            if device_type == self.device_type and self.model.device_manager.is_device_loaded(serial):
                 self.device_list.addItem(serial)
 
     def _on_ok_clicked(self):
         selected_items = self.device_list.selectedItems()
         if not selected_items:
-            QMessageBox.warning(self, "No Selection", "Please select a camera.")
+            QMessageBox.warning(self, "No Selection", f"Please select a {self.device_type}.")
             return
 
         self.selected_serial = selected_items[0].text()
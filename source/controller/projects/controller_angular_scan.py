@@ -0,0 +1,186 @@
+import time
+
+import numpy as np
+from PySide6.QtCore import QThread, Signal
+
+from source.acquisition.angular_scan import AngularScan
+from source.acquisition.resonance_tracking import AngleActuator, ResonanceTracker, tracking_rois
+from source.controller.CameraWorker import CameraWorkerThread
+from source.utilities.project_file import project_rois
+from source.utilities.telemetry import telemetry
+
+
+class AngularScanWorker(QThread):
+    step_acquired = Signal(int, float, float)  # (step or frame, angle, mean intensity)
+    scan_finished = Signal(str)  # path of the cube
+    scan_failed = Signal(str)
+
+    CONTINUOUS_UPDATE_INTERVAL = 0.1  # A sweep reports every frame, the plot is updated at most this often [s]
+
+    def __init__(self, scan):
+        super().__init__()
+        self.scan = scan
+        self._last_update = 0.0
+
+    def run(self):
+        try:
+            self.scan.run(progress=self._on_step)
+            self.scan_finished.emit(self.scan.output_path)
+        except Exception as e:
+            self.scan_failed.emit(str(e))
+
+    def _on_step(self, step, angle, frame):
+        if self.scan.mode == 'continuous':
+            now = time.monotonic()
+            if now - self._last_update < self.CONTINUOUS_UPDATE_INTERVAL:
+                return
+            self._last_update = now
+        # Subsampled mean: cheap, and enough for the live curve
+        self.step_acquired.emit(step, float(angle), float(frame[::8, ::8].mean()))
+
+    def stop(self):
+        self.scan.stop()
+        self.wait()
+
+
+class AngularScanController:
+
+    def __init__(self, model, project_view, camera_serial, motor_serial, logger=None):
+        self.model = model
+        self.project_view = project_view
+        self.logger = logger
+
+        self.camera = self.model.device_manager.loaded_devices[camera_serial]
+        self.motor = self.model.device_manager.loaded_devices[motor_serial]
+        self.worker = None
+        self.scan = None  # Last scan, its temporary cube is kept until the next scan
+        self.camera_thread = None  # Live frames of the resonance tracking
+        self.tracker = None
+        self.rois = {}  # ROIs tracked, the whole frame if empty
+
+        self.project_view.set_angle(self.motor.get_position())
+
+        self.project_view.start_scan.connect(self.start_scan)
+        self.project_view.stop_scan.connect(self.stop_scan)
+        self.project_view.start_tracking.connect(self.start_tracking)
+        self.project_view.stop_tracking.connect(self.stop_tracking)
+        self.project_view.load_rois.connect(self.load_rois)
+        self.project_view.closed.connect(self.close)
+
+    def close(self):
+        """Stops a running scan and the tracking and releases the last cube, called when the window is closed."""
+        self.stop_scan()
+        self.stop_tracking()
+        if self.scan is not None:
+            self.scan.close()
+
+    def start_scan(self, parameters: dict):
+        if self.worker is not None and self.worker.isRunning():
+            return
+        if self.tracker is not None:
+            return  # The scan and the tracking both drive the stage
+        if self.scan is not None:
+            self.scan.close()
+
+        step = parameters['step'] if parameters['stop'] >= parameters['start'] else -parameters['step']
+        angles = np.arange(parameters['start'], parameters['stop'] + step / 2, step)
+        self.scan = AngularScan(self.camera, self.motor, angles, mode=parameters['mode'],
+                                frames_per_step=parameters['frames_per_step'],
+                                discard_frames=parameters['discard_frames'],
+                                output_path=parameters.get('output_path'))
+
+        self.worker = AngularScanWorker(self.scan)
+        self.worker.step_acquired.connect(self.on_step_acquired)
+        self.worker.scan_finished.connect(self.on_scan_finished)
+        self.worker.scan_failed.connect(self.on_scan_failed)
+
+        self.project_view.scan_started(len(angles) if parameters['mode'] == 'step' else 0)
+        self.worker.start()
+
+    def stop_scan(self):
+        if self.worker is not None:
+            self.worker.stop()
+
+    def on_step_acquired(self, step, angle, mean):
+        self.project_view.update_curve(step, angle, mean)
+
+    def on_scan_finished(self, path):
+        self.project_view.scan_finished(path)
+        if self.logger is not None:
+            kept = " (temporary, deleted by the next scan)" if self.scan.temporary else ""
+            self.logger.info(f"Angular scan saved to {path}{kept}")
+
+    def on_scan_failed(self, message):
+        self.project_view.scan_finished(None)
+        if self.logger is not None:
+            self.logger.error(f"Angular scan failed: {message}")
+
+    def load_rois(self, path):
+        """Tracks the ROIs saved in a project file (e.g. a camera noise project) instead of the whole frame."""
+        try:
+            rois = project_rois(path)
+        except (OSError, ValueError) as e:
+            if self.logger is not None:
+                self.logger.error(f"ROIs of {path} could not be read: {e}")
+            return
+        if not rois:
+            if self.logger is not None:
+                self.logger.error(f"{path} has no ROIs")
+            return
+        self.rois = rois
+        self.project_view.rois_loaded(len(rois), path)
+
+    def start_tracking(self, parameters: dict):
+        """
+        Tracks the working point of the ROIs (the whole frame without ROIs) with the stage angle, on live frames
+        of a camera thread.
+        """
+        if self.tracker is not None or (self.worker is not None and self.worker.isRunning()):
+            return
+        woi = self.camera.get_woi()
+        rois = tracking_rois(self.rois, woi[2], woi[3])
+        if len(rois) < len(self.rois) and self.logger is not None:
+            self.logger.warning(f"{len(self.rois) - len(rois)} ROIs lie outside the {woi[2]} x {woi[3]} frame")
+        if not rois:
+            return
+        tracker = ResonanceTracker(AngleActuator(self.motor), rois, dither=parameters['dither'],
+                                   gain=parameters['gain'], on_update=self.on_tracking_update)
+        try:
+            tracker.start()
+        except (RuntimeError, ValueError) as e:
+            # E.g. a dither beyond the stage limits
+            if self.logger is not None:
+                self.logger.error(f"Resonance tracking failed to start: {e}")
+            return
+        self.tracker = tracker
+
+        self.camera_thread = CameraWorkerThread(self.camera, logger=self.logger)
+        self.camera_thread.frame_received.connect(self.on_tracking_frame)
+        self.camera_thread.start()
+        self.project_view.tracking_started()
+
+    def stop_tracking(self):
+        if self.tracker is not None:
+            self.tracker.stop()
+            self.tracker = None
+        if self.camera_thread is not None:
+            self.camera_thread.stop()
+            self.camera_thread.deleteLater()
+            self.camera_thread = None
+            self.camera.pause()
+        self.project_view.tracking_stopped()
+
+    def on_tracking_frame(self, image):
+        telemetry.frame_received('frame_received', image)
+        if self.tracker is None:
+            return  # Queued before the tracking stopped
+        try:
+            self.tracker.process_frame(image)
+        except Exception as e:
+            # Stage errors (e.g. a limit), or a working point off resonance
+            if self.logger is not None:
+                self.logger.error(f"Resonance tracking stopped: {e}")
+            self.stop_tracking()
+
+    def on_tracking_update(self, angle, error, intensities):
+        self.project_view.update_tracking(angle, error)
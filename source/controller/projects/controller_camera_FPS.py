@@ -1,124 +1,94 @@
-import numpy as np
-
-from source.controller.CameraWorker import CameraWorkerThread
-
-
-class CameraFPSController:
 
-    def __init__(self, model, project_view, serial = '40463210'):
-        self.model = model
-        self.project_view = project_view
+import numpy as np
+from PySide6.QtCore import QThread, Signal
 
-        self.serial = serial
+from source.acquisition.frame_rate_characterisation import FrameRateCharacterisation
 
-        self.camera = self.model.device_manager.loaded_devices[self.serial]
-        self.worker_thread = CameraWorkerThread(self.camera, FPS_averaging = 10.0, target_fps=1000000)
 
-        self.worker_thread.fps_updated.connect(self.on_fps_measurement_exposure)
+class FrameRateCharacterisationThread(QThread):
+    """Runs a FrameRateCharacterisation off the GUI thread and reports its points and the fitted model."""
+    point_measured = Signal(dict)
+    model_fitted = Signal(object)
+    failed = Signal(str)
 
-        self.start_measurement_exposure()
+    def __init__(self, characterisation):
+        super().__init__()
+        self.characterisation = characterisation
+        self.characterisation.on_point = self.point_measured.emit
 
-    def start_measurement_exposure(self):
-        self.exposure_bounds = self.camera.get_exposure_min_max()
-        self.exposure = self.get_random_exposure()
-        self.worker_thread.start()
+    def run(self):
+        try:
+            model = self.characterisation.run()
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.model_fitted.emit(model)
 
-    def start_measurement_height(self):
-        self.height_bounds = self.camera.get_height_min_max()
-        self.height = self.height_bounds[1]
-        settings = {'exposure': {'value': 0.0161}, 'height': {'value': self.height}}
+    def stop(self):
+        self.characterisation.stop()
+        self.wait()
 
-        self.model.device_manager.set_device_settings(self.serial, settings)
-        self.worker_thread.start()
-
-    def start_measurement_both(self):
-        self.exposure_bounds = (0.02, 100)
-        self.height_bounds = self.camera.get_height_min_max()
-        self.exposure = self.get_random_exposure()
-        self.height = int(self.get_random_height())
-        settings = {'exposure': {'value': self.exposure}, 'height': {'value': self.height}}
-        self.model.device_manager.set_device_settings(self.serial, settings)
-        self.worker_thread.start()
 
+class CameraFPSController:
 
-    def get_random_exposure(self):
-        """
-        Select a random exposure time from the bounds (0.02, 100) logarithmically.
-        Lower values should have a higher chance of being selected.
-        """
-        min_exposure, max_exposure = self.exposure_bounds
+    def __init__(self, model, project_view, serial = '40463210', frames=50, refine_levels=2):
+        self.model = model
+        self.project_view = project_view
 
-        # Logarithmic sampling:
-        log_min = np.log(min_exposure)
-        log_max = np.log(max_exposure)
+        self.serial = serial
 
-        # Sample a value from the logarithmic range
-        log_sample = np.random.uniform(log_min, log_max)
+        self.camera = self.model.device_manager.loaded_devices[self.serial]
+        self.readout_model = None
 
-        # Exponentiate to return a value in the original exposure range
-        exposure = np.exp(log_sample)
+        exposures, heights, widths = self.default_grid()
+        self.characterisation = FrameRateCharacterisation(self.camera, exposures, heights, widths, frames=frames,
+                                                          refine_levels=refine_levels)
+        self.worker_thread = FrameRateCharacterisationThread(self.characterisation)
+        self.worker_thread.point_measured.connect(self.on_point_measured)
+        self.worker_thread.model_fitted.connect(self.on_model_fitted)
+        self.worker_thread.failed.connect(self.on_failed)
 
-        return exposure
+        self.start_measurement()
 
-    def get_random_height(self):
+    def default_grid(self):
         """
-        Select a random exposure time from the bounds (0.02, 100) logarithmically.
-        Lower values should have a higher chance of being selected.
+        12 log-spaced exposures from the minimum to 100 ms, 6 heights over the sensor and the full and half width.
+        Heights and widths are multiples of 16 px, which every Basler increment divides.
         """
-        min_height, max_height = self.height_bounds
-
-        # Sample a value from the  range
-        height = np.random.uniform(min_height, max_height)
-
-        return int(height)
+        exposure_min = max(self.camera.get_exposure_min_max()[0], 0.02)
+        exposures = np.geomspace(exposure_min, 100.0, 12)
 
-    def on_fps_measurement_exposure(self, fps):
-        print(f"FPS: {fps}, Exposure: {self.exposure}")
-        self.project_view.plot_widget.update_plot(self.exposure, fps)
+        height_min, height_max = self.camera.get_height_min_max()
+        heights = np.unique(np.clip(np.linspace(height_min, height_max, 6) // 16 * 16, height_min, height_max))
 
-        self.worker_thread.stop()
-        self.model.device_manager.loaded_devices[self.serial].pause()
-
-        self.exposure = self.get_random_exposure()
-
-        settings = {'exposure': {'value': self.exposure}}
+        width_min, width_max = self.camera.get_width_min_max()
+        widths = sorted({width_max, max(width_min, width_max // 32 * 16)}, reverse=True)
+        return exposures, heights.astype(int), widths
 
-        self.model.device_manager.set_device_settings(self.serial, settings)
-        target_fps = self.model.device_manager.loaded_devices[self.serial].target_fps
-
-        self.worker_thread.update_fps(target_fps)
+    def start_measurement(self):
         self.worker_thread.start()
 
-    def on_fps_measurement_height(self, fps):
-        print(f"FPS: {fps}, Height: {self.height}")
-        self.project_view.plot_widget_2.update_plot(self.height, fps)
-
+    def stop_measurement(self):
         self.worker_thread.stop()
-        self.model.device_manager.loaded_devices[self.serial].pause()
 
-        if self.height > self.height_bounds[0]:
-            self.height = self.height-1
-        else:
+    def on_point_measured(self, point):
+        fps = point['fps']
+        print(f"FPS: {fps:.2f}, Exposure: {point['exposure']:.4f} ms, WOI: {point['width']}x{point['height']}")
+        self.project_view.plot_widget.update_plot(point['exposure'], fps)
+        self.project_view.plot_widget_2.update_plot(point['height'], fps)
+        if point['width'] == self.characterisation.widths[0]:
+            self.project_view.plot_widget_3.update_plot(point['height'], point['exposure'], fps)
+
+    def on_model_fitted(self, readout_model):
+        self.readout_model = readout_model
+        self.project_view.plot_widget_3.finish()
+        if readout_model is None:
             return
-
-        settings = {'height': {'value': self.height}}
-
-        self.model.device_manager.set_device_settings(self.serial, settings)
-        self.worker_thread.start()
-
-    def on_fps_measurement_both(self, fps):
-        print(f"FPS: {fps}, Exposure: {self.exposure}, Height: {self.height}")
-        self.project_view.plot_widget_3.update_plot(self.exposure, self.height, fps)
-
-        self.worker_thread.stop()
-        self.model.device_manager.loaded_devices[self.serial].pause()
-
-        self.exposure = self.get_random_exposure()
-        self.height = self.get_random_height()
-
-        settings = {'exposure': {'value': self.exposure}, 'height': {'value': self.height}}
-        self.model.device_manager.set_device_settings(self.serial, settings)
-        target_fps = self.model.device_manager.loaded_devices[self.serial].target_fps * 40.0
-
-        self.worker_thread.update_fps(target_fps)
-        self.worker_thread.start()
\ No newline at end of file
+        if self.camera.frame_rate_planner is not None:
+            self.camera.frame_rate_planner.set_model(readout_model)
+        points = self.characterisation.points
+        duration = self.characterisation.duration
+        print(f"{len(points)} points measured" + (f" in {duration:.1f} s" if duration else "") + f": {readout_model}")
+
+    def on_failed(self, message):
+        print(f"Frame rate characterisation of camera {self.serial} failed: {message}")
@@ -1,13 +1,30 @@
-import random
-from collections import deque
+import time
 
 import numpy as np
+from PySide6.QtCore import QObject, QTimer, Signal
 
+from source.acquisition.auto_exposure import AutoExposure
+from source.acquisition.measurements import NoiseStatistics, read_noise_statistics
 from source.controller.CameraWorker import CameraWorkerThread
 from source.controller.widgets.ROI_controller import ROIController
+from source.processing.analysis_pool import AnalysisPool, FrameStatisticsStage, ROIMeansStage
+from source.processing.calibration import CALIBRATION_KINDS, CalibrationStore, FlatFieldCorrection, MasterFrame, \
+    flat_gain
+from source.processing.defect_pixels import DefectCorrection, combine_defects, detect_defects
+from source.processing.pipeline import FramePipeline
+from source.utilities.project_file import ProjectFile, camera_settings
+from source.utilities.telemetry import telemetry
+
+
+class AnalysisResults(QObject):
+    """Hands the results of an AnalysisPool from its executor threads over to the GUI thread."""
+    received = Signal(object)
 
 
 class CameraNoiseController:
+    ANALYSIS_WORKERS = 2  # Worker processes of the live ROI statistics
+    ANALYSIS_UPDATE_INTERVAL = 0.2  # Seconds between updates of the displayed statistics
+    DRIFT_INTERVAL = 3  # Preview frames (6 FPS) between drift estimates
 
     def __init__(self, model, project_view, serial, full_well_capacity = 182000):
         self.model = model
@@ -21,6 +38,20 @@ class CameraNoiseController:
         # Setup camera
         self.camera = self.model.device_manager.loaded_devices[self.serial]
         self.camera_thread = None
+        self.pipeline = FramePipeline()  # Shared by every camera thread of this controller
+
+        # Dark/flat calibration
+        self.calibration_store = CalibrationStore()
+        self.master_frame = None  # MasterFrame being captured
+        self.master_kind = None
+        self.auto_exposure = None  # AutoExposure fed by the camera thread
+
+        # Live statistics: the camera thread hands the processed frames to an analysis pool
+        self.analysis_pool = None
+        self._analysis_key = None  # (frame shape, ROIs) the pool was started for
+        self._last_analysis_update = 0.0
+        self.analysis_results = AnalysisResults()
+        self.analysis_results.received.connect(self.on_analysis_result)
         self.start_camera_thread()
 
         # Setup spinbox exposure values
@@ -40,17 +71,31 @@ class CameraNoiseController:
         self.ROI_controller = ROIController(self.model, self.serial, self.project_view.roi_widget, self.project_view.image_display)
         self.ROI_controller.start_camera_thread.connect(self.start_camera_thread)
         self.ROI_controller.stop_camera_thread.connect(self.stop_camera_thread)
+        self.ROI_controller.rois_changed.connect(self.update_auto_exposure_rois)
 
         # data processing initialization
         self.full_well_capacity = full_well_capacity
-        self.data = None  # Will hold per-pixel intensity histories
+        self.statistics = None  # Streaming per-pixel statistics of the running measurement
         self.max_frames = 200
         self.means = None  # Will be 1D array of per-pixel means
         self.vars = None   # Will be 1D array of per-pixel stds
         self.processed = False  # Flag to ensure one-time processing
+        self.defects = {}  # {roi_id: defect mask} of the last measurement
+        self.project = None  # ProjectFile loaded for review
 
         # Connects
         self.project_view.button_start.clicked.connect(self.start_measurement)
+        self.project_view.button_dark.clicked.connect(lambda: self.start_calibration('dark'))
+        self.project_view.button_flat.clicked.connect(lambda: self.start_calibration('flat'))
+        self.project_view.checkbox_calibration.toggled.connect(self.apply_calibration)
+        self.project_view.button_defects.clicked.connect(self.save_defect_map)
+        self.project_view.checkbox_defects.toggled.connect(self.apply_defect_correction)
+        self.project_view.checkbox_auto_exposure.toggled.connect(self.set_auto_exposure)
+        self.project_view.checkbox_analysis.toggled.connect(self.set_live_analysis)
+        self.project_view.checkbox_drift.toggled.connect(self.set_drift_tracking)
+        self.project_view.save_project.connect(self.save_project)
+        self.project_view.open_project.connect(self.load_project)
+        self.project_view.closed.connect(self.close)
 
         # Update spinbox
         self.project_view.spinbox_max_frames.setValue(self.max_frames)
@@ -60,8 +105,11 @@ class CameraNoiseController:
             self.camera_thread.stop()
             self.camera_thread.deleteLater()
 
-        self.camera_thread = CameraWorkerThread(self.camera)
+        self.camera_thread = CameraWorkerThread(self.camera, pipeline=self.pipeline, auto_exposure=self.auto_exposure,
+                                                analysis_pool=self.analysis_pool,
+                                                logger=self.model.device_manager.logger)
         self.camera_thread.frame_received.connect(self.process_frame)
+        self.camera_thread.exposure_changed.connect(self.on_exposure_changed)
         self.camera_thread.frame_received_6FPS.connect(self.process_frame_60FPS)
         self.camera_thread.start() # This should start the thread and call `run`
 
@@ -71,90 +119,341 @@ class CameraNoiseController:
             self.camera_thread.deleteLater()
             self.camera.pause()
 
+    def close(self):
+        """Stops the camera thread and the analysis workers and closes the project, called when the window is closed."""
+        self.stop_camera_thread()
+        self.camera_thread = None
+        if self.analysis_pool is not None:
+            # The camera thread is stopped, nothing writes into the ring any more
+            self.analysis_pool.close(wait=False)
+            self.analysis_pool = None
+            self._analysis_key = None
+        if self.project is not None:
+            self.project.close()
+            self.project = None
+
     def start_measurement(self):
         self.max_frames = self.project_view.spinbox_max_frames.value()
 
-        self.data = None
+        self.statistics = None
         self.processed = False
         self.start_processing = True
 
     def set_exposure(self, exposure: float):
+        self.project_view.checkbox_auto_exposure.setChecked(False)  # A manual exposure ends auto exposure
         self.stop_camera_thread()
 
         settings = {'exposure': {'value': exposure}}
         self.model.device_manager.set_device_settings(self.serial, settings)
+        if self.project_view.checkbox_calibration.isChecked():
+            self.apply_calibration(True)  # Dark frame of the new exposure
 
         self.start_camera_thread()
 
+    def set_auto_exposure(self, enabled):
+        """
+        Starts or stops the software auto exposure on the ROIs (the whole frame without ROIs). The black level is
+        taken from the stored dark frame when there is one.
+        """
+        if not enabled:
+            self.auto_exposure = None
+        else:
+            dark = self.calibration_store.find('dark', self.serial, self.camera.get_woi(), self.camera.get_exposure())
+            black_level = float(dark.mean()) if dark is not None else 0.0
+            self.auto_exposure = AutoExposure(self.camera, rois=self.ROI_controller.rois, black_level=black_level)
+        if self.camera_thread is not None:
+            self.camera_thread.auto_exposure = self.auto_exposure
+
+    def update_auto_exposure_rois(self):
+        # The camera thread reads the ROIs of the auto exposure, it gets a copy of every edit
+        if self.auto_exposure is not None:
+            self.auto_exposure.set_rois(self.ROI_controller.rois)
+
+    def on_exposure_changed(self, exposure):
+        self.project_view.spinbox_exposure.setValue(exposure)
+        if self.project_view.checkbox_calibration.isChecked():
+            self.apply_calibration(True)  # Dark frame of the new exposure
+
     def set_max_frames(self, max_frames: int):
         self.max_frames = max_frames
 
-        # Reset data so that new deques with updated maxlen are created
-        self.data = None
+        # Reset data so that a new measurement starts with the updated frame count
+        self.statistics = None
         self.processed = False
         self.start_processing = False  # Or True if you want to start immediately
 
 
+    def start_calibration(self, kind):
+        """Captures a master dark or flat frame over the next `max_frames` frames, on raw frames."""
+        self.max_frames = self.project_view.spinbox_max_frames.value()
+        self.project_view.checkbox_calibration.setChecked(False)
+        self.master_frame = MasterFrame('mean')
+        self.master_kind = kind
+        print(f"Capturing {kind} frame over {self.max_frames} frames")
+
+    def finish_calibration(self):
+        master = self.master_frame.result()
+        kind, frames = self.master_kind, self.master_frame.count
+        self.master_frame = None
+        self.master_kind = None
+
+        woi = self.camera.get_woi()
+        exposure = self.camera.get_exposure()
+        if kind == 'dark':
+            path = self.calibration_store.save('dark', self.serial, master, woi, exposure, frames)
+        else:
+            dark = self.calibration_store.find('dark', self.serial, woi, exposure)
+            if dark is None:
+                print("No dark frame stored for this camera and WOI, the flat field is not dark-subtracted")
+            path = self.calibration_store.save('flat', self.serial, flat_gain(master, dark), woi, frames=frames)
+        print(f"Master {kind} frame saved to {path}")
+
+    def apply_calibration(self, enabled):
+        """Adds or removes the dark/flat correction of the current exposure and WOI to the frame pipeline."""
+        if not enabled:
+            self.pipeline.remove(FlatFieldCorrection.name)
+            self.attach_pipeline()
+            return
+        stage = FlatFieldCorrection.from_store(self.calibration_store, self.serial, self.camera.get_woi(),
+                                               self.camera.get_exposure())
+        if stage is None:
+            print(f"No calibration stored for camera {self.serial} at this WOI")
+            self.project_view.checkbox_calibration.setChecked(False)
+            return
+        self.pipeline.add(stage, index=0)  # Before the defect correction
+        self.attach_pipeline()
+
+    def attach_pipeline(self):
+        """Attaches the pipeline to the camera thread again, which detaches it when a stage fails."""
+        if self.camera_thread is not None:
+            self.camera_thread.pipeline = self.pipeline
+
+    def save_defect_map(self):
+        """Stores the defects flagged by the last noise measurement as a mask over the current WOI."""
+        if not self.defects:
+            print("Run a noise measurement first")
+            return
+        woi = self.camera.get_woi()
+        mask = np.zeros((woi[3], woi[2]), dtype=bool)
+        for roi_id, defects in self.defects.items():
+            if roi_id == "full_image":
+                mask |= defects
+                continue
+            region = self.ROI_controller.rois[roi_id]
+            x, y = max(0, region["x"]), max(0, region["y"])
+            mask[y:y + defects.shape[0], x:x + defects.shape[1]] |= defects
+        path = self.calibration_store.save('defects', self.serial, mask, woi)
+        print(f"{int(mask.sum())} defective pixels saved to {path}")
+
+    def apply_defect_correction(self, enabled):
+        if not enabled:
+            self.pipeline.remove(DefectCorrection.name)
+            self.attach_pipeline()
+            return
+        stage = DefectCorrection.from_store(self.calibration_store, self.serial, self.camera.get_woi())
+        if stage is None:
+            print(f"No defect map stored for camera {self.serial} at this WOI")
+            self.project_view.checkbox_defects.setChecked(False)
+            return
+        self.pipeline.add(stage)
+        self.attach_pipeline()
+
+    def set_live_analysis(self, enabled):
+        """Starts (on the next frame) or stops the live frame and ROI statistics."""
+        if not enabled:
+            self.close_analysis_pool()
+            self.project_view.show_analysis("")
+
+    def _update_analysis_pool(self, image):
+        """(Re)starts the analysis pool when the frame shape or the ROIs changed, attached to the camera thread."""
+        rois = {roi_id: dict(region) for roi_id, region in self.ROI_controller.rois.items()}
+        if self._analysis_key == (image.shape, rois):
+            return
+        self.close_analysis_pool()
+        stages = [FrameStatisticsStage(2 ** self.camera.get_bitdepth() - 1)]
+        if rois:
+            stages.append(ROIMeansStage(rois))
+        # float32 slots take raw frames as well as dark/flat corrected ones
+        self.analysis_pool = AnalysisPool(image.shape, np.float32, stages, workers=self.ANALYSIS_WORKERS,
+                                          on_result=self.analysis_results.received.emit)
+        self._analysis_key = (image.shape, rois)
+        if self.camera_thread is not None:
+            self.camera_thread.analysis_pool = self.analysis_pool
+
+    def close_analysis_pool(self):
+        pool = self.analysis_pool
+        if pool is None:
+            return
+        self.analysis_pool = None
+        self._analysis_key = None
+        if self.camera_thread is not None:
+            self.camera_thread.analysis_pool = None
+        # The camera thread may be writing a frame into the ring right now, it is freed once that is done
+        QTimer.singleShot(1000, lambda: pool.close(wait=False))
+
+    def on_analysis_result(self, results):
+        now = time.monotonic()
+        if now - self._last_analysis_update < self.ANALYSIS_UPDATE_INTERVAL or self.analysis_pool is None:
+            return
+        self._last_analysis_update = now
+        statistics = results['statistics']
+        lines = [f"Frame {results['frame']}: mean {statistics['mean']:.1f}, std {statistics['std']:.1f}, "
+                 f"saturated {100 * statistics['saturated']:.2f} %"]
+        if self.ROI_controller.drift_tracker is None:
+            # With drift tracking, the ROI means at the moved ROIs are shown instead
+            for roi_id, mean in results.get('roi_means', {}).items():
+                lines.append(f"ROI {roi_id}: {mean:.1f}")
+        self.project_view.show_analysis("\n".join(lines))
+
+    def set_drift_tracking(self, enabled):
+        """Starts (the next preview frame is the reference) or stops moving the ROIs with the drift of the sample."""
+        if enabled:
+            self.ROI_controller.enable_drift_tracking(interval=self.DRIFT_INTERVAL)
+        else:
+            self.ROI_controller.disable_drift_tracking()
+            self.project_view.show_drift("")
+
+    def update_drift(self, image):
+        """Shows the drift offset and the ROI means at that subpixel offset."""
+        with telemetry.measure('roi.means'):
+            means = self.ROI_controller.roi_means(image)
+        dy, dx = self.ROI_controller.drift_offset
+        lines = [f"Drift {dx:+.2f}, {dy:+.2f} px"]
+        lines += [f"ROI {roi_id}: {mean:.1f}" for roi_id, mean in means.items()]
+        self.project_view.show_drift("\n".join(lines))
+
     def process_frame(self, image):
+        telemetry.frame_received('frame_received', image)
+        if self.project_view.checkbox_analysis.isChecked():
+            self._update_analysis_pool(image)
+        if self.ROI_controller.collect_frame(image):
+            return
+        if self.master_frame is not None:
+            self.master_frame.add(image)
+            if self.master_frame.count >= self.max_frames:
+                self.finish_calibration()
+            return
         if not self.start_processing:
             return
 
         if len(image.shape) != 2:
             raise ValueError("Input must be a 2D grayscale image.")
 
-        images = self.ROI_controller.process_ROI(image)
-
-        # Only initialize deque once
-        if self.data is None:
-            self.data = {}  # Dict of {roi_id: deque}
-            for roi_id, _ in images:
-                self.data[roi_id] = deque(maxlen=self.max_frames)
+        with telemetry.measure('roi.process'):
+            images = self.ROI_controller.process_ROI(image)
 
-        # === Process each ROI image individually ===
-        for roi_id, roi_image in images:
-            # Normalize and invert: 0 → 1.0, 4095 → 0.0
-            inverted = (roi_image.astype(np.float32) / 4095.0)
+        with telemetry.measure('analysis.noise'):
+            self._accumulate(images)
 
-            # Multiply by full well capacity
-            inverted *= self.full_well_capacity
-
-            # Append to deque for that ROI
-            self.data[roi_id].append(inverted)
+    def _accumulate(self, images):
+        if self.statistics is None:
+            max_value = 2 ** self.camera.get_bitdepth() - 1
+            self.statistics = NoiseStatistics(self.full_well_capacity, max_value)
+        self.statistics.add(images)
 
         # === Once we have enough frames, compute statistics ===
-        if not self.processed and all(len(dq) == self.max_frames for dq in self.data.values()):
+        if not self.processed and self.statistics.count >= self.max_frames:
             self.stop_camera_thread()
             self.processed = True
 
-            color_cycle = ['red', 'green', 'blue', 'orange', 'purple', 'cyan']
-            for i, (roi_id, dq) in enumerate(self.data.items()):
-                data_array = np.stack(dq, axis=0)  # Shape: (max_frames, H, W)
-                mean_image = np.mean(data_array, axis=0)
-                var_image = np.var(data_array, axis=0)  # Var = square of STD
-
-                self.means = mean_image.flatten()
-                self.vars = var_image.flatten()
-
-                color = color_cycle[i % len(color_cycle)]
-                self.project_view.plot_widget.plot_data(self.means, self.vars, scatter_plot=True, color=color)
-
-                if i == 0:
-                    # === Pick a random pixel and plot its histogram ===
-                    h, w = mean_image.shape
-                    rand_y = random.randint(0, h - 1)
-                    rand_x = random.randint(0, w - 1)
-
-                    pixel_values = data_array[:, rand_y, rand_x]  # Shape: (max_frames,)
-                    self.project_view.histogram_widget.plot_histogram(pixel_values, color=color)
-
-            # === Plot reference curve (same for all ROIs) ===
-            x = np.linspace(0, self.full_well_capacity, 1000)
-            self.project_view.plot_widget.plot_data(x, x)
+            self.plot_statistics(self.statistics.result(), self.statistics.pixel_values, self.statistics.count)
+
+    def plot_statistics(self, results, pixel_values, frames):
+        """
+        Plots variance over mean of every ROI ({roi_id: (mean image, variance image)} over `frames` frames),
+        defects in black.
+        """
+        color_cycle = ['red', 'green', 'blue', 'orange', 'purple', 'cyan']
+        self.defects = {}
+        for i, (roi_id, (mean_image, var_image)) in enumerate(results.items()):
+            self.means = mean_image.flatten()
+            self.vars = var_image.flatten()
+
+            color = color_cycle[i % len(color_cycle)]
+            self.project_view.plot_widget.plot_data(self.means, self.vars, scatter_plot=True, color=color)
+
+            # === Hot, dead and noisy pixels in black ===
+            defects = combine_defects(detect_defects(mean_image, var_image, frames))
+            self.defects[roi_id] = defects
+            flagged = defects.flatten()
+            if flagged.any():
+                self.project_view.plot_widget.plot_data(self.means[flagged], self.vars[flagged],
+                                                        scatter_plot=True, color='black')
+
+            if i == 0:
+                # === Histogram of the randomly picked pixel ===
+                self.project_view.histogram_widget.plot_histogram(np.asarray(pixel_values[roi_id]), color=color)
+
+        # === Plot reference curve (same for all ROIs) ===
+        x = np.linspace(0, self.full_well_capacity, 1000)
+        self.project_view.plot_widget.plot_data(x, x)
+
+    def save_project(self, path):
+        """
+        Saves the session to a project file: camera settings, ROIs, the calibration maps of the current WOI and
+        exposure and the statistics of the last noise measurement.
+        """
+        woi, exposure = self.camera.get_woi(), self.camera.get_exposure()
+        with ProjectFile(path, 'w') as project:
+            project.metadata.update({
+                'type': 'Camera_noise',
+                'serial': self.serial,
+                'devices': {self.serial: self.camera.get_all_settings()},
+                'rois': self.ROI_controller.rois,
+                'max_frames': self.max_frames,
+                'full_well_capacity': self.full_well_capacity,
+            })
+            for kind in CALIBRATION_KINDS:
+                array = self.calibration_store.find(kind, self.serial, woi, exposure)
+                if array is not None:
+                    project.write_array(f"calibration/{kind}", array,
+                                        {'woi': woi, 'exposure': exposure if kind == 'dark' else None})
+            if self.statistics is not None and self.statistics.count >= 2:
+                self.statistics.write_project(project)
+        print(f"Project saved to {path}")
+
+    def load_project(self, path):
+        """
+        Restores the camera settings and ROIs of a project file and plots its noise statistics. Only the metadata
+        is read when opening; the statistics images are memory-mapped.
+        """
+        with ProjectFile(path) as project:
+            metadata = project.metadata
+        if metadata.get('type') != 'Camera_noise':
+            print(f"{path} is not a camera noise project")
+            return
+        snapshot = metadata.get('devices', {}).get(self.serial)
+        if snapshot is None:
+            print(f"{path} was saved with camera {metadata.get('serial')}, its settings are not applied")
+        else:
+            self.project_view.checkbox_auto_exposure.setChecked(False)
+            self.stop_camera_thread()
+            self.model.device_manager.set_device_settings(self.serial, camera_settings(snapshot))
+            self.project_view.spinbox_exposure.setValue(self.camera.get_exposure())
+            self.start_camera_thread()
 
+        self.full_well_capacity = metadata.get('full_well_capacity', self.full_well_capacity)
+        self.max_frames = metadata.get('max_frames', self.max_frames)
+        self.project_view.spinbox_max_frames.setValue(self.max_frames)
+        self.ROI_controller.set_ROIs(metadata.get('rois', {}))
+
+        if self.project is not None:
+            self.project.close()
+        self.project = ProjectFile(path)  # Kept open for the memory maps of the statistics
+        statistics = read_noise_statistics(self.project)
+        if statistics:
+            self.plot_statistics({roi_id: (np.asarray(mean), np.asarray(variance))
+                                  for roi_id, (mean, variance, _) in statistics.items()},
+                                 {roi_id: values for roi_id, (_, _, values) in statistics.items()},
+                                 next(iter(statistics.values()))[0].attrs['frames'])
+        print(f"Project {path} loaded")
 
     def process_frame_60FPS(self, image):
         """This method simulates acquiring a frame."""
         # Your frame acquisition logic here (e.g., from camera)
         # processing image
+        telemetry.frame_received('frame_received_6FPS', image)
 
-        self.project_view.update_frame(image)
\ No newline at end of file
+        self.project_view.update_frame(image)
+        if self.ROI_controller.drift_tracker is not None:
+            self.update_drift(image)
\ No newline at end of file
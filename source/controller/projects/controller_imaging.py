@@ -1,4 +1,5 @@
-from source.view.tabs.view_imaging import ImagingView
+from source.utilities.project_file import ProjectFile, camera_settings
+
 
 class ImagingController:
 
@@ -6,6 +7,26 @@ class ImagingController:
         self.model = model
         self.view = view
 
-        # Create an instance of the ImagingView and show it
-        self.imaging_view = ImagingView()
-        self.imaging_view.show()
\ No newline at end of file
+        self.view.save_project.connect(self.save_project)
+
+    def save_project(self, path):
+        """Saves the settings of every loaded device to a project file."""
+        device_manager = self.model.device_manager
+        with ProjectFile(path, 'w') as project:
+            project.metadata['type'] = 'Imaging'
+            project.metadata['devices'] = {serial: device_manager.get_device_settings(serial)
+                                           for serial in device_manager.loaded_devices}
+        print(f"Project saved to {path}")
+
+    def load_project(self, path):
+        """Applies the camera settings stored in a project file to the cameras that are loaded."""
+        with ProjectFile(path) as project:
+            devices = project.metadata.get('devices', {})
+        device_manager = self.model.device_manager
+        connected_devices = device_manager.list_connected_devices()
+        for serial, snapshot in devices.items():
+            if not device_manager.is_device_loaded(serial):
+                print(f"Device {serial} of the project is not loaded, its settings are not applied")
+            elif connected_devices.get(serial, {}).get('type') == 'camera':
+                device_manager.set_device_settings(serial, camera_settings(snapshot))
+        print(f"Project {path} loaded")
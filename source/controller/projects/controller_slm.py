@@ -0,0 +1,82 @@
+import numpy as np
+from PySide6.QtGui import QGuiApplication
+
+from source.hardware.slms.slm_patterns import PatternEngine, EXULUS_MODELS
+from source.view.widgets.slm_window import SLMWindow
+
+
+class SLMController:
+
+    def __init__(self, project_view, logger=None):
+        self.project_view = project_view
+        self.logger = logger
+
+        self.engine = None
+        self.engine_model = None
+        self.window = None
+
+        self.project_view.show_pattern.connect(self.show_pattern)
+        self.project_view.play_sequence.connect(self.play_sequence)
+        self.project_view.stop_output.connect(self.stop_output)
+
+    @staticmethod
+    def available_screens():
+        return [f"{screen.name()} ({screen.geometry().width()}x{screen.geometry().height()})"
+                for screen in QGuiApplication.screens()]
+
+    @staticmethod
+    def available_models():
+        return list(EXULUS_MODELS)
+
+    def _prepare(self, parameters):
+        """Creates the engine and the output window for the selected model and screen if they changed."""
+        if self.engine is None or self.engine_model != parameters['model']:
+            self.engine = PatternEngine.for_model(parameters['model'])
+            self.engine_model = parameters['model']
+        self.engine.wavelength = parameters['wavelength']
+
+        screen = QGuiApplication.screens()[parameters['screen']]
+        if self.window is None or self.window.screen() is not screen:
+            if self.window is not None:
+                self.window.close()
+            self.window = SLMWindow(screen)
+            self.window.showFullScreen()
+
+    @staticmethod
+    def _spec(parameters, grating_phase=0.0):
+        spec = []
+        if parameters['period'] > 0:
+            spec.append(('grating', parameters['period'], parameters['angle']))
+        if parameters['focal_length'] != 0:
+            spec.append(('lens', parameters['focal_length']))
+        zernike = tuple((j, parameters[key]) for j, key in ((4, 'defocus'), (6, 'astigmatism')) if parameters[key])
+        if zernike:
+            spec.append(('zernike', zernike))
+        if grating_phase:
+            spec.append(('constant', grating_phase))
+        return tuple(spec)
+
+    def show_pattern(self, parameters: dict):
+        self._prepare(parameters)
+        self.window.show_frame(self.engine.render(self._spec(parameters)))
+        self.project_view.set_status("Showing pattern")
+
+    def play_sequence(self, parameters: dict):
+        """Structured illumination: the grating shifted by 2 pi / phase_steps per pattern, looped."""
+        self._prepare(parameters)
+        steps = parameters['phase_steps']
+        specs = [self._spec(parameters, grating_phase=2 * np.pi * i / steps) for i in range(steps)]
+
+        # Render everything up front, the window then only swaps cached frames
+        frames = self.engine.prerender(specs).result()
+        self.window.play_sequence(frames, parameters['refreshes_per_pattern'], loop=True)
+        self.project_view.set_status(f"Playing {steps} patterns")
+        if self.logger is not None:
+            self.logger.info(f"SLM sequence of {steps} patterns started")
+
+    def stop_output(self):
+        if self.window is not None:
+            self.window.stop_sequence()
+            self.window.close()
+            self.window = None
+        self.project_view.set_status("")
@@ -1,4 +1,6 @@
 from source.controller.CameraWorker import CameraWorkerThread
+from source.utilities.frame_server import FrameServer
+from source.utilities.telemetry import telemetry
 from source.view.settings.view_settings_camera import ViewCameraSettings
 
 class CameraSettingsController:
@@ -13,13 +15,19 @@ class CameraSettingsController:
 
         self.settings_dialog = ViewCameraSettings(serial, settings)
         self.settings_dialog.settings_widget.settings_applied.connect(self.handle_settings_applied)
+        self.settings_dialog.settings_widget.settings_edited.connect(self.predict_frame_rate)
+        self.settings_dialog.settings_widget.start_stream.connect(self.start_stream)
+        self.settings_dialog.settings_widget.stop_stream.connect(self.stop_stream)
+        self.settings_dialog.closed.connect(self.close)
+        self.frame_server = None  # Optional FrameServer fed by the camera thread
 
 
         # create an image acquisition link
         camera = self.model.device_manager.loaded_devices[serial]
+        self.frame_rate_planner = camera.frame_rate_planner
 
         # Create the worker thread
-        self.worker_thread = CameraWorkerThread(camera)
+        self.worker_thread = CameraWorkerThread(camera, frame_server=self.frame_server)
 
         # Connect signals to the controller slots
         self.worker_thread.fps_updated.connect(self.update_fps)
@@ -35,16 +43,66 @@ class CameraSettingsController:
         """This method simulates acquiring a frame."""
         # Your frame acquisition logic here (e.g., from camera)
         #processing image
+        telemetry.frame_received('frame_received', image)
 
         self.settings_dialog.update_frame(image)
 
     def update_fps(self, fps):
         self.settings_dialog.update_fps(fps)
 
+    def predict_frame_rate(self, settings):
+        """Shows the frame rate the edited settings would reach, without applying them."""
+        if self.frame_rate_planner is None:
+            return
+        try:
+            camera = self.model.device_manager.loaded_devices[self.serial]
+            pixel_format = camera.pixel_format_for(settings['bitdepth'], settings.get('packed'))
+            plan = self.frame_rate_planner.plan(settings['width'], settings['height'], settings['exposure'],
+                                                pixel_format)
+        except Exception as e:
+            print(f"Frame rate prediction failed: {e}")
+            return
+        self.settings_dialog.update_prediction(plan.fps, plan.limiting_factor)
+
+    def start_stream(self, address):
+        """
+        Starts a FrameServer on `address` ('host:port' or 'unix:<path>') and streams the camera frames to it. This
+        window has no ROIs: ROI crops and values are only served by the headless sensorgram measurement.
+        """
+        self.stop_stream()
+        server = FrameServer(address)
+        try:
+            server.start()
+        except (OSError, ValueError) as e:
+            print(f"Frame stream on {address} failed: {e}")
+            self.settings_dialog.settings_widget.stream_stopped()
+            return
+        camera = self.model.device_manager.loaded_devices[self.serial]
+        server.set_metadata(serial=self.serial, woi=list(camera.get_woi()), exposure=camera.get_exposure())
+        self.frame_server = server
+        self.worker_thread.frame_server = server
+        print(f"Streaming frames of {self.serial} on {address}")
+
+    def stop_stream(self):
+        if self.frame_server is None:
+            return
+        self.worker_thread.frame_server = None
+        self.frame_server.stop()
+        self.frame_server = None
+
+    def close(self):
+        """Stops the frame stream and the camera thread, called when the dialog is closed."""
+        self.stop_stream()
+        self.worker_thread.stop()
+        self.model.device_manager.loaded_devices[self.serial].pause()
+
     def handle_settings_applied(self, settings):
         self.worker_thread.stop()
         self.model.device_manager.loaded_devices[self.serial].pause()
         self.model.device_manager.set_device_settings(self.serial, settings)
+        if self.frame_server is not None:
+            camera = self.model.device_manager.loaded_devices[self.serial]
+            self.frame_server.set_metadata(woi=list(camera.get_woi()), exposure=camera.get_exposure())
         target_fps = self.model.device_manager.loaded_devices[self.serial].target_fps
         self.worker_thread.update_fps(target_fps)
         self.worker_thread.start()
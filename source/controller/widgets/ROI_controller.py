@@ -1,13 +1,20 @@
+import numpy as np
 from PySide6.QtCore import QObject, Signal
 
+from source.processing.calibration import MasterFrame
+from source.processing.registration import DriftTracker, ROIPlan
+from source.processing.spot_detection import spot_rois
+
 
 class ROIController(QObject):
     stop_camera_thread = Signal()
     start_camera_thread = Signal()
+    rois_changed = Signal()  # Emitted after every edit of the ROIs
 
-    def __init__(self, model, serial, roi_widget, image_display):
+    def __init__(self, model, serial, roi_widget, image_display, spot_frames=20):
         super().__init__()
         self.rois = {}  # Dict of {id: region_dict}
+        self._next_id = 0  # IDs only grow, a new ID never scans the existing ones
 
         self.model = model
         self.serial = serial
@@ -17,40 +24,142 @@ class ROIController(QObject):
         self.roi_widget.delete_all_ROI.connect(self.delete_all_ROI)
         self.roi_widget.modify_ROI.connect(self.modify_ROI)
         self.roi_widget.apply_changes.connect(self.set_ROI_settings)
+        self.roi_widget.detect_spots.connect(self.start_spot_detection)
 
         self.image_display = image_display
         self.image_display.add_ROI.connect(self.new_ROI)
 
         self.current_woi = (0, 0, self.image_display.width, self.image_display.height)
 
+        # Drift tracking: ROIs follow the sample by the offset of the frames to a reference frame
+        self.drift_tracker = None
+        self.drift_offset = (0.0, 0.0)
+        self._drift_frame = None  # Last frame the tracker saw, a frame is registered once
+        self._plan = None
+        self._plan_rois = None
+
+        # Spot detection: frames are averaged before detecting the spots
+        self.spot_frames = spot_frames
+        self.spot_average = None
+
+    def enable_drift_tracking(self, interval=10, decimation=2, patch=None):
+        """The next frame becomes the reference, the offset is re-estimated every `interval` frames."""
+        self.drift_tracker = DriftTracker(interval, patch, decimation)
+        self.drift_offset = (0.0, 0.0)
+        self._drift_frame = None
+
+    def disable_drift_tracking(self):
+        self.drift_tracker = None
+        self.drift_offset = (0.0, 0.0)
+        self._drift_frame = None
+
+    def _update_drift(self, image):
+        if self.drift_tracker is not None and image is not self._drift_frame:
+            if self._drift_frame is not None and image.shape != self._drift_frame.shape:
+                self.drift_tracker.reset()  # New WOI: this frame becomes the reference
+            self.drift_offset = self.drift_tracker.update(image)
+            self._drift_frame = image
+        return self.drift_offset
+
+    def roi_means(self, image):
+        """
+        {roi_id: mean} of all ROIs, moved by the subpixel drift offset when tracking. Uses an ROIPlan (one integral
+        image), which is cheaper than cropping once there are many ROIs.
+        """
+        if self._plan is None or self._plan_rois != self.rois:
+            self._plan = ROIPlan(self.rois)
+            self._plan_rois = {roi_id: dict(region) for roi_id, region in self.rois.items()}
+        if not self.rois:
+            return {"full_image": float(image.mean())}
+        return dict(zip(self._plan.ids, self._plan.means(image, self._update_drift(image))))
+
+    def _new_id(self):
+        # ROIs may also be assigned directly (e.g. benchmarks), skip IDs they use
+        while str(self._next_id) in self.rois:
+            self._next_id += 1
+        region_id = str(self._next_id)
+        self._next_id += 1
+        return region_id
+
     def new_ROI(self, roi_array):
-        x, y, w, h = roi_array
+        self.add_ROIs([roi_array])
+
+    def add_ROIs(self, roi_arrays):
+        """Adds [x, y, w, h] regions under new string IDs, refreshing the display and the table once."""
+        for x, y, w, h in roi_arrays:
+            self.rois[self._new_id()] = {
+                "x": int(x),
+                "y": int(y),
+                "width": int(w),
+                "height": int(h)
+            }
 
-        # Auto-generate a unique string ID starting from "0"
-        region_id = 0
-        while str(region_id) in self.rois:
-            region_id += 1
-        region_id = str(region_id)
+        self.image_display.update_ROI_dict(self.rois)
+        self.roi_widget.refresh_list(self.rois)
+        self.rois_changed.emit()
 
-        self.rois[region_id] = {
-            "x": x,
-            "y": y,
-            "width": w,
-            "height": h
-        }
+    def set_ROIs(self, rois):
+        """Replaces all ROIs by `rois` ({id: {x, y, width, height}}), keeping their IDs (e.g. from a project)."""
+        self.rois.clear()
+        self.rois.update({str(roi_id): {key: int(region[key]) for key in ("x", "y", "width", "height")}
+                          for roi_id, region in rois.items()})
+        self._next_id = 0
 
         self.image_display.update_ROI_dict(self.rois)
         self.roi_widget.refresh_list(self.rois)
+        self.rois_changed.emit()
+
+    def start_spot_detection(self):
+        """The next `spot_frames` frames passed to collect_frame() are averaged and searched for spots."""
+        self.spot_average = MasterFrame('mean')
+
+    def collect_frame(self, image):
+        """
+        Feeds a frame to a running spot detection. Returns True if the frame was taken, the ROIs being replaced by
+        the detected ones once enough frames are averaged.
+        """
+        if self.spot_average is None:
+            return False
+        self.spot_average.add(image)
+        if self.spot_average.count >= self.spot_frames:
+            average = self.spot_average.result()
+            self.spot_average = None
+            self.detect_ROIs(average)
+        return True
+
+    def detect_ROIs(self, image, replace=True, **options):
+        """
+        Creates ROIs on the spots of an (averaged) frame, on the fitted array lattice when the spots are gridded.
+        `options` are passed to spot_rois(). Returns the number of ROIs created.
+        """
+        offset = (self.image_display.current_woi[0], self.image_display.current_woi[1])
+        regions, spots, lattice = spot_rois(image, offset=offset, **options)
+        if lattice is not None:
+            print(f"{len(spots.areas)} {spots.polarity} spots on a lattice of pitch "
+                  f"{np.linalg.norm(lattice.a):.1f} x {np.linalg.norm(lattice.b):.1f} px, {len(regions)} ROIs")
+        else:
+            print(f"{len(spots.areas)} {spots.polarity} spots, no regular array found, {len(regions)} ROIs")
+        if not regions:
+            return 0
+
+        if replace:
+            self.rois.clear()
+            self._next_id = 0
+        self.add_ROIs(regions)
+        return len(regions)
 
     def delete_ROI(self, roi_id: str):
         if roi_id in self.rois:
             self.rois.pop(roi_id)
             self.roi_widget.refresh_list(self.rois)
+            self.rois_changed.emit()
 
     def delete_all_ROI(self):
         self.rois.clear()
+        self._next_id = 0
 
         self.roi_widget.refresh_list(self.rois)
+        self.rois_changed.emit()
 
     def modify_ROI(self, data):
         roi_id, updated_roi = data
@@ -58,15 +167,20 @@ class ROIController(QObject):
             self.rois[roi_id] = updated_roi
             self.image_display.update_ROI_dict(self.rois)
             self.roi_widget.refresh_list(self.rois)
+            self.rois_changed.emit()
 
     def process_ROI(self, image):
         if not self.rois:
             # No ROIs defined: return the whole image with a default ID
             return [("full_image", image.copy())]
 
+        # Crops follow the drift to the nearest pixel
+        dy, dx = self._update_drift(image)
+        shift_x, shift_y = int(round(dx)), int(round(dy))
+
         cropped_images = []
         for roi_id, region in self.rois.items():
-            x, y = region["x"], region["y"]
+            x, y = region["x"] + shift_x, region["y"] + shift_y
             w, h = region["width"], region["height"]
 
             # Ensure coordinates are within image bounds
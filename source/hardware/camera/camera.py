@@ -11,6 +11,8 @@ class Camera(QObject):
         super().__init__()
         self.average = 100
         self.serial = None
+        self.frame_rate_planner = None  # FrameRatePlanner of cameras reporting their resulting frame rate
+        self.packed = False  # Prefer packed pixel formats (e.g. Mono12p) where the camera has them
 
     def close(self):
         """Closes the camera connection and deletes related objects.
@@ -56,6 +58,21 @@ class Camera(QObject):
         """
         raise NotImplementedError()
 
+    def reuses_buffer(self, frame):
+        """Checks whether a frame of acquire_image() lives in a buffer the camera overwrites with a later frame.
+
+        Parameters
+        ----------
+        frame : numpy.ndarray
+            Frame returned by acquire_image().
+
+        Returns
+        -------
+        bool
+            True if the frame must be copied to be kept, False for a frame of its own.
+        """
+        return False
+
     def pause(self):
         """Stop Acquiring images from the camera.
 
@@ -66,6 +83,26 @@ class Camera(QObject):
         """
         raise NotImplementedError()
 
+    def acquire_timestamps(self, count):
+        """Grabs a burst of `count` frames and returns their hardware timestamps.
+
+        Parameters
+        ----------
+        count : int
+            Number of frames in the burst.
+
+        Returns
+        -------
+        numpy.ndarray
+            Timestamps of the received frames in seconds.
+
+        Raises
+        ------
+        NotImplementedError
+            If the method is not implemented.
+        """
+        raise NotImplementedError()
+
     def set_average(self, average):
         self.average = average
 
@@ -135,6 +172,18 @@ class Camera(QObject):
         """
         raise NotImplementedError()
 
+    def set_exposure_live(self, exposure):
+        """Sets the integration time while grabbing, without restarting the stream or other settings.
+
+        Cameras that cannot change the exposure while grabbing fall back to set_exposure().
+
+        Parameters
+        ----------
+        exposure : float
+            The integration time in milliseconds.
+        """
+        self.set_exposure(exposure)
+
     def set_gain(self, gain):
         """Sets the camera gain.
 
@@ -407,6 +456,58 @@ class Camera(QObject):
         """
         raise NotImplementedError()
 
+    def get_resulting_frame_rate(self):
+        """Gets the frame rate the camera achieves with the current exposure, WOI and pixel format.
+
+        Returns
+        -------
+        float
+            Frames per second.
+
+        Raises
+        ------
+        NotImplementedError
+            If the method is not implemented.
+        """
+        raise NotImplementedError()
+
+    def get_link_bandwidth(self):
+        """Gets the usable bandwidth of the link to the host.
+
+        Returns
+        -------
+        float or None
+            Bytes per second, None if unknown.
+        """
+        return None
+
+    def get_pixel_format(self):
+        """Gets the pixel format name.
+
+        Returns
+        -------
+        str
+            Pixel format, e.g. 'Mono12'.
+        """
+        return f"Mono{self.get_bitdepth()}"
+
+    def pixel_format_for(self, bitdepth, packed=None):
+        """Gets the pixel format set_bitdepth() selects for a bit depth.
+
+        Parameters
+        ----------
+        bitdepth : int
+            The bit depth of the camera resolution.
+        packed : bool, optional
+            Whether a packed format is wanted, `self.packed` if not given.
+
+        Returns
+        -------
+        str
+            Pixel format, e.g. 'Mono12' or 'Mono12p'.
+        """
+        return f"Mono{bitdepth}"
+
     def get_woi(self):
         """Gets the current Window of Interest.
 
@@ -484,6 +585,17 @@ class Camera(QObject):
 
     ############################################ IMPLEMENTED FUNCTIONS #################################################
 
+    def set_packed(self, packed):
+        """Selects packed pixel formats for the current and later bit depths, where the camera has them.
+
+        Parameters
+        ----------
+        packed : bool
+            Whether packed formats are preferred.
+        """
+        self.packed = bool(packed)
+        self.set_bitdepth(self.get_bitdepth())
+
     def get_all_settings(self):
         """Gets all the current settings of the camera, including min and max values.
 
@@ -505,6 +617,7 @@ class Camera(QObject):
                 'max': self.get_height_min_max()[1]
             },
             'bitdepth': self.get_bitdepth(),
+            'packed': self.packed,
             'exposure': {
                 'value': self.get_exposure(),
                 'min': self.get_exposure_min_max()[0],
@@ -554,6 +667,10 @@ class Camera(QObject):
                 self.set_height(height)
             else:
                 raise ValueError(f"Height {height} is out of range ({min_height}, {max_height})")
+        if 'packed' in settings:
+            self.packed = bool(settings['packed'])
+            if 'bitdepth' not in settings:
+                self.set_bitdepth(self.get_bitdepth())
         if 'bitdepth' in settings:
             self.set_bitdepth(settings['bitdepth'])
         if 'exposure' in settings:
@@ -1,6 +1,9 @@
+import numpy as np
 from pypylon import pylon
 
 from source.hardware.camera.camera import Camera
+from source.hardware.camera.frame_rate_planner import FrameRatePlanner, DEFAULT_LINK_BANDWIDTH
+from source.hardware.camera.pixel_formats import FrameUnpacker, PackedFrame, is_packed, pixel_format_bitdepth
 
 
 class Basler(Camera):
@@ -28,6 +31,9 @@ class Basler(Camera):
         if self.cam is None:
             raise ValueError(f"No camera with serial number {serial} found")
 
+        # Reading a GenICam node costs a round trip through the SDK, the format is cached for acquire_image()
+        self.pixel_format = self.cam.PixelFormat.Value
+
         # Finally, use the superclass constructor to initialize other required variables.
         # - Gathering parameters such a width, height, and bitdepth.
         super().__init__()
@@ -41,6 +47,12 @@ class Basler(Camera):
 
         self.nodemap = self.cam.GetNodeMap()
 
+        # Frame rate predictions, the calibrated readout model is kept next to the other per-run files
+        self.frame_rate_planner = FrameRatePlanner(self, model_path=f"readout_model_{serial}.json")
+
+        # Packed frames (Mono12p, Mono12Packed) are unpacked into a ring of preallocated uint16 frames
+        self.unpacker = FrameUnpacker()
+
         self.multi_roi_info = {}
         self._init_multi_roi_info()
 
@@ -103,26 +115,67 @@ class Basler(Camera):
         pass
 
     def flush(self):
+        """Discards the frames waiting in the grab queue so that the next acquire_image() yields a fresh frame."""
+        if not self.cam.IsGrabbing():
+            return
+        while self.cam.GetGrabResultWaitObject().Wait(0):
+            grab_result = self.cam.RetrieveResult(0, pylon.TimeoutHandling_Return)
+            if grab_result is None or not grab_result.IsValid():
+                break
+            grab_result.Release()
+
+    def acquire_image(self, unpack: bool = True):
         """
-        Abstract method to cycle the image buffer (if any)
-        such that all new :meth:`.get_image()`
-        calls yield fresh frames.
+        Acquires an image from the camera. Frames in a packed pixel format are unpacked into uint16 frames of the
+        unpacker's ring, or returned as a PackedFrame of the raw bytes if `unpack` is False (e.g. for recording).
         """
-        raise NotImplementedError()
-
-    def acquire_image(self):
-        """Acquires an image from the camera."""
         if self.cam.IsGrabbing():
             grab_result = self.cam.RetrieveResult(5000, pylon.TimeoutHandling_ThrowException) # 0 or 5000 ???
             if grab_result.GrabSucceeded():
-                return grab_result.Array
+                pixel_format = self.pixel_format
+                if not is_packed(pixel_format):
+                    return grab_result.Array
+                packed = PackedFrame(np.frombuffer(grab_result.GetBuffer(), dtype=np.uint8),
+                                     (grab_result.Height, grab_result.Width), pixel_format)
+                grab_result.Release()
+                return self.unpacker.unpack(packed) if unpack else packed
             grab_result.Release()
         else:
             self.cam.StartGrabbing()
 
+    def reuses_buffer(self, frame):
+        # Grab result arrays are copies, only the unpacked frames live in a ring
+        return self.unpacker.ring.owns(frame)
+
     def pause(self):
         self.cam.StopGrabbing()
 
+    def acquire_timestamps(self, count: int, timeout: int = 5000):
+        """
+        Grabs a burst of `count` frames and returns their hardware timestamps in seconds.
+
+        The frames are released without being copied, so the host does not limit the measured frame rate.
+        """
+        if self.cam.IsGrabbing():
+            self.cam.StopGrabbing()
+
+        frequency = self.get_timestamp_frequency()
+        timestamps = np.empty(count, dtype=np.int64)
+        received = 0
+        self.cam.StartGrabbingMax(count, pylon.GrabStrategy_OneByOne)
+        try:
+            while self.cam.IsGrabbing() and received < count:
+                grab_result = self.cam.RetrieveResult(timeout, pylon.TimeoutHandling_ThrowException)
+                try:
+                    if grab_result.GrabSucceeded():
+                        timestamps[received] = grab_result.TimeStamp
+                        received += 1
+                finally:
+                    grab_result.Release()
+        finally:
+            self.cam.StopGrabbing()
+        return timestamps[:received] / frequency
+
     def handle_message(self, massage):
         print("Cannot handle massage: " + str(massage))
 
@@ -137,8 +190,9 @@ class Basler(Camera):
         self.cam.Height.SetValue(height)
 
     def set_bitdepth(self, bitdepth: int):
-        """Sets the camera bit depth."""
-        self.cam.PixelFormat.SetValue(f"Mono{bitdepth}")
+        """Sets the camera bit depth, with a packed pixel format if preferred and available."""
+        self.cam.PixelFormat.SetValue(self.pixel_format_for(bitdepth))
+        self.pixel_format = self.cam.PixelFormat.Value
 
 
     def set_exposure(self, exposure_time: float):
@@ -169,21 +223,24 @@ class Basler(Camera):
         print(f"Exposure Time: {self.get_exposure()}")
         print(f"Target Frame Rate: {self.target_fps}")
 
+    def set_exposure_live(self, exposure_time: float):
+        """
+        Sets the exposure time (ms) while grabbing. ExposureTime is writable during acquisition and the frame rate
+        limit is disabled, so the sensor follows the new exposure without a restart.
+        """
+        min_exposure_time, max_exposure_time = self.get_exposure_min_max()
+        self.exposure_time = min(max(exposure_time, min_exposure_time), max_exposure_time)
+        self.cam.ExposureTime.SetValue(self.exposure_time * 1000)
+
     def adjust_frame_rate_based_on_exposure(self):
         """
-        Adjust the frame rate based on the exposure time.
-        If exposure time is at the minimum, set the highest possible frame rate.
+        Sets target_fps to the frame rate the camera reports for the current exposure, WOI and pixel format, with
+        the frame rate limit disabled so the sensor runs as fast as it can.
         """
-        min_exposure_time = self.get_exposure_min_max()[0]
-        if self.exposure_time is None or self.exposure_time == min_exposure_time:
-            # If exposure time is minimum or auto-exposure is used, set frame rate to maximum
-            max_frame_rate = self.cam.ResultingFrameRateAbs.GetMax()
-            self.target_fps = max_frame_rate
-        else:
-            # Calculate the optimal frame rate based on exposure time (if not at minimum exposure)
-            max_frame_rate = self.get_frame_rate_min_max()[1]
-            optimal_frame_rate = 1000 /  self.exposure_time  # Adjusting to exposure in miliseconds
-            self.target_fps = min(optimal_frame_rate, max_frame_rate)
+        self.cam.AcquisitionFrameRateEnable.Value = False
+        plan = self.frame_rate_planner.current()
+        self.target_fps = plan.fps
+        print(f"Frame rate {plan.fps:.2f} fps, limited by {plan.limiting_factor}")
 
     def set_gain(self, gain: float):
         """Sets the camera gain."""
@@ -229,7 +286,7 @@ class Basler(Camera):
 
     def get_bitdepth(self):
         """Gets the bit depth of the camera's resolution."""
-        return int(self.cam.PixelFormat.Value.replace("Mono", ""))
+        return pixel_format_bitdepth(self.pixel_format)
 
     def get_exposure(self):
         """Gets the integration time in seconds."""
@@ -255,6 +312,48 @@ class Basler(Camera):
         """Gets the minimum and maximum frame rate values."""
         return (self.cam.AcquisitionFrameRate.Min, self.cam.AcquisitionFrameRate.Max)
 
+    def get_pixel_format(self):
+        """Gets the pixel format name, e.g. 'Mono12p'."""
+        return self.pixel_format
+
+    def pixel_format_for(self, bitdepth, packed=None):
+        """Mono12p (USB3 Vision) or Mono12Packed (GigE) for 12 bits when packing is preferred, else Mono{bitdepth}."""
+        packed = self.packed if packed is None else packed
+        if packed and bitdepth == 12:
+            available = self.cam.PixelFormat.Symbolics
+            for pixel_format in ('Mono12p', 'Mono12Packed'):
+                if pixel_format in available:
+                    return pixel_format
+        return f"Mono{bitdepth}"
+
+    def get_resulting_frame_rate(self):
+        """Gets the frame rate the camera achieves with the current settings, as computed by the camera."""
+        try:
+            return self.cam.ResultingFrameRate.Value  # USB3 (SFNC)
+        except Exception:
+            return self.cam.ResultingFrameRateAbs.Value  # GigE
+
+    def get_link_bandwidth(self):
+        """Gets the usable link bandwidth in bytes/s: the throughput limit if enabled, else the link speed."""
+        try:
+            if self.cam.DeviceLinkThroughputLimitMode.Value == 'On':
+                return float(self.cam.DeviceLinkThroughputLimit.Value)
+            return float(self.cam.DeviceLinkSpeed.Value)
+        except Exception:
+            pass
+        try:
+            return float(self.cam.GevSCBWA.Value)  # GigE assigned bandwidth
+        except Exception:
+            return DEFAULT_LINK_BANDWIDTH['gige' if self.cam.GetDeviceInfo().GetDeviceClass() == 'BaslerGigE'
+                                          else 'usb3']
+
+    def get_timestamp_frequency(self):
+        """Gets the frequency of the frame timestamp counter [Hz]; USB3 cameras count nanoseconds."""
+        try:
+            return float(self.cam.GevTimestampTickFrequency.Value)
+        except Exception:
+            return 1e9
+
     def get_woi(self):
         """Gets the current Window of Interest."""
         return (self.cam.OffsetX.Value, self.cam.OffsetY.Value, self.cam.Width.Value, self.cam.Height.Value)
@@ -0,0 +1,149 @@
+import json
+import os
+from collections import namedtuple
+
+from source.acquisition.frame_rate_characterisation import ReadoutModel, pixel_format_bytes
+
+# Usable payload bandwidth [bytes/s] when the camera does not report its link throughput
+DEFAULT_LINK_BANDWIDTH = {
+    'usb3': 360e6,
+    'gige': 118e6,
+}
+
+FramePlan = namedtuple('FramePlan', ['fps', 'limiting_factor', 'exposure', 'width', 'height', 'pixel_format',
+                                     'source'])
+FramePlan.__doc__ = """
+Achievable frame rate of a camera configuration.
+
+fps: frames per second; limiting_factor: 'exposure', 'readout' or 'bandwidth'; exposure [ms], width and height
+[px] and pixel_format describe the configuration; source is 'camera' when the fps was read from the camera's
+resulting frame rate and 'model' when it was predicted.
+"""
+
+
+class FrameRatePlanner:
+    """
+    Predicts the frame rate a camera achieves for a proposed WOI, exposure and pixel format, and what limits it.
+
+    The prediction comes from a ReadoutModel calibrated with FrameRateCharacterisation and stored per camera
+    in `model_path`. Without one, a coarse model is derived from the camera's resulting frame rate at the
+    current settings (readout time proportional to height). The link term uses the smaller of the calibrated
+    bandwidth and the link bandwidth, so a throughput limit set on the camera or a shared USB controller is
+    taken into account.
+
+    For the settings currently applied, current() returns the camera's own resulting frame rate, which is
+    exact; the model only supplies the limiting factor.
+
+    Parameters
+    ----------
+    camera : Camera
+        Camera providing get_resulting_frame_rate(), get_link_bandwidth() and the usual getters.
+    readout_model : ReadoutModel, optional
+        Calibrated model; loaded from `model_path` if not given and the file exists.
+    model_path : str, optional
+        JSON file the calibrated model is kept in.
+    link_bandwidth : float, optional
+        Usable link bandwidth [bytes/s]; the camera's report if not given.
+    """
+
+    def __init__(self, camera, readout_model=None, model_path=None, link_bandwidth=None):
+        self.camera = camera
+        self.model_path = model_path
+        self.link_bandwidth = link_bandwidth
+        self.readout_model = readout_model
+        if self.readout_model is None and model_path and os.path.exists(model_path):
+            self.readout_model = self.load_model(model_path)
+
+    @staticmethod
+    def load_model(path):
+        with open(path, 'r') as file:
+            return ReadoutModel.from_dict(json.load(file))
+
+    def set_model(self, readout_model, save=True):
+        """Replaces the calibrated model, writing it to `model_path` if `save`."""
+        self.readout_model = readout_model
+        if save and self.model_path:
+            with open(self.model_path, 'w') as file:
+                json.dump(readout_model.to_dict(), file, indent=2)
+
+    def get_link_bandwidth(self):
+        if self.link_bandwidth is not None:
+            return self.link_bandwidth
+        return self.camera.get_link_bandwidth()
+
+    def model(self):
+        """The calibrated model, or a coarse one derived from the camera's current resulting frame rate."""
+        if self.readout_model is not None:
+            return self.readout_model
+        period = 1.0 / self.camera.get_resulting_frame_rate()
+        exposure = self.camera.get_exposure() / 1e3
+        # Exposure limited at the current settings: nothing is known about the readout beyond being faster
+        readout = period if period > 1.05 * exposure else exposure
+        return ReadoutModel(max(0.0, period - exposure), 0.0, readout / self.camera.get_height(), None)
+
+    def plan(self, width, height, exposure, pixel_format='Mono8', link_bandwidth=None):
+        """
+        Predicted frame rate of a proposed configuration.
+
+        Parameters
+        ----------
+        width, height : int
+            WOI [px].
+        exposure : float
+            Exposure time [ms].
+        pixel_format : str or int
+            Pixel format name or bit depth.
+        link_bandwidth : float, optional
+            Usable link bandwidth [bytes/s], overriding the planner's.
+
+        Returns
+        -------
+        FramePlan
+        """
+        model = self.model()
+        bytes_per_pixel = pixel_format_bytes(pixel_format)
+        terms = model.terms(exposure, width, height, bytes_per_pixel)
+        link = link_bandwidth if link_bandwidth is not None else self.get_link_bandwidth()
+        if link:
+            terms[2] = max(float(terms[2]), width * height * bytes_per_pixel / link)
+        factor = int(terms.argmax())
+        return FramePlan(1.0 / float(terms[factor]), ('exposure', 'readout', 'bandwidth')[factor], exposure,
+                         width, height, pixel_format, 'model')
+
+    def current(self):
+        """Frame rate of the applied settings, read from the camera, with the limiting factor of the model."""
+        planned = self.plan(self.camera.get_width(), self.camera.get_height(), self.camera.get_exposure(),
+                            self.camera.get_pixel_format())
+        try:
+            fps = self.camera.get_resulting_frame_rate()
+        except Exception:
+            return planned
+        return planned._replace(fps=fps, source='camera')
+
+    def max_exposure(self, width, height, pixel_format='Mono8', fps=None):
+        """
+        Longest exposure [ms] that keeps `fps` (the fastest rate of the WOI if not given). None if the WOI cannot
+        reach `fps` at any exposure.
+        """
+        floor = self.plan(width, height, 0.0, pixel_format)
+        if fps is None:
+            fps = floor.fps
+        if floor.fps < fps:
+            return None
+        return max(0.0, (1.0 / fps - self.model().exposure_overhead) * 1e3)
+
+    def max_height(self, width, exposure, fps, pixel_format='Mono8', height_range=(1, 100000), increment=1):
+        """Tallest WOI (multiple of `increment`) reaching `fps` at `exposure`, None if even the lowest does not."""
+        low, high = height_range
+        low = -(-low // increment) * increment
+        high = high // increment * increment
+        if self.plan(width, low, exposure, pixel_format).fps < fps:
+            return None
+        # The period does not decrease with height, so bisect
+        while low < high:
+            middle = (low + high + increment) // 2 // increment * increment
+            if self.plan(width, middle, exposure, pixel_format).fps >= fps:
+                low = middle
+            else:
+                high = middle - increment
+        return low
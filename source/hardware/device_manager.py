@@ -7,16 +7,24 @@ from pylablib.devices import Thorlabs
 
 import source.hardware.slms.EXULUS_COMMAND_LIB as ThorlabsExulus
 from source.hardware.camera.camera_models.basler import Basler
+from source.hardware.filter.PE_filter import PEFilter, list_pe_filters
 from source.hardware.motion_control.motion_control_models.thorlabs_kcube_KDC101 import KinesisMotor
 from source.hardware.motion_control.motion_control_models.thorlabs_kcube_KSC101 import KinesisSolenoid
 
 #from source.hardware.usb_helper import get_usb_devices_by_serial, get_usb_info
 
+# Kinesis serial number prefixes of the supported K-Cubes
+KINESIS_SERIAL_PREFIXES = {
+    '27': 'k_cube_KDC',  # KDC101 DC servo
+    '68': 'k_cube_KSC',  # KSC101 solenoid
+}
+
 # Define a mapping of device types to their corresponding classes
 DEVICE_CLASS_REGISTRY = {
     'camera': Basler,
     'k_cube_KDC': KinesisMotor,
-    'k_cube_KSC': KinesisSolenoid
+    'k_cube_KSC': KinesisSolenoid,
+    'filter': PEFilter
     # Add new device types here
     # 'motor': MotorDevice,
     # 'sensor': SensorDevice,
@@ -25,15 +33,17 @@ DEVICE_CLASS_REGISTRY = {
 
 class ThreadWorker(QThread):
 
-    def __init__(self, device):
+    def __init__(self, device, interval=0.01):
         super().__init__()
         self.device = device
+        self.interval = interval  # Pause between steps [s], keeps the loop from spinning a core
         self.running = False
 
     def run(self):
         self.running = True
         while self.running:
             self.device.step()
+            self.msleep(int(self.interval * 1000))
 
     def stop(self):
         self.running = False
@@ -72,6 +82,9 @@ class DeviceManager:
             # Detect SLM devices
             self._detect_slm_devices(current_device_serials)
 
+            # Detect tunable filters
+            self._detect_filter_devices(current_device_serials)
+
             # Remove disconnected devices
             self._cleanup_disconnected_devices(current_device_serials)
 
@@ -107,7 +120,7 @@ class DeviceManager:
                 if serial_number not in self.connected_devices:
                     self.connected_devices[serial_number] = {
                         'name': description,
-                        'type': 'k_cube',
+                        'type': KINESIS_SERIAL_PREFIXES.get(str(serial_number)[:2], 'k_cube'),
                         'status': 'connected'
                     }
         except Exception as e:
@@ -129,6 +142,20 @@ class DeviceManager:
         except Exception as e:
             self.logger.error(f"Error detecting SLM devices: {str(e)}")
 
+    def _detect_filter_devices(self, current_device_serials: set) -> None:
+        """Detect and register PE tunable filters (one per PHySpec configuration file)."""
+        try:
+            for serial_number in list_pe_filters():
+                current_device_serials.add(serial_number)
+                if serial_number not in self.connected_devices:
+                    self.connected_devices[serial_number] = {
+                        'name': f'PE filter {serial_number}',
+                        'type': 'filter',
+                        'status': 'connected'
+                    }
+        except Exception as e:
+            self.logger.error(f"Error detecting filter devices: {str(e)}")
+
     def _cleanup_disconnected_devices(self, current_device_serials: set) -> None:
         """Remove devices that are no longer connected."""
         disconnected_devices = [serial for serial in self.connected_devices
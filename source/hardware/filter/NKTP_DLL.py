@@ -8,6 +8,8 @@ from ctypes import (c_ubyte, c_short, c_ushort, c_long, c_ulong, c_ulonglong,
                     c_char_p, POINTER, CFUNCTYPE, create_string_buffer, byref)
 from collections import namedtuple
 
+from source.hardware.filter.NKTP_types import *
+
 # Try preloading the OS related DLL, x86 or x64.
 # Alternatively copy the correct version into your script folder.
 
@@ -21,221 +23,6 @@ else:
     NKTPDLL = ctypes.cdll.LoadLibrary(dllFolder + r'\NKTPDLL\x64\NKTPDLL.dll')
 
 
-def PortResultTypes(result):
-    return {
-        0: '0:OPSuccess',
-        1: '1:OPFailed',
-        2: '2:OPPortNotFound',
-        3: '3:OPNoDevices',
-        4: '4:OPApplicationBusy',
-    }.get(result, 'Unknown result')
-
-
-def P2PPortResultTypes(result):
-    return {
-        0: '0:P2PSuccess',
-        1: '1:P2PInvalidPortname',
-        2: '2:P2PInvalidLocalIP',
-        3: '3:P2PInvalidRemoteIP',
-        4: '4:P2PPortnameNotFound',
-        5: '5:P2PPortnameExists',
-        6: '6:P2PApplicationBusy',
-    }.get(result, 'Unknown result')
-
-
-def DeviceResultTypes(result):
-    return {
-        0: '0:DevResultSuccess',
-        1: '1:DevResultWaitTimeout',
-        2: '2:DevResultFailed',
-        3: '3:DevResultDeviceNotFound',
-        4: '4:DevResultPortNotFound',
-        5: '5:DevResultPortOpenError',
-        6: '6:DevResultApplicationBusy',
-    }.get(result, 'Unknown result')
-
-
-def DeviceModeTypes(mode):
-    return {
-        0: '0:DevModeDisabled',
-        1: '1:DevModeAnalyzeInit',
-        2: '2:DevModeAnalyze',
-        3: '3:DevModeNormal',
-        4: '4:DevModeLogDownload',
-        5: '5:DevModeError',
-        6: '6:DevModeTimeout',
-        7: '7:DevModeUpload',
-    }.get(mode, 'Unknown mode' + str(mode))
-
-
-def RegisterResultTypes(result):
-    return {
-        0: '0:RegResultSuccess',
-        1: '1:RegResultReadError',
-        2: '2:RegResultFailed',
-        3: '3:RegResultBusy',
-        4: '4:RegResultNacked',
-        5: '5:RegResultCRCErr',
-        6: '6:RegResultTimeout',
-        7: '7:RegResultComError',
-        8: '8:RegResultTypeError',
-        9: '9:RegResultIndexError',
-        10: '10:RegResultPortClosed',
-        11: '11:RegResultRegisterNotFound',
-        12: '12:RegResultDeviceNotFound',
-        13: '13:RegResultPortNotFound',
-        14: '14:RegResultPortOpenError',
-        15: '15:RegResultApplicationBusy',
-    }.get(result, 'Unknown result')
-
-
-def RegisterDataTypes(datatype):
-    return {
-        0: '0:RegData_Unknown',
-        1: '1:RegData_Array',
-        2: '2:RegData_U8',
-        3: '3:RegData_S8',
-        4: '4:RegData_U16',
-        5: '5:RegData_S16',
-        6: '6:RegData_U32',
-        7: '7:RegData_S32',
-        8: '8:RegData_F32',
-        9: '9:RegData_U64',
-        10: '10:RegData_S64',
-        11: '11:RegData_F64',
-        12: '12:RegData_Ascii',
-        13: '13:RegData_Paramset',
-        14: '14:RegData_B8',
-        15: '15:RegData_H8',
-        16: '16:RegData_B16',
-        17: '17:RegData_H16',
-        18: '18:RegData_B32',
-        19: '19:RegData_H32',
-        20: '20:RegData_B64',
-        21: '21:RegData_H64',
-        22: '22:RegData_DateTime',
-    }.get(datatype, 'Unknown data type')
-
-
-def RegisterPriorityTypes(priority):
-    return {
-        0: '0:RegPriority_Low',
-        1: '1:RegPriority_High',
-    }.get(priority, 'Unknown priority')
-
-
-def PortStatusTypes(status):
-    return {
-        0: '0:PortStatusUnknown',
-        1: '1:PortOpening',
-        2: '2:PortOpened',
-        3: '3:PortOpenFail',
-        4: '4:PortScanStarted',
-        5: '5:PortScanProgress',
-        6: '6:PortScanDeviceFound',
-        7: '7:PortScanEnded',
-        8: '8:PortClosing',
-        9: '9:PortClosed',
-        10: '10:PortReady',
-    }.get(status, 'Unknown status')
-
-
-def DeviceStatusTypes(status):
-    return {
-        0: '0:DeviceModeChanged',
-        1: '1:DeviceLiveChanged',
-        2: '2:DeviceTypeChanged',
-        3: '3:DevicePartNumberChanged',
-        4: '4:DevicePCBVersionChanged',
-        5: '5:DeviceStatusBitsChanged',
-        6: '6:DeviceErrorCodeChanged',
-        7: '7:DeviceBlVerChanged',
-        8: '8:DeviceFwVerChanged',
-        9: '9:DeviceModuleSerialChanged',
-        10: '10:DevicePCBSerialChanged',
-        11: '11:DeviceSysTypeChanged',
-    }.get(status, 'Unknown status')
-
-
-def RegisterStatusTypes(status):
-    return {
-        0: '0:RegSuccess',
-        1: '1:RegBusy',
-        2: '2:RegNacked',
-        3: '3:RegCRCErr',
-        4: '4:RegTimeout',
-        5: '5:RegComError',
-    }.get(status, 'Unknown status')
-
-
-class tDateTimeStruct(ctypes.Structure):
-    _fields_ = [('Sec', c_ubyte),  # !< Seconds
-                ('Min', c_ubyte),  # !< Minutes
-                ('Hour', c_ubyte),  # !< Hours
-                ('Day', c_ubyte),  # !< Days
-                ('Month', c_ubyte),  # !< Months
-                ('Year', c_ubyte)]  # !< Years
-
-
-def ParamSetUnitTypes(unit):
-    return {
-        0: '0:Unit None',
-        1: '1:Unit mV',
-        2: '2:Unit V',
-        3: '3:Unit uA',
-        4: '4:Unit mA',
-        5: '5:Unit A',
-        6: '6:Unit uW',
-        7: '7:Unit cmW',
-        8: '8:Unit dmW',
-        9: '9:Unit mW',
-        10: '10:Unit W',
-        11: '11:Unit mC',
-        12: '12:Unit cC',
-        13: '13:Unit dC',
-        14: '14:Unit pm',
-        15: '15:Unit dnm',
-        16: '16:Unit nm',
-        17: '17:Unit PerCent',
-        18: '18:Unit PerMille',
-        19: '19:Unit cmA',
-        20: '20:Unit dmA',
-        21: '21:Unit RPM',
-        22: '22:Unit dBm',
-        23: '23:Unit cBm',
-        24: '24:Unit mBm',
-        25: '25:Unit dB',
-        26: '26:Unit cB',
-        27: '27:Unit mB',
-        28: '28:Unit dpm',
-        29: '29:Unit cV',
-        30: '30:Unit dV',
-        31: '31:Unit lm',
-        32: '32:Unit dlm',
-        33: '33:Unit clm',
-        34: '34:Unit mlm',
-    }.get(unit, 'Unknown unit')
-
-class tParamSetStruct(ctypes.Structure):
-    """
-    tParamSetStruct, The ParameterSet struct
-        * note How calculation on parametersets is done internally by modules:\n
-        * DAC_value = (value * (X/Y)) + Offset; Where value is either StartVal or FactoryVal\n
-        * value = (ADC_value * (X/Y)) + Offset; Where value often is available via another measurement register\n
-    """
-    _fields_ = [('Unit', c_ubyte),  # !< Unit type as defined in ::ParamSetUnitTypes
-                ('ErrorHandler', c_ubyte),  # !< Warning/Errorhandler not used.
-                # !< Setpoint for Settings parameterset, unused in Measurement parametersets.
-                ('StartVal', c_ushort),
-                # !< Factory Setpoint for Settings parameterset, unused in Measurement parametersets.
-                ('FactoryVal', c_ushort),
-                ('ULimit', c_ushort),  # !< Upper limit.
-                ('LLimit', c_ushort),  # !< Lower limit.
-                ('Numerator', c_short),  # !< Numerator(X) for calculation.
-                ('Denominator', c_short),  # !< Denominator(Y) for calculation.
-                ('Offset', c_short)]  # !< Offset for calculation
-
-
 # *******************************************************************************************************
 # Port functions
 # *******************************************************************************************************
@@ -0,0 +1,559 @@
+"""In-process emulator of the NKT Photonics DLL.
+
+:class:`NKTPEmulator` exposes the same functions as :mod:`NKTP_DLL` (port, point-to-point, register and device
+functions, including the raw ``_registerRead*``/``_registerWrite*`` prototypes used by the register engine),
+but talks to :class:`EmulatedModule` register maps instead of real hardware. Bus latency and error results are
+configurable, so register polling, retry logic and the laser/filter control paths can be exercised and
+benchmarked on machines without NKTPDLL.dll.
+
+Point-to-point ports are served by :class:`EmulatedModuleServer` over a localhost TCP socket.
+"""
+import random
+import socket
+import socketserver
+import struct
+import threading
+import time
+from ctypes import (c_ubyte, c_byte, c_ushort, c_short, c_ulong, c_long, c_ulonglong, c_longlong, c_float,
+                    c_double)
+from collections import namedtuple
+
+from source.hardware.filter.NKTP_types import *
+
+# ::RegisterResultTypes used by the emulator
+REG_SUCCESS = 0
+REG_BUSY = 3
+REG_NACKED = 4
+REG_TIMEOUT = 6
+REG_COM_ERROR = 7
+REG_PORT_NOT_FOUND = 13
+
+# ::PortResultTypes
+OP_SUCCESS = 0
+OP_FAILED = 1
+OP_PORT_NOT_FOUND = 2
+
+# ::P2PPortResultTypes
+P2P_SUCCESS = 0
+P2P_PORTNAME_NOT_FOUND = 4
+
+# Standard module registers
+REG_MODULE_TYPE = 0x61
+REG_FIRMWARE_VERSION = 0x64
+REG_MODULE_SERIAL = 0x65
+REG_STATUS_BITS = 0x66
+REG_ERROR_CODE = 0x67
+
+# (NKTP_DLL suffix, struct format, ctypes type) of the typed register functions
+TYPED_REGISTERS = (
+    ('U8', '<B', c_ubyte),
+    ('S8', '<b', c_byte),
+    ('U16', '<H', c_ushort),
+    ('S16', '<h', c_short),
+    ('U32', '<I', c_ulong),
+    ('S32', '<i', c_long),
+    ('U64', '<Q', c_ulonglong),
+    ('S64', '<q', c_longlong),
+    ('F32', '<f', c_float),
+    ('F64', '<d', c_double),
+)
+
+# Same named tuple as NKTP_DLL.pointToPointPortData
+pointToPointPortData = namedtuple(
+    'pointToPointPortData', 'hostAddress, hostPort, clientAddress, clientPort, protocol, msTimeout')
+
+# Telegram format of the point-to-point socket: request (op, devId, regId, index, length) + data,
+# response (result, length) + data
+_REQUEST = struct.Struct('<BBBhB')
+_RESPONSE = struct.Struct('<BB')
+_OP_READ = 0
+_OP_WRITE = 1
+
+
+class EmulatedModule:
+    """
+    Register map of one emulated NKT module.
+
+    Registers are stored as little-endian byte strings, the `index` argument of the DLL functions is the byte
+    offset into the register (-1 meaning 0), as on the real modules.
+    """
+
+    def __init__(self, module_type, serial='EMU00000', firmware=100, registers=None):
+        self.lock = threading.Lock()
+        self.registers = {
+            REG_MODULE_TYPE: struct.pack('<B', module_type),
+            REG_FIRMWARE_VERSION: struct.pack('<H', firmware),
+            REG_MODULE_SERIAL: serial.encode('ascii'),
+            REG_STATUS_BITS: struct.pack('<H', 0),
+            REG_ERROR_CODE: struct.pack('<H', 0),
+        }
+        for regId, value in (registers or {}).items():
+            self.registers[regId] = bytes(value)
+
+    @classmethod
+    def superk_extreme(cls, serial='EMU-EXTREME'):
+        """SuperK EXTREME/FIANIUM supercontinuum source: emission (0x30), power level in per mille (0x37)."""
+        return cls(0x60, serial, registers={0x30: struct.pack('<B', 0), 0x37: struct.pack('<H', 0)})
+
+    @classmethod
+    def superk_varia(cls, serial='EMU-VARIA'):
+        """SuperK VARIA tunable filter: ND setpoint (0x32), short (0x33) and long (0x34) edge in 0.1 nm."""
+        return cls(0x68, serial, registers={0x32: struct.pack('<H', 1000), 0x33: struct.pack('<H', 5950),
+                                            0x34: struct.pack('<H', 6050)})
+
+    def read(self, regId, index, size):
+        """Returns (::RegisterResultTypes, data). `size` of 0 reads the whole register."""
+        with self.lock:
+            data = self.registers.get(regId)
+        if data is None:
+            return REG_NACKED, b''
+        start = max(index, 0)
+        end = len(data) if size == 0 else start + size
+        if end > len(data):
+            return REG_NACKED, b''
+        return REG_SUCCESS, data[start:end]
+
+    def write(self, regId, index, data):
+        """Writes `data` at byte offset `index`, extending the register if needed."""
+        with self.lock:
+            current = self.registers.get(regId, b'')
+            start = max(index, 0)
+            if len(current) < start:
+                current = current + bytes(start - len(current))
+            self.registers[regId] = current[:start] + bytes(data) + current[start + len(data):]
+        return REG_SUCCESS
+
+    def set_value(self, regId, fmt, value):
+        """Sets a register from the module side, e.g. to simulate a status change."""
+        with self.lock:
+            self.registers[regId] = struct.pack(fmt, value)
+
+
+class _ModuleRequestHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        modules = self.server.modules
+        while True:
+            header = _recv_exact(self.request, _REQUEST.size)
+            if header is None:
+                return
+            op, devId, regId, index, length = struct.unpack(_REQUEST.format, header)
+            payload = _recv_exact(self.request, length) if op == _OP_WRITE else b''
+
+            module = modules.get(devId)
+            if module is None:
+                # No module answers on the bus
+                result, data = REG_TIMEOUT, b''
+            elif op == _OP_READ:
+                result, data = module.read(regId, index, length)
+            else:
+                result, data = module.write(regId, index, payload), b''
+            self.request.sendall(_RESPONSE.pack(result, len(data)) + data)
+
+
+class EmulatedModuleServer(socketserver.ThreadingTCPServer):
+    """
+    Serves emulated modules over a localhost TCP socket, standing in for an Ethernet-connected NKT module
+    reached through a point-to-point port. Use ``server.server_address`` as the client address of the port.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, modules, host='127.0.0.1', port=0):
+        super().__init__((host, port), _ModuleRequestHandler)
+        self.modules = modules
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="NKTP-emulator-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _Port:
+    """Local (serial) port holding modules directly."""
+
+    def __init__(self):
+        self.modules = {}
+        self.opened = False
+        self.bus_lock = threading.Lock()  # One telegram at a time, as on a real bus
+
+    def read(self, devId, regId, index, size):
+        module = self.modules.get(devId)
+        if module is None:
+            return REG_TIMEOUT, b''
+        return module.read(regId, index, size)
+
+    def write(self, devId, regId, index, data):
+        module = self.modules.get(devId)
+        if module is None:
+            return REG_TIMEOUT
+        return module.write(regId, index, data)
+
+    def close(self):
+        self.opened = False
+
+
+class _PointToPointPort(_Port):
+    """Point-to-point port forwarding telegrams to an EmulatedModuleServer."""
+
+    def __init__(self, portdata):
+        super().__init__()
+        self.portdata = portdata
+        self.socket = None
+
+    def connect(self):
+        if self.socket is None:
+            timeout = max(self.portdata.msTimeout, 1) / 1000.0
+            self.socket = socket.create_connection((self.portdata.clientAddress, self.portdata.clientPort),
+                                                   timeout=timeout)
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _transfer(self, op, devId, regId, index, data, size):
+        try:
+            self.connect()
+            length = len(data) if op == _OP_WRITE else size
+            self.socket.sendall(_REQUEST.pack(op, devId, regId, index, length) + data)
+            header = _recv_exact(self.socket, _RESPONSE.size)
+            if header is None:
+                raise ConnectionError("Connection closed by the module server")
+            result, length = _RESPONSE.unpack(header)
+            return result, _recv_exact(self.socket, length) if length else b''
+        except socket.timeout:
+            # The late response would be read as the answer of the next request: the next transfer reconnects,
+            # the port itself stays open
+            self._disconnect()
+            return REG_TIMEOUT, b''
+        except OSError:
+            self.close()
+            return REG_COM_ERROR, b''
+
+    def read(self, devId, regId, index, size):
+        return self._transfer(_OP_READ, devId, regId, index, b'', size)
+
+    def write(self, devId, regId, index, data):
+        return self._transfer(_OP_WRITE, devId, regId, index, bytes(data), 0)[0]
+
+    def _disconnect(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    def close(self):
+        super().close()
+        self._disconnect()
+
+
+class NKTPEmulator:
+    """
+    Drop-in replacement for the NKTP_DLL module.
+
+    Parameters
+    ----------
+    latency : float
+        Simulated duration of one bus telegram in seconds (a dedicated read over USB is typically 2-5 ms).
+    jitter : float
+        Uniformly distributed extra latency in seconds.
+    error_rate : float
+        Probability that a register telegram fails with `error_result`.
+    error_result : int
+        ::RegisterResultTypes returned by random failures, RegResultBusy by default.
+    seed : int, optional
+        Seed of the random generator, for reproducible benchmarks.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_result=REG_BUSY, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_result = error_result
+        self._random = random.Random(seed)
+        self._ports = {}
+        self._injected = {}
+        self._lock = threading.Lock()
+        self.telegrams = 0
+
+    ############################################ EMULATOR SETUP ########################################################
+
+    def add_module(self, portname, devId, module):
+        """Connects an EmulatedModule at address `devId` of a local port, creating the port if needed."""
+        port = self._ports.setdefault(portname, _Port())
+        port.modules[devId] = module
+        return module
+
+    def inject_error(self, devId, regId, result, count=1):
+        """The next `count` telegrams to (devId, regId) fail with `result`, to test retry logic."""
+        with self._lock:
+            self._injected[(devId, regId)] = [result] * count
+
+    def _telegram(self, portname, devId, regId, transfer):
+        """Runs one bus telegram on `portname` with the configured latency and errors."""
+        port = self._ports.get(portname)
+        if port is None:
+            return REG_PORT_NOT_FOUND, b''
+
+        with port.bus_lock:
+            self.telegrams += 1
+            delay = self.latency + (self._random.uniform(0.0, self.jitter) if self.jitter else 0.0)
+            if delay > 0:
+                time.sleep(delay)
+
+            with self._lock:
+                injected = self._injected.get((devId, regId))
+                if injected:
+                    return injected.pop(), b''
+            if self.error_rate and self._random.random() < self.error_rate:
+                return self.error_result, b''
+
+            return transfer(port)
+
+    def _read(self, portname, devId, regId, index, size):
+        return self._telegram(portname, devId, regId, lambda port: port.read(devId, regId, index, size))
+
+    def _write(self, portname, devId, regId, index, data):
+        return self._telegram(portname, devId, regId, lambda port: (port.write(devId, regId, index, data), b''))[0]
+
+    ############################################### PORT FUNCTIONS #####################################################
+
+    def getAllPorts(self):
+        return ','.join(self._ports)
+
+    def getOpenPorts(self):
+        return ','.join(name for name, port in self._ports.items() if port.opened)
+
+    def pointToPointPortAdd(self, portname, portdata):
+        existing = self._ports.get(portname)
+        if isinstance(existing, _PointToPointPort):
+            existing.close()
+        self._ports[portname] = _PointToPointPort(pointToPointPortData(*portdata))
+        return P2P_SUCCESS
+
+    def pointToPointPortGet(self, portname):
+        port = self._ports.get(portname)
+        if not isinstance(port, _PointToPointPort):
+            return P2P_PORTNAME_NOT_FOUND, pointToPointPortData('', 0, '', 0, 0, 0)
+        return P2P_SUCCESS, port.portdata
+
+    def pointToPointPortDel(self, portname):
+        port = self._ports.get(portname)
+        if not isinstance(port, _PointToPointPort):
+            return P2P_PORTNAME_NOT_FOUND
+        port.close()
+        del self._ports[portname]
+        return P2P_SUCCESS
+
+    def openPorts(self, portnames, autoMode, liveMode):
+        names = [name for name in portnames.split(',') if name] or list(self._ports)
+        for name in names:
+            port = self._ports.get(name)
+            if port is None:
+                return OP_PORT_NOT_FOUND
+            if isinstance(port, _PointToPointPort):
+                try:
+                    port.connect()
+                except OSError:
+                    return OP_FAILED
+            port.opened = True
+        return OP_SUCCESS
+
+    def closePorts(self, portnames):
+        names = [name for name in portnames.split(',') if name] or list(self._ports)
+        for name in names:
+            port = self._ports.get(name)
+            if port is None:
+                return OP_PORT_NOT_FOUND
+            port.close()
+        return OP_SUCCESS
+
+    def setLegacyBusScanning(self, legacyScanning):
+        pass
+
+    def getLegacyBusScanning(self):
+        return 0
+
+    def getPortStatus(self, portname):
+        port = self._ports.get(portname)
+        if port is None:
+            return OP_PORT_NOT_FOUND, 0
+        return OP_SUCCESS, 10 if port.opened else 9  # PortReady / PortClosed
+
+    def getPortErrorMsg(self, portname):
+        return (OP_SUCCESS, '') if portname in self._ports else (OP_PORT_NOT_FOUND, '')
+
+    ############################################# REGISTER FUNCTIONS ###################################################
+
+    def registerRead(self, portname, devId, regId, index):
+        return self._read(portname, devId, regId, index, 0)
+
+    def _registerReadAscii(self, portname, devId, regId, readStr, maxLen, index):
+        result, data = self._read(portname.decode('ascii'), devId, regId, index, 0)
+        if result == REG_SUCCESS:
+            data = data.split(b'\0', 1)[0][:maxLen.value - 1]
+            readStr.value = data
+            maxLen.value = len(data)
+        return result
+
+    def registerReadAscii(self, portname, devId, regId, index):
+        result, data = self._read(portname, devId, regId, index, 0)
+        return result, data.split(b'\0', 1)[0] if result == REG_SUCCESS else b''
+
+    def registerWrite(self, portname, devId, regId, writeData, writeSize, index):
+        return self._write(portname, devId, regId, index, bytes(writeData)[:writeSize])
+
+    def _registerWriteAscii(self, portname, devId, regId, writeStr, writeEOL, index):
+        data = bytes(writeStr)[:239] + (b'\0' if writeEOL else b'')
+        return self._write(portname.decode('ascii'), devId, regId, index, data)
+
+    def registerWriteAscii(self, portname, devId, regId, strValue, wrEOL, index):
+        return self._registerWriteAscii(portname.encode('ascii'), devId, regId, strValue.encode('ascii'), wrEOL,
+                                        index)
+
+    def registerWriteRead(self, portname, devId, regId, writeData, writeSize, index):
+        result = self.registerWrite(portname, devId, regId, writeData, writeSize, index)
+        if result != REG_SUCCESS:
+            return result, b''
+        return self.registerRead(portname, devId, regId, index)
+
+    def registerWriteReadAscii(self, portname, devId, regId, strValue, wrEOL, index):
+        result = self.registerWriteAscii(portname, devId, regId, strValue, wrEOL, index)
+        if result != REG_SUCCESS:
+            return result, b''
+        return self.registerReadAscii(portname, devId, regId, index)
+
+    ############################################## DEVICE FUNCTIONS ####################################################
+
+    def _device_read(self, portname, devId, regId, fmt):
+        result, data = self._read(portname, devId, regId, -1, struct.calcsize(fmt))
+        return result, struct.unpack(fmt, data)[0] if result == REG_SUCCESS else 0
+
+    def _device_read_str(self, portname, devId, regId):
+        result, data = self.registerReadAscii(portname, devId, regId, -1)
+        return result, data.decode('ascii')
+
+    def deviceGetType(self, portname, devId):
+        return self._device_read(portname, devId, REG_MODULE_TYPE, '<B')
+
+    def deviceGetFirmwareVersion(self, portname, devId):
+        return self._device_read(portname, devId, REG_FIRMWARE_VERSION, '<H')
+
+    def deviceGetStatusBits(self, portname, devId):
+        return self._device_read(portname, devId, REG_STATUS_BITS, '<H')
+
+    def deviceGetErrorCode(self, portname, devId):
+        return self._device_read(portname, devId, REG_ERROR_CODE, '<H')
+
+    def deviceGetModuleSerialNumberStr(self, portname, devId):
+        return self._device_read_str(portname, devId, REG_MODULE_SERIAL)
+
+    def deviceExists(self, portname, devId):
+        port = self._ports.get(portname)
+        return OP_SUCCESS, int(port is not None and devId in port.modules)
+
+    def deviceCreate(self, portname, devId, waitReady):
+        result, _ = self.deviceGetType(portname, devId)
+        return 0 if result == REG_SUCCESS else 3  # DevResultSuccess / DevResultDeviceNotFound
+
+    def deviceRemove(self, portname, devId):
+        return 0
+
+    def deviceRemoveAll(self, portname):
+        return 0
+
+    def deviceGetAllTypes(self, portname):
+        port = self._ports.get(portname)
+        if port is None:
+            return 4, b''  # DevResultPortNotFound
+        types = bytearray(256)
+        for devId, module in port.modules.items():
+            types[devId] = module.registers[REG_MODULE_TYPE][0]
+        return 0, bytes(types)
+
+    def deviceGetMode(self, portname, devId):
+        return 0, 3  # DevModeNormal
+
+    def deviceGetLive(self, portname, devId):
+        return 0, 0
+
+    def deviceSetLive(self, portname, devId, liveMode):
+        return 0
+
+
+def _recv_exact(sock, size):
+    """Receives exactly `size` bytes, None if the connection was closed."""
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data.extend(chunk)
+    return bytes(data)
+
+
+def _make_typed_functions(suffix, fmt, ctype):
+    """Builds the raw ctypes-style prototype and the NKTP_DLL-style wrapper for one register type."""
+    size = struct.calcsize(fmt)
+
+    def raw_read(self, portname, devId, regId, value, index):
+        result, data = self._read(portname.decode('ascii'), devId, regId, index, size)
+        if result == REG_SUCCESS:
+            value.value = struct.unpack(fmt, data)[0]
+        return result
+
+    def read(self, portname, devId, regId, index):
+        value = ctype(0)
+        result = raw_read(self, portname.encode('ascii'), devId, regId, value, index)
+        return result, value.value
+
+    def raw_write(self, portname, devId, regId, value, index):
+        return self._write(portname.decode('ascii'), devId, regId, index, struct.pack(fmt, value))
+
+    def write(self, portname, devId, regId, value, index):
+        return raw_write(self, portname.encode('ascii'), devId, regId, value, index)
+
+    def write_read(self, portname, devId, regId, writeValue, index):
+        result = write(self, portname, devId, regId, writeValue, index)
+        if result != REG_SUCCESS:
+            return result, 0
+        return read(self, portname, devId, regId, index)
+
+    return {
+        f'_registerRead{suffix}': raw_read,
+        f'registerRead{suffix}': read,
+        f'_registerWrite{suffix}': raw_write,
+        f'registerWrite{suffix}': write,
+        f'registerWriteRead{suffix}': write_read,
+    }
+
+
+for _suffix, _fmt, _ctype in TYPED_REGISTERS:
+    for _name, _function in _make_typed_functions(_suffix, _fmt, _ctype).items():
+        setattr(NKTPEmulator, _name, _function)
+
+
+if __name__ == "__main__":
+    # Polling throughput through the register engine at a realistic USB latency
+    from source.hardware.filter.NKTP_registers import RegisterEngine, REG_DATA_U8, REG_DATA_U16
+
+    emulator = NKTPEmulator(latency=0.003, jitter=0.001, error_rate=0.01, seed=0)
+    emulator.add_module("COM5", 15, EmulatedModule.superk_extreme())
+    emulator.add_module("COM5", 16, EmulatedModule.superk_varia())
+
+    engine = RegisterEngine("COM5", backend=emulator)
+    engine.start()
+    status = [(15, REG_STATUS_BITS, REG_DATA_U16), (15, 0x30, REG_DATA_U8), (15, 0x37, REG_DATA_U16),
+              (16, 0x33, REG_DATA_U16), (16, 0x34, REG_DATA_U16)]
+
+    start = time.perf_counter()
+    batches = 100
+    for _ in range(batches):
+        futures = engine.submit(status)
+        [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+    engine.stop()
+
+    print(f"{batches} status batches in {elapsed:.2f} s: {batches / elapsed:.1f} Hz, "
+          f"{emulator.telegrams / elapsed:.0f} telegrams/s")
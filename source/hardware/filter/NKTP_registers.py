@@ -0,0 +1,275 @@
+"""Batched and pipelined register access for NKT Photonics modules.
+
+The wrappers in :mod:`NKTP_DLL` perform one blocking DLL call per register and allocate fresh ctypes
+buffers for every call. :class:`RegisterEngine` sits on top of the same ctypes prototypes and executes
+batches of register reads/writes on a dedicated I/O thread, reusing one preallocated buffer per data type.
+Every request resolves a :class:`concurrent.futures.Future`, so acquisition threads never block on the bus.
+"""
+import itertools
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+from ctypes import (c_ubyte, c_byte, c_ushort, c_short, c_ulong, c_long, c_ulonglong, c_longlong, c_float,
+                    c_double, create_string_buffer)
+
+from source.hardware.filter.NKTP_types import RegisterResultTypes
+
+# Values of ::RegisterPriorityTypes
+REG_PRIORITY_LOW = 0
+REG_PRIORITY_HIGH = 1
+
+# Values of ::RegisterDataTypes handled by the engine, mapped to the NKTP_DLL suffix and the ctypes buffer type
+REG_DATA_U8 = 2
+REG_DATA_S8 = 3
+REG_DATA_U16 = 4
+REG_DATA_S16 = 5
+REG_DATA_U32 = 6
+REG_DATA_S32 = 7
+REG_DATA_F32 = 8
+REG_DATA_U64 = 9
+REG_DATA_S64 = 10
+REG_DATA_F64 = 11
+REG_DATA_ASCII = 12
+
+REGISTER_TYPES = {
+    REG_DATA_U8: ('U8', c_ubyte),
+    REG_DATA_S8: ('S8', c_byte),
+    REG_DATA_U16: ('U16', c_ushort),
+    REG_DATA_S16: ('S16', c_short),
+    REG_DATA_U32: ('U32', c_ulong),
+    REG_DATA_S32: ('S32', c_long),
+    REG_DATA_F32: ('F32', c_float),
+    REG_DATA_U64: ('U64', c_ulonglong),
+    REG_DATA_S64: ('S64', c_longlong),
+    REG_DATA_F64: ('F64', c_double),
+}
+
+# ::RegisterResultTypes worth retrying: RegResultBusy, RegResultCRCErr, RegResultTimeout
+RETRYABLE_RESULTS = (3, 5, 6)
+
+ASCII_BUFFER_SIZE = 255
+
+# A single register access. `value` is None for a read, otherwise the value to write.
+RegisterRequest = namedtuple('RegisterRequest', 'devId, regId, dataType, index, value', defaults=(-1, None))
+
+
+class RegisterError(RuntimeError):
+    """Raised (through the request future) when the DLL returns a non-success ::RegisterResultTypes."""
+
+    def __init__(self, result, request, description):
+        super().__init__(f"Register 0x{request.regId:02X} on device {request.devId} failed: {description}")
+        self.result = result
+        self.request = request
+
+
+class _PollJob:
+    """Periodic batch executed by the I/O thread."""
+
+    def __init__(self, requests, interval, callback):
+        self.requests = [RegisterRequest(*request) for request in requests]
+        self.interval = interval
+        self.callback = callback
+        self.next_due = time.monotonic()
+
+
+class RegisterEngine:
+    """
+    Executes register batches for a single NKT port on a dedicated I/O thread.
+
+    Requests are ordered by ::RegisterPriorityTypes (high priority first, FIFO within a priority) and every
+    request returns a future that resolves to the read value (or the written value). Periodic polls, e.g. a
+    laser status loop at 50 Hz, are scheduled on the same thread and take precedence over queued batches.
+
+    Parameters
+    ----------
+    portname : str
+        Port the modules are connected to, e.g. "COM5".
+    backend : module or object, optional
+        Provider of the NKTP_DLL ctypes prototypes (``_registerReadU8``, ``_registerWriteU8``, ...).
+        Defaults to :mod:`NKTP_DLL`; the emulator exposes the same interface.
+    retries : int
+        Number of retries for transient bus errors (busy, CRC error, timeout).
+    """
+
+    def __init__(self, portname, backend=None, retries=2):
+        if backend is None:
+            # Imported lazily, loading the module loads NKTPDLL.dll
+            from source.hardware.filter import NKTP_DLL as backend
+        self.backend = backend
+        self.portname = portname
+        self.retries = retries
+
+        self._port = portname.encode('ascii')
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._polls = {}
+        self._polls_lock = threading.Lock()
+        self._running = False
+        self._thread = None
+
+        # === Preallocated buffers, one per data type, reused for every read ===
+        self._buffers = {data_type: ctype(0) for data_type, (_, ctype) in REGISTER_TYPES.items()}
+        self._ascii_size = c_ubyte(ASCII_BUFFER_SIZE)
+        self._ascii_buffer = create_string_buffer(ASCII_BUFFER_SIZE)
+
+        # === Resolve the ctypes prototypes once ===
+        self._readers = {data_type: getattr(backend, f'_registerRead{suffix}')
+                         for data_type, (suffix, _) in REGISTER_TYPES.items()}
+        self._writers = {data_type: getattr(backend, f'_registerWrite{suffix}')
+                         for data_type, (suffix, _) in REGISTER_TYPES.items()}
+        self._read_ascii = backend._registerReadAscii
+        self._write_ascii = backend._registerWriteAscii
+
+    def start(self):
+        """Starts the I/O thread."""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"NKTP-{self.portname}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        """Stops the I/O thread. Requests still queued are cancelled."""
+        if not self._running:
+            return
+        self._running = False
+        self._queue.put((-REG_PRIORITY_HIGH - 1, next(self._sequence), None, None))
+        self._thread.join(timeout)
+        self._thread = None
+
+        while True:
+            try:
+                _, _, requests, futures = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            for future in futures or ():
+                future.cancel()
+
+    ############################################## REQUEST API #########################################################
+
+    def submit(self, requests, priority=REG_PRIORITY_LOW):
+        """
+        Queues a batch of register requests.
+
+        Parameters
+        ----------
+        requests : iterable
+            RegisterRequest instances or (devId, regId, dataType[, index[, value]]) tuples.
+        priority : int
+            ::RegisterPriorityTypes value, REG_PRIORITY_HIGH batches overtake REG_PRIORITY_LOW ones.
+
+        Returns
+        -------
+        list of Future
+            One future per request, in the order given.
+        """
+        requests = [RegisterRequest(*request) for request in requests]
+        futures = [Future() for _ in requests]
+        self._queue.put((-priority, next(self._sequence), requests, futures))
+        return futures
+
+    def read(self, devId, regId, dataType, index=-1, priority=REG_PRIORITY_LOW):
+        """Queues a single register read and returns its future."""
+        return self.submit([RegisterRequest(devId, regId, dataType, index)], priority)[0]
+
+    def write(self, devId, regId, dataType, value, index=-1, priority=REG_PRIORITY_LOW):
+        """Queues a single register write and returns its future."""
+        return self.submit([RegisterRequest(devId, regId, dataType, index, value)], priority)[0]
+
+    def poll(self, name, requests, interval, callback):
+        """
+        Executes a batch every `interval` seconds on the I/O thread.
+
+        `callback(values)` is called on the I/O thread with a list holding, for each request, the value or the
+        exception (usually a RegisterError) raised by it. Exceptions of the callback are printed and ignored. Keep it short, e.g. emit a Qt signal.
+        """
+        with self._polls_lock:
+            self._polls[name] = _PollJob(requests, interval, callback)
+        # Wake the thread so it picks up the new deadline
+        self._queue.put((-REG_PRIORITY_HIGH, next(self._sequence), [], []))
+
+    def stop_poll(self, name):
+        """Removes a periodic poll."""
+        with self._polls_lock:
+            self._polls.pop(name, None)
+
+    ################################################ I/O THREAD ########################################################
+
+    def _run(self):
+        while self._running:
+            timeout = self._run_due_polls()
+            try:
+                _, _, requests, futures = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            if requests is None:
+                break
+
+            for request, future in zip(requests, futures):
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(self._execute(request))
+                except Exception as e:
+                    future.set_exception(e)
+
+    def _run_due_polls(self):
+        """Runs polls whose deadline passed and returns the time until the next one (None if no polls)."""
+        with self._polls_lock:
+            jobs = list(self._polls.items())
+        if not jobs:
+            return None
+
+        now = time.monotonic()
+        for name, job in jobs:
+            if job.next_due > now:
+                continue
+            values = []
+            for request in job.requests:
+                try:
+                    values.append(self._execute(request))
+                except Exception as e:
+                    values.append(e)
+            # Keep a fixed cadence, but after a late poll restart it from now instead of polling again at once
+            job.next_due += job.interval
+            if job.next_due <= now:
+                job.next_due = now + job.interval
+            try:
+                job.callback(values)
+            except Exception as e:
+                # A failing callback must not stop the I/O thread, other requests and polls go on
+                print(f"Register poll {name} callback failed: {e!r}")
+            now = time.monotonic()
+
+        return max(0.0, min(job.next_due for _, job in jobs) - now)
+
+    def _execute(self, request):
+        """Executes a request, retrying transient failures, and returns its value."""
+        for _ in range(self.retries + 1):
+            result, value = self._execute_once(request)
+            if result not in RETRYABLE_RESULTS:
+                break
+        if result != 0:
+            raise RegisterError(result, request, RegisterResultTypes(result))
+        return value
+
+    def _execute_once(self, request):
+        devId, regId, dataType, index, value = request
+
+        if dataType == REG_DATA_ASCII:
+            if value is None:
+                self._ascii_size.value = ASCII_BUFFER_SIZE
+                result = self._read_ascii(self._port, devId, regId, self._ascii_buffer, self._ascii_size, index)
+                return result, self._ascii_buffer.value.decode('ascii')
+            return self._write_ascii(self._port, devId, regId, value.encode('ascii'), 0, index), value
+
+        if dataType not in REGISTER_TYPES:
+            raise ValueError(f"Unsupported register data type {dataType}")
+
+        if value is None:
+            buffer = self._buffers[dataType]
+            result = self._readers[dataType](self._port, devId, regId, buffer, index)
+            return result, buffer.value
+        return self._writers[dataType](self._port, devId, regId, value, index), value
@@ -1,5 +1,11 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from ctypes import *
 
+DEFAULT_DLL_PATH = os.path.join(os.path.dirname(__file__), "PE_Filter_SDK.dll")
+DEFAULT_CONFIG_DIR = r"C:\Program Files\Photon etc\PHySpecV2\Devices"
+
 STATUS_CODE = {
     0: "PE_SUCCESS Function executed successfully.",
     1: "PE_INVALID_HANDLE Supplied handle is corrupted or has a NULL value.",
@@ -19,7 +25,7 @@ STATUS_CODE = {
 
 
 class PEDevice:
-    def __init__(self, dll_path, config_file_path):
+    def __init__(self, dll_path, config_file_path, settle_time=0.02):
         self.dll_path = dll_path
         self.config_file_path = config_file_path
         self.pe_dll = CDLL(self.dll_path)
@@ -40,6 +46,10 @@ class PEDevice:
         self.pe_set_wavelength.restype = c_int
         self.pe_set_wavelength.argtypes = [c_void_p, c_double]
 
+        self.pe_get_wavelength = self.pe_dll.PE_GetWavelength
+        self.pe_get_wavelength.restype = c_int
+        self.pe_get_wavelength.argtypes = [c_void_p, POINTER(c_double)]
+
         self.pe_close = self.pe_dll.PE_Close
         self.pe_close.restype = c_int
         self.pe_close.argtypes = [c_void_p]
@@ -60,6 +70,13 @@ class PEDevice:
         self.MAX_SYSTEM_NAME_LEN = 256
         self.system_name = create_string_buffer(self.MAX_SYSTEM_NAME_LEN)
 
+        self.wavelength = None
+        self.wavelength_range = (None, None)
+        # Time the filter needs after PE_SetWavelength returns before the transmission is stable [s]
+        self.settle_time = settle_time
+        # Wavelength changes are serialized on one worker so they can run while the camera reads out
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="PE-filter")
+
     def initialize(self):
         status = self.pe_create(
             self.config_file_path.encode("utf-8"), byref(self.pe_handle)
@@ -76,7 +93,6 @@ class PEDevice:
             raise RuntimeError(
                 f"PE_GetSystemName failed with status: {status} - {STATUS_CODE[status]}"
             )
-        print(f"System Name: {self.system_name.value.decode('utf-8')}")
 
         status = self.pe_open(self.pe_handle, self.system_name)
         if status != 0:
@@ -93,15 +109,67 @@ class PEDevice:
             raise RuntimeError(
                 f"PE_GetWavelengthRange failed with status: {status} - {STATUS_CODE[status]}"
             )
-        print(f"Wavelength Range: {min_wavelength.value}, {max_wavelength.value}")
+        self.wavelength_range = (min_wavelength.value, max_wavelength.value)
+        self.wavelength = self.get_wavelength()  # Tuned by a previous session or the vendor software
+
+    def get_name(self):
+        return self.system_name.value.decode('utf-8')
+
+    def get_wavelength(self):
+        """Reads the wavelength the filter is tuned to [nm]."""
+        wavelength = c_double()
+        status = self.pe_get_wavelength(self.pe_handle, byref(wavelength))
+        if status != 0:
+            raise RuntimeError(
+                f"PE_GetWavelength failed with status: {status} - {STATUS_CODE[status]}"
+            )
+        return wavelength.value
 
     def set_wavelength(self, wavelength):
+        """Tunes the filter to `wavelength` [nm]. Blocks until the SDK call returns."""
         status = self.pe_set_wavelength(self.pe_handle, c_double(wavelength))
         if status != 0:
             raise RuntimeError(
                 f"PE_SetWavelength failed with status: {status} - {STATUS_CODE[status]}"
             )
-        print(f"Wavelength Set: {wavelength}")
+        self.wavelength = wavelength
+
+    def set_wavelength_async(self, wavelength, settle=True):
+        """
+        Tunes the filter on the filter worker thread.
+
+        Returns a Future resolving to the wavelength once the filter is tuned and, if `settle` is True,
+        `settle_time` has elapsed.
+        """
+        def move():
+            self.set_wavelength(wavelength)
+            if settle and self.settle_time:
+                time.sleep(self.settle_time)
+            return wavelength
+
+        return self._executor.submit(move)
+
+    def get_all_settings(self):
+        return {
+            'name': self.get_name(),
+            'wavelength': {
+                'value': self.wavelength,
+                'min': self.wavelength_range[0],
+                'max': self.wavelength_range[1]
+            },
+            'settle_time': self.settle_time
+        }
+
+    def set_all_settings(self, settings):
+        if 'settle_time' in settings:
+            self.settle_time = settings['settle_time']
+        if 'wavelength' in settings:
+            wavelength = settings['wavelength']['value']
+            min_wavelength, max_wavelength = self.wavelength_range
+            if min_wavelength <= wavelength <= max_wavelength:
+                self.set_wavelength(wavelength)
+            else:
+                raise ValueError(f"Wavelength {wavelength} is out of range ({min_wavelength}, {max_wavelength})")
 
     def close(self):
         status = self.pe_close(self.pe_handle)
@@ -111,6 +179,7 @@ class PEDevice:
             )
 
     def destroy(self):
+        self._executor.shutdown(wait=True)
         status = self.pe_destroy(self.pe_handle)
         if status != 0:
             raise RuntimeError(
@@ -118,6 +187,25 @@ class PEDevice:
             )
 
 
+class PEFilter(PEDevice):
+    """
+    PE tunable filter loaded by the DeviceManager. The serial is the name of the PHySpec device configuration
+    file, e.g. "M000010666" for M000010666.xml.
+    """
+
+    def __init__(self, serial, dll_path=DEFAULT_DLL_PATH, config_dir=DEFAULT_CONFIG_DIR):
+        super().__init__(dll_path, os.path.join(config_dir, f"{serial}.xml"))
+        self.serial = serial
+        self.initialize()
+
+
+def list_pe_filters(config_dir=DEFAULT_CONFIG_DIR):
+    """Returns the serials of the PE filters with a PHySpec configuration file."""
+    if not os.path.isdir(config_dir):
+        return []
+    return [os.path.splitext(name)[0] for name in sorted(os.listdir(config_dir)) if name.lower().endswith('.xml')]
+
+
 if __name__ == "__main__":
     dll_path = r"C:\Users\jurco\PycharmProjects\SPR-Microscopy\source\hardware\filter\PE_Filter_SDK.dll"
     config_file_path = r"C:\Program Files\Photon etc\PHySpecV2\Devices\M000010666.xml"
@@ -125,5 +213,6 @@ if __name__ == "__main__":
     device = PEDevice(dll_path, config_file_path)
     device.initialize()
     device.set_wavelength(420)
+    print(f"Wavelength Set: {device.wavelength}")
     device.close()
     device.destroy()
\ No newline at end of file
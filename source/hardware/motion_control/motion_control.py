@@ -1,29 +1,330 @@
-from PyQt5.QtCore import QObject
+import queue
+import threading
+import time
+from concurrent.futures import Future, CancelledError
+
+import numpy as np
+from PySide6.QtCore import QObject, Signal
+
+
+class PositionBuffer:
+    """
+    Thread-safe ring buffer of timestamped positions.
+
+    Timestamps are time.perf_counter() values, so frames stamped with the same clock can be tagged with
+    the interpolated stage position.
+
+    Parameters
+    ----------
+    capacity : int
+        Number of samples kept, the oldest are overwritten.
+    """
+
+    def __init__(self, capacity=4096):
+        self.capacity = int(capacity)
+        self._times = np.zeros(self.capacity, dtype=np.float64)
+        self._positions = np.zeros(self.capacity, dtype=np.float64)
+        self._count = 0  # Total number of samples ever appended
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    def append(self, timestamp, position):
+        with self._lock:
+            index = self._count % self.capacity
+            self._times[index] = timestamp
+            self._positions[index] = position
+            self._count += 1
+
+    def clear(self):
+        with self._lock:
+            self._count = 0
+
+    def latest(self):
+        """Returns the last (timestamp, position) sample, or None if the buffer is empty."""
+        with self._lock:
+            if self._count == 0:
+                return None
+            index = (self._count - 1) % self.capacity
+            return self._times[index], self._positions[index]
+
+    def latest_time(self):
+        sample = self.latest()
+        return -np.inf if sample is None else sample[0]
+
+    def snapshot(self):
+        """Returns copies of the (timestamps, positions) currently held, oldest first."""
+        with self._lock:
+            if self._count <= self.capacity:
+                return self._times[:self._count].copy(), self._positions[:self._count].copy()
+            start = self._count % self.capacity
+            return np.roll(self._times, -start), np.roll(self._positions, -start)
+
+    def interpolate(self, timestamps):
+        """Positions at `timestamps`, linearly interpolated, clamped to the oldest/newest sample."""
+        times, positions = self.snapshot()
+        if len(times) == 0:
+            raise RuntimeError("No position samples")
+        return np.interp(timestamps, times, positions)
 
 
 class MotionControl(QObject):
+    """
+    Base class of motion devices.
+
+    Every device owns a worker thread executing a queue of commands, one at a time. Motion commands (moves,
+    homing) only start the motion; the worker then polls the device every `poll_interval` seconds, streams
+    the position into `positions` and resolves the command's future when the device stops moving. Polling
+    continues between commands, so the buffer always covers the recent past. `poll_interval` must be > 0.
 
-    def __init__(self, serial):
+    Subclasses implement the hardware primitives _start_move(), _start_home(), _halt(), _is_busy() and
+    _read_position(). All hardware access goes through `_device_lock`, so primitives may be called from the
+    worker and from stop() concurrently.
+    """
+    position_updated = Signal(float)
+    motion_finished = Signal(float)
+
+    def __init__(self, serial_number, name=None, settings=None, poll_interval=0.02, buffer_size=4096):
         super().__init__()
+        self.serial_number = serial_number
+        self.name = name
+        self.settings = dict(settings or {})
+        self.loaded = False
         self.running = False  # Is device running?
 
-    def close(self):
-        """Closes the .... connection and deletes related objects.
+        self.poll_interval = poll_interval
+        self.positions = PositionBuffer(buffer_size)
 
-        Raises
-        ------
-        NotImplementedError
-            If the method is not implemented.
-        """
+        self._device_lock = threading.RLock()
+        self._commands = queue.Queue()
+        # Held while a command is queued, started or cancelled, cancel() sees it either queued or active
+        self._command_lock = threading.Lock()
+        self._cancels = 0  # Number of cancel() calls, commands queued before the last one are cancelled
+        self._active = None  # Future of the motion being executed
+        self._active_started = 0.0
+        self._last_motion = None  # Future of the last submitted motion
+        self._worker = None
+
+    def get_name(self):
+        """Returns the name of the device."""
+        return self.name
+
+    ############################################## HARDWARE PRIMITIVES #################################################
+
+    def _start_move(self, position):
+        """Starts an absolute move without waiting for it."""
         raise NotImplementedError()
 
-    def reset(self):
-        """Resets the .... to a default state.
+    def _start_home(self):
+        """Starts homing without waiting for it."""
+        raise NotImplementedError()
 
-        Raises
-        ------
-        NotImplementedError
-            If the method is not implemented.
-        """
+    def _halt(self, immediate=False):
+        """Stops the current motion."""
         raise NotImplementedError()
 
+    def _is_busy(self):
+        """Returns True while the device is moving or homing."""
+        return False
+
+    def _read_position(self):
+        """Returns the current position, or None if the device has none."""
+        return None
+
+    ################################################# WORKER ###########################################################
+
+    def start(self):
+        """Starts the command worker and position streaming."""
+        if self._worker is not None and self._worker.is_alive():
+            return
+        self.running = True
+        self._worker = threading.Thread(target=self._run, name=f"MotionControl-{self.serial_number}", daemon=True)
+        self._worker.start()
+
+    def shutdown(self, timeout=5.0):
+        """Cancels all commands, halts the device and stops the worker."""
+        if not self.running:
+            return
+        self.cancel()
+        self.running = False
+        self._commands.put(None)  # Wake the worker
+        if self._worker is not None:
+            self._worker.join(timeout)
+            self._worker = None
+
+    def _sample(self):
+        with self._device_lock:
+            before = time.perf_counter()
+            position = self._read_position()
+            after = time.perf_counter()
+        if position is not None:
+            # The position is latched somewhere during the query, take the middle of the round trip
+            self.positions.append(0.5 * (before + after), position)
+            self.position_updated.emit(float(position))
+        return position
+
+    def _run(self):
+        next_sample = time.perf_counter()
+        while self.running:
+            if self._active is None:
+                # === Idle: wait for a command until the next position sample is due ===
+                timeout = max(0.0, next_sample - time.perf_counter())
+                try:
+                    command = self._commands.get(timeout=timeout)
+                except queue.Empty:
+                    command = None
+                if command is not None:
+                    self._execute(*command)
+            else:
+                time.sleep(max(0.0, next_sample - time.perf_counter()))
+
+            if not self.running:
+                break
+
+            # === Stream the position and check for the end of the active motion ===
+            now = time.perf_counter()
+            if now >= next_sample:
+                next_sample = now + self.poll_interval
+                try:
+                    self._sample()
+                except Exception:
+                    pass  # A failed poll is retried at the next interval
+
+            future = self._active
+            if future is not None:
+                try:
+                    with self._device_lock:
+                        busy = self._is_busy()
+                    # Controllers report the motion status with a delay, give the motion one interval to show up
+                    if not busy and time.perf_counter() - self._active_started >= self.poll_interval:
+                        self._active = None
+                        position = self._sample()
+                        if not future.done():
+                            future.set_result(position)
+                        self.motion_finished.emit(float(position) if position is not None else float('nan'))
+                except Exception as e:
+                    self._active = None
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _execute(self, future, function, args, motion, cancels):
+        with self._command_lock:
+            if cancels != self._cancels:
+                future.cancel()  # Taken from the queue by the worker just before cancel() emptied it
+            if not future.set_running_or_notify_cancel():
+                return  # Cancelled while queued
+            try:
+                with self._device_lock:
+                    result = function(*args)
+            except Exception as e:
+                future.set_exception(e)
+                return
+            if motion:
+                self._active_started = time.perf_counter()
+                self._active = future
+            else:
+                future.set_result(result)
+
+    def submit(self, function, *args, motion=False):
+        """
+        Queues `function(*args)` for the worker and returns its Future.
+
+        Motion commands resolve with the final position once the device stopped moving, other commands
+        resolve with the return value of the function.
+        """
+        if not self.running:
+            self.start()
+        future = Future()
+        with self._command_lock:
+            self._commands.put((future, function, args, motion, self._cancels))
+        if motion:
+            self._last_motion = future
+        return future
+
+    def cancel(self, immediate=False):
+        """Cancels all queued commands and halts the motion in progress, whose future raises CancelledError."""
+        with self._command_lock:
+            self._cancels += 1
+            while True:
+                try:
+                    command = self._commands.get_nowait()
+                except queue.Empty:
+                    break
+                if command is not None:
+                    command[0].cancel()
+
+            future = self._active
+            if future is not None:
+                with self._device_lock:
+                    self._halt(immediate)
+                if not future.done():
+                    future.set_exception(CancelledError())
+
+    ################################################# COMMANDS #########################################################
+
+    def move_to_async(self, position):
+        """Queues an absolute move, returns a Future resolving with the final position."""
+        self._check_position(position)
+        return self.submit(self._start_move, position, motion=True)
+
+    def move_to(self, position, wait=True, timeout=None):
+        """Queues an absolute move and, by default, blocks until it is finished."""
+        future = self.move_to_async(position)
+        if wait:
+            future.result(timeout)
+        return future
+
+    def home_async(self):
+        return self.submit(self._start_home, motion=True)
+
+    def home(self, wait=True, timeout=None):
+        """Queues homing and, by default, blocks until it is finished."""
+        future = self.home_async()
+        if wait:
+            future.result(timeout)
+        return future
+
+    def wait_move(self, timeout=None):
+        """Blocks until all queued motions are finished."""
+        if self._last_motion is not None:
+            self._last_motion.result(timeout)
+
+    def is_moving(self):
+        """True while a motion is executing or queued."""
+        return self._last_motion is not None and not self._last_motion.done()
+
+    def stop(self, immediate=False):
+        """Stops the device: cancels queued commands and halts the current motion."""
+        self.cancel(immediate)
+
+    def get_position(self, max_age=None):
+        """
+        Returns the current position. The last streamed sample is used if it is younger than `max_age`
+        seconds (two poll intervals by default), otherwise the device is queried.
+        """
+        if max_age is None:
+            max_age = 2 * self.poll_interval
+        sample = self.positions.latest()
+        if sample is not None and time.perf_counter() - sample[0] <= max_age:
+            return sample[1]
+        return self._sample()
+
+    def _check_position(self, position):
+        if not self.loaded:
+            raise RuntimeError("Device not loaded. Cannot move.")
+        min_position = self.settings.get('min_position')
+        max_position = self.settings.get('max_position')
+        if (min_position is not None and position < min_position) or \
+                (max_position is not None and position > max_position):
+            raise ValueError(f"Position {position} is out of bounds ({min_position}, {max_position}).")
+
+    def close(self):
+        """Stops the worker and closes the connection."""
+        self.shutdown()
+        self.loaded = False
+
+    def reset(self):
+        """Stops any motion and homes the device."""
+        self.stop()
+        self.home()
@@ -1,33 +1,83 @@
+from pylablib.devices import Thorlabs
+
 from source.hardware.motion_control.motion_control import MotionControl
 
 
 class KinesisMotor(MotionControl):
-    def __init__(self, serial_number, settings=None):
-        super().__init__(serial_number, 'Kinesis Motor', settings)
-        self.position = 0
+    """
+    Thorlabs KDC101 K-Cube DC servo controller, driven through pylablib's Kinesis API.
 
-    def move_to(self, position):
-        """
-        Move the motor to a specified position.
-        Args:
-            position (int): The target position to move the motor to.
-        """
-        if not self.loaded:
-            logging.error("Device not loaded. Cannot move motor.")
-            return
+    Positions and velocities are in stage units (degrees for rotation stages) when the stage is given in
+    settings['scale'] (e.g. 'PRM1-Z8') or can be autodetected ('stage', the default), otherwise in encoder steps.
+    settings['min_position'] / settings['max_position'] limit the allowed moves.
+    Moves and homing run on the command worker of MotionControl, see move_to_async() and home_async().
+    """
+
+    def __init__(self, serial_number, settings=None, poll_interval=0.02):
+        super().__init__(serial_number, 'Kinesis Motor', settings, poll_interval=poll_interval)
+        self.motor = Thorlabs.KinesisMotor(str(serial_number), scale=self.settings.get('scale', 'stage'))
+        self.loaded = True
+        self.start()
+
+    def close(self):
+        """Stops the motor and the worker and closes the connection."""
+        if self.loaded:
+            self.shutdown()
+            with self._device_lock:
+                self.motor.close()
+            self.loaded = False
 
-        if position < self.settings.get('min_position', 0) or position > self.settings.get('max_position', 100):
-            logging.error(f"Position {position} is out of bounds.")
-            return
+    def _start_move(self, position):
+        self.motor.move_to(position)
 
-        self.position = position
-        logging.info(f"Moved motor {self.serial_number} to position {self.position}")
+    def _start_home(self):
+        self.motor.home(sync=False, force=True)
 
-    def set_speed(self, speed):
+    def _halt(self, immediate=False):
+        self.motor.stop(immediate=immediate, sync=False)
+
+    def _is_busy(self):
+        return self.motor.is_moving() or self.motor.is_homing()
+
+    def _read_position(self):
+        return self.motor.get_position()
+
+    def set_speed(self, speed, acceleration=None):
         """
         Set the speed of the motor.
         Args:
-            speed (int): The speed to set the motor to.
+            speed (float): Maximum velocity of the moves in stage units per second.
+            acceleration (float): Acceleration in stage units per second squared, unchanged if None.
         """
+        with self._device_lock:
+            self.motor.setup_velocity(max_velocity=speed, acceleration=acceleration)
         self.settings['speed'] = speed
-        logging.info(f"Set speed of motor {self.serial_number} to {speed}")
+        if acceleration is not None:
+            self.settings['acceleration'] = acceleration
+
+    def get_speed(self):
+        """Returns the (max velocity, acceleration) of the moves."""
+        with self._device_lock:
+            parameters = self.motor.get_velocity_parameters()
+        return parameters.max_velocity, parameters.acceleration
+
+    def get_all_settings(self):
+        speed, acceleration = self.get_speed()
+        return {
+            'name': self.get_name(),
+            'position': self.get_position(),
+            'speed': speed,
+            'acceleration': acceleration,
+            'poll_interval': self.poll_interval,
+            'min_position': self.settings.get('min_position'),
+            'max_position': self.settings.get('max_position')
+        }
+
+    def set_all_settings(self, settings):
+        for key in ('min_position', 'max_position'):
+            if key in settings:
+                self.settings[key] = settings[key]
+        if 'poll_interval' in settings:
+            self.poll_interval = settings['poll_interval']
+        if 'speed' in settings:
+            self.set_speed(settings['speed'], settings.get('acceleration'))
@@ -0,0 +1,266 @@
+"""Phase pattern generation, LUT quantisation and frame caching for phase-only SLMs (Thorlabs EXULUS).
+
+Patterns are described by hashable specs, tuples of terms summed into one phase map:
+
+    ('grating', period_px, angle_deg)        blazed grating
+    ('lens', focal_length_m)                 Fresnel lens at the rendering wavelength
+    ('zernike', ((noll_index, rad), ...))    Zernike sum over the unit disk inscribed in the panel
+    ('correction', name)                     wavefront correction map registered with add_correction()
+    ('constant', rad)                        piston
+
+e.g. ``(('grating', 8, 0), ('lens', 0.5))``. The spec and the wavelength are the key of the frame cache, so a
+sequence of patterns can be rendered once and switched without regenerating anything.
+"""
+import math
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+TWO_PI = 2 * np.pi
+
+# Panel resolution and pixel pitch [m] of the supported EXULUS models
+EXULUS_MODELS = {
+    'EXULUS-HD1': (1920, 1080, 6.4e-6),
+    'EXULUS-HD2': (1920, 1080, 6.4e-6),
+    'EXULUS-HD3': (1920, 1080, 6.4e-6),
+    'EXULUS-4K1': (3840, 2160, 3.74e-6),
+}
+
+
+def noll_to_nm(j):
+    """Converts a Noll index (1 = piston) to the Zernike (n, m) indices."""
+    if j < 1:
+        raise ValueError("Noll indices start at 1")
+    n = int((math.sqrt(8 * j - 7) - 1) // 2)
+    p = j - n * (n + 1) // 2  # Position within the radial order, 1-based
+    m = n % 2 + 2 * ((p - 1 + (n + 1) % 2) // 2)
+    return n, (-m if j % 2 else m) if m else 0
+
+
+class PatternGrid:
+    """
+    Pixel coordinates of an SLM panel, computed once and shared by all generators.
+
+    Parameters
+    ----------
+    width, height : int
+        Panel resolution [px].
+    pixel_pitch : float
+        Pixel size [m].
+    """
+
+    def __init__(self, width, height, pixel_pitch):
+        self.width = int(width)
+        self.height = int(height)
+        self.pixel_pitch = float(pixel_pitch)
+
+        # Pixel-centred coordinates with the origin in the middle of the panel, broadcastable (1, W) and (H, 1)
+        self.x = (np.arange(self.width, dtype=np.float32) - (self.width - 1) / 2)[None, :]
+        self.y = (np.arange(self.height, dtype=np.float32) - (self.height - 1) / 2)[:, None]
+        self._unit_disk = None
+
+    @property
+    def shape(self):
+        return self.height, self.width
+
+    def unit_disk(self):
+        """(rho, theta, inside) over the disk inscribed in the panel, computed on first use."""
+        if self._unit_disk is None:
+            radius = min(self.width, self.height) / 2
+            rho = np.hypot(self.x, self.y) / radius
+            theta = np.arctan2(self.y, self.x)
+            self._unit_disk = (rho.astype(np.float32), theta.astype(np.float32), rho <= 1)
+        return self._unit_disk
+
+
+######################################################## GENERATORS ####################################################
+
+def grating(grid, period, angle=0.0):
+    """Blazed grating with a `period` in pixels along direction `angle` [deg]."""
+    a = np.deg2rad(angle)
+    return (TWO_PI / period) * (np.float32(np.cos(a)) * grid.x + np.float32(np.sin(a)) * grid.y)
+
+
+def lens(grid, focal_length, wavelength):
+    """Thin lens phase -pi r^2 / (lambda f), with `focal_length` and `wavelength` in metres."""
+    k = np.float32(-np.pi * grid.pixel_pitch ** 2 / (wavelength * focal_length))
+    return k * (grid.x ** 2 + grid.y ** 2)
+
+
+def zernike(grid, coefficients):
+    """Sum of Zernike polynomials, `coefficients` as ((noll_index, amplitude_rad), ...). Zero outside the disk."""
+    rho, theta, inside = grid.unit_disk()
+    phase = np.zeros(grid.shape, dtype=np.float32)
+    for j, amplitude in coefficients:
+        n, m = noll_to_nm(j)
+        radial = np.zeros_like(rho)
+        for k in range((n - abs(m)) // 2 + 1):
+            c = (-1) ** k * math.factorial(n - k) / (
+                math.factorial(k) * math.factorial((n + abs(m)) // 2 - k) * math.factorial((n - abs(m)) // 2 - k))
+            radial += np.float32(c) * rho ** (n - 2 * k)
+        if m > 0:
+            radial *= np.cos(m * theta)
+        elif m < 0:
+            radial *= np.sin(-m * theta)
+        phase += np.float32(amplitude) * radial
+    phase[~inside] = 0
+    return phase
+
+
+######################################################## QUANTISATION ##################################################
+
+class PhaseLUT:
+    """
+    Maps phase to 8-bit grey levels, per wavelength.
+
+    The EXULUS reaches 2 pi at a different grey level for every wavelength (and phase stroke mode). `calibration`
+    maps wavelengths [m] to either the grey level of 2 pi (linear response) or a measured table of grey levels
+    for equally spaced phases over [0, 2 pi). Wavelengths between calibration points use the nearest one.
+
+    Parameters
+    ----------
+    calibration : dict
+        {wavelength: gray_2pi or array_like of grey levels}.
+    resolution : int
+        Phase steps of the lookup table.
+    """
+
+    def __init__(self, calibration=None, resolution=1024):
+        self.calibration = dict(calibration or {633e-9: 255})
+        self.resolution = int(resolution)
+        self._tables = {}
+
+    def table(self, wavelength):
+        """The uint8 lookup table of the nearest calibrated wavelength."""
+        key = min(self.calibration, key=lambda w: abs(w - wavelength))
+        if key not in self._tables:
+            entry = self.calibration[key]
+            phases = np.arange(self.resolution) / self.resolution
+            if np.isscalar(entry):
+                levels = phases * entry
+            else:
+                measured = np.asarray(entry, dtype=np.float64)
+                levels = np.interp(phases, np.arange(len(measured)) / len(measured), measured)
+            self._tables[key] = np.clip(np.rint(levels), 0, 255).astype(np.uint8)
+        return self._tables[key]
+
+    def quantise(self, phase, wavelength, out=None):
+        """Wraps `phase` to [0, 2 pi) and converts it to grey levels."""
+        scaled = np.multiply(phase, np.float32(self.resolution / TWO_PI), dtype=np.float32)
+        indices = np.floor(scaled).astype(np.int32)
+        np.remainder(indices, self.resolution, out=indices)
+        return np.take(self.table(wavelength), indices, out=out)
+
+
+######################################################## ENGINE ########################################################
+
+class PatternEngine:
+    """
+    Renders pattern specs to 8-bit frames and keeps the last `cache_size` frames in an LRU cache.
+
+    Parameters
+    ----------
+    grid : PatternGrid
+        Panel geometry.
+    lut : PhaseLUT
+        Phase to grey level conversion.
+    wavelength : float
+        Default rendering wavelength [m].
+    cache_size : int
+        Number of frames kept (about 2 MB each at 1920x1080).
+    """
+
+    def __init__(self, grid, lut=None, wavelength=633e-9, cache_size=64):
+        self.grid = grid
+        self.lut = lut or PhaseLUT()
+        self.wavelength = wavelength
+        self.cache_size = int(cache_size)
+        self.corrections = {}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @classmethod
+    def for_model(cls, model, **kwargs):
+        """Engine for an EXULUS model name, e.g. 'EXULUS-HD1'."""
+        width, height, pitch = EXULUS_MODELS[model]
+        return cls(PatternGrid(width, height, pitch), **kwargs)
+
+    def add_correction(self, name, phase):
+        """Registers a wavefront correction map [rad] usable as ('correction', name)."""
+        phase = np.asarray(phase, dtype=np.float32)
+        if phase.shape != self.grid.shape:
+            raise ValueError(f"Correction shape {phase.shape} does not match the panel {self.grid.shape}")
+        self.corrections[name] = phase
+        self.clear_cache()  # Frames rendered with the old map are stale
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+    def phase(self, spec, wavelength=None):
+        """Unwrapped phase map [rad] of a spec."""
+        wavelength = self.wavelength if wavelength is None else wavelength
+        phase = np.zeros(self.grid.shape, dtype=np.float32)
+        for term in spec:
+            kind, *args = term
+            match kind:
+                case 'grating':
+                    phase += grating(self.grid, *args)
+                case 'lens':
+                    phase += lens(self.grid, args[0], wavelength)
+                case 'zernike':
+                    phase += zernike(self.grid, args[0])
+                case 'correction':
+                    phase += self.corrections[args[0]]
+                case 'constant':
+                    phase += np.float32(args[0])
+                case _:
+                    raise ValueError(f"Unknown pattern term {kind}")
+        return phase
+
+    def render(self, spec, wavelength=None):
+        """The 8-bit frame of a spec, from the cache if it was rendered before. Treat it as read-only."""
+        wavelength = self.wavelength if wavelength is None else wavelength
+        key = (tuple(spec), wavelength)
+        with self._lock:
+            frame = self._cache.get(key)
+            if frame is not None:
+                self._cache.move_to_end(key)
+                return frame
+
+        frame = self.lut.quantise(self.phase(spec, wavelength), wavelength)
+        frame.flags.writeable = False
+
+        with self._lock:
+            self._cache[key] = frame
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return frame
+
+    def prerender(self, specs, wavelength=None):
+        """Renders `specs` in a background thread so switching between them later is a cache hit. Returns a Future."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        specs = list(specs)
+        if len(specs) > self.cache_size:
+            raise ValueError(f"{len(specs)} patterns do not fit into a cache of {self.cache_size} frames")
+        return self._executor.submit(lambda: [self.render(spec, wavelength) for spec in specs])
+
+
+class OffscreenSurface:
+    """Output surface keeping the frames in memory instead of displaying them, for tests and dry runs."""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.frame = None
+        self.frames_shown = 0
+
+    def show_frame(self, frame):
+        if frame.shape != (self.height, self.width):
+            raise ValueError(f"Frame shape {frame.shape} does not match the surface ({self.height}, {self.width})")
+        self.frame = frame
+        self.frames_shown += 1
@@ -1,3 +1,4 @@
+import os
 import sys
 
 from PySide6.QtGui import QFont
@@ -32,7 +33,7 @@ if __name__ == '__main__':
 
     # Set style sheet for application
     # Load the QSS file
-    with open('styles.qss', 'r') as file:
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'styles.qss'), 'r') as file:
         style_sheet = file.read()
     app.setStyleSheet(style_sheet)
 
@@ -46,7 +47,7 @@ if __name__ == '__main__':
     # application structure.
 
     #Logger: Logs all events.
-    logger = Logging(enable_print=True)
+    logger = Logging(enable_print=True, log_file="spr_microscopy.log")
 
     # Model: Contains the data and the long-running task.
     model = Model(logger)
@@ -0,0 +1,179 @@
+"""
+Headless batch runner: loads devices and runs measurements from a JSON parameter file, without any window.
+
+    python -m source.main_headless parameters.json [--output results/]
+
+Parameter file:
+
+    {
+        "devices": ["40463210"],
+        "stream": {"address": "127.0.0.1:5555", "queue_size": 8},
+        "measurements": [
+            {"type": "noise", "camera": "40463210", "max_frames": 200, "bitdepth": 12,
+             "settings": {"exposure": {"value": 10.0}}, "rois": {"0": {"x": 0, "y": 0, "width": 64, "height": 64}},
+             "output": "noise.npz"},
+            {"type": "fps", "camera": "40463210", "frames": 100,
+             "points": [{"exposure": {"value": 1.0}}, {"exposure": {"value": 10.0}}], "output": "fps.csv"},
+            {"type": "sensorgram", "camera": "40463210", "duration": 3600, "frames_per_point": 10,
+             "drift_interval": 50, "rois": {}, "auto_exposure": {"target": 0.8, "percentile": 99.5},
+             "project": "experiment.sprproj", "record_frames": true, "output": "sensorgram.csv"},
+            {"type": "fps_characterisation", "camera": "40463210", "frames": 50,
+             "exposures": [0.02, 0.1, 1.0, 10.0, 100.0], "heights": [256, 1024, 2048], "widths": [2448],
+             "refine_levels": 2, "output": "fps_characterisation.json"},
+            {"type": "calibration", "kind": "dark", "camera": "40463210", "frames": 100,
+             "settings": {"exposure": {"value": 10.0}}, "directory": "calibration"},
+            {"type": "analysis", "camera": "40463210", "frames": 1000, "rois": {}, "registration": true,
+             "workers": 4, "output": "analysis.csv"}
+        ]
+    }
+
+Camera "settings" use the same dictionary format as the settings dialog (Camera.set_all_settings).
+"auto_exposure" runs the software auto exposure (AutoExposure options) on the measurement ROIs before it starts.
+"stream" (optional) serves the sensorgram frames and points to local clients (source.utilities.frame_server).
+"project" (noise and sensorgram) also stores the camera settings, ROIs and results in a project file
+(source.utilities.project_file), the raw frames too with "record_frames". Measurements naming the same project add
+to it.
+"""
+import argparse
+import json
+import os
+import sys
+
+from source.acquisition.auto_exposure import AutoExposure
+from source.acquisition.frame_rate_characterisation import FrameRateCharacterisation
+from source.acquisition.measurements import NoiseMeasurement, FrameRateMeasurement, SensorgramMeasurement, \
+    AnalysisMeasurement, grab
+from source.hardware.device_manager import DeviceManager
+from source.processing.calibration import CalibrationStore, MasterFrame, flat_gain
+from source.utilities.frame_server import FrameServer
+from source.utilities.logging import Logging
+from source.utilities.project_file import ProjectFile
+
+
+def run_measurement(device_manager, parameters, output_dir, logger, server=None):
+    measurement_type = parameters['type']
+    serial = parameters['camera']
+    camera = device_manager.loaded_devices[serial]
+    output = os.path.join(output_dir, parameters.get('output', f"{measurement_type}_{serial}"))
+
+    if 'bitdepth' in parameters:
+        camera.set_bitdepth(parameters['bitdepth'])
+    if 'settings' in parameters:
+        device_manager.set_device_settings(serial, parameters['settings'])
+    if 'auto_exposure' in parameters:
+        auto_exposure = AutoExposure(camera, rois=parameters.get('rois'), **parameters['auto_exposure'])
+        exposure = auto_exposure.run(lambda: grab(camera))
+        camera.pause()
+        logger.info(f"Auto exposure: {exposure:.4f} ms after {auto_exposure.steps} steps")
+
+    project = None
+    if 'project' in parameters:
+        project = ProjectFile(os.path.join(output_dir, parameters['project']), 'a')
+        project.metadata.setdefault('devices', {})[serial] = camera.get_all_settings()
+        project.metadata.setdefault('measurements', []).append(parameters)
+
+    logger.info(f"Running {measurement_type} measurement on {serial}")
+    try:
+        _run(device_manager, camera, serial, measurement_type, parameters, output, output_dir, logger, server,
+             project)
+    finally:
+        if project is not None:
+            project.close()
+    logger.info(f"Results written to {output}" + (f" and {project.path}" if project is not None else ""))
+
+
+def _run(device_manager, camera, serial, measurement_type, parameters, output, output_dir, logger, server, project):
+    match measurement_type:
+        case 'noise':
+            measurement = NoiseMeasurement(camera, parameters.get('max_frames', 200), parameters.get('rois'),
+                                           parameters.get('full_well_capacity', 182000))
+            measurement.run()
+            measurement.save(output)
+            if project is not None:
+                measurement.write_project(project)
+        case 'fps':
+            measurement = FrameRateMeasurement(device_manager, serial, parameters['points'],
+                                               parameters.get('frames', 100))
+            measurement.run()
+            measurement.save(output)
+        case 'sensorgram':
+            measurement = SensorgramMeasurement(camera, parameters.get('rois'), parameters['duration'],
+                                                parameters.get('frames_per_point', 1),
+                                                parameters.get('drift_interval', 0), server, project,
+                                                parameters.get('record_frames', False))
+            measurement.run(output)
+        case 'fps_characterisation':
+            measurement = FrameRateCharacterisation(camera, parameters['exposures'], parameters['heights'],
+                                                    parameters['widths'], parameters.get('frames', 50),
+                                                    parameters.get('refine_levels', 2))
+            logger.info(f"Readout model: {measurement.run()}")
+            measurement.save(output)
+        case 'calibration':
+            store = CalibrationStore(parameters.get('directory', os.path.join(output_dir, 'calibration')))
+            master = MasterFrame(parameters.get('method', 'mean'), parameters.get('sigma', 3.0))
+            for _ in range(parameters.get('frames', 100)):
+                master.add(grab(camera))
+            camera.pause()
+            kind, woi, exposure = parameters['kind'], camera.get_woi(), camera.get_exposure()
+            if kind == 'flat':
+                array = flat_gain(master.result(), store.find('dark', serial, woi, exposure))
+                exposure = None
+            else:
+                array = master.result()
+            path = store.save(kind, serial, array, woi, exposure, master.count)
+            logger.info(f"Master {kind} frame written to {path}")
+        case 'analysis':
+            measurement = AnalysisMeasurement(camera, parameters['frames'], parameters.get('rois'),
+                                              parameters.get('registration', False), parameters.get('workers'))
+            analysed = measurement.run(output)
+            logger.info(f"{analysed} frames analysed, {measurement.dropped} dropped")
+        case _:
+            raise ValueError(f"Unknown measurement type {measurement_type}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run SPR microscope measurements without the GUI.")
+    parser.add_argument('parameters', help="JSON parameter file")
+    parser.add_argument('--output', default='.', help="Directory for the results")
+    parser.add_argument('--log-file', default=None, help="Log file, console only if not given")
+    args = parser.parse_args(argv)
+
+    with open(args.parameters, 'r') as file:
+        parameters = json.load(file)
+    os.makedirs(args.output, exist_ok=True)
+
+    logger = Logging(enable_print=True, log_file=args.log_file)
+    device_manager = DeviceManager(logger)
+    server = None
+    failed = 0
+    try:
+        if 'stream' in parameters:
+            server = FrameServer(**parameters['stream'])
+            server.start()
+            logger.info(f"Streaming on {server.address}")
+        device_manager.auto_detect_devices()
+        for serial in parameters.get('devices', []):
+            if not device_manager.load_device(serial):
+                raise RuntimeError(f"Device {serial} could not be loaded")
+
+        for measurement in parameters.get('measurements', []):
+            try:
+                run_measurement(device_manager, measurement, args.output, logger, server)
+            except Exception as e:
+                failed += 1
+                logger.error(f"{measurement.get('type')} measurement failed: {e}")
+    finally:
+        if server is not None:
+            server.stop()
+        for device in device_manager.loaded_devices.values():
+            try:
+                device.close()
+            except Exception as e:
+                logger.error(f"Closing device failed: {e}")
+        logger.close()
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
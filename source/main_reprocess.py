@@ -0,0 +1,94 @@
+"""
+Offline reprocessing of a recording (source.processing.reprocessing), without any window or camera.
+
+    python -m source.main_reprocess recording.sprproj results.sprproj [--rois rois.json] [--registration]
+        [--calibration calibration/] [--workers 8] [--csv results.csv]
+
+The ROIs default to those saved with the recording. Corrections use the calibration maps saved in the recording's
+project file, else those of the --calibration directory for the camera, WOI and exposure of the recording.
+Running the same command again after an interruption resumes it.
+"""
+import argparse
+import csv
+import json
+import sys
+
+import numpy as np
+
+from source.processing.calibration import CalibrationStore
+from source.processing.reprocessing import Reprocessor, recorded_corrections
+from source.utilities.logging import Logging
+from source.utilities.project_file import ProjectFile
+
+
+def export_csv(output, path):
+    """Writes the 'results' array of a reprocessing output to a CSV file."""
+    with ProjectFile(output) as project:
+        results = project['results']
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(results.attrs['columns'])
+            for _, rows in results.chunks():
+                writer.writerows(np.asarray(rows).tolist())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reprocess recorded frames with other ROIs or corrections.")
+    parser.add_argument('source', help="Recording: a project file or an .npy stack of frames")
+    parser.add_argument('output', help="Output project file, resumed if it exists")
+    parser.add_argument('--rois', default=None, help="JSON file of {id: {x, y, width, height}} ROIs")
+    parser.add_argument('--registration', action='store_true', help="Register the frames to the first one")
+    parser.add_argument('--no-statistics', action='store_true', help="Skip the frame statistics")
+    parser.add_argument('--no-corrections', action='store_true', help="Process the raw frames")
+    parser.add_argument('--calibration', default=None, help="Calibration directory (CalibrationStore)")
+    parser.add_argument('--serial', default=None, help="Camera serial of the calibration maps")
+    parser.add_argument('--max-value', type=int, default=4095, help="Saturation level of the statistics")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes, all CPUs if not given")
+    parser.add_argument('--block-frames', type=int, default=64, help="Frames per task")
+    parser.add_argument('--csv', default=None, help="Also write the results to this CSV file")
+    parser.add_argument('--log-file', default=None, help="Log file, console only if not given")
+    args = parser.parse_args(argv)
+
+    logger = Logging(enable_print=True, log_file=args.log_file)
+    try:
+        rois = None
+        if args.rois is not None:
+            with open(args.rois, 'r') as file:
+                rois = json.load(file)
+        corrections = []
+        if not args.no_corrections:
+            store = CalibrationStore(args.calibration) if args.calibration else None
+            corrections = recorded_corrections(args.source, store=store, serial=args.serial)
+        reprocessor = Reprocessor(args.source, args.output, rois, corrections, args.registration,
+                                  not args.no_statistics, args.max_value, workers=args.workers,
+                                  block_frames=args.block_frames)
+
+        last_report = 0
+
+        def report(done, total):
+            nonlocal last_report
+            if done - last_report >= total // 20 or done == total:
+                logger.info(f"{done}/{total} frames")
+                last_report = done
+
+        reprocessor.on_progress = report
+        logger.info(f"Reprocessing {len(reprocessor.frames)} frames of {args.source} on {reprocessor.workers} "
+                    f"workers, corrections: {[stage.name for stage in corrections] or 'none'}")
+        done = reprocessor.run()
+        logger.info(f"{done} frames in {args.output}")
+        if args.csv:
+            export_csv(args.output, args.csv)
+            logger.info(f"Results written to {args.csv}")
+    except KeyboardInterrupt:
+        logger.warning("Interrupted, run the same command again to resume")
+        return 1
+    except Exception as e:
+        logger.error(f"Reprocessing failed: {e}")
+        return 1
+    finally:
+        logger.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,300 @@
+"""
+Process-pool analysis tier fed through a shared-memory frame ring.
+
+Frames are copied once into a multiprocessing.shared_memory ring by the acquisition thread. Worker processes attach
+to the ring when they start and read the frames in place, run the registered analysis stages on them and send
+back only the small results (ROI means, drift offsets, fit parameters). Heavy analysis then runs on other cores
+instead of competing for the GIL with acquisition and rendering.
+
+A slot is not reused before the workers are done with its frame. When every slot is busy, the analysis is behind
+and the frame is dropped (counted in `dropped`) rather than stalling acquisition.
+
+Stages are pickled to every worker, so they must be picklable and should carry only what they need (e.g. ROIs or
+a reference patch). They see frames independently and in any order, so a stage keeps no state from frame to
+frame; accumulate the results in the parent instead.
+"""
+import os
+import queue
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from threading import Lock
+
+import numpy as np
+
+from source.processing.registration import PhaseCorrelator, ROIPlan
+from source.utilities.telemetry import telemetry
+
+_HEADER_BYTES = 64  # Per-slot sequence numbers are stored in front of the frames, padded to a cache line
+
+
+class SharedFrameRing:
+    """
+    `slots` frames of one shape and dtype in one shared memory block, with a sequence number per slot telling
+    which frame a slot holds.
+
+    Parameters
+    ----------
+    shape : tuple
+        Frame shape.
+    dtype : numpy.dtype
+        Frame dtype.
+    slots : int
+        Frames in the ring.
+    name : str, optional
+        Name of an existing ring to attach to; a new block is created if not given.
+    """
+
+    def __init__(self, shape, dtype, slots=8, name=None):
+        self.shape = tuple(int(v) for v in shape)
+        self.dtype = np.dtype(dtype)
+        self.slots = int(slots)
+        self.frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        header = -(-8 * self.slots // _HEADER_BYTES) * _HEADER_BYTES
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=header + self.slots * self.frame_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.sequences = np.ndarray((self.slots,), dtype=np.int64, buffer=self.shm.buf)
+        self.frames = np.ndarray((self.slots,) + self.shape, dtype=self.dtype, buffer=self.shm.buf, offset=header)
+        if self.owner:
+            self.sequences[:] = -1
+
+    @property
+    def spec(self):
+        """What a worker needs to attach: SharedFrameRing(**spec)."""
+        return {'shape': self.shape, 'dtype': self.dtype.str, 'slots': self.slots, 'name': self.shm.name}
+
+    def write(self, slot, frame, sequence):
+        np.copyto(self.frames[slot], frame, casting='same_kind')
+        self.sequences[slot] = sequence
+
+    def read(self, slot, sequence):
+        """The frame of `slot` (a view, no copy) if it still holds frame `sequence`, else None."""
+        if self.sequences[slot] != sequence:
+            return None
+        return self.frames[slot]
+
+    def close(self):
+        # Views into the block must be released before it can be closed
+        self.sequences = None
+        self.frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class AnalysisStage:
+    """Base class of analysis stages run by the worker processes."""
+    name = 'analysis'
+
+    def setup(self):
+        """Prepares the stage in the worker process, once, before the first frame."""
+        pass
+
+    def process(self, frame):
+        """Returns a small picklable result for the frame.
+
+        Raises
+        ------
+        NotImplementedError
+            If the method is not implemented.
+        """
+        raise NotImplementedError()
+
+
+class FrameStatisticsStage(AnalysisStage):
+    """Mean, standard deviation, minimum, maximum and saturated fraction of the frame."""
+    name = 'statistics'
+
+    def __init__(self, max_value=4095):
+        self.max_value = max_value
+
+    def process(self, frame):
+        return {
+            'mean': float(frame.mean()),
+            'std': float(frame.std()),
+            'min': float(frame.min()),
+            'max': float(frame.max()),
+            'saturated': float(np.count_nonzero(frame >= self.max_value)) / frame.size,
+        }
+
+
+class ROIMeansStage(AnalysisStage):
+    """{roi_id: mean} of ROIs ({id: {x, y, width, height}}), through an ROIPlan."""
+    name = 'roi_means'
+
+    def __init__(self, rois):
+        self.rois = dict(rois)
+        self.plan = None
+
+    def setup(self):
+        self.plan = ROIPlan(self.rois)
+
+    def process(self, frame):
+        return dict(zip(self.plan.ids, self.plan.means(frame).tolist()))
+
+
+class RegistrationStage(AnalysisStage):
+    """{'dy', 'dx', 'confidence'} of the frame relative to a reference frame, see PhaseCorrelator."""
+    name = 'registration'
+
+    def __init__(self, reference, patch=None, decimation=2):
+        self.patch = patch
+        self.decimation = decimation
+        # Only the patch travels to the workers, not the whole reference frame
+        correlator = PhaseCorrelator(reference, patch, decimation)
+        y, x, height, width = correlator.patch
+        self.reference = np.array(reference[y:y + height, x:x + width])
+        self.patch = (0, 0, height, width)
+        self.offset = (y, x)
+        self.correlator = None
+
+    def setup(self):
+        self.correlator = PhaseCorrelator(self.reference, self.patch, self.decimation)
+
+    def process(self, frame):
+        y, x = self.offset
+        height, width = self.patch[2], self.patch[3]
+        dy, dx, confidence = self.correlator.estimate(frame[y:y + height, x:x + width])
+        return {'dy': float(dy), 'dx': float(dx), 'confidence': confidence}
+
+
+_worker = {}
+
+
+def _init_worker(ring_spec, stages):
+    _worker['ring'] = SharedFrameRing(**ring_spec)
+    for stage in stages:
+        stage.setup()
+    _worker['stages'] = stages
+
+
+def _analyse(slot, sequence):
+    ring = _worker['ring']
+    frame = ring.read(slot, sequence)
+    if frame is None:
+        return sequence, None  # Overwritten, cannot happen while the parent keeps the slot reserved
+    results = {}
+    for stage in _worker['stages']:
+        start = time.perf_counter()
+        results[stage.name] = stage.process(frame)
+        results[f'{stage.name}.seconds'] = time.perf_counter() - start
+    return sequence, results
+
+
+class AnalysisPool:
+    """
+    Worker processes running analysis stages on frames handed over through a SharedFrameRing.
+
+    Results arrive as {'frame': sequence, 'time': submission time, <stage name>: result, ...} dicts, in
+    completion order (sort by 'frame' if the order matters). They are queued for results() and passed to
+    `on_result` if given. `on_result` is called from a thread of the executor, so a Qt consumer should emit a
+    signal from it.
+
+    Parameters
+    ----------
+    shape, dtype :
+        Frame shape and dtype; frames of another shape are rejected (restart the pool after a WOI change).
+    stages : list
+        AnalysisStage instances, each run on every frame.
+    workers : int, optional
+        Worker processes, the number of CPUs minus one (for acquisition and the GUI) if not given.
+    slots : int, optional
+        Frames in the ring, twice the number of workers if not given.
+    on_result : callable, optional
+        Called with every result dict.
+    on_error : callable, optional
+        Called as on_error(sequence, exception) when a stage raised on a frame (counted in `failed`); the
+        error is printed if not given.
+    """
+
+    def __init__(self, shape, dtype, stages, workers=None, slots=None, on_result=None, on_error=None):
+        if not stages:
+            raise ValueError("An analysis pool needs at least one stage")
+        names = [stage.name for stage in stages]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Analysis stage names must be unique, got {names}")
+        self.stages = list(stages)
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.ring = SharedFrameRing(shape, dtype, slots or 2 * self.workers)
+        self.on_result = on_result
+        self.on_error = on_error
+
+        self.submitted = 0
+        self.dropped = 0
+        self.failed = 0
+        self._free = deque(range(self.ring.slots))
+        self._lock = Lock()  # Guards the free slots, released from executor threads
+        self._results = queue.Queue()
+        self._times = {}
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                            initargs=(self.ring.spec, self.stages))
+
+    def submit(self, frame):
+        """Queues a frame for analysis. Returns False if it was dropped because every slot is busy."""
+        if frame.shape != self.ring.shape:
+            raise ValueError(f"Frame {frame.shape} does not match the analysis ring {self.ring.shape}")
+        with self._lock:
+            if not self._free:
+                self.dropped += 1
+                return False
+            slot = self._free.popleft()
+        sequence = self.submitted
+        self.submitted += 1
+        with telemetry.measure('analysis.submit'):
+            self.ring.write(slot, frame, sequence)
+        self._times[sequence] = time.time()
+        future = self.executor.submit(_analyse, slot, sequence)
+        future.add_done_callback(lambda f, slot=slot, sequence=sequence: self._done(slot, sequence, f))
+        return True
+
+    def _done(self, slot, sequence, future):
+        with self._lock:
+            self._free.append(slot)
+        submitted = self._times.pop(sequence, None)  # Popped whatever the outcome, the dict stays bounded
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            self.failed += 1
+            if self.on_error is not None:
+                self.on_error(sequence, error)
+            else:
+                print(f"Analysis of frame {sequence} failed: {error!r}")
+            return
+        _, results = future.result()
+        if results is None:
+            return
+        results['frame'] = sequence
+        results['time'] = submitted
+        self._results.put(results)
+        if self.on_result is not None:
+            self.on_result(results)
+
+    def pending(self):
+        """Frames submitted and not analysed yet."""
+        with self._lock:
+            return self.ring.slots - len(self._free)
+
+    def results(self):
+        """All results received since the last call."""
+        results = []
+        while True:
+            try:
+                results.append(self._results.get_nowait())
+            except queue.Empty:
+                return results
+
+    def close(self, wait=True):
+        """Stops the workers (finishing the queued frames if `wait`) and frees the ring."""
+        self.executor.shutdown(wait=wait, cancel_futures=not wait)
+        self.ring.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,273 @@
+"""
+Dark-frame and flat-field calibration: master frame capture, per-camera storage and the correction stage.
+
+Corrected frame = (raw - dark) * gain, gain being the flat field normalised to a mean of 1 (dark subtracted).
+"""
+import json
+import os
+import time
+
+import numpy as np
+
+from source.processing.pipeline import BufferRing, FrameStage
+
+CALIBRATION_KINDS = ('dark', 'flat', 'defects')
+MAP_DTYPES = {'dark': np.float32, 'flat': np.float32, 'defects': bool}
+
+
+class MasterFrame:
+    """
+    Streaming master frame of a stack of frames, without keeping the stack.
+
+    - 'mean': sigma-clipped mean. The first `warmup` frames give a robust per-pixel centre (median) and spread
+      (scaled MAD); every frame, those included, is then accumulated only where it lies within `sigma` spreads of
+      the centre, which rejects cosmic rays and transient hot pixels.
+    - 'median': median of the medians of consecutive chunks of `chunk` frames, memory being one chunk.
+
+    Parameters
+    ----------
+    method : str
+        'mean' or 'median'.
+    sigma : float
+        Clipping threshold in spreads ('mean' only).
+    warmup : int
+        Frames used for the clipping centre ('mean' only).
+    chunk : int
+        Frames per chunk ('median' only).
+    """
+
+    def __init__(self, method='mean', sigma=3.0, warmup=8, chunk=16):
+        if method not in ('mean', 'median'):
+            raise ValueError(f"Unknown master frame method {method}")
+        self.method = method
+        self.sigma = sigma
+        self.warmup = max(3, int(warmup))
+        self.chunk = max(3, int(chunk))
+        self.count = 0
+
+        self._buffer = []  # Warm-up frames or the current chunk
+        self._center = None
+        self._threshold = None
+        self._sum = None
+        self._accepted = None
+        self._chunk_medians = []
+
+    def add(self, frame):
+        frame = np.array(frame, dtype=np.float32)  # Copy: frames may be reused pipeline buffers
+        self.count += 1
+        if self.method == 'median':
+            self._buffer.append(frame)
+            if len(self._buffer) == self.chunk:
+                self._chunk_medians.append(np.median(np.stack(self._buffer), axis=0))
+                self._buffer = []
+            return
+
+        if self._center is None:
+            self._buffer.append(frame)
+            if len(self._buffer) == self.warmup:
+                stack = np.stack(self._buffer)
+                self._buffer = []
+                self._center = np.median(stack, axis=0)
+                # Half a grey level floor: a noiseless pixel must not reject its own quantisation steps
+                spread = 1.4826 * np.median(np.abs(stack - self._center), axis=0) + np.float32(0.5)
+                self._threshold = self.sigma * spread
+                self._sum = np.zeros(frame.shape, dtype=np.float64)
+                self._accepted = np.zeros(frame.shape, dtype=np.int32)
+                for warmup_frame in stack:
+                    self._accumulate(warmup_frame)
+            return
+        self._accumulate(frame)
+
+    def _accumulate(self, frame):
+        accept = np.abs(frame - self._center) <= self._threshold
+        self._sum += np.where(accept, frame, 0.0)
+        self._accepted += accept
+
+    def result(self):
+        """The master frame as float32."""
+        if self.count == 0:
+            raise ValueError("No frames were added to the master frame")
+        if self.method == 'median':
+            medians = list(self._chunk_medians)
+            if self._buffer:
+                medians.append(np.median(np.stack(self._buffer), axis=0))
+            return np.median(np.stack(medians), axis=0).astype(np.float32)
+
+        if self._center is None:
+            return np.median(np.stack(self._buffer), axis=0).astype(np.float32)
+        mean = np.divide(self._sum, self._accepted, out=self._center.astype(np.float64), where=self._accepted > 0)
+        return mean.astype(np.float32)
+
+
+def flat_gain(flat, dark=None, min_fraction=0.05):
+    """
+    Gain map mean(signal) / signal of a master flat, signal = flat - dark. Pixels with less than `min_fraction`
+    of the median signal (dead or unlit) get a gain of 1, i.e. are left uncorrected.
+    """
+    signal = np.asarray(flat, dtype=np.float32) - (0.0 if dark is None else np.asarray(dark, dtype=np.float32))
+    valid = signal > min_fraction * np.median(signal)
+    if not valid.any():
+        raise ValueError("The flat frame has no signal above the dark level")
+    gain = np.ones(signal.shape, dtype=np.float32)
+    gain[valid] = signal[valid].mean() / signal[valid]
+    return gain
+
+
+def slice_woi(array, stored_woi, woi):
+    """The part of `array`, captured with WOI `stored_woi`, covering `woi` ((offsetX, offsetY, width, height))."""
+    x0, y0 = woi[0] - stored_woi[0], woi[1] - stored_woi[1]
+    return array[y0:y0 + woi[3], x0:x0 + woi[2]]
+
+
+def contains_woi(stored_woi, woi):
+    return (stored_woi[0] <= woi[0] and stored_woi[1] <= woi[1]
+            and woi[0] + woi[2] <= stored_woi[0] + stored_woi[2] and woi[1] + woi[3] <= stored_woi[1] + stored_woi[3])
+
+
+class CalibrationStore:
+    """
+    Master dark frames, flat gain maps and defect masks on disk, per camera serial, exposure and WOI.
+
+    Maps are stored as .npy files under `directory`/<serial>/ and listed in `directory`/index.json. A request for a
+    WOI is served from any stored map whose WOI contains it, by slicing, so a full-sensor capture covers every
+    later WOI. Dark frames are selected by exposure: an exact match, else a linear interpolation between the
+    nearest shorter and longer exposures (offset plus dark current is linear in time), else the nearest.
+    Flat gain maps and defect masks do not depend on exposure.
+    """
+
+    def __init__(self, directory='calibration'):
+        self.directory = directory
+        self.index_path = os.path.join(directory, 'index.json')
+        self.entries = []
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as file:
+                self.entries = json.load(file)
+
+    def _write_index(self):
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = self.index_path + '.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(self.entries, file, indent=2)
+        os.replace(temporary, self.index_path)
+
+    def save(self, kind, serial, array, woi, exposure=None, frames=None):
+        """
+        Stores a map, replacing one of the same kind, serial, WOI and exposure (required for dark frames). Returns
+        the file path.
+        """
+        if kind not in CALIBRATION_KINDS:
+            raise ValueError(f"Unknown calibration kind {kind}")
+        if kind == 'dark' and exposure is None:
+            raise ValueError("A dark frame needs the exposure it was taken at")
+        woi = [int(v) for v in woi]
+        if np.shape(array) != (woi[3], woi[2]):
+            raise ValueError(f"Map shape {np.shape(array)} does not match the WOI {woi}")
+
+        exposure_tag = f"_{exposure:.4f}ms" if exposure is not None else ""
+        name = f"{kind}{exposure_tag}_{woi[2]}x{woi[3]}+{woi[0]}+{woi[1]}.npy"
+        path = os.path.join(self.directory, str(serial), name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.save(path, np.asarray(array, dtype=MAP_DTYPES[kind]))
+
+        self.entries = [e for e in self.entries if os.path.join(self.directory, e['file']) != path]
+        self.entries.append({
+            'kind': kind,
+            'serial': str(serial),
+            'exposure': exposure,
+            'woi': woi,
+            'frames': frames,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'file': os.path.relpath(path, self.directory),
+        })
+        self._write_index()
+        return path
+
+    def _load(self, entry, woi):
+        array = np.load(os.path.join(self.directory, entry['file']), mmap_mode='r')
+        return np.ascontiguousarray(slice_woi(array, entry['woi'], woi), dtype=MAP_DTYPES[entry['kind']])
+
+    def candidates(self, kind, serial, woi):
+        return [e for e in self.entries
+                if e['kind'] == kind and e['serial'] == str(serial) and contains_woi(e['woi'], woi)]
+
+    def find(self, kind, serial, woi, exposure=None):
+        """The map covering `woi` (float32, boolean for defects), None if nothing is stored."""
+        candidates = self.candidates(kind, serial, woi)
+        if not candidates:
+            return None
+        if kind != 'dark' or exposure is None:
+            return self._load(max(candidates, key=lambda e: e['created']), woi)
+
+        # Dark frames indexed without an exposure (older indexes) cannot be matched to one
+        candidates = [e for e in candidates if e['exposure'] is not None]
+        if not candidates:
+            return None
+        for entry in candidates:
+            if np.isclose(entry['exposure'], exposure, rtol=1e-3):
+                return self._load(entry, woi)
+        shorter = [e for e in candidates if e['exposure'] < exposure]
+        longer = [e for e in candidates if e['exposure'] > exposure]
+        if shorter and longer:
+            low = max(shorter, key=lambda e: e['exposure'])
+            high = min(longer, key=lambda e: e['exposure'])
+            weight = np.float32((exposure - low['exposure']) / (high['exposure'] - low['exposure']))
+            return (1 - weight) * self._load(low, woi) + weight * self._load(high, woi)
+        return self._load(min(candidates, key=lambda e: abs(e['exposure'] - exposure)), woi)
+
+
+class FlatFieldCorrection(FrameStage):
+    """
+    Pipeline stage computing (raw - dark) * gain into preallocated float32 buffers.
+
+    With both maps, dark * gain is precomputed so the frame costs one multiply and one subtract, done per block of
+    rows so the output block is still in cache for the subtract: the raw frame is read once and the output
+    written once. Either map may be None.
+
+    Parameters
+    ----------
+    dark : numpy.ndarray, optional
+        Master dark frame.
+    gain : numpy.ndarray, optional
+        Flat gain map.
+    buffers : int
+        Output buffers in the ring.
+    block_bytes : int
+        Output bytes per row block.
+    """
+    name = 'flat_field'
+
+    def __init__(self, dark=None, gain=None, buffers=3, block_bytes=512 * 1024):
+        if dark is None and gain is None:
+            raise ValueError("A dark frame or a gain map is needed")
+        self.dark = None if dark is None else np.ascontiguousarray(dark, dtype=np.float32)
+        self.gain = None if gain is None else np.ascontiguousarray(gain, dtype=np.float32)
+        if self.dark is not None and self.gain is not None and self.dark.shape != self.gain.shape:
+            raise ValueError(f"Dark {self.dark.shape} and gain {self.gain.shape} maps differ in shape")
+        self.offset = self.dark * self.gain if self.dark is not None and self.gain is not None else None
+        self.shape = (self.dark if self.dark is not None else self.gain).shape
+        self.block_rows = max(1, block_bytes // (4 * self.shape[1]))
+        self.ring = BufferRing(buffers)
+
+    @classmethod
+    def from_store(cls, store, serial, woi, exposure, buffers=3):
+        """Stage with the stored maps of the camera for `woi` and `exposure`, None if neither is stored."""
+        dark = store.find('dark', serial, woi, exposure)
+        gain = store.find('flat', serial, woi)
+        if dark is None and gain is None:
+            return None
+        return cls(dark, gain, buffers)
+
+    def process(self, frame):
+        if frame.shape != self.shape:
+            raise ValueError(f"Frame {frame.shape} does not match the calibration maps {self.shape}")
+        out = self.ring.next(frame.shape)
+        for start in range(0, self.shape[0], self.block_rows):
+            rows = slice(start, start + self.block_rows)
+            if self.gain is None:
+                np.subtract(frame[rows], self.dark[rows], out=out[rows])
+            elif self.dark is None:
+                np.multiply(frame[rows], self.gain[rows], out=out[rows])
+            else:
+                np.multiply(frame[rows], self.gain[rows], out=out[rows])
+                np.subtract(out[rows], self.offset[rows], out=out[rows])
+        return out
@@ -0,0 +1,162 @@
+"""
+Defective pixel detection from per-pixel mean/variance statistics and per-frame correction.
+
+Detection flags single-pixel outliers: a pixel is compared with the brightest and darkest of its 8 neighbours, on
+the scale of its temporal noise, and must also stand out by more than the neighbours vary among themselves, so
+illumination gradients and the peaks and dips of SPR spots are not flagged.
+
+Correction replaces every defective pixel by the mean of its nearest good neighbours, using index arrays
+precomputed once: per frame it is one gather and one fancy-indexed assignment over the defects only.
+"""
+import numpy as np
+from scipy.ndimage import maximum_filter, minimum_filter
+
+from source.processing.pipeline import FrameStage
+
+DEFECT_KINDS = ('hot', 'dead', 'noisy')
+
+_NEIGHBOURS = np.array([[1, 1, 1], [1, 0, 1], [1, 1, 1]], dtype=bool)
+
+
+def neighbour_extremes(image):
+    """Maximum and minimum of the 8 neighbours of every pixel, the pixel itself excluded (also at the borders)."""
+    return (maximum_filter(image, footprint=_NEIGHBOURS, mode='mirror'),
+            minimum_filter(image, footprint=_NEIGHBOURS, mode='mirror'))
+
+
+def detect_defects(mean, variance, frames, hot_sigma=6.0, dead_fraction=0.5, noisy_sigma=6.0, structure=2.0):
+    """
+    Flags single-pixel outliers of a noise measurement.
+
+    Parameters
+    ----------
+    mean, variance : numpy.ndarray
+        Per-pixel temporal mean and variance images (any consistent unit).
+    frames : int
+        Frames the statistics were taken over; the temporal sigma of a mean is sqrt(variance / frames).
+    hot_sigma : float
+        A pixel is hot if its mean exceeds the brightest neighbour by more than `hot_sigma` temporal sigmas of
+        its mean.
+    dead_fraction : float
+        A pixel is dead if its mean is below `dead_fraction` of the darkest neighbour.
+    noisy_sigma : float
+        A pixel is noisy if its variance exceeds the largest neighbour variance by more than `noisy_sigma`
+        sampling sigmas of that variance (variance * sqrt(2 / (frames - 1))).
+    structure : float
+        In addition, the excess over the neighbours must be more than `structure` times the spread (maximum minus
+        minimum) of the neighbours, which a smooth peak or dip does not reach.
+
+    Returns
+    -------
+    dict
+        {'hot': mask, 'dead': mask, 'noisy': mask} boolean images.
+    """
+    mean = np.asarray(mean, dtype=np.float64)
+    variance = np.asarray(variance, dtype=np.float64)
+    sigma = np.sqrt(np.maximum(variance, 0.0) / max(int(frames), 1))
+
+    high, low = neighbour_extremes(mean)
+    spread = structure * (high - low)
+    variance_high, variance_low = neighbour_extremes(variance)
+    variance_sigma = variance_high * np.sqrt(2.0 / max(int(frames) - 1, 1))
+
+    return {
+        'hot': mean - high > hot_sigma * sigma + spread,
+        'dead': (mean < dead_fraction * low) & (low - mean > spread),
+        'noisy': variance - variance_high > noisy_sigma * variance_sigma + structure * (variance_high - variance_low),
+    }
+
+
+def combine_defects(defects):
+    """Union of the masks of detect_defects()."""
+    return np.logical_or.reduce([defects[kind] for kind in DEFECT_KINDS])
+
+
+class DefectMap:
+    """
+    Replacement indices of the defective pixels of one frame shape.
+
+    For every defect the `neighbours` nearest good pixels within `radius` are found (4-neighbours first, then
+    diagonals, then further out). Defects with fewer good neighbours repeat the ones they have; defects without
+    any stay unchanged.
+
+    Parameters
+    ----------
+    mask : numpy.ndarray
+        Boolean image, True at defective pixels.
+    neighbours : int
+        Good pixels averaged per defect, 1 for nearest-neighbour replacement.
+    radius : int
+        Search radius.
+    """
+
+    def __init__(self, mask, neighbours=4, radius=3):
+        mask = np.asarray(mask, dtype=bool)
+        self.shape = mask.shape
+        self.neighbours = max(1, int(neighbours))
+
+        rows, columns = np.nonzero(mask)
+        self.defects = np.ravel_multi_index((rows, columns), self.shape)
+
+        # Candidate offsets in order of distance, excluding the pixel itself
+        dy, dx = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+        dy, dx = dy.ravel(), dx.ravel()
+        order = np.lexsort((np.abs(dx) + np.abs(dy), dy * dy + dx * dx))
+        dy, dx = dy[order][1:], dx[order][1:]
+
+        candidate_rows = rows[:, None] + dy[None, :]
+        candidate_columns = columns[:, None] + dx[None, :]
+        inside = ((candidate_rows >= 0) & (candidate_rows < self.shape[0])
+                  & (candidate_columns >= 0) & (candidate_columns < self.shape[1]))
+        candidate_rows = np.clip(candidate_rows, 0, self.shape[0] - 1)
+        candidate_columns = np.clip(candidate_columns, 0, self.shape[1] - 1)
+        good = inside & ~mask[candidate_rows, candidate_columns]
+
+        # First `neighbours` good candidates per defect, cycling through them if there are fewer
+        rank = np.cumsum(good, axis=1) - 1
+        available = good.sum(axis=1)
+        self.neighbour_index = np.repeat(self.defects[:, None], self.neighbours, axis=1)
+        for k in range(self.neighbours):
+            wanted = np.where(available > 0, k % np.maximum(available, 1), -1)
+            hit = good & (rank == wanted[:, None])
+            has = hit.any(axis=1)
+            position = hit.argmax(axis=1)
+            flat = np.ravel_multi_index((candidate_rows[np.arange(len(rows)), position],
+                                         candidate_columns[np.arange(len(rows)), position]), self.shape)
+            self.neighbour_index[has, k] = flat[has]
+        self.uncorrectable = int(np.sum(available == 0))
+
+    def __len__(self):
+        return len(self.defects)
+
+    def correct(self, frame):
+        """Replaces the defective pixels of `frame` in place and returns it."""
+        if frame.shape != self.shape:
+            raise ValueError(f"Frame {frame.shape} does not match the defect map {self.shape}")
+        flat = frame.reshape(-1)  # A view for the contiguous frames of the pipeline
+        if self.neighbours == 1:
+            flat[self.defects] = flat[self.neighbour_index[:, 0]]
+        else:
+            flat[self.defects] = flat[self.neighbour_index].mean(axis=1)
+        return frame
+
+
+class DefectCorrection(FrameStage):
+    """Pipeline stage replacing defective pixels in place, see DefectMap."""
+    name = 'defects'
+
+    def __init__(self, mask, neighbours=4, radius=3):
+        self.map = DefectMap(mask, neighbours, radius)
+
+    @classmethod
+    def from_store(cls, store, serial, woi, neighbours=4):
+        """Stage with the stored defect mask of the camera for `woi`, None if none is stored."""
+        mask = store.find('defects', serial, woi)
+        if mask is None:
+            return None
+        return cls(mask, neighbours)
+
+    def process(self, frame):
+        if not frame.flags.c_contiguous:
+            frame = np.ascontiguousarray(frame)
+        return self.map.correct(frame)
@@ -0,0 +1,91 @@
+"""
+Per-frame processing pipeline run by CameraWorkerThread between grabbing and emitting a frame.
+
+A stage is an object with a `name` and a `process(frame)` method returning the processed frame. Stages that
+produce a new array write into buffers preallocated by a BufferRing instead of allocating per frame. A buffer is
+reused `count` frames later, so consumers that keep a frame longer than that (or modify it) must copy it;
+CameraWorkerThread emits copies of buffered frames, as its queued signals can be delivered any number of frames
+later.
+"""
+import numpy as np
+
+from source.utilities.telemetry import telemetry
+
+
+class BufferRing:
+    """
+    `count` preallocated output buffers handed out in turn, reallocated when the frame shape or dtype changes
+    (e.g. after a WOI change).
+    """
+
+    def __init__(self, count=3):
+        self.count = max(1, int(count))
+        self._buffers = []
+        self._index = 0
+
+    def next(self, shape, dtype=np.float32):
+        if not self._buffers or self._buffers[0].shape != tuple(shape) or self._buffers[0].dtype != dtype:
+            self._buffers = [np.empty(shape, dtype=dtype) for _ in range(self.count)]
+            self._index = 0
+        buffer = self._buffers[self._index]
+        self._index = (self._index + 1) % self.count
+        return buffer
+
+    def owns(self, array):
+        """True if `array` is one of the buffers or a view of one, i.e. it is overwritten `count` frames later."""
+        base = array if array.base is None else array.base
+        return any(base is buffer for buffer in self._buffers)
+
+
+class FrameStage:
+    """Base class of pipeline stages."""
+    name = 'stage'
+
+    def process(self, frame):
+        """Returns the processed frame.
+
+        Raises
+        ------
+        NotImplementedError
+            If the method is not implemented.
+        """
+        raise NotImplementedError()
+
+
+class FramePipeline:
+    """
+    Ordered stages applied to every frame, each timed under the telemetry stage 'pipeline.<name>'.
+
+    Stages can be added and removed from another thread while frames are processed: the stage list is replaced,
+    never modified in place, so a frame always runs through a consistent list.
+    """
+
+    def __init__(self, stages=None):
+        self.stages = list(stages or [])
+
+    def add(self, stage, index=None):
+        """Adds a stage at `index` (the end if None), replacing a stage of the same name."""
+        stages = [s for s in self.stages if s.name != stage.name]
+        stages.insert(len(stages) if index is None else index, stage)
+        self.stages = stages
+
+    def remove(self, name):
+        self.stages = [s for s in self.stages if s.name != name]
+
+    def get(self, name):
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        return None
+
+    def clear(self):
+        self.stages = []
+
+    def process(self, frame):
+        for stage in self.stages:
+            with telemetry.measure(f'pipeline.{stage.name}'):
+                frame = stage.process(frame)
+        return frame
+
+    def __len__(self):
+        return len(self.stages)
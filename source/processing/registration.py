@@ -0,0 +1,212 @@
+"""
+Drift registration for long SPR runs: subpixel frame-to-reference translation by FFT phase correlation, and ROI
+means evaluated at subpixel offsets.
+
+The correlation runs on a fixed patch, optionally block-decimated and Hann-windowed, every `interval` frames.
+The reference spectrum is computed once. The patch shape never changes, so scipy.fft reuses its cached
+transform plans, and the transforms run in single precision. ROI signals follow the drift through bilinear
+weights on box sums from an integral image. Their cost does not depend on the ROI sizes, and frames are never
+resampled.
+"""
+import numpy as np
+import scipy.fft
+
+from source.utilities.telemetry import telemetry
+
+
+def decimate(image, factor):
+    """Block mean over factor x factor pixels, the image being cropped to a multiple of `factor`."""
+    if factor == 1:
+        return image.astype(np.float32)
+    height, width = image.shape[0] // factor * factor, image.shape[1] // factor * factor
+    blocks = image[:height, :width].reshape(height // factor, factor, width // factor, factor)
+    return blocks.mean(axis=(1, 3), dtype=np.float32)
+
+
+def _subpixel(left, centre, right):
+    """Vertex of the parabola through three equally spaced samples, relative to the centre one."""
+    denominator = left - 2.0 * centre + right
+    if denominator >= 0:
+        return 0.0
+    return float(np.clip(0.5 * (left - right) / denominator, -0.5, 0.5))
+
+
+class PhaseCorrelator:
+    """
+    Translation of frames relative to a reference frame.
+
+    Parameters
+    ----------
+    reference : numpy.ndarray
+        Reference frame.
+    patch : (int, int, int, int), optional
+        (y, x, height, width) region used, the central 512 x 512 (or the whole frame if smaller) if not given.
+        Choose a region with structure (spots, edges) that stays in view.
+    decimation : int
+        Block-mean decimation of the patch before the transform.
+    regularisation : float
+        Whitening of the cross-power spectrum S: S / (|S| + regularisation * max|S|). Pure phase correlation
+        (0) gives the noise-dominated, near-empty high frequencies of smooth SPR images the same weight as the
+        signal and fails on noisy frames; 1e-2 keeps the sharp peak without that.
+    """
+
+    def __init__(self, reference, patch=None, decimation=1, regularisation=1e-2):
+        if patch is None:
+            height, width = min(512, reference.shape[0]), min(512, reference.shape[1])
+            patch = ((reference.shape[0] - height) // 2, (reference.shape[1] - width) // 2, height, width)
+        self.patch = tuple(int(v) for v in patch)
+        self.decimation = max(1, int(decimation))
+
+        shape = (self.patch[2] // self.decimation, self.patch[3] // self.decimation)
+        if min(shape) < 8:
+            raise ValueError(f"Registration patch {self.patch} is too small for decimation {self.decimation}")
+        self.shape = shape
+        self.window = np.outer(np.hanning(shape[0]), np.hanning(shape[1])).astype(np.float32)
+        self.regularisation = regularisation
+        self.reference_spectrum = np.conj(scipy.fft.rfft2(self.prepare(reference)))
+        # Peak of the reference with itself, normalising the confidence
+        self.self_peak = 1.0
+        self.self_peak = self._correlate(np.conj(self.reference_spectrum))[0, 0]
+
+    def prepare(self, frame):
+        y, x, height, width = self.patch
+        patch = decimate(frame[y:y + height, x:x + width], self.decimation)
+        patch -= patch.mean()
+        patch *= self.window
+        return patch
+
+    def estimate(self, frame):
+        """
+        (dy, dx, confidence): displacement of the frame content relative to the reference in pixels, and the
+        correlation peak relative to the reference's own (1 for identical patches, about 0.3 for unrelated ones).
+        """
+        correlation = self._correlate(scipy.fft.rfft2(self.prepare(frame)))
+
+        peak_y, peak_x = np.unravel_index(np.argmax(correlation), self.shape)
+        rows, columns = self.shape
+        dy = peak_y + _subpixel(correlation[peak_y - 1, peak_x], correlation[peak_y, peak_x],
+                                correlation[(peak_y + 1) % rows, peak_x])
+        dx = peak_x + _subpixel(correlation[peak_y, peak_x - 1], correlation[peak_y, peak_x],
+                                correlation[peak_y, (peak_x + 1) % columns])
+        # Peaks past the middle are negative shifts (circular correlation)
+        if dy > rows / 2:
+            dy -= rows
+        if dx > columns / 2:
+            dx -= columns
+        return dy * self.decimation, dx * self.decimation, float(correlation[peak_y, peak_x])
+
+    def _correlate(self, spectrum):
+        """Whitened circular cross-correlation of a patch spectrum with the reference, normalised to self_peak."""
+        spectrum *= self.reference_spectrum
+        magnitude = np.abs(spectrum)
+        magnitude += self.regularisation * magnitude.max() + np.float32(1e-30)
+        spectrum /= magnitude
+        return scipy.fft.irfft2(spectrum, s=self.shape) / self.self_peak
+
+
+class DriftTracker:
+    """
+    Keeps the drift of the frames relative to the first frame seen, re-estimated every `interval` frames.
+
+    Estimates whose correlation peak is below `min_confidence` (e.g. a blocked beam) are ignored and the last
+    offset is kept.
+    """
+
+    def __init__(self, interval=10, patch=None, decimation=2, min_confidence=0.5):
+        self.interval = max(1, int(interval))
+        self.patch = patch
+        self.decimation = decimation
+        self.min_confidence = min_confidence
+        self.correlator = None
+        self.offset = (0.0, 0.0)
+        self.confidence = None
+        self.frames = 0
+
+    def reset(self):
+        """The next frame becomes the reference."""
+        self.correlator = None
+        self.offset = (0.0, 0.0)
+        self.confidence = None
+        self.frames = 0
+
+    def update(self, frame):
+        """Returns the current (dy, dx) offset, updated from `frame` every `interval` frames."""
+        if self.correlator is None:
+            self.correlator = PhaseCorrelator(frame, self.patch, self.decimation)
+            self.frames = 0
+            return self.offset
+        self.frames += 1
+        if self.frames % self.interval == 0:
+            with telemetry.measure('registration'):
+                dy, dx, confidence = self.correlator.estimate(frame)
+            self.confidence = confidence
+            if confidence >= self.min_confidence:
+                self.offset = (dy, dx)
+        return self.offset
+
+
+class ROIPlan:
+    """
+    Means of many rectangular ROIs at a common subpixel offset.
+
+    The ROI box sums come from one integral image over the bounding box of the (shifted) ROIs. The four
+    integer-shifted means around the offset are combined with bilinear weights, which equals resampling the
+    frame by the offset before averaging. Pixels shifted out of the frame are left out of the mean.
+
+    Parameters
+    ----------
+    rois : dict
+        {roi_id: {"x": x, "y": y, "width": w, "height": h}}, as kept by ROIController.
+    """
+
+    def __init__(self, rois):
+        self.ids = list(rois)
+        regions = [rois[roi_id] for roi_id in self.ids]
+        self.x = np.array([r["x"] for r in regions], dtype=np.int64)
+        self.y = np.array([r["y"] for r in regions], dtype=np.int64)
+        self.width = np.array([r["width"] for r in regions], dtype=np.int64)
+        self.height = np.array([r["height"] for r in regions], dtype=np.int64)
+        self._integral = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def means(self, image, offset=(0.0, 0.0)):
+        """ROI means (numpy array in the order of `ids`) with the ROIs moved by offset = (dy, dx)."""
+        if not self.ids:
+            return np.empty(0)
+        rows, columns = image.shape
+        dy, dx = offset
+        shift_y, shift_x = int(np.floor(dy)), int(np.floor(dx))
+        fy, fx = dy - shift_y, dx - shift_x
+
+        # Bounding box of the ROIs over the four integer shifts
+        y0 = int(np.clip((self.y + shift_y).min(), 0, rows))
+        x0 = int(np.clip((self.x + shift_x).min(), 0, columns))
+        y1 = int(np.clip((self.y + self.height + shift_y + 1).max(), 0, rows))
+        x1 = int(np.clip((self.x + self.width + shift_x + 1).max(), 0, columns))
+        integral = self._integral_image(image[y0:y1, x0:x1])
+
+        result = np.zeros(len(self.ids))
+        for oy, ox, weight in ((0, 0, (1 - fy) * (1 - fx)), (0, 1, (1 - fy) * fx),
+                               (1, 0, fy * (1 - fx)), (1, 1, fy * fx)):
+            if weight == 0:
+                continue
+            top = np.clip(self.y + shift_y + oy, y0, y1) - y0
+            bottom = np.clip(self.y + self.height + shift_y + oy, y0, y1) - y0
+            left = np.clip(self.x + shift_x + ox, x0, x1) - x0
+            right = np.clip(self.x + self.width + shift_x + ox, x0, x1) - x0
+            sums = integral[bottom, right] - integral[top, right] - integral[bottom, left] + integral[top, left]
+            area = (bottom - top) * (right - left)
+            result += weight * np.divide(sums, area, out=np.full(len(self.ids), np.nan), where=area > 0)
+        return result
+
+    def _integral_image(self, image):
+        """Zero-padded summed-area table of `image`, into a reused buffer."""
+        shape = (image.shape[0] + 1, image.shape[1] + 1)
+        if self._integral is None or self._integral.shape != shape:
+            self._integral = np.zeros(shape, dtype=np.float64)
+        inner = self._integral[1:, 1:]
+        np.cumsum(image, axis=0, dtype=np.float64, out=inner)
+        np.cumsum(inner, axis=1, out=inner)
+        return self._integral
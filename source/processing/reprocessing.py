@@ -0,0 +1,245 @@
+"""
+Offline reprocessing of recorded frames, e.g. with other ROIs or corrections than during the experiment.
+
+A recording (the 'frames' array of a project file, or an .npy stack) is split into blocks of frames that each lie
+in one chunk of the file. Worker processes memory-map the recording themselves, so frames never pass through the
+parent, and run every frame of a block through the live correction stages (a FramePipeline of dark/flat and defect
+correction) and the analysis stages of the analysis pool (statistics, ROI means, registration). Only the small
+results come back.
+
+Results are appended in frame order to the 'results' array of an output project file, one row per frame, and the
+file is flushed every `flush_interval` seconds. The project index only ever covers flushed rows, so an interrupted
+run (Ctrl+C, crash, power cut) is resumed by running it again with the same settings: it continues after the last
+flushed frame.
+"""
+import copy
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from source.acquisition.measurements import flatten_result
+from source.processing.analysis_pool import FrameStatisticsStage, RegistrationStage, ROIMeansStage
+from source.processing.calibration import FlatFieldCorrection
+from source.processing.defect_pixels import DefectCorrection
+from source.processing.pipeline import FramePipeline
+from source.utilities.project_file import LazyArray, ProjectFile
+
+
+def open_recording(path, name='frames'):
+    """Frames of a recording: a LazyArray of a project file, or a memory-mapped .npy stack."""
+    if path.endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+    with ProjectFile(path) as project:
+        return project[name]
+
+
+def frame_blocks(frames, block_frames=64, start=0):
+    """[(start, stop)] blocks of at most `block_frames` frames from frame `start` on, none crossing a chunk."""
+    bounds = frames.chunk_bounds() if isinstance(frames, LazyArray) else [(0, len(frames))]
+    blocks = []
+    for first, end in bounds:
+        for block_start in range(max(first, start), end, block_frames):
+            blocks.append((block_start, min(block_start + block_frames, end)))
+    return blocks
+
+
+def recorded_corrections(path, name='frames', store=None, serial=None):
+    """
+    Correction stages for a recording: the calibration maps saved in its project file ('calibration/dark',
+    'calibration/flat', 'calibration/defects'), else those of a CalibrationStore for the camera, WOI and exposure
+    of the recording (frame attributes). `serial` defaults to the only camera in the project metadata.
+    """
+    if path.endswith('.npy'):
+        return []
+    with ProjectFile(path) as project:
+        maps = {kind: np.asarray(project[f"calibration/{kind}"]) for kind in ('dark', 'flat', 'defects')
+                if f"calibration/{kind}" in project}
+        if not maps and store is not None:
+            attrs = project[name].attrs
+            devices = list(project.metadata.get('devices', {}))
+            if serial is None and len(devices) == 1:
+                serial = devices[0]
+            if serial is None or 'woi' not in attrs:
+                raise ValueError(f"The camera and WOI of {path} are unknown, no calibration maps can be looked up")
+            maps = {kind: store.find(kind, serial, attrs['woi'], attrs.get('exposure'))
+                    for kind in ('dark', 'flat', 'defects')}
+
+    stages = []
+    if maps.get('dark') is not None or maps.get('flat') is not None:
+        stages.append(FlatFieldCorrection(maps.get('dark'), maps.get('flat')))
+    if maps.get('defects') is not None:
+        stages.append(DefectCorrection(maps['defects']))
+    return stages
+
+
+_worker = {}
+
+
+def _init_worker(path, name, corrections, stages):
+    _worker['frames'] = open_recording(path, name)
+    _worker['pipeline'] = FramePipeline(corrections)
+    # The defect correction works in place, recorded frames are read-only memory maps
+    _worker['copy'] = bool(corrections) and corrections[0].name == DefectCorrection.name
+    for stage in stages:
+        stage.setup()
+    _worker['stages'] = stages
+
+
+def _process_block(start, stop):
+    rows = []
+    for index, frame in enumerate(_worker['frames'][start:stop], start):
+        if _worker['copy']:
+            frame = np.array(frame)
+        frame = _worker['pipeline'].process(frame)
+        result = {'frame': index}
+        for stage in _worker['stages']:
+            result[stage.name] = stage.process(frame)
+        rows.append(flatten_result(result))
+    return start, rows
+
+
+class Reprocessor:
+    """
+    Reprocesses a recording on a pool of worker processes into the 'results' array of an output project file.
+
+    Result columns are the flattened results of the stages ('frame', 'statistics.mean', 'roi_means.<id>',
+    'registration.dy', ...), listed in the 'columns' attribute of the array.
+
+    Parameters
+    ----------
+    source : str
+        Recording, a project file or an .npy stack of frames.
+    output : str
+        Output project file, created or resumed.
+    rois : dict, optional
+        {roi_id: {x, y, width, height}} whose means are computed; the ROIs of the recording's project if None.
+    corrections : list, optional
+        Correction stages (FlatFieldCorrection, DefectCorrection) applied in this order, see
+        recorded_corrections().
+    registration : bool
+        Register every frame against the first (corrected) frame.
+    statistics : bool
+        Frame statistics (mean, std, min, max, saturated fraction).
+    max_value : int
+        Saturation level of the statistics.
+    name : str
+        Array of the frames in the source project.
+    workers : int, optional
+        Worker processes, the number of CPUs if not given.
+    block_frames : int
+        Frames per task.
+    flush_interval : float
+        Seconds between flushes of the output, the work lost at most by an interruption.
+    """
+
+    def __init__(self, source, output, rois=None, corrections=None, registration=False, statistics=True,
+                 max_value=4095, name='frames', workers=None, block_frames=64, flush_interval=10.0):
+        self.source = source
+        self.output = output
+        self.name = name
+        self.frames = open_recording(source, name)
+        if self.frames.ndim != 3:
+            raise ValueError(f"{source} holds {self.frames.shape} frames, expected a stack of 2D frames")
+        if rois is None and not source.endswith('.npy'):
+            with ProjectFile(source) as project:
+                rois = project.metadata.get('rois')
+        self.rois = rois or {}
+        self.corrections = list(corrections or [])
+        self.registration = registration
+        self.statistics = statistics
+        self.max_value = max_value
+        self.workers = workers or os.cpu_count() or 1
+        self.block_frames = max(1, int(block_frames))
+        self.flush_interval = flush_interval
+        self.on_progress = None  # Called with (frames done, frames) after every block written
+        self._stop = False
+
+    def stop(self):
+        """Stops after the blocks being processed, from another thread; the results so far are flushed."""
+        self._stop = True
+
+    def stages(self):
+        stages = []
+        if self.statistics:
+            stages.append(FrameStatisticsStage(self.max_value))
+        if self.rois:
+            stages.append(ROIMeansStage(self.rois))
+        if self.registration:
+            # Copies of the corrections: their buffers are not sent to the workers
+            reference = FramePipeline(copy.deepcopy(self.corrections)).process(np.array(self.frames[0]))
+            stages.append(RegistrationStage(np.array(reference)))
+        if not stages:
+            raise ValueError("Nothing to compute: enable statistics, registration or give ROIs")
+        return stages
+
+    def settings(self, stages):
+        """What the results depend on; a run is only resumed with the same settings."""
+        return {
+            'source': os.path.abspath(self.source),
+            'name': self.name,
+            'frames': len(self.frames),
+            'stages': [stage.name for stage in stages],
+            'rois': self.rois,
+            'corrections': [stage.name for stage in self.corrections],
+        }
+
+    def _resume(self, output, settings):
+        """Frames already in the output, 0 for a new output; raises ValueError if it was made otherwise."""
+        if 'results' not in output:
+            output.metadata['reprocessing'] = settings
+            return 0
+        previous = output.metadata.get('reprocessing')
+        if previous != settings:
+            raise ValueError(f"{self.output} holds results of other reprocessing settings ({previous}), "
+                             f"choose another output file")
+        return len(output['results'])
+
+    def run(self):
+        """Processes the frames not in the output yet. Returns the number of frames in the output."""
+        self._stop = False
+        stages = self.stages()
+        total = len(self.frames)
+        with ProjectFile(self.output, 'a') as output:
+            done = self._resume(output, self.settings(stages))
+            blocks = frame_blocks(self.frames, self.block_frames, done)
+            if not blocks:
+                return done
+            writer = output.append_to('results') if 'results' in output else None
+
+            executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                           initargs=(self.source, self.name, self.corrections, stages))
+            running, finished = set(), {}
+            next_block = 0
+            last_flush = time.monotonic()
+            try:
+                while running or (next_block < len(blocks) and not self._stop):
+                    # Two blocks per worker in flight keep the workers busy and the finished blocks bounded
+                    while next_block < len(blocks) and len(running) < 2 * self.workers and not self._stop:
+                        running.add(executor.submit(_process_block, *blocks[next_block]))
+                        next_block += 1
+                    completed, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in completed:
+                        start, rows = future.result()
+                        finished[start] = rows
+
+                    # Blocks are written in frame order, a later block waits for the earlier ones
+                    while done in finished:
+                        rows = finished.pop(done)
+                        if writer is None:
+                            columns = list(rows[0])
+                            writer = output.create_array('results', (len(columns),), np.float64,
+                                                         {'columns': columns})
+                        columns = output.arrays['results']['attrs']['columns']
+                        writer.append(np.array([[row[column] for column in columns] for row in rows],
+                                               dtype=np.float64))
+                        done += len(rows)
+                        if self.on_progress is not None:
+                            self.on_progress(done, total)
+                    if time.monotonic() - last_flush > self.flush_interval:
+                        output.flush()
+                        last_flush = time.monotonic()
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+        return done
@@ -0,0 +1,264 @@
+"""
+Automatic spot detection and ROI generation for SPR microarrays.
+
+Spots are found on an averaged frame by smoothing, an Otsu threshold and connected-component labelling. When the
+spots form a regular array, a lattice (origin and two basis vectors) is fitted to their centroids, which places
+ROIs on every array site, including spots too dim to pass the threshold, and rejects debris between the sites.
+"""
+from collections import namedtuple
+
+import numpy as np
+from scipy import ndimage
+from scipy.spatial import cKDTree
+
+# centroids: (n, 2) float (y, x); areas: (n,) pixels; boxes: (n, 4) int (x, y, width, height)
+Spots = namedtuple('Spots', ['centroids', 'areas', 'boxes', 'threshold', 'polarity'])
+# origin, a, b: (y, x) vectors; indices: (n, 2) int lattice indices of the centroids; inliers: (n,) bool
+Lattice = namedtuple('Lattice', ['origin', 'a', 'b', 'indices', 'inliers', 'rms'])
+
+
+def otsu_threshold(image, bins=1024):
+    """
+    Threshold maximising the between-class variance of the histogram of `image`.
+
+    The histogram is one bincount over the values scaled to `bins` levels, the class statistics cumulative sums
+    over it, so the cost is one pass over the image whatever its bit depth.
+    """
+    image = np.asarray(image)
+    low, high = float(image.min()), float(image.max())
+    if high <= low:
+        return low
+    scale = (bins - 1) / (high - low)
+    levels = ((image.ravel() - low) * scale).astype(np.intp)
+    histogram = np.bincount(levels, minlength=bins).astype(np.float64)
+
+    weight = np.cumsum(histogram)
+    moment = np.cumsum(histogram * np.arange(bins))
+    total, total_moment = weight[-1], moment[-1]
+    background = weight[:-1]
+    foreground = total - background
+    valid = (background > 0) & (foreground > 0)
+    between = np.zeros(bins - 1)
+    mean_background = moment[:-1][valid] / background[valid]
+    mean_foreground = (total_moment - moment[:-1][valid]) / foreground[valid]
+    between[valid] = background[valid] * foreground[valid] * (mean_background - mean_foreground) ** 2
+    # Pixels at levels <= k are background: the threshold lies between levels k and k + 1
+    return low + (np.argmax(between) + 1) / scale
+
+
+def detect_spots(image, threshold=None, polarity='auto', smooth=1.0, min_area=16, max_area=None):
+    """
+    Connected regions of an averaged frame above (or below) a threshold.
+
+    Parameters
+    ----------
+    image : numpy.ndarray
+        Averaged frame; single frames work too but noise splits the spots.
+    threshold : float, optional
+        Intensity threshold, Otsu's threshold of the smoothed image if not given.
+    polarity : str
+        'bright' for spots above the background, 'dark' for spots below it (e.g. at resonance), 'auto' takes the
+        class covering fewer pixels as the spots.
+    smooth : float
+        Sigma in pixels of the Gaussian smoothing before thresholding, 0 for none.
+    min_area, max_area : int
+        Regions outside this area range in pixels are dropped (noise, merged spots, chip edges).
+
+    Returns
+    -------
+    Spots
+        Centroids, areas and bounding boxes of the spots, ordered by y, and the threshold and polarity used.
+    """
+    if polarity not in ('auto', 'bright', 'dark'):
+        raise ValueError(f"Unknown spot polarity {polarity}")
+    image = np.asarray(image, dtype=np.float32)
+    if smooth:
+        image = ndimage.gaussian_filter(image, smooth)
+    if threshold is None:
+        threshold = otsu_threshold(image)
+
+    mask = image > threshold
+    if polarity == 'dark' or (polarity == 'auto' and np.count_nonzero(mask) > mask.size // 2):
+        mask = ~mask
+        polarity = 'dark'
+    else:
+        polarity = 'bright'
+    # Opening removes single noisy pixels and thin bridges between neighbouring spots
+    mask = ndimage.binary_opening(mask)
+    labels, count = ndimage.label(mask)
+
+    # Areas and centroids of all regions in three bincounts
+    flat = labels.ravel()
+    areas = np.bincount(flat, minlength=count + 1)[1:]
+    rows, columns = np.indices(labels.shape)
+    sum_y = np.bincount(flat, weights=rows.ravel(), minlength=count + 1)[1:]
+    sum_x = np.bincount(flat, weights=columns.ravel(), minlength=count + 1)[1:]
+    slices = ndimage.find_objects(labels)
+
+    keep = areas >= min_area
+    if max_area is not None:
+        keep &= areas <= max_area
+    keep = np.nonzero(keep)[0]
+    centroids = np.column_stack((sum_y[keep] / areas[keep], sum_x[keep] / areas[keep])).reshape(-1, 2)
+    boxes = np.array([(slices[k][1].start, slices[k][0].start,
+                       slices[k][1].stop - slices[k][1].start, slices[k][0].stop - slices[k][0].start)
+                      for k in keep], dtype=np.int64).reshape(-1, 4)
+
+    order = np.lexsort((centroids[:, 1], centroids[:, 0]))
+    return Spots(centroids[order], areas[keep][order], boxes[order], float(threshold), polarity)
+
+
+def _dominant_vector(vectors, tolerance):
+    """The vector with the most others within `tolerance` of its length, refined to the mean of those."""
+    tree = cKDTree(vectors)
+    radii = tolerance * np.linalg.norm(vectors, axis=1)
+    best = np.argmax(tree.query_ball_point(vectors, radii, return_length=True))
+    return vectors[tree.query_ball_point(vectors[best], radii[best])].mean(axis=0)
+
+
+def fit_lattice(centroids, tolerance=0.25, min_fraction=0.6, neighbours=4):
+    """
+    Fits a 2D lattice, origin + i * a + j * b, to spot centroids.
+
+    The basis vectors are the most common nearest-neighbour displacements (the shorter first, the second the most
+    common one not parallel to it). Each centroid gets the nearest integer indices, and origin and basis are then
+    refined by least squares over the centroids lying within `tolerance` pitches of their site.
+
+    Parameters
+    ----------
+    centroids : numpy.ndarray
+        (n, 2) spot centroids (y, x).
+    tolerance : float
+        Allowed distance of a centroid from its site and between displacements of the same basis vector, as a
+        fraction of the lattice pitch.
+    min_fraction : float
+        Fraction of the centroids that must lie on the lattice for the spots to be considered gridded.
+    neighbours : int
+        Nearest neighbours per centroid the displacements are taken from.
+
+    Returns
+    -------
+    Lattice or None
+        None if there are too few spots or they do not form a lattice.
+    """
+    centroids = np.asarray(centroids, dtype=np.float64).reshape(-1, 2)
+    if len(centroids) < 4:
+        return None
+
+    # Nearest-neighbour displacements, folded to the upper half plane (v and -v are the same basis vector)
+    k = min(neighbours, len(centroids) - 1)
+    _, nearest = cKDTree(centroids).query(centroids, k=k + 1)
+    vectors = (centroids[nearest[:, 1:]] - centroids[:, None, :]).reshape(-1, 2)
+    flip = (vectors[:, 0] < 0) | ((vectors[:, 0] == 0) & (vectors[:, 1] < 0))
+    vectors[flip] *= -1
+
+    first = _dominant_vector(vectors, tolerance)
+    lengths = np.linalg.norm(vectors, axis=1)
+    sine = np.abs(vectors[:, 0] * first[1] - vectors[:, 1] * first[0]) / (lengths * np.linalg.norm(first))
+    others = vectors[sine > 0.5]
+    if len(others) < 2:
+        return None
+    second = _dominant_vector(others, tolerance)
+    a, b = sorted((first, second), key=np.linalg.norm)
+    pitch = np.linalg.norm(a)
+
+    # Start from the spot nearest the median position, it is rarely debris
+    origin = centroids[np.argmin(np.linalg.norm(centroids - np.median(centroids, axis=0), axis=1))]
+    for _ in range(3):
+        basis = np.column_stack((a, b))
+        indices = np.rint(np.linalg.solve(basis, (centroids - origin).T).T).astype(np.int64)
+        sites = origin + indices @ basis.T
+        inliers = np.linalg.norm(centroids - sites, axis=1) <= tolerance * pitch
+        if inliers.sum() < 3:
+            return None
+        # centroid = origin + i * a + j * b, linear in (origin, a, b)
+        design = np.column_stack((np.ones(inliers.sum()), indices[inliers]))
+        solution = np.linalg.lstsq(design, centroids[inliers], rcond=None)[0]
+        origin, a, b = solution
+        pitch = min(np.linalg.norm(a), np.linalg.norm(b))
+
+    basis = np.column_stack((a, b))
+    indices = np.rint(np.linalg.solve(basis, (centroids - origin).T).T).astype(np.int64)
+    residuals = np.linalg.norm(centroids - (origin + indices @ basis.T), axis=1)
+    inliers = residuals <= tolerance * pitch
+    if inliers.mean() < min_fraction:
+        return None
+    rms = float(np.sqrt(np.mean(residuals[inliers] ** 2)))
+    return Lattice(origin, a, b, indices, inliers, rms)
+
+
+def lattice_sites(lattice, shape, margin=0):
+    """
+    (m, 2) positions (y, x) of all sites within the index range of the lattice inliers, that is the whole array
+    including missing spots, that lie at least `margin` pixels inside an image of `shape`.
+    """
+    indices = lattice.indices[lattice.inliers]
+    (i0, j0), (i1, j1) = indices.min(axis=0), indices.max(axis=0)
+    i, j = np.mgrid[i0:i1 + 1, j0:j1 + 1]
+    sites = lattice.origin + np.column_stack((i.ravel(), j.ravel())) @ np.column_stack((lattice.a, lattice.b)).T
+    inside = ((sites[:, 0] >= margin) & (sites[:, 0] <= shape[0] - 1 - margin)
+              & (sites[:, 1] >= margin) & (sites[:, 1] <= shape[1] - 1 - margin))
+    # Row-major order: the basis vector closer to vertical steps between rows
+    i, j, sites = i.ravel()[inside], j.ravel()[inside], sites[inside]
+    if abs(lattice.a[0]) >= abs(lattice.b[0]):
+        order = np.lexsort((j * np.sign(lattice.b[1]), i * np.sign(lattice.a[0])))
+    else:
+        order = np.lexsort((i * np.sign(lattice.a[1]), j * np.sign(lattice.b[0])))
+    return sites[order]
+
+
+def centred_rois(centres, size, shape, offset=(0, 0)):
+    """
+    Square [x, y, width, height] ROIs of side `size` centred on (y, x) `centres`, clipped to an image of `shape`
+    and moved by `offset` = (offsetX, offsetY), e.g. the WOI offset.
+    """
+    size = max(1, int(size))
+    regions = []
+    for cy, cx in np.asarray(centres).reshape(-1, 2):
+        x = int(np.clip(np.rint(cx - (size - 1) / 2), 0, max(0, shape[1] - size)))
+        y = int(np.clip(np.rint(cy - (size - 1) / 2), 0, max(0, shape[0] - size)))
+        regions.append([x + offset[0], y + offset[1], min(size, shape[1]), min(size, shape[0])])
+    return regions
+
+
+def spot_rois(image, roi_size=None, fill=0.7, gridded=True, offset=(0, 0), **detection):
+    """
+    ROIs on the spots of an averaged frame.
+
+    Parameters
+    ----------
+    image : numpy.ndarray
+        Averaged frame.
+    roi_size : int, optional
+        ROI side in pixels. By default `fill` times the median equivalent diameter of the spots, so the ROIs stay
+        inside the spots, and at most `fill` times the lattice pitch.
+    fill : float
+        ROI side relative to the spot diameter (0.7 fits a square inside a round spot).
+    gridded : bool
+        Fit a lattice and place the ROIs on its sites. Falls back to the detected spots when they do not form one.
+    offset : (int, int)
+        Added to the ROI positions, (offsetX, offsetY) of the WOI the frame was taken with.
+    **detection
+        Passed to detect_spots().
+
+    Returns
+    -------
+    (list, Spots, Lattice or None)
+        [x, y, width, height] ROIs (in lattice rows when gridded), the detected spots and the fitted lattice.
+    """
+    spots = detect_spots(image, **detection)
+    if len(spots.areas) == 0:
+        return [], spots, None
+
+    lattice = fit_lattice(spots.centroids) if gridded else None
+    if roi_size is None:
+        diameter = 2 * np.sqrt(np.median(spots.areas) / np.pi)
+        roi_size = fill * diameter
+        if lattice is not None:
+            roi_size = min(roi_size, fill * min(np.linalg.norm(lattice.a), np.linalg.norm(lattice.b)))
+
+    if lattice is not None:
+        centres = lattice_sites(lattice, image.shape, margin=roi_size / 2)
+    else:
+        centres = spots.centroids
+    return centred_rois(centres, roi_size, image.shape, offset), spots, lattice
@@ -0,0 +1,394 @@
+"""
+Local streaming of frames, metadata and ROI values to external analysis clients (Jupyter, other tools).
+
+    server = FrameServer('127.0.0.1:5555')  # or 'unix:/tmp/spr.sock'
+    server.start()
+    server.publish_frame(frame)  # acquisition thread, returns immediately
+    server.publish_values({'0': 1021.4, '1': 998.2})
+
+    client = FrameClient('127.0.0.1:5555')  # in the analysis process
+    client.subscribe(decimation=10, frames='rois', rois=['0'])
+    for message in client:
+        ...
+
+Protocol: every message is a 28 byte header, struct '<4sBBHQdI' (magic b'SPRS', version, message type, reserved,
+frame index, timestamp [s since the epoch], payload length), followed by the payload:
+
+- METADATA (1): UTF-8 JSON, e.g. {"rois": {...}, "values": [roi ids in the order of VALUES], ...}. Sent on
+  connection, on every subscription and whenever the metadata or the ROIs change.
+- FRAME (2): a 32 byte frame header, struct '<4sIIii12s' (numpy dtype string, height, width, x, y of the crop
+  in the frame, ROI id or empty for the whole frame), then the C-ordered pixels.
+- VALUES (3): float64 ROI values, in the order listed by the last METADATA.
+- SUBSCRIBE (4, client to server): UTF-8 JSON {"decimation": n, "frames": "none" | "full" | "rois",
+  "rois": [ids] or null for all, "values": true}.
+
+Every client has its own bounded queue, drained by its own sender thread. A slow client loses its oldest frames and
+values (counted in its `dropped`), never metadata, and never slows acquisition or the other clients. A frame is serialised once per
+publish and the same bytes are queued for every client that wants it.
+"""
+import json
+import os
+import socket
+import struct
+import threading
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+
+MAGIC = b'SPRS'
+VERSION = 1
+HEADER = struct.Struct('<4sBBHQdI')
+FRAME_HEADER = struct.Struct('<4sIIii12s')
+
+METADATA, FRAME, VALUES, SUBSCRIBE = 1, 2, 3, 4
+FRAME_MODES = ('none', 'full', 'rois')
+
+# kind: message type; data: dict (METADATA), FrameData (FRAME) or {roi_id: value} (VALUES)
+Message = namedtuple('Message', ['kind', 'index', 'timestamp', 'data'])
+FrameData = namedtuple('FrameData', ['image', 'x', 'y', 'roi_id'])
+
+
+def parse_address(address):
+    """('unix', path) for 'unix:<path>', else ('tcp', (host, port)) for 'host:port'."""
+    if address.startswith('unix:'):
+        if not hasattr(socket, 'AF_UNIX'):
+            raise ValueError("Unix sockets are not available on this platform")
+        return 'unix', address[len('unix:'):]
+    host, _, port = address.rpartition(':')
+    return 'tcp', (host or '127.0.0.1', int(port))
+
+
+def encode_message(kind, payload, index=0, timestamp=0.0):
+    """A message as one bytes object; `payload` is a bytes-like object or a sequence of them."""
+    parts = [payload] if isinstance(payload, (bytes, bytearray, memoryview)) else list(payload)
+    length = sum(memoryview(part).nbytes for part in parts)
+    return b''.join([HEADER.pack(MAGIC, VERSION, kind, 0, index, timestamp, length)] + parts)
+
+
+def encode_json(kind, data, index=0, timestamp=0.0):
+    return encode_message(kind, json.dumps(data).encode('utf-8'), index, timestamp)
+
+
+def encode_frame(image, index, timestamp, x=0, y=0, roi_id=''):
+    image = np.ascontiguousarray(image)
+    header = FRAME_HEADER.pack(image.dtype.str.encode('ascii'), image.shape[0], image.shape[1], x, y,
+                               str(roi_id).encode('utf-8')[:12])
+    return encode_message(FRAME, (header, memoryview(image).cast('B')), index, timestamp)
+
+
+def _receive_exactly(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionError("Connection closed")
+        received += count
+    return buffer
+
+
+def receive_message(sock):
+    """(kind, index, timestamp, payload bytes) of the next message on a socket."""
+    magic, version, kind, _, index, timestamp, length = HEADER.unpack(_receive_exactly(sock, HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ConnectionError(f"Not a frame stream (magic {magic!r}, version {version})")
+    return kind, index, timestamp, _receive_exactly(sock, length)
+
+
+def decode_frame(payload):
+    dtype, height, width, x, y, roi_id = FRAME_HEADER.unpack_from(payload)
+    image = np.frombuffer(payload, dtype=np.dtype(dtype.rstrip(b'\0 ').decode('ascii')), offset=FRAME_HEADER.size)
+    return FrameData(image.reshape(height, width), x, y, roi_id.rstrip(b'\0').decode('utf-8'))
+
+
+class _Client:
+    """One connection: its subscription, bounded queue and sender and receiver threads."""
+
+    def __init__(self, server, sock, address, queue_size):
+        self.server = server
+        self.sock = sock
+        self.address = address
+        self.queue = deque()
+        self.queue_size = queue_size
+        self.ready = threading.Condition()
+        self.dropped = 0
+        self.sent = 0
+        self.closed = False
+        self.decimation = 1
+        self.frames = 'none'
+        self.rois = None  # None: all ROIs
+        self.values = True
+        self.sender = threading.Thread(target=self._send_loop, daemon=True)
+        self.receiver = threading.Thread(target=self._receive_loop, daemon=True)
+
+    def start(self):
+        self.sender.start()
+        self.receiver.start()
+
+    def subscribe(self, options):
+        decimation = max(1, int(options.get('decimation', self.decimation)))
+        frames = options.get('frames', self.frames)
+        if frames not in FRAME_MODES:
+            raise ValueError(f"Unknown frame mode {frames}")
+        self.decimation, self.frames = decimation, frames
+        self.rois = options.get('rois', self.rois)
+        self.values = bool(options.get('values', self.values))
+
+    def roi_ids(self, ids):
+        """The subscribed ones of `ids`, in their order."""
+        if self.rois is None:
+            return list(ids)
+        wanted = {str(roi_id) for roi_id in self.rois}
+        return [roi_id for roi_id in ids if roi_id in wanted]
+
+    def offer(self, kind, message):
+        """
+        Queues a message. When the queue is full the oldest frame or values message is dropped; METADATA is never
+        dropped, the VALUES after it could not be decoded without it.
+        """
+        with self.ready:
+            if len(self.queue) >= self.queue_size:
+                position = next((i for i, (k, _) in enumerate(self.queue) if k != METADATA), None)
+                if position is not None:
+                    del self.queue[position]
+                    self.dropped += 1
+            self.queue.append((kind, message))
+            self.ready.notify()
+
+    def _send_loop(self):
+        try:
+            while True:
+                with self.ready:
+                    while not self.queue and not self.closed:
+                        self.ready.wait()
+                    if self.closed:
+                        break
+                    _, message = self.queue.popleft()
+                self.sock.sendall(message)
+                self.sent += 1
+        except OSError:
+            pass
+        self.close()
+
+    def _receive_loop(self):
+        try:
+            while not self.closed:
+                kind, _, _, payload = receive_message(self.sock)
+                if kind == SUBSCRIBE:
+                    self.subscribe(json.loads(payload.decode('utf-8')))
+                    self.offer(METADATA, self.server.metadata_message(self))
+        except (OSError, ConnectionError, ValueError) as e:
+            if not self.closed and not isinstance(e, ConnectionError):
+                print(f"Frame stream client {self.address}: {e}")
+        self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        with self.ready:
+            self.closed = True
+            self.ready.notify()  # Wakes the sender
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self.server._remove(self)
+
+
+class FrameServer:
+    """
+    Publishes frames and ROI values to the clients connected on a localhost TCP port or a Unix socket.
+
+    Parameters
+    ----------
+    address : str
+        'host:port' (use 127.0.0.1, the stream is not authenticated) or 'unix:<path>'.
+    queue_size : int
+        Messages queued per client before its oldest ones are dropped.
+    """
+
+    def __init__(self, address='127.0.0.1:5555', queue_size=8):
+        self.address = address
+        self.queue_size = queue_size
+        self.clients = []
+        self.metadata = {}
+        self.rois = {}
+        self.value_ids = []  # ROI ids of the last published values, in their order
+        self.index = 0
+        self._lock = threading.Lock()
+        self._socket = None
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        family, address = parse_address(self.address)
+        if family == 'unix':
+            if os.path.exists(address):
+                os.unlink(address)
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(address)
+        self._socket.listen()
+        self._socket.settimeout(0.5)  # The accept loop checks for stop()
+        self._running = True
+        self._thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+        for client in list(self.clients):
+            client.close()
+        if self._socket is not None:
+            self._socket.close()
+            family, address = parse_address(self.address)
+            if family == 'unix' and os.path.exists(address):
+                os.unlink(address)
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                sock, address = self._socket.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            sock.settimeout(None)
+            if sock.family == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client = _Client(self, sock, address, self.queue_size)
+            with self._lock:
+                self.clients = self.clients + [client]
+            client.offer(METADATA, self.metadata_message(client))
+            client.start()
+
+    def _remove(self, client):
+        with self._lock:
+            self.clients = [c for c in self.clients if c is not client]
+
+    def metadata_message(self, client):
+        metadata = dict(self.metadata, rois=self.rois, values=client.roi_ids(self.value_ids),
+                        subscription={'decimation': client.decimation, 'frames': client.frames,
+                                      'rois': client.rois, 'values': client.values})
+        return encode_json(METADATA, metadata, self.index, time.time())
+
+    def set_metadata(self, **metadata):
+        """Updates the metadata (e.g. serial, exposure, woi) and sends it to every client."""
+        self.metadata.update(metadata)
+        for client in self.clients:
+            client.offer(METADATA, self.metadata_message(client))
+
+    def set_rois(self, rois):
+        """Sets the ROIs ({id: {x, y, width, height}}) of the values and frame crops, telling every client."""
+        rois = {str(roi_id): dict(region) for roi_id, region in rois.items()}
+        if rois == self.rois:
+            return
+        self.rois = rois
+        for client in self.clients:
+            client.offer(METADATA, self.metadata_message(client))
+
+    def publish_frame(self, frame, index=None, timestamp=None):
+        """
+        Queues a frame for the clients subscribed to frames whose decimation selects it. The frame (or ROI crop) is
+        serialised once, whatever the number of clients. Returns the frame index.
+        """
+        index = self.index if index is None else index
+        self.index = index + 1
+        clients = [c for c in self.clients if c.frames != 'none' and index % c.decimation == 0]
+        if not clients:
+            return index
+        timestamp = time.time() if timestamp is None else timestamp
+
+        encoded = {}  # Shared by the clients: '' for the whole frame, else ROI id
+        for client in clients:
+            if client.frames == 'full':
+                if '' not in encoded:
+                    encoded[''] = encode_frame(frame, index, timestamp)
+                client.offer(FRAME, encoded[''])
+                continue
+            for roi_id in client.roi_ids(self.rois):
+                if roi_id not in encoded:
+                    region = self.rois[roi_id]
+                    x, y = max(0, region['x']), max(0, region['y'])
+                    crop = frame[y:y + region['height'], x:x + region['width']]
+                    encoded[roi_id] = encode_frame(crop, index, timestamp, x, y, roi_id)
+                client.offer(FRAME, encoded[roi_id])
+        return index
+
+    def publish_values(self, values, index=None, timestamp=None):
+        """Queues ROI values ({roi_id: value}) for the clients subscribed to values (every point, no decimation)."""
+        index = self.index if index is None else index
+        timestamp = time.time() if timestamp is None else timestamp
+        values = {str(roi_id): value for roi_id, value in values.items()}
+        if list(values) != self.value_ids:
+            self.value_ids = list(values)
+            for client in self.clients:
+                client.offer(METADATA, self.metadata_message(client))
+        for client in self.clients:
+            if client.values:
+                ids = client.roi_ids(self.value_ids)
+                payload = np.array([values[roi_id] for roi_id in ids], dtype=np.float64)
+                client.offer(VALUES, encode_message(VALUES, payload.tobytes(), index, timestamp))
+
+    def statistics(self):
+        """{client address: {'queued', 'sent', 'dropped'}}."""
+        return {str(c.address): {'queued': len(c.queue), 'sent': c.sent, 'dropped': c.dropped}
+                for c in self.clients}
+
+
+class FrameClient:
+    """
+    Receiving end of a FrameServer stream, e.g. in a notebook.
+
+    Messages are returned as Message tuples: METADATA as a dict, FRAME as FrameData (image, x, y, roi_id) and
+    VALUES as {roi_id: value}.
+    """
+
+    def __init__(self, address='127.0.0.1:5555', timeout=None):
+        family, address = parse_address(address)
+        self.sock = socket.socket(socket.AF_UNIX if family == 'unix' else socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.connect(address)
+        self.sock.settimeout(timeout)
+        self.metadata = {}
+
+    def subscribe(self, decimation=1, frames='none', rois=None, values=True):
+        """Changes the subscription; the server answers with a METADATA message."""
+        if frames not in FRAME_MODES:
+            raise ValueError(f"Unknown frame mode {frames}")
+        options = {'decimation': decimation, 'frames': frames, 'rois': rois, 'values': values}
+        self.sock.sendall(encode_json(SUBSCRIBE, options))
+
+    def receive(self):
+        kind, index, timestamp, payload = receive_message(self.sock)
+        if kind == METADATA:
+            self.metadata = json.loads(payload.decode('utf-8'))
+            data = self.metadata
+        elif kind == FRAME:
+            data = decode_frame(payload)
+        elif kind == VALUES:
+            data = dict(zip(self.metadata.get('values', []), np.frombuffer(payload, dtype=np.float64).tolist()))
+        else:
+            raise ConnectionError(f"Unknown message type {kind}")
+        return Message(kind, index, timestamp, data)
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.receive()
+            except ConnectionError:
+                return
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
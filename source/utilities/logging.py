@@ -1,34 +1,147 @@
+import atexit
+import os
+import sys
+import threading
+import time
+from collections import deque, namedtuple
+
 from PySide6.QtCore import QObject, Signal
-import datetime
+
+LogRecord = namedtuple('LogRecord', 'timestamp level message color')
+
+COLORS = {
+    "info": ("", ""),
+    "warning": ("33", "orange"),
+    "error": ("31", "red"),
+}
+
 
 class Logging(QObject):
-    update = Signal(str, str)  # (message: str, color: str)
+    """
+    Asynchronous logger.
+
+    info()/warning()/error() only append a record to a deque, which is safe from any thread without a lock, so
+    logging from acquisition threads costs next to nothing. A flush thread drains the deque every
+    `flush_interval` seconds and writes the whole batch to the console, to a size-rotated log file and,
+    as one `records` signal, to the GUI. Records are formatted once, in the flush thread, and the GUI receives
+    the formatted lines with them.
 
-    def __init__(self, enable_print=True):
+    Args:
+        enable_print (bool): Write records to the console.
+        log_file (str): Path of the log file, no file logging if None.
+        max_bytes (int): Size at which the log file is rotated.
+        backup_count (int): Number of rotated files kept (log.1 ... log.N).
+        flush_interval (float): Batching period [s].
+    """
+    records = Signal(list)  # [(LogRecord, formatted line), ...], one emission per flush
+
+    def __init__(self, enable_print=True, log_file=None, max_bytes=5 * 1024 * 1024, backup_count=3,
+                 flush_interval=0.1):
         super().__init__()
         self.enable_print = enable_print
+        self.log_file = log_file
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
 
-    def _get_timestamp(self):
-        return datetime.datetime.now().strftime("[%Y-%m-%d %H:%M:%S]")
-
-    def _log(self, message, level, color_code=None, color_name=None):
-        timestamp = self._get_timestamp()
-        formatted = f"{timestamp} [{level.upper()}] {message}"
+        self._queue = deque()
+        self._file = None
+        self._second = None  # Cached "[%Y-%m-%d %H:%M:%S" prefix of the current second
+        self._prefix = ""
+        self._flush_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="LoggingFlush", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
 
-        if self.enable_print:
-            if color_code:
-                print(f"\033[{color_code}m{formatted}\033[0m")
-            else:
-                print(formatted)
+    ################################################ RECORDING #########################################################
 
-        # Emit Qt signal with message and color
-        self.update.emit(formatted, color_name or "")
+    def _log(self, message, level):
+        self._queue.append(LogRecord(time.time(), level, str(message), COLORS[level][1]))
 
     def info(self, message):
         self._log(message, "info")
 
+    def warning(self, message):
+        self._log(message, "warning")
+
     def error(self, message):
-        self._log(message, "error", color_code="31", color_name="red")
+        self._log(message, "error")
+
+    ################################################ FLUSHING ##########################################################
+
+    def format_timestamp(self, timestamp):
+        # Keeps the prefix of the current second, only called from flush() under the flush lock
+        second = int(timestamp)
+        if second != self._second:
+            self._second = second
+            self._prefix = time.strftime("[%Y-%m-%d %H:%M:%S", time.localtime(second))
+        return f"{self._prefix}.{int((timestamp - second) * 1000):03d}]"
+
+    def format(self, record):
+        return f"{self.format_timestamp(record.timestamp)} [{record.level.upper()}] {record.message}"
+
+    def _run(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Writes all queued records now."""
+        with self._flush_lock:
+            batch = []
+            while self._queue:
+                batch.append(self._queue.popleft())
+            if not batch:
+                return
+
+            lines = [self.format(record) for record in batch]
+
+            if self.enable_print:
+                console = []
+                for record, line in zip(batch, lines):
+                    code = COLORS[record.level][0]
+                    console.append(f"\033[{code}m{line}\033[0m" if code else line)
+                sys.stdout.write("\n".join(console) + "\n")
+                sys.stdout.flush()
+
+            if self.log_file is not None:
+                self._write_file(lines)
+
+            self.records.emit(list(zip(batch, lines)))
+
+    def _write_file(self, lines):
+        if self._file is None:
+            self._file = open(self.log_file, 'a', encoding='utf-8')
+        self._file.write("\n".join(lines) + "\n")
+        self._file.flush()
+        if self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        for i in range(self.backup_count - 1, 0, -1):
+            source = f"{self.log_file}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.log_file}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.log_file, f"{self.log_file}.1")
+        else:
+            os.remove(self.log_file)
+
+    def close(self):
+        """Stops the flush thread after writing the remaining records."""
+        if self._stop_event.is_set():
+            return
+        self._stop_event.set()
+        self._thread.join()
+        try:
+            self.flush()
+        except RuntimeError:
+            pass  # Qt objects already deleted at interpreter exit
+        if self._file is not None:
+            self._file.close()
+            self._file = None
 
 # Create a globally shared logger instance
-logger = Logging()
\ No newline at end of file
+logger = Logging()
@@ -0,0 +1,343 @@
+"""
+Project files: one container holding the session metadata and the bulk data of an experiment.
+
+    [64 byte header][array chunks, 64 byte aligned ...][JSON index]
+
+The header holds the magic, the format version and the offset and length of the JSON index. The index holds the
+metadata (device settings snapshot, ROIs, ...) and, per named array, its dtype, shape and the file offsets of its
+chunks. Opening a project reads only the header and the index, however large the file; arrays are memory-mapped
+chunk by chunk when indexed, so a frame of a multi-GB recording costs one page-in.
+
+Arrays are appended chunk by chunk while recording (ProjectFile.create_array), several at a time. flush() writes a
+new index at the end of the file and then points the header at it, so after a crash the file is still valid up to
+the last flush. Replaced arrays and old indexes stay in the file as unused bytes.
+"""
+import bisect
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+MAGIC = b'SPRPROJ\x00'
+VERSION = 1
+HEADER = struct.Struct('<8sIIQQ')  # magic, version, reserved, index offset, index length
+HEADER_BYTES = 64
+ALIGNMENT = 64
+PROJECT_EXTENSION = '.sprproj'
+
+# Camera settings applied when a project is restored, the rest of the snapshot is informational
+RESTORED_SETTINGS = ('width', 'height', 'bitdepth', 'packed', 'exposure', 'gain')
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, tuple):
+        return list(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def camera_settings(snapshot):
+    """Settings of a Camera.get_all_settings() snapshot in the form Camera.set_all_settings() applies."""
+    settings = {key: snapshot[key] for key in RESTORED_SETTINGS if key in snapshot}
+    if 'woi' in snapshot:
+        settings['woi'] = tuple(snapshot['woi']['value'])
+    return settings
+
+
+def project_rois(path):
+    """ROIs ({id: {x, y, width, height}}) saved in a project file, e.g. by the camera noise project; {} if none."""
+    with ProjectFile(path) as project:
+        rois = project.metadata.get('rois', {})
+    return {str(roi_id): {key: int(region[key]) for key in ("x", "y", "width", "height")}
+            for roi_id, region in rois.items()}
+
+
+class LazyArray:
+    """
+    Read-only view of a project array. Nothing is read until it is indexed; indexing memory-maps the chunks the
+    rows lie in. The first index selects rows (int, slice or integer array), the remaining ones are applied to the
+    rows selected. np.asarray() reads the whole array.
+    """
+
+    def __init__(self, path, entry):
+        self.path = path
+        self.dtype = np.dtype(entry['dtype'])
+        self.shape = tuple(entry['shape'])
+        self.attrs = entry.get('attrs', {})
+        self._offsets = [offset for offset, _ in entry['chunks']]
+        self._rows = [rows for _, rows in entry['chunks']]
+        self._starts = list(np.cumsum([0] + self._rows[:-1])) if self._rows else []
+        self._maps = {}
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def nbytes(self):
+        return int(np.prod(self.shape)) * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0] if self.shape else 1
+
+    def chunk(self, index):
+        """The memory-mapped rows of chunk `index`."""
+        if index not in self._maps:
+            shape = (self._rows[index],) + self.shape[1:] if self.shape else ()
+            self._maps[index] = np.memmap(self.path, dtype=self.dtype, mode='r', offset=self._offsets[index],
+                                          shape=shape)
+        return self._maps[index]
+
+    def chunk_bounds(self):
+        """[(first row, end row)] of every chunk, in order, without mapping any."""
+        return [(int(start), int(start) + rows) for start, rows in zip(self._starts, self._rows)]
+
+    def chunks(self):
+        """Yields (first row, memory-mapped rows) of every chunk, in order."""
+        for index, start in enumerate(self._starts):
+            yield int(start), self.chunk(index)
+
+    def _rows_of(self, indices):
+        """Rows at the (sorted or not) integer `indices`, gathered chunk by chunk."""
+        out = np.empty((len(indices),) + self.shape[1:], dtype=self.dtype)
+        chunk_of = np.searchsorted(self._starts, indices, side='right') - 1
+        for index in np.unique(chunk_of):
+            selected = chunk_of == index
+            out[selected] = self.chunk(index)[indices[selected] - self._starts[index]]
+        return out
+
+    def __getitem__(self, key):
+        if not self._rows:
+            return np.empty(self.shape, self.dtype)[key]
+        if not self.shape or len(self._rows) == 1:
+            return self.chunk(0)[key]
+        rows, rest = (key[0], key[1:]) if isinstance(key, tuple) and key else (key, ())
+        if rows is Ellipsis:
+            return self[:][key]
+
+        if isinstance(rows, (int, np.integer)):
+            row = int(rows) + (len(self) if rows < 0 else 0)
+            if not 0 <= row < len(self):
+                raise IndexError(f"Row {rows} out of range for {len(self)} rows")
+            index = bisect.bisect_right(self._starts, row) - 1
+            return self.chunk(index)[row - self._starts[index]][rest]
+        if isinstance(rows, slice):
+            start, stop, step = rows.indices(len(self))
+            index = bisect.bisect_right(self._starts, start) - 1
+            if step == 1 and start < stop and stop <= self._starts[index] + self._rows[index]:
+                # Within one chunk: a view of the memory map, nothing read yet
+                selected = self.chunk(index)[start - self._starts[index]:stop - self._starts[index]]
+            else:
+                selected = self._rows_of(np.arange(start, stop, step))
+        else:
+            indices = np.asarray(rows)
+            if indices.dtype == bool:
+                indices = np.nonzero(indices)[0]
+            selected = self._rows_of(np.where(indices < 0, indices + len(self), indices))
+        return selected[(slice(None),) + tuple(rest)] if rest else selected
+
+    def __array__(self, dtype=None, copy=None):
+        array = self[:] if self.shape else self.chunk(0)
+        return np.array(array, dtype=dtype)
+
+    def __repr__(self):
+        return f"LazyArray({self.shape}, {self.dtype}, {len(self._rows)} chunks)"
+
+
+class ArrayWriter:
+    """
+    Appends rows to a project array, written out in chunks of about `chunk_bytes`. Rows are buffered until a chunk
+    is full; flush() (or ProjectFile.flush()) writes a partial chunk.
+    """
+
+    def __init__(self, project, name, row_shape, dtype, chunk_bytes):
+        self.project = project
+        self.name = name
+        self.row_shape = tuple(int(v) for v in row_shape)
+        self.dtype = np.dtype(dtype)
+        row_bytes = max(1, int(np.prod(self.row_shape)) * self.dtype.itemsize)
+        self._buffer = np.empty((max(1, chunk_bytes // row_bytes),) + self.row_shape, dtype=self.dtype)
+        self._filled = 0
+
+    @property
+    def rows(self):
+        return self.project.arrays[self.name]['shape'][0] + self._filled
+
+    def append(self, rows):
+        """Appends one row (of `row_shape`) or a stack of rows."""
+        rows = np.asarray(rows)
+        if rows.shape == self.row_shape:
+            rows = rows[None]
+        if rows.shape[1:] != self.row_shape:
+            raise ValueError(f"Rows {rows.shape[1:]} do not match the array rows {self.row_shape}")
+        while len(rows):
+            if self._filled == 0 and len(rows) >= len(self._buffer):
+                # Whole chunks are written straight from the rows, without going through the buffer
+                count = len(rows) // len(self._buffer) * len(self._buffer)
+                self.project._append_chunk(self.name, np.asarray(rows[:count], dtype=self.dtype))
+                rows = rows[count:]
+                continue
+            count = min(len(rows), len(self._buffer) - self._filled)
+            np.copyto(self._buffer[self._filled:self._filled + count], rows[:count], casting='same_kind')
+            self._filled += count
+            rows = rows[count:]
+            if self._filled == len(self._buffer):
+                self.flush()
+
+    def flush(self):
+        if self._filled:
+            self.project._append_chunk(self.name, self._buffer[:self._filled])
+            self._filled = 0
+
+
+class ProjectFile:
+    """
+    A project file opened for reading ('r'), created ('w', replacing an existing file) or extended ('a').
+
+    `metadata` is a JSON-serialisable dict saved with the index; numpy scalars, arrays and tuples are converted.
+    Arrays are read with project[name], a LazyArray, and written with write_array() or create_array(). Names may
+    contain '/' to group arrays ('noise/0/mean'), see names().
+
+    Parameters
+    ----------
+    path : str
+        Project file path.
+    mode : str
+        'r', 'w' or 'a'.
+    chunk_bytes : int
+        Approximate chunk size of arrays written with create_array().
+    """
+
+    def __init__(self, path, mode='r', chunk_bytes=16 * 1024 * 1024):
+        if mode not in ('r', 'w', 'a'):
+            raise ValueError(f"Unknown project file mode {mode}")
+        self.path = path
+        self.mode = mode
+        self.chunk_bytes = int(chunk_bytes)
+        self.metadata = {}
+        self.arrays = {}  # {name: {'dtype', 'shape', 'chunks': [[offset, rows], ...], 'attrs'}}
+        self._writers = {}
+        self._lazy = {}
+
+        if mode == 'w' or (mode == 'a' and not os.path.exists(path)):
+            self.file = open(path, 'w+b')
+            self.file.write(bytes(HEADER_BYTES))
+            self.metadata = {'created': time.strftime('%Y-%m-%d %H:%M:%S')}
+            self._write_index()
+        else:
+            self.file = open(path, 'rb' if mode == 'r' else 'r+b')
+            self._read_index()
+
+    def _read_index(self):
+        self.file.seek(0)
+        magic, version, _, offset, length = HEADER.unpack(self.file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a project file")
+        if version > VERSION:
+            raise ValueError(f"{self.path} has project format version {version}, newer than {VERSION}")
+        self.file.seek(offset)
+        index = json.loads(self.file.read(length).decode('utf-8'))
+        self.metadata = index['metadata']
+        self.arrays = index['arrays']
+
+    def _write_index(self):
+        index = json.dumps({'metadata': self.metadata, 'arrays': self.arrays}, default=_json_default)
+        data = index.encode('utf-8')
+        offset = self._end()
+        self.file.seek(offset)
+        self.file.write(data)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        # The header is switched to the new index only once the index and the chunks before it are on disk
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, 0, offset, len(data)))
+        self.file.flush()
+
+    def _end(self):
+        self.file.seek(0, os.SEEK_END)
+        end = self.file.tell()
+        return -(-end // ALIGNMENT) * ALIGNMENT
+
+    def _check_writable(self):
+        if self.mode == 'r':
+            raise RuntimeError(f"{self.path} is opened read-only")
+
+    def _append_chunk(self, name, rows):
+        """Writes `rows` (a 1-row stack for a 0-d array) at the end of the file as a new chunk of `name`."""
+        offset = self._end()
+        self.file.seek(offset)
+        self.file.write(np.ascontiguousarray(rows).tobytes())
+        entry = self.arrays[name]
+        entry['chunks'].append([offset, len(rows)])
+        if entry['shape']:
+            entry['shape'][0] += len(rows)
+        self._lazy.pop(name, None)
+
+    def __contains__(self, name):
+        return name in self.arrays
+
+    def __getitem__(self, name):
+        if name not in self.arrays:
+            raise KeyError(f"No array {name} in {self.path}")
+        if name not in self._lazy:
+            self.file.flush()
+            self._lazy[name] = LazyArray(self.path, self.arrays[name])
+        return self._lazy[name]
+
+    def names(self, prefix=''):
+        """Array names starting with `prefix` (e.g. 'noise/')."""
+        return [name for name in self.arrays if name.startswith(prefix)]
+
+    def write_array(self, name, array, attrs=None):
+        """Stores a whole array (replacing one of the same name) in one chunk."""
+        self._check_writable()
+        array = np.asarray(array)
+        self._writers.pop(name, None)
+        self.arrays[name] = {'dtype': array.dtype.str, 'shape': [0] + list(array.shape[1:]) if array.ndim else [],
+                             'chunks': [], 'attrs': attrs or {}}
+        if array.size:
+            self._append_chunk(name, array if array.ndim else array[None])
+        self.arrays[name]['shape'] = list(array.shape)
+
+    def create_array(self, name, row_shape, dtype, attrs=None):
+        """New empty array (replacing one of the same name) of rows of `row_shape`, returns its ArrayWriter."""
+        self._check_writable()
+        self.arrays[name] = {'dtype': np.dtype(dtype).str, 'shape': [0] + list(row_shape), 'chunks': [],
+                             'attrs': attrs or {}}
+        self._lazy.pop(name, None)
+        self._writers[name] = ArrayWriter(self, name, row_shape, dtype, self.chunk_bytes)
+        return self._writers[name]
+
+    def append_to(self, name):
+        """ArrayWriter appending to an existing array, e.g. to continue an interrupted recording."""
+        self._check_writable()
+        if name not in self._writers:
+            entry = self.arrays[name]
+            self._writers[name] = ArrayWriter(self, name, entry['shape'][1:], entry['dtype'], self.chunk_bytes)
+        return self._writers[name]
+
+    def flush(self):
+        """Writes the buffered rows and a new index; the file is consistent up to here after a crash."""
+        self._check_writable()
+        for writer in self._writers.values():
+            writer.flush()
+        self._write_index()
+
+    def close(self):
+        if self.file.closed:
+            return
+        if self.mode != 'r':
+            self.flush()
+        self._lazy.clear()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,228 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Histogram resolution: values below 2 * SUB_BUCKETS ns are exact, above that every power of two is split into
+# SUB_BUCKETS buckets (~3 % relative precision), up to MAX_SHIFT powers of two (~hours)
+SUB_BUCKETS = 32
+EXACT = 2 * SUB_BUCKETS
+MAX_SHIFT = 40
+
+
+class LatencyHistogram:
+    """
+    HDR-style latency histogram: log-linear buckets over nanoseconds, constant time record, bounded memory.
+
+    Percentiles are accurate to the bucket width (about 3 % of the value).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * (EXACT + MAX_SHIFT * SUB_BUCKETS)
+            self.count = 0
+            self.total = 0
+            self.min = None
+            self.max = 0
+
+    @staticmethod
+    def _index(value):
+        if value < EXACT:
+            return value
+        shift = value.bit_length() - EXACT.bit_length() + 1
+        return min(EXACT + (shift - 1) * SUB_BUCKETS + (value >> shift) - SUB_BUCKETS,
+                   EXACT + MAX_SHIFT * SUB_BUCKETS - 1)
+
+    @staticmethod
+    def _value(index):
+        """Middle of the range [ns] of a bucket."""
+        if index < EXACT:
+            return index
+        shift = (index - EXACT) // SUB_BUCKETS + 1
+        mantissa = (index - EXACT) % SUB_BUCKETS + SUB_BUCKETS
+        return (mantissa << shift) + (1 << (shift - 1))
+
+    def record(self, seconds):
+        value = max(0, int(seconds * 1e9))
+        index = self._index(value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, percent):
+        """Value [s] below which `percent` % of the records are."""
+        with self._lock:
+            if self.count == 0:
+                return None
+            target = max(1, int(round(self.count * percent / 100.0)))
+            cumulative = 0
+            for index, count in enumerate(self.counts):
+                cumulative += count
+                if cumulative >= target:
+                    return min(self._value(index), self.max) * 1e-9
+        return self.max * 1e-9
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count * 1e-9 if self.count else None,
+            'min': self.min * 1e-9 if self.min is not None else None,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'p999': self.percentile(99.9),
+            'max': self.max * 1e-9 if self.count else None,
+        }
+
+
+class QueueStats:
+    """Depth and drop counters of a queue between two stages."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.depth = 0
+            self.max_depth = 0
+            self.enqueued = 0
+            self.dropped = 0
+
+    def put(self):
+        with self._lock:
+            self.enqueued += 1
+            self.depth += 1
+            self.max_depth = max(self.max_depth, self.depth)
+
+    def get(self):
+        with self._lock:
+            self.depth = max(0, self.depth - 1)
+
+    def drop(self):
+        with self._lock:
+            self.dropped += 1
+            self.depth = max(0, self.depth - 1)
+
+    def summary(self):
+        return {'depth': self.depth, 'max_depth': self.max_depth, 'enqueued': self.enqueued, 'dropped': self.dropped}
+
+
+class Telemetry:
+    """
+    Registry of per-stage latency histograms and per-queue counters.
+
+    Stages are recorded with record(stage, seconds) or the measure(stage) context manager. Frames handed over
+    a queue (e.g. a queued Qt signal) are tracked with frame_sent()/frame_received(), which record the time
+    the frame spent in the queue as stage 'queue.<name>' and keep the queue depth. Frames never received are
+    counted as dropped once more than `max_in_flight` are pending.
+
+    All timestamps are time.perf_counter() values.
+    """
+
+    def __init__(self, enabled=True, max_in_flight=64):
+        self.enabled = enabled
+        self.max_in_flight = max_in_flight
+        self._stages = {}
+        self._queues = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._rate_reference = {}  # stage: (time, count) of the previous snapshot
+
+    def stage(self, name):
+        histogram = self._stages.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._stages.setdefault(name, LatencyHistogram())
+        return histogram
+
+    def queue(self, name):
+        stats = self._queues.get(name)
+        if stats is None:
+            with self._lock:
+                stats = self._queues.setdefault(name, QueueStats())
+                self._in_flight.setdefault(name, OrderedDict())
+        return stats
+
+    def record(self, stage, seconds):
+        if self.enabled:
+            self.stage(stage).record(seconds)
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def frame_sent(self, queue_name, frame):
+        """Marks `frame` as enqueued into `queue_name`."""
+        if not self.enabled:
+            return
+        stats = self.queue(queue_name)
+        pending = self._in_flight[queue_name]
+        with self._lock:
+            pending[id(frame)] = time.perf_counter()
+            overflow = len(pending) > self.max_in_flight
+            if overflow:
+                pending.popitem(last=False)
+        stats.put()
+        if overflow:
+            stats.drop()
+
+    def frame_received(self, queue_name, frame):
+        """Marks `frame` as dequeued from `queue_name`, returns the time it spent in the queue [s] or None."""
+        if not self.enabled or queue_name not in self._queues:
+            return None
+        with self._lock:
+            sent = self._in_flight[queue_name].pop(id(frame), None)
+        if sent is None:
+            return None  # Already received by another slot, or evicted
+        self._queues[queue_name].get()
+        latency = time.perf_counter() - sent
+        self.stage(f"queue.{queue_name}").record(latency)
+        return latency
+
+    def snapshot(self):
+        """
+        Current statistics.
+
+        Returns:
+            dict: {'stages': {name: {count, rate, mean, min, p50, p99, p999, max}},
+                   'queues': {name: {depth, max_depth, enqueued, dropped}}}, latencies in seconds, rate in 1/s
+                   since the previous snapshot.
+        """
+        now = time.perf_counter()
+        stages = {}
+        for name, histogram in list(self._stages.items()):
+            summary = histogram.summary()
+            previous_time, previous_count = self._rate_reference.get(name, (None, 0))
+            summary['rate'] = (summary['count'] - previous_count) / (now - previous_time) \
+                if previous_time is not None and now > previous_time else None
+            self._rate_reference[name] = (now, summary['count'])
+            stages[name] = summary
+        queues = {name: stats.summary() for name, stats in list(self._queues.items())}
+        return {'stages': stages, 'queues': queues}
+
+    def reset(self):
+        for histogram in self._stages.values():
+            histogram.reset()
+        for stats in self._queues.values():
+            stats.reset()
+        with self._lock:
+            for pending in self._in_flight.values():
+                pending.clear()
+        self._rate_reference.clear()
+
+
+# Create a globally shared telemetry instance
+telemetry = Telemetry()
@@ -1,6 +1,6 @@
 from PySide6.QtCore import Qt, Signal
 from PySide6.QtWidgets import QWidget, QVBoxLayout, QLabel, QSpinBox, QPushButton, QFormLayout, QHBoxLayout, \
-    QDoubleSpinBox
+    QDoubleSpinBox, QCheckBox, QLineEdit
 
 from source.view.widgets.image_display import ImageDisplay
 
@@ -9,6 +9,8 @@ class ViewCameraSettings(QWidget):
     """
     GUI for displaying and modifying camera settings.
     """
+    closed = Signal()
+
     def __init__(self, serial: str, settings: dict):
         """
                 Constructs the CameraSettingsGUI with the specified Camera ID.
@@ -44,6 +46,13 @@ class ViewCameraSettings(QWidget):
     def update_fps(self, fps):
         self.settings_widget.update_fps(fps)
 
+    def update_prediction(self, fps, limiting_factor):
+        self.settings_widget.update_prediction(fps, limiting_factor)
+
+    def closeEvent(self, event):
+        self.closed.emit()  # The controller stops the camera thread and the frame stream
+        super().closeEvent(event)
+
 
 class SettingsWidget(QWidget):
     """
@@ -57,6 +66,9 @@ class SettingsWidget(QWidget):
     DEFAULT_FRAME_RATE = 30
 
     settings_applied = Signal(dict)
+    settings_edited = Signal(dict)  # Spinbox values as they are edited, before applying
+    start_stream = Signal(str)  # Address of the frame server
+    stop_stream = Signal()
 
     def __init__(self, serial: str, settings: dict):
         """
@@ -102,16 +114,38 @@ class SettingsWidget(QWidget):
         self.gain_label, self.gain_spinbox, self.gain_range_label = self.create_spinbox('Gain:', self.DEFAULT_GAIN, form_layout, type='double')
         self.frame_rate_label, self.frame_rate_spinbox, self.frame_rate_range_label = self.create_spinbox('Frame Rate (fps):', self.DEFAULT_FRAME_RATE, form_layout, type='double')
 
+        # Packed pixel formats (Mono12p), 25 % less link traffic than Mono12
+        self.packed_checkbox = QCheckBox('Packed pixels')
+        form_layout.addRow(self.packed_checkbox)
+
         # Make the spinbox read-onlyy, make it non-editable (won't allow the user to change the value)
         self.frame_rate_spinbox.setEnabled(False)  # Disable the user interaction
         self.frame_rate_spinbox.setButtonSymbols(QSpinBox.ButtonSymbols.NoButtons)  # Hide the increment/decrement buttons
 
+        # Frame rate the edited settings would reach, and what limits it
+        self.prediction_label = QLabel('Predicted: -')
+        for spinbox in (self.width_spinbox, self.height_spinbox, self.bitdepth_spinbox, self.exposure_spinbox):
+            spinbox.valueChanged.connect(self.emit_settings_edited)
+        self.packed_checkbox.toggled.connect(self.emit_settings_edited)
+
 
         self.apply_button = QPushButton('Apply Settings')
         self.apply_button.clicked.connect(self.apply_camera_settings)
 
+        # Frames streamed to local analysis clients (source.utilities.frame_server)
+        self.stream_address_edit = QLineEdit('127.0.0.1:5555')
+        self.stream_button = QPushButton('Start streaming')
+        self.stream_button.setCheckable(True)
+        self.stream_button.toggled.connect(self.handle_stream_toggled)
+        stream_layout = QHBoxLayout()
+        stream_layout.addWidget(QLabel('Stream:'))
+        stream_layout.addWidget(self.stream_address_edit)
+        stream_layout.addWidget(self.stream_button)
+
         layout.addLayout(form_layout)
+        layout.addWidget(self.prediction_label)
         layout.addWidget(self.apply_button)
+        layout.addLayout(stream_layout)
         layout.addStretch()
 
         self.setLayout(layout)
@@ -256,6 +290,7 @@ class SettingsWidget(QWidget):
         self.bitdepth_spinbox.setRange(self.camera_settings['bitdepth'], self.camera_settings['bitdepth'])
         self.bitdepth_spinbox.setValue(self.camera_settings['bitdepth'])
         self.bitdepth_range_label.setText(f'({self.camera_settings['bitdepth']})')
+        self.packed_checkbox.setChecked(self.camera_settings.get('packed', False))
 
         self.exposure_spinbox.setRange(self.camera_settings['exposure']['min'], self.camera_settings['exposure']['max'])
         self.exposure_spinbox.setValue(self.camera_settings['exposure']['value'])
@@ -275,6 +310,7 @@ class SettingsWidget(QWidget):
         self.camera_settings['width']['value'] = self.width_spinbox.value()
         self.camera_settings['height']['value'] = self.height_spinbox.value()
         self.camera_settings['bitdepth'] = self.bitdepth_spinbox.value()
+        self.camera_settings['packed'] = self.packed_checkbox.isChecked()
         self.camera_settings['exposure']['value'] = self.exposure_spinbox.value()
         self.camera_settings['gain']['value'] = self.gain_spinbox.value()
         #self.camera_settings['frame_rate']['value'] = self.frame_rate_spinbox.value()
@@ -282,4 +318,32 @@ class SettingsWidget(QWidget):
         return self.camera_settings
 
     def update_fps(self, fps):
-        self.frame_rate_spinbox.setValue(fps)
\ No newline at end of file
+        self.frame_rate_spinbox.setValue(fps)
+
+    def emit_settings_edited(self):
+        self.settings_edited.emit({
+            'width': self.width_spinbox.value(),
+            'height': self.height_spinbox.value(),
+            'bitdepth': self.bitdepth_spinbox.value(),
+            'packed': self.packed_checkbox.isChecked(),
+            'exposure': self.exposure_spinbox.value(),
+        })
+
+    def update_prediction(self, fps, limiting_factor):
+        self.prediction_label.setText(f'Predicted: {fps:.1f} fps ({limiting_factor} limited)')
+
+    def handle_stream_toggled(self, checked):
+        self.stream_address_edit.setEnabled(not checked)
+        self.stream_button.setText('Stop streaming' if checked else 'Start streaming')
+        if checked:
+            self.start_stream.emit(self.stream_address_edit.text().strip())
+        else:
+            self.stop_stream.emit()
+
+    def stream_stopped(self):
+        """Resets the stream button, e.g. when the server could not start."""
+        self.stream_button.blockSignals(True)
+        self.stream_button.setChecked(False)
+        self.stream_button.blockSignals(False)
+        self.stream_address_edit.setEnabled(True)
+        self.stream_button.setText('Start streaming')
@@ -0,0 +1,197 @@
+from PySide6.QtCore import Signal
+from PySide6.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QLabel, QPushButton, QSpinBox, QDoubleSpinBox, \
+    QFormLayout, QProgressBar, QFileDialog, QSpacerItem, QSizePolicy, QComboBox
+
+from source.utilities.project_file import PROJECT_EXTENSION
+
+from source.view.widgets.plotting_widgets import PlotWidget
+
+
+class AngularScanView(QWidget):
+    start_scan = Signal(dict)
+    stop_scan = Signal()
+    start_tracking = Signal(dict)
+    stop_tracking = Signal()
+    load_rois = Signal(str)  # Project file whose ROIs are tracked
+    closed = Signal()
+
+    def __init__(self):
+        super().__init__()
+        self.output_path = None
+        self.setup_content()
+
+        self.setWindowTitle("Angular scan")
+
+    def setup_content(self):
+        # Main horizontal layout (plot on the left, scan settings on the right)
+        main_layout = QHBoxLayout()
+
+        self.plot_widget = PlotWidget(x_label="Angle [deg]", y_label="Mean intensity")
+        main_layout.addWidget(self.plot_widget)
+
+        # Scan settings
+        self.spinbox_start = QDoubleSpinBox()
+        self.spinbox_stop = QDoubleSpinBox()
+        self.spinbox_step = QDoubleSpinBox()
+        for spinbox in (self.spinbox_start, self.spinbox_stop):
+            spinbox.setRange(-360, 360)
+        for spinbox in (self.spinbox_start, self.spinbox_stop, self.spinbox_step):
+            spinbox.setDecimals(3)
+            spinbox.setSuffix(" deg")
+        self.spinbox_step.setRange(0.001, 90)
+        self.spinbox_step.setValue(0.1)
+
+        self.combobox_mode = QComboBox()
+        self.combobox_mode.addItem("Step", 'step')
+        self.combobox_mode.addItem("Continuous sweep", 'continuous')
+
+        self.spinbox_frames = QSpinBox()
+        self.spinbox_frames.setRange(1, 1000)
+        self.spinbox_frames.setValue(4)
+
+        self.spinbox_discard = QSpinBox()
+        self.spinbox_discard.setRange(0, 100)
+        self.spinbox_discard.setValue(1)
+
+        form_layout = QFormLayout()
+        form_layout.addRow("Start angle", self.spinbox_start)
+        form_layout.addRow("Stop angle", self.spinbox_stop)
+        form_layout.addRow("Step", self.spinbox_step)
+        form_layout.addRow("Mode", self.combobox_mode)
+        form_layout.addRow("Frames per step", self.spinbox_frames)
+        form_layout.addRow("Discarded frames", self.spinbox_discard)
+
+        self.button_output = QPushButton("Output file...")
+        self.button_output.clicked.connect(self.select_output_path)
+        self.label_output = QLabel("Temporary file")
+
+        self.button_start = QPushButton("Start scan")
+        self.button_start.clicked.connect(self.handle_start_scan)
+        self.button_stop = QPushButton("Stop scan")
+        self.button_stop.setEnabled(False)
+        self.button_stop.clicked.connect(self.stop_scan.emit)
+
+        self.progress_bar = QProgressBar()
+
+        # Resonance tracking: the stage follows the working point of the live frames
+        self.spinbox_dither = QDoubleSpinBox()
+        self.spinbox_dither.setDecimals(3)
+        self.spinbox_dither.setRange(0.001, 5)
+        self.spinbox_dither.setValue(0.05)
+        self.spinbox_dither.setSuffix(" deg")
+        self.spinbox_gain = QDoubleSpinBox()
+        self.spinbox_gain.setDecimals(2)
+        self.spinbox_gain.setRange(0.01, 1)
+        self.spinbox_gain.setValue(0.5)
+        tracking_layout = QFormLayout()
+        tracking_layout.addRow("Tracking dither", self.spinbox_dither)
+        tracking_layout.addRow("Tracking gain", self.spinbox_gain)
+
+        self.button_rois = QPushButton("ROIs from project...")
+        self.button_rois.clicked.connect(self.handle_load_rois)
+        self.label_rois = QLabel("Tracking the whole frame")
+
+        self.button_start_tracking = QPushButton("Start tracking")
+        self.button_start_tracking.clicked.connect(self.handle_start_tracking)
+        self.button_stop_tracking = QPushButton("Stop tracking")
+        self.button_stop_tracking.setEnabled(False)
+        self.button_stop_tracking.clicked.connect(self.stop_tracking.emit)
+        self.label_tracking = QLabel()
+
+        settings_layout = QVBoxLayout()
+        settings_layout.addLayout(form_layout)
+        settings_layout.addWidget(self.button_output)
+        settings_layout.addWidget(self.label_output)
+        settings_layout.addItem(QSpacerItem(20, 40, QSizePolicy.Minimum, QSizePolicy.Expanding))
+        settings_layout.addWidget(self.progress_bar)
+        settings_layout.addWidget(self.button_start)
+        settings_layout.addWidget(self.button_stop)
+        settings_layout.addLayout(tracking_layout)
+        settings_layout.addWidget(self.button_rois)
+        settings_layout.addWidget(self.label_rois)
+        settings_layout.addWidget(self.button_start_tracking)
+        settings_layout.addWidget(self.button_stop_tracking)
+        settings_layout.addWidget(self.label_tracking)
+
+        main_layout.addLayout(settings_layout)
+        self.setLayout(main_layout)
+
+    def set_angle(self, angle):
+        """Starts the scan settings at the current stage angle."""
+        self.spinbox_start.setValue(angle)
+        self.spinbox_stop.setValue(angle)
+
+    def select_output_path(self):
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save Angular Cube", "", "NumPy Files (*.npy)")
+        if file_path:
+            self.output_path = file_path
+            self.label_output.setText(file_path)
+
+    def handle_start_scan(self):
+        self.start_scan.emit({
+            'start': self.spinbox_start.value(),
+            'stop': self.spinbox_stop.value(),
+            'step': self.spinbox_step.value(),
+            'mode': self.combobox_mode.currentData(),
+            'frames_per_step': self.spinbox_frames.value(),
+            'discard_frames': self.spinbox_discard.value(),
+            'output_path': self.output_path
+        })
+
+    def scan_started(self, n_steps):
+        """`n_steps` angles in step mode, 0 for a continuous sweep (busy progress bar)."""
+        self.progress_bar.setRange(0, n_steps)
+        self.progress_bar.setValue(0)
+        self.button_start.setEnabled(False)
+        self.button_stop.setEnabled(True)
+        self.button_start_tracking.setEnabled(False)
+        self.plot_widget.ax.clear()
+        self.plot_widget.data = {"x": None, "y": None}
+
+    def update_curve(self, step, angle, mean):
+        if self.progress_bar.maximum() > 0:
+            self.progress_bar.setValue(step + 1)
+        self.plot_widget.update_plot(angle, mean)
+
+    def scan_finished(self, path):
+        self.progress_bar.setRange(0, 1)
+        self.progress_bar.setValue(1 if path else 0)
+        self.button_start.setEnabled(True)
+        self.button_stop.setEnabled(False)
+        self.button_start_tracking.setEnabled(True)
+        if path:
+            self.label_output.setText(path)
+
+    def handle_load_rois(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "Open Project", "",
+                                                   f"SPR Projects (*{PROJECT_EXTENSION});;All Files (*)")
+        if file_path:
+            self.load_rois.emit(file_path)
+
+    def rois_loaded(self, count, path):
+        self.label_rois.setText(f"Tracking {count} ROIs of {path}")
+
+    def handle_start_tracking(self):
+        self.start_tracking.emit({
+            'dither': self.spinbox_dither.value(),
+            'gain': self.spinbox_gain.value(),
+        })
+
+    def tracking_started(self):
+        self.button_start_tracking.setEnabled(False)
+        self.button_stop_tracking.setEnabled(True)
+        self.button_start.setEnabled(False)
+        self.button_rois.setEnabled(False)
+
+    def tracking_stopped(self):
+        self.button_start_tracking.setEnabled(True)
+        self.button_stop_tracking.setEnabled(False)
+        self.button_start.setEnabled(True)
+        self.button_rois.setEnabled(True)
+
+    def update_tracking(self, angle, error):
+        self.label_tracking.setText(f"Working point {angle:.4f} deg, error {error:+.4f} deg")
+
+    def closeEvent(self, event):
+        self.closed.emit()  # The controller stops the scan and the tracking and deletes a temporary cube
+        super().closeEvent(event)
@@ -8,13 +8,77 @@ from PySide6.QtWidgets import (
 )
 from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qtagg import NavigationToolbar2QT as NavigationToolbar
+from matplotlib.collections import PathCollection
 from matplotlib.figure import Figure
 from PySide6.QtCore import Slot
 
 
+class SparseGrid:
+    """
+    z values on a rectilinear grid that grows as new x and y coordinates arrive, missing cells being NaN.
+
+    Coordinates are kept in sorted arrays and located by bisection; the z matrix only grows (one np.insert)
+    when a new coordinate appears, setting a value at existing coordinates is O(log n). Every point is also kept
+    in insertion order for the scattered representation; append() only keeps the point, for scattered data
+    where nearly every point brings new coordinates and the grid would grow by a row and a column each time.
+    """
+
+    def __init__(self):
+        self.x = np.empty(0)
+        self.y = np.empty(0)
+        self.z = np.empty((0, 0))
+        self.points = np.empty((64, 3))
+        self.count = 0
+
+    def append(self, x, y, z):
+        """Keeps the point for the scattered representation only, the grid is not updated."""
+        if self.count == len(self.points):
+            self.points = np.concatenate([self.points, np.empty_like(self.points)])
+        self.points[self.count] = (x, y, z)
+        self.count += 1
+
+    def add(self, x, y, z):
+        """Sets z at (x, y). Returns True if the grid shape changed."""
+        self.append(x, y, z)
+
+        reshaped = False
+        xi = np.searchsorted(self.x, x)
+        if xi == len(self.x) or self.x[xi] != x:
+            self.x = np.insert(self.x, xi, x)
+            self.z = np.insert(self.z, xi, np.nan, axis=1)
+            reshaped = True
+        yi = np.searchsorted(self.y, y)
+        if yi == len(self.y) or self.y[yi] != y:
+            self.y = np.insert(self.y, yi, y)
+            self.z = np.insert(self.z, yi, np.nan, axis=0)
+            reshaped = True
+        self.z[yi, xi] = z
+        return reshaped
+
+    def scattered(self):
+        """(x, y, z) arrays of all points in insertion order."""
+        points = self.points[:self.count]
+        return points[:, 0], points[:, 1], points[:, 2]
+
+    def clear(self):
+        self.__init__()
+
+
 class ColorMeshWidget(QWidget):
-    def __init__(self, parent=None, x_label="X-axis", y_label="Y-axis", log_scale=False):
+    """
+    Colour map of z over (x, y) built point by point.
+
+    In 'grid' mode the points are collected into a SparseGrid and shown with pcolormesh: a point at existing
+    coordinates only updates the mesh array in place, the mesh is rebuilt only when a new x or y value appears,
+    and the colour limits only widen when a value falls outside them. In 'scattered' mode (points not on a grid,
+    e.g. adaptively refined) the points are shown as a scatter plot while arriving and triangulated once, by
+    finish() or the Plot Data button.
+    """
+
+    def __init__(self, parent=None, x_label="X-axis", y_label="Y-axis", log_scale=False, mode='grid'):
         super().__init__(parent)
+        if mode not in ('grid', 'scattered'):
+            raise ValueError(f"Unknown colour mesh mode {mode}")
 
         self.figure = Figure()
         self.canvas = FigureCanvas(self.figure)
@@ -22,10 +86,13 @@ class ColorMeshWidget(QWidget):
 
         self.ax = self.figure.add_subplot(111)
         self.colorbar = None
+        self.artist = None  # QuadMesh, PathCollection or tripcolor collection
+        self.limits = None  # (min, max) of the colour scale
 
         self.x_label = x_label
         self.y_label = y_label
         self.log_scale = log_scale
+        self.mode = mode
 
         self.plot_button = QPushButton("Plot Data")
         self.save_data_button = QPushButton("Save Data")
@@ -40,75 +107,111 @@ class ColorMeshWidget(QWidget):
         self.plot_button.clicked.connect(self._trigger_plot)
         self.save_data_button.clicked.connect(self.save_data)
 
-        self.data = {
-            "x_vals": [],  # list of unique x values
-            "y_vals": [],  # list of unique y values
-            "z_grid": []   # 2D grid as list of lists
-        }
+        self.data = SparseGrid()
 
     def _trigger_plot(self):
-        if self.data["x_vals"] and self.data["y_vals"] and self.data["z_grid"]:
-            self._replot()
-
-    def _replot(self):
-        self.ax.clear()
-
-        x = self.data["x_vals"]
-        y = self.data["y_vals"]
-        z = np.array(self.data["z_grid"])
-
-        if self.log_scale:
-            self.ax.set_xscale("log")
-            self.ax.set_yscale("log")
+        if self.data.count:
+            if self.mode == 'scattered':
+                self.finish()
+            else:
+                self._replot()
+
+    def _set_artist(self, artist):
+        if self.artist is not None:
+            self.artist.remove()
+        self.artist = artist
+        if self.limits is not None:
+            artist.set_clim(*self.limits)
+        if self.colorbar is None:
+            self.colorbar = self.figure.colorbar(artist, ax=self.ax)
         else:
-            self.ax.set_xscale("linear")
-            self.ax.set_yscale("linear")
-
-        mesh = self.ax.pcolormesh(x, y, z, shading='auto', cmap='viridis')
-
-        if self.colorbar:
-            self.colorbar.remove()
-        self.colorbar = self.figure.colorbar(mesh, ax=self.ax)
-
+            self.colorbar.update_normal(artist)
+
+    def _update_limits(self, z):
+        """Widens the colour limits to include z. Returns True if they changed."""
+        if not np.isfinite(z):
+            return False
+        if self.limits is None:
+            self.limits = (z, z)
+        elif self.limits[0] <= z <= self.limits[1]:
+            return False
+        else:
+            self.limits = (min(self.limits[0], z), max(self.limits[1], z))
+        if self.artist is not None:
+            self.artist.set_clim(*self.limits)
+        return True
+
+    def _set_axes(self):
+        scale = "log" if self.log_scale else "linear"
+        self.ax.set_xscale(scale)
+        self.ax.set_yscale(scale)
         self.ax.set_xlabel(self.x_label)
         self.ax.set_ylabel(self.y_label)
-        self.figure.tight_layout()
-        self.canvas.draw()
 
+    def _replot(self):
+        """Rebuilds the artist from all data."""
+        if self.mode == 'scattered':
+            x, y, z = self.data.scattered()
+            self._set_artist(self.ax.scatter(x, y, c=z, s=12, cmap='viridis'))
+        else:
+            z = np.ma.masked_invalid(self.data.z)
+            self._set_artist(self.ax.pcolormesh(self.data.x, self.data.y, z, shading='auto', cmap='viridis'))
+        self._set_axes()
+        self.ax.relim()
+        self.ax.autoscale_view()
+        self.canvas.draw_idle()
 
     def update_plot(self, x, y, z_value):
         """
-        Add a single (x, y, z) value into the grid.
-        Dynamically updates meshgrid and Z matrix.
+        Add a single (x, y, z) value. The redraw is deferred to the next event loop pass, so bursts of points
+        cost one draw.
         """
-        x_vals = self.data["x_vals"]
-        y_vals = self.data["y_vals"]
-        z_grid = self.data["z_grid"]
-
-        # Insert x if new
-        if x not in x_vals:
-            x_vals.append(x)
-            x_vals.sort()
-            for row in z_grid:
-                row.insert(x_vals.index(x), np.nan)
-
-        # Insert y if new
-        if y not in y_vals:
-            y_vals.append(y)
-            y_vals.sort()
-            row_len = len(x_vals)
-            z_grid.insert(y_vals.index(y), [np.nan] * row_len)
-
-        # Update z value at proper index
-        xi = x_vals.index(x)
-        yi = y_vals.index(y)
-        z_grid[yi][xi] = z_value
-
-        self._replot()
+        if self.mode == 'scattered':
+            # Only the point list grows, the scatter artist is updated in place
+            self.data.append(x, y, z_value)
+            self._update_limits(z_value)
+            if not isinstance(self.artist, PathCollection):  # None, or the triangulation of finish()
+                self._replot()
+                return
+            points = self.data.points[:self.data.count]
+            self.artist.set_offsets(points[:, :2])
+            self.artist.set_array(points[:, 2])
+            self.ax.update_datalim([(x, y)])
+            self.ax.autoscale_view()
+            self.canvas.draw_idle()
+            return
+
+        reshaped = self.data.add(x, y, z_value)
+        self._update_limits(z_value)
+        if self.artist is None or reshaped:
+            self._replot()
+            return
+        self.artist.set_array(np.ma.masked_invalid(self.data.z))
+        self.canvas.draw_idle()
+
+    def finish(self):
+        """Triangulates the scattered points into a filled colour map (needs three non-collinear points)."""
+        x, y, z = self.data.scattered()
+        if len(x) < 3:
+            return
+        try:
+            artist = self.ax.tripcolor(x, y, z, shading='gouraud', cmap='viridis')
+        except (ValueError, RuntimeError):
+            return  # Collinear points cannot be triangulated
+        self._set_artist(artist)
+        self._set_axes()
+        self.canvas.draw_idle()
+
+    def clear(self):
+        self.data.clear()
+        self.ax.clear()
+        self.artist = None
+        self.limits = None
+        self.canvas.draw_idle()
 
     @Slot()
     def save_data(self):
-        if not self.data["z_grid"]:
+        if not self.data.count:
             return
 
         options = QFileDialog.Options()
@@ -118,20 +221,25 @@ class ColorMeshWidget(QWidget):
         if file_path:
             with open(file_path, 'w', newline='') as file:
                 writer = csv.writer(file)
-                writer.writerow([""] + self.data["x_vals"])
-                for y, row in zip(self.data["y_vals"], self.data["z_grid"]):
-                    writer.writerow([y] + row)
+                if self.mode == 'scattered':
+                    writer.writerow([self.x_label, self.y_label, "z"])
+                    writer.writerows(zip(*self.data.scattered()))
+                else:
+                    writer.writerow([""] + list(self.data.x))
+                    for y, row in zip(self.data.y, self.data.z):
+                        writer.writerow([y] + list(row))
 
     def set_labels(self, x_label, y_label):
         self.x_label = x_label
         self.y_label = y_label
         self.ax.set_xlabel(self.x_label)
         self.ax.set_ylabel(self.y_label)
-        self.canvas.draw()
+        self.canvas.draw_idle()
 
     def set_log_scale(self, log_scale):
         self.log_scale = log_scale
-        self._replot()
+        if self.data.count:
+            self._replot()
 
 class CameraFPSView(QWidget):
     def __init__(self):
@@ -150,7 +258,7 @@ class CameraFPSView(QWidget):
         main_layout.addWidget(self.plot_widget)
         self.plot_widget_2 = PlotWidget(x_label="Height [px]", y_label="FPS", scatter_plot=True)  # Assuming you have a PlotWidget defined elsewhere
         main_layout.addWidget(self.plot_widget_2)  # Give it more space with a stretch factor
-        self.plot_widget_3 = ColorMeshWidget(x_label="Height [px]", y_label="Exposure [ms]",)  # Assuming you have a PlotWidget defined elsewhere
+        self.plot_widget_3 = ColorMeshWidget(x_label="Height [px]", y_label="Exposure [ms]", mode='scattered')  # Assuming you have a PlotWidget defined elsewhere
         main_layout.addWidget(self.plot_widget_3)  # Give it more space with a stretch factor
 
         # Right part - Settings section
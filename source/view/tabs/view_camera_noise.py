@@ -1,6 +1,8 @@
 from PySide6.QtCore import Signal
 from PySide6.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QLabel, QPushButton, QSpinBox, QSpacerItem, \
-    QSizePolicy, QDoubleSpinBox
+    QSizePolicy, QDoubleSpinBox, QCheckBox, QFileDialog
+
+from source.utilities.project_file import PROJECT_EXTENSION
 
 from source.view.widgets.ROI_widget import ROIWidget
 from source.view.widgets.image_display import ImageDisplay
@@ -10,6 +12,9 @@ from source.view.widgets.plotting_widgets import PlotWidget, HistogramPlotWidget
 class CameraNoiseView(QWidget):
     set_exposure = Signal(float)
     max_frames_changed = Signal(int)
+    save_project = Signal(str)
+    open_project = Signal(str)
+    closed = Signal()
 
     def __init__(self, width, height):
         super().__init__()
@@ -36,11 +41,14 @@ class CameraNoiseView(QWidget):
         # Button
         self.button_exposure = QPushButton("Set exposure")
         self.button_exposure.clicked.connect(self.handle_set_exposure)
+        # Software auto exposure on the ROI histogram
+        self.checkbox_auto_exposure = QCheckBox("Auto")
         # Horizontal layout for spinbox + label
         hlayout_1 = QHBoxLayout()
         hlayout_1.addWidget(label_exposure)
         hlayout_1.addWidget(self.spinbox_exposure)
         hlayout_1.addWidget(self.button_exposure)
+        hlayout_1.addWidget(self.checkbox_auto_exposure)
         # Spinbox with minimum value of 100
         self.spinbox_max_frames = QSpinBox()
         self.spinbox_max_frames.setMinimum(100)
@@ -56,6 +64,31 @@ class CameraNoiseView(QWidget):
         # Button
         self.button_start = QPushButton("Start noise measurement")
 
+        # Calibration: master dark/flat frames over the same number of frames, whole image
+        self.button_dark = QPushButton("Capture dark frame")
+        self.button_flat = QPushButton("Capture flat frame")
+        self.checkbox_calibration = QCheckBox("Apply dark/flat correction")
+        # Defective pixels flagged by the last noise measurement
+        self.button_defects = QPushButton("Save defect map")
+        self.checkbox_defects = QCheckBox("Correct defective pixels")
+        hlayout_3 = QHBoxLayout()
+        hlayout_3.addWidget(self.button_dark)
+        hlayout_3.addWidget(self.button_flat)
+        # Project file with the ROIs, camera settings, calibration maps and noise statistics
+        self.button_save_project = QPushButton("Save project")
+        self.button_save_project.clicked.connect(self.handle_save_project)
+        self.button_open_project = QPushButton("Open project")
+        self.button_open_project.clicked.connect(self.handle_open_project)
+        hlayout_4 = QHBoxLayout()
+        hlayout_4.addWidget(self.button_save_project)
+        hlayout_4.addWidget(self.button_open_project)
+        # Live frame and ROI statistics computed by the analysis worker processes
+        self.checkbox_analysis = QCheckBox("Live ROI statistics")
+        self.label_analysis = QLabel()
+        # Drift tracking: the ROIs follow the sample, their means are shown at the subpixel drift offset
+        self.checkbox_drift = QCheckBox("Track drift")
+        self.label_drift = QLabel()
+
         # Camera image
         self.image_display = ImageDisplay(self.width, self.height)
         #self.image_display.set_image_from_file('C:/Users/jurco/Desktop/images.png')
@@ -74,6 +107,15 @@ class CameraNoiseView(QWidget):
         vlayout.addLayout(hlayout_1)
         vlayout.addLayout(hlayout_2)
         vlayout.addWidget(self.button_start)
+        vlayout.addLayout(hlayout_3)
+        vlayout.addWidget(self.checkbox_calibration)
+        vlayout.addWidget(self.button_defects)
+        vlayout.addWidget(self.checkbox_defects)
+        vlayout.addLayout(hlayout_4)
+        vlayout.addWidget(self.checkbox_analysis)
+        vlayout.addWidget(self.label_analysis)
+        vlayout.addWidget(self.checkbox_drift)
+        vlayout.addWidget(self.label_drift)
 
 
         # Add widgets to the main layout
@@ -87,5 +129,27 @@ class CameraNoiseView(QWidget):
         exposure_value = self.spinbox_exposure.value()
         self.set_exposure.emit(exposure_value)
 
+    def handle_save_project(self):
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save Project", "",
+                                                   f"SPR Projects (*{PROJECT_EXTENSION});;All Files (*)")
+        if file_path:
+            self.save_project.emit(file_path)
+
+    def handle_open_project(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "Open Project", "",
+                                                   f"SPR Projects (*{PROJECT_EXTENSION});;All Files (*)")
+        if file_path:
+            self.open_project.emit(file_path)
+
     def update_frame(self, image):
-        self.image_display.set_image(image, show_max_intensity=True, show_min_intensity=True)
\ No newline at end of file
+        self.image_display.set_image(image, show_max_intensity=True, show_min_intensity=True)
+
+    def show_analysis(self, text):
+        self.label_analysis.setText(text)
+
+    def show_drift(self, text):
+        self.label_drift.setText(text)
+
+    def closeEvent(self, event):
+        self.closed.emit()  # The controller stops the camera thread and frees the analysis workers
+        super().closeEvent(event)
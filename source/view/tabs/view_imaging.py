@@ -1,11 +1,15 @@
-from PySide6.QtCore import Qt
+from PySide6.QtCore import Qt, Signal
 
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QComboBox, QLabel, QPushButton, QHBoxLayout, QSplitter, QSpinBox
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QComboBox, QLabel, QPushButton, QHBoxLayout, QSplitter, QSpinBox, \
+    QFileDialog
 
+from source.utilities.project_file import PROJECT_EXTENSION
 from source.view.widgets.image_display import ImageDisplay
 from source.view.widgets.plotting_widgets import PlotWidget  # Assuming this is a custom widget for plotting
 
 class ImagingView(QWidget):
+    save_project = Signal(str)
+
     def __init__(self):
         super().__init__()
         self.setup_content()
@@ -44,6 +48,7 @@ class ImagingView(QWidget):
 
         # Add action buttons for saving the project and noise analysis
         self.save_project_button = QPushButton("Save Project")
+        self.save_project_button.clicked.connect(self.handle_save_project)
         self.noise_analysis_button = QPushButton("Noise Analysis")
         settings_layout.addWidget(self.save_project_button)
         settings_layout.addWidget(self.noise_analysis_button)
@@ -73,6 +78,12 @@ class ImagingView(QWidget):
         # Set the layout for this window
         self.setLayout(main_layout)
 
+    def handle_save_project(self):
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save Project", "",
+                                                   f"SPR Projects (*{PROJECT_EXTENSION});;All Files (*)")
+        if file_path:
+            self.save_project.emit(file_path)
+
     def calculate_image_height(self):
         """Calculate height for the image display, using a fixed height as a ratio of the screen's height."""
         screen_height = self.screen().availableGeometry().height()
@@ -0,0 +1,115 @@
+from PySide6.QtCore import Signal
+from PySide6.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QLabel, QPushButton, QSpinBox, QDoubleSpinBox, \
+    QFormLayout, QComboBox, QSpacerItem, QSizePolicy, QGroupBox
+
+
+class SLMView(QWidget):
+    show_pattern = Signal(dict)
+    play_sequence = Signal(dict)
+    stop_output = Signal()
+
+    def __init__(self, screens, models):
+        super().__init__()
+        self.setup_content(screens, models)
+
+        self.setWindowTitle("SLM")
+
+    def setup_content(self, screens, models):
+        main_layout = QHBoxLayout()
+
+        # Output
+        self.combo_screen = QComboBox()
+        self.combo_screen.addItems(screens)
+        self.combo_model = QComboBox()
+        self.combo_model.addItems(models)
+        self.spinbox_wavelength = QDoubleSpinBox()
+        self.spinbox_wavelength.setRange(400, 1100)
+        self.spinbox_wavelength.setValue(633)
+        self.spinbox_wavelength.setSuffix(" nm")
+
+        output_layout = QFormLayout()
+        output_layout.addRow("Screen", self.combo_screen)
+        output_layout.addRow("Model", self.combo_model)
+        output_layout.addRow("Wavelength", self.spinbox_wavelength)
+        output_group = QGroupBox("Output")
+        output_group.setLayout(output_layout)
+
+        # Pattern
+        self.spinbox_period = QDoubleSpinBox()
+        self.spinbox_period.setRange(0, 1000)
+        self.spinbox_period.setValue(8)
+        self.spinbox_period.setSuffix(" px")
+        self.spinbox_angle = QDoubleSpinBox()
+        self.spinbox_angle.setRange(-180, 180)
+        self.spinbox_angle.setSuffix(" °")
+        self.spinbox_focal_length = QDoubleSpinBox()
+        self.spinbox_focal_length.setRange(-100, 100)
+        self.spinbox_focal_length.setDecimals(3)
+        self.spinbox_focal_length.setSuffix(" m")
+        self.spinbox_defocus = QDoubleSpinBox()
+        self.spinbox_defocus.setRange(-100, 100)
+        self.spinbox_defocus.setSuffix(" rad")
+        self.spinbox_astigmatism = QDoubleSpinBox()
+        self.spinbox_astigmatism.setRange(-100, 100)
+        self.spinbox_astigmatism.setSuffix(" rad")
+
+        pattern_layout = QFormLayout()
+        pattern_layout.addRow("Grating period (0 = off)", self.spinbox_period)
+        pattern_layout.addRow("Grating angle", self.spinbox_angle)
+        pattern_layout.addRow("Lens focal length (0 = off)", self.spinbox_focal_length)
+        pattern_layout.addRow("Defocus (Z4)", self.spinbox_defocus)
+        pattern_layout.addRow("Astigmatism (Z6)", self.spinbox_astigmatism)
+        pattern_group = QGroupBox("Pattern")
+        pattern_group.setLayout(pattern_layout)
+
+        # Structured illumination sequence: grating phase steps
+        self.spinbox_phase_steps = QSpinBox()
+        self.spinbox_phase_steps.setRange(2, 64)
+        self.spinbox_phase_steps.setValue(3)
+        self.spinbox_refreshes = QSpinBox()
+        self.spinbox_refreshes.setRange(1, 1000)
+        self.spinbox_refreshes.setValue(1)
+
+        sequence_layout = QFormLayout()
+        sequence_layout.addRow("Phase steps", self.spinbox_phase_steps)
+        sequence_layout.addRow("Refreshes per pattern", self.spinbox_refreshes)
+        sequence_group = QGroupBox("Sequence")
+        sequence_group.setLayout(sequence_layout)
+
+        self.button_show = QPushButton("Show pattern")
+        self.button_show.clicked.connect(lambda: self.show_pattern.emit(self.get_parameters()))
+        self.button_sequence = QPushButton("Play sequence")
+        self.button_sequence.clicked.connect(lambda: self.play_sequence.emit(self.get_parameters()))
+        self.button_stop = QPushButton("Stop output")
+        self.button_stop.clicked.connect(self.stop_output.emit)
+        self.label_status = QLabel("")
+
+        settings_layout = QVBoxLayout()
+        settings_layout.addWidget(output_group)
+        settings_layout.addWidget(pattern_group)
+        settings_layout.addWidget(sequence_group)
+        settings_layout.addItem(QSpacerItem(20, 40, QSizePolicy.Minimum, QSizePolicy.Expanding))
+        settings_layout.addWidget(self.label_status)
+        settings_layout.addWidget(self.button_show)
+        settings_layout.addWidget(self.button_sequence)
+        settings_layout.addWidget(self.button_stop)
+
+        main_layout.addLayout(settings_layout)
+        self.setLayout(main_layout)
+
+    def get_parameters(self):
+        return {
+            'screen': self.combo_screen.currentIndex(),
+            'model': self.combo_model.currentText(),
+            'wavelength': self.spinbox_wavelength.value() * 1e-9,
+            'period': self.spinbox_period.value(),
+            'angle': self.spinbox_angle.value(),
+            'focal_length': self.spinbox_focal_length.value(),
+            'defocus': self.spinbox_defocus.value(),
+            'astigmatism': self.spinbox_astigmatism.value(),
+            'phase_steps': self.spinbox_phase_steps.value(),
+            'refreshes_per_pattern': self.spinbox_refreshes.value()
+        }
+
+    def set_status(self, text):
+        self.label_status.setText(text)
@@ -0,0 +1,184 @@
+from PySide6.QtCore import Signal
+from PySide6.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QLabel, QPushButton, QSpinBox, QDoubleSpinBox, \
+    QFormLayout, QProgressBar, QFileDialog, QSpacerItem, QSizePolicy
+
+from source.utilities.project_file import PROJECT_EXTENSION
+
+from source.view.widgets.plotting_widgets import PlotWidget
+
+
+class SpectroscopyView(QWidget):
+    start_scan = Signal(dict)
+    stop_scan = Signal()
+    start_tracking = Signal(dict)
+    stop_tracking = Signal()
+    load_rois = Signal(str)  # Project file whose ROIs are tracked
+    closed = Signal()
+
+    def __init__(self):
+        super().__init__()
+        self.output_path = None
+        self.setup_content()
+
+        self.setWindowTitle("Spectroscopy")
+
+    def setup_content(self):
+        # Main horizontal layout (plot on the left, scan settings on the right)
+        main_layout = QHBoxLayout()
+
+        self.plot_widget = PlotWidget(x_label="Wavelength [nm]", y_label="Mean intensity")
+        main_layout.addWidget(self.plot_widget)
+
+        # Scan settings
+        self.spinbox_start = QDoubleSpinBox()
+        self.spinbox_stop = QDoubleSpinBox()
+        self.spinbox_step = QDoubleSpinBox()
+        for spinbox in (self.spinbox_start, self.spinbox_stop, self.spinbox_step):
+            spinbox.setDecimals(1)
+            spinbox.setSuffix(" nm")
+        self.spinbox_step.setRange(0.1, 1000)
+        self.spinbox_step.setValue(1.0)
+
+        self.spinbox_frames = QSpinBox()
+        self.spinbox_frames.setRange(1, 1000)
+        self.spinbox_frames.setValue(4)
+
+        self.spinbox_settle = QDoubleSpinBox()
+        self.spinbox_settle.setRange(0, 10000)
+        self.spinbox_settle.setSuffix(" ms")
+
+        form_layout = QFormLayout()
+        form_layout.addRow("Start wavelength", self.spinbox_start)
+        form_layout.addRow("Stop wavelength", self.spinbox_stop)
+        form_layout.addRow("Step", self.spinbox_step)
+        form_layout.addRow("Frames per step", self.spinbox_frames)
+        form_layout.addRow("Settle time", self.spinbox_settle)
+
+        self.button_output = QPushButton("Output file...")
+        self.button_output.clicked.connect(self.select_output_path)
+        self.label_output = QLabel("Temporary file")
+
+        self.button_start = QPushButton("Start scan")
+        self.button_start.clicked.connect(self.handle_start_scan)
+        self.button_stop = QPushButton("Stop scan")
+        self.button_stop.setEnabled(False)
+        self.button_stop.clicked.connect(self.stop_scan.emit)
+
+        self.progress_bar = QProgressBar()
+
+        # Resonance tracking: the filter follows the working point of the live frames
+        self.spinbox_dither = QDoubleSpinBox()
+        self.spinbox_dither.setDecimals(2)
+        self.spinbox_dither.setRange(0.01, 100)
+        self.spinbox_dither.setValue(0.5)
+        self.spinbox_dither.setSuffix(" nm")
+        self.spinbox_gain = QDoubleSpinBox()
+        self.spinbox_gain.setDecimals(2)
+        self.spinbox_gain.setRange(0.01, 1)
+        self.spinbox_gain.setValue(0.5)
+        tracking_layout = QFormLayout()
+        tracking_layout.addRow("Tracking dither", self.spinbox_dither)
+        tracking_layout.addRow("Tracking gain", self.spinbox_gain)
+
+        self.button_rois = QPushButton("ROIs from project...")
+        self.button_rois.clicked.connect(self.handle_load_rois)
+        self.label_rois = QLabel("Tracking the whole frame")
+
+        self.button_start_tracking = QPushButton("Start tracking")
+        self.button_start_tracking.clicked.connect(self.handle_start_tracking)
+        self.button_stop_tracking = QPushButton("Stop tracking")
+        self.button_stop_tracking.setEnabled(False)
+        self.button_stop_tracking.clicked.connect(self.stop_tracking.emit)
+        self.label_tracking = QLabel()
+
+        settings_layout = QVBoxLayout()
+        settings_layout.addLayout(form_layout)
+        settings_layout.addWidget(self.button_output)
+        settings_layout.addWidget(self.label_output)
+        settings_layout.addItem(QSpacerItem(20, 40, QSizePolicy.Minimum, QSizePolicy.Expanding))
+        settings_layout.addWidget(self.progress_bar)
+        settings_layout.addWidget(self.button_start)
+        settings_layout.addWidget(self.button_stop)
+        settings_layout.addLayout(tracking_layout)
+        settings_layout.addWidget(self.button_rois)
+        settings_layout.addWidget(self.label_rois)
+        settings_layout.addWidget(self.button_start_tracking)
+        settings_layout.addWidget(self.button_stop_tracking)
+        settings_layout.addWidget(self.label_tracking)
+
+        main_layout.addLayout(settings_layout)
+        self.setLayout(main_layout)
+
+    def set_wavelength_range(self, min_wavelength, max_wavelength):
+        for spinbox in (self.spinbox_start, self.spinbox_stop):
+            spinbox.setRange(min_wavelength, max_wavelength)
+        self.spinbox_start.setValue(min_wavelength)
+        self.spinbox_stop.setValue(max_wavelength)
+
+    def select_output_path(self):
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save Spectral Cube", "", "NumPy Files (*.npy)")
+        if file_path:
+            self.output_path = file_path
+            self.label_output.setText(file_path)
+
+    def handle_start_scan(self):
+        self.start_scan.emit({
+            'start': self.spinbox_start.value(),
+            'stop': self.spinbox_stop.value(),
+            'step': self.spinbox_step.value(),
+            'frames_per_step': self.spinbox_frames.value(),
+            'settle_time': self.spinbox_settle.value() / 1000.0,
+            'output_path': self.output_path
+        })
+
+    def scan_started(self, n_steps):
+        self.progress_bar.setRange(0, n_steps)
+        self.progress_bar.setValue(0)
+        self.button_start.setEnabled(False)
+        self.button_stop.setEnabled(True)
+        self.plot_widget.ax.clear()
+        self.plot_widget.data = {"x": None, "y": None}
+
+    def update_spectrum(self, step, wavelength, mean):
+        self.progress_bar.setValue(step + 1)
+        self.plot_widget.update_plot(wavelength, mean)
+
+    def scan_finished(self, path):
+        self.button_start.setEnabled(True)
+        self.button_stop.setEnabled(False)
+        if path:
+            self.label_output.setText(path)
+
+    def handle_load_rois(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "Open Project", "",
+                                                   f"SPR Projects (*{PROJECT_EXTENSION});;All Files (*)")
+        if file_path:
+            self.load_rois.emit(file_path)
+
+    def rois_loaded(self, count, path):
+        self.label_rois.setText(f"Tracking {count} ROIs of {path}")
+
+    def handle_start_tracking(self):
+        self.start_tracking.emit({
+            'dither': self.spinbox_dither.value(),
+            'gain': self.spinbox_gain.value(),
+        })
+
+    def tracking_started(self):
+        self.button_start_tracking.setEnabled(False)
+        self.button_stop_tracking.setEnabled(True)
+        self.button_start.setEnabled(False)
+        self.button_rois.setEnabled(False)
+
+    def tracking_stopped(self):
+        self.button_start_tracking.setEnabled(True)
+        self.button_stop_tracking.setEnabled(False)
+        self.button_start.setEnabled(True)
+        self.button_rois.setEnabled(True)
+
+    def update_tracking(self, wavelength, error):
+        self.label_tracking.setText(f"Working point {wavelength:.3f} nm, error {error:+.3f} nm")
+
+    def closeEvent(self, event):
+        self.closed.emit()  # The controller stops the scan and the tracking and deletes a temporary cube
+        super().closeEvent(event)
@@ -2,10 +2,14 @@ from PySide6.QtCore import Qt, Signal
 from PySide6.QtGui import QAction, QColor, QPalette, QFont
 from PySide6.QtWidgets import QMainWindow, QToolBar, QStatusBar, QWidget, QHBoxLayout, QSplitter, QMenu, QVBoxLayout, \
     QTabWidget, QLabel, QPushButton, QSpacerItem, QSizePolicy, QTableWidget, QTableWidgetItem, QHeaderView, \
-    QAbstractItemView, QDialog, QTextEdit
+    QAbstractItemView, QDialog, QPlainTextEdit, QFileDialog
+import html
+import time
 from functools import partial
 from typing import Dict, Any
 
+from source.utilities.project_file import PROJECT_EXTENSION
+
 
 class StartUpWindow(QMainWindow):
     """
@@ -16,6 +20,7 @@ class StartUpWindow(QMainWindow):
     device_activate_click = Signal(str, bool)
     on_settings_clicked = Signal(str)
     new_project = Signal(str)
+    open_project = Signal(str)
 
     def __init__(self, logger):
         """
@@ -113,17 +118,25 @@ class StartUpWindow(QMainWindow):
         # Use lambda to delay the function call
         self.project_menu.addAction("Imaging", lambda: self.select_project("Imaging"))
         self.project_menu.addAction("Spectroscopy", lambda: self.select_project("Spectroscopy"))
+        self.project_menu.addAction("Angular scan", lambda: self.select_project("Angular_scan"))
         self.project_menu.addAction("Camera FPS meter", lambda: self.select_project("Camera_FPS_meter"))
         self.project_menu.addAction("Camera noise", lambda: self.select_project("Camera_noise"))
         self.project_menu.addAction("SLM", lambda: self.select_project("SLM"))
 
         # Connect the "New Project" button to show the menu
         new_project_button.setMenu(self.project_menu)
+        open_project_button.clicked.connect(self.select_project_file)
 
     def select_project(self, project_type):
         """ Handle selection of Project A """
         self.new_project.emit(project_type)
 
+    def select_project_file(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "Open Project", "",
+                                                   f"SPR Projects (*{PROJECT_EXTENSION});;All Files (*)")
+        if file_path:
+            self.open_project.emit(file_path)
+
     def fill_tab_Available_Devices(self, tab_widget):
         """Fill the content of Tab 1 (Available Devices)."""
         layout = QVBoxLayout()
@@ -255,26 +268,96 @@ class StartUpWindow(QMainWindow):
         # Add more content related to Active Projects here.
         tab_widget.setLayout(tab_layout)
 
+    TELEMETRY_COLUMNS = ['Stage / Queue', 'Count', 'Rate [1/s]', 'p50 [ms]', 'p99 [ms]', 'Max [ms]', 'Depth',
+                         'Max depth', 'Dropped']
+
     def fill_tab_Active_Threads(self, tab_widget):
         """Fill the content of Tab 3 (Active Threads)."""
         tab_layout = QVBoxLayout()
-        tab_layout.addWidget(QLabel("Currently Active Threads"))
-        # Add more content related to Active Threads here.
+        tab_layout.addWidget(QLabel("Pipeline latency and queues"))
+
+        self.telemetry_table = QTableWidget()
+        self.telemetry_table.verticalHeader().setVisible(False)
+        self.telemetry_table.setColumnCount(len(self.TELEMETRY_COLUMNS))
+        self.telemetry_table.setHorizontalHeaderLabels(self.TELEMETRY_COLUMNS)
+        self.telemetry_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.telemetry_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+        tab_layout.addWidget(self.telemetry_table)
         tab_widget.setLayout(tab_layout)
 
+    def update_telemetry(self, snapshot):
+        """Shows a Telemetry.snapshot(): one row per stage, queues on the row of their 'queue.<name>' stage."""
+        def ms(value):
+            return "" if value is None else f"{value * 1e3:.3f}"
+
+        rows = []
+        queues = snapshot['queues']
+        for name, stage in sorted(snapshot['stages'].items()):
+            queue = queues.get(name[len('queue.'):]) if name.startswith('queue.') else None
+            rate = "" if stage['rate'] is None else f"{stage['rate']:.1f}"
+            row = [name, str(stage['count']), rate, ms(stage['p50']), ms(stage['p99']), ms(stage['max'])]
+            row += [str(queue[key]) for key in ('depth', 'max_depth', 'dropped')] if queue else ["", "", ""]
+            rows.append(row)
+
+        self.telemetry_table.setRowCount(len(rows))
+        for r, row in enumerate(rows):
+            for c, text in enumerate(row):
+                item = self.telemetry_table.item(r, c)
+                if item is None:
+                    self.telemetry_table.setItem(r, c, QTableWidgetItem(text))
+                else:
+                    item.setText(text)
+
+    # Log view limits: lines kept, and lines shown per second before the rest is summarised
+    LOG_MAX_LINES = 5000
+    LOG_MAX_LINES_PER_SECOND = 100
+
     def fill_tab_Logging(self, tab_widget):
         """Fill the content of Tab 4 (Logs)."""
-        self.log_box = QTextEdit(readOnly=True)
+        self.log_box = QPlainTextEdit(readOnly=True)
+        self.log_box.setMaximumBlockCount(self.LOG_MAX_LINES)  # Oldest lines are dropped
+        self._last_log = None  # (level, message) of the last shown record
+        self._log_repeats = 0
+        self._log_window_start = 0.0
+        self._log_window_lines = 0
+        self._log_suppressed = 0
         tab_layout = QVBoxLayout()
         tab_layout.addWidget(self.log_box)
         tab_widget.setLayout(tab_layout)
 
-    def add_log(self, message, color):
-        if color == "red":
-            self.log_box.setTextColor("red")
-        else:
-            self.log_box.setTextColor("black")
-        self.log_box.append(message)
+    def add_logs(self, records):
+        """
+        Appends a batch of (LogRecord, formatted line) pairs. Consecutive duplicates are collapsed into a repeat
+        count and at most LOG_MAX_LINES_PER_SECOND lines are shown per second, the rest only counted.
+        """
+        lines = []
+        now = time.monotonic()
+        if now - self._log_window_start >= 1.0:
+            if self._log_suppressed:
+                lines.append((f"... {self._log_suppressed} messages suppressed", "orange"))
+            self._log_window_start = now
+            self._log_window_lines = 0
+            self._log_suppressed = 0
+
+        for record, line in records:
+            key = (record.level, record.message)
+            if key == self._last_log:
+                self._log_repeats += 1
+                continue
+            if self._log_repeats:
+                lines.append((f"... last message repeated {self._log_repeats} times", ""))
+                self._log_repeats = 0
+            self._last_log = key
+
+            if self._log_window_lines >= self.LOG_MAX_LINES_PER_SECOND:
+                self._log_suppressed += 1
+                continue
+            self._log_window_lines += 1
+            lines.append((line, record.color))
+
+        for text, color in lines:
+            text = html.escape(text)
+            self.log_box.appendHtml(f'<span style="color:{color}">{text}</span>' if color else text)
 
     def toggle_activation(self, table_widget, row: int):
         """
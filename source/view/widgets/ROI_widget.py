@@ -9,6 +9,7 @@ class ROIWidget(QWidget):
     delete_all_ROI = Signal()
     modify_ROI = Signal(tuple)
     apply_changes = Signal()
+    detect_spots = Signal()
 
     def __init__(self, width, height):
         super().__init__()
@@ -48,12 +49,14 @@ class ROIWidget(QWidget):
         self.btn_delete_selected = QPushButton("Delete Selected ROI")
         self.btn_delete_all = QPushButton("Delete All ROIs")
         self.btn_apply = QPushButton("Apply Changes")
+        self.btn_detect = QPushButton("Detect Spots")
 
         layout.addWidget(QLabel("Defined ROIs:"))
         layout.addWidget(self.table)
         layout.addWidget(self.btn_delete_selected)
         layout.addWidget(self.btn_delete_all)
         layout.addWidget(self.btn_apply)
+        layout.addWidget(self.btn_detect)
 
         self.setLayout(layout)
 
@@ -61,6 +64,7 @@ class ROIWidget(QWidget):
         self.btn_delete_selected.clicked.connect(self.delete_selected_roi)
         self.btn_delete_all.clicked.connect(self.delete_all_rois)
         self.btn_apply.clicked.connect(self.on_apply_clicked)
+        self.btn_detect.clicked.connect(self.detect_spots.emit)
 
     def delete_selected_roi(self):
         selected_rows = self.table.selectionModel().selectedRows()
@@ -82,17 +86,19 @@ class ROIWidget(QWidget):
         `rois` is a dictionary {id: {"x": x, "y": y, "width": w, "height": h}}
         """
         self.table.blockSignals(True)  # Block signal temporarily
+        self.table.setUpdatesEnabled(False)  # One repaint for hundreds of rows
 
         self.table.setRowCount(0)  # Clear existing rows£
+        self.table.setRowCount(len(rois))
 
         for i, (roi_id, region) in enumerate(rois.items()):
-            self.table.insertRow(i)
             self.table.setItem(i, 0, QTableWidgetItem(str(roi_id)))
             self.table.setItem(i, 1, QTableWidgetItem(str(region["x"])))
             self.table.setItem(i, 2, QTableWidgetItem(str(region["y"])))
             self.table.setItem(i, 3, QTableWidgetItem(str(region["width"])))
             self.table.setItem(i, 4, QTableWidgetItem(str(region["height"])))
 
+        self.table.setUpdatesEnabled(True)
         self.table.blockSignals(False)  # Re-enable signals
 
     def cell_changed(self, row, column):
@@ -5,6 +5,8 @@ from PySide6.QtWidgets import QWidget, QVBoxLayout, QLabel, QSpinBox, QPushButto
     QSizePolicy, QLayout, QDoubleSpinBox, QListWidget
 import cv2  # OpenCV for resizing
 
+from source.utilities.telemetry import telemetry
+
 def filter_intensities(image, show_max_intensity=False, show_min_intensity=False):
     # Ensure the image is grayscale (2D)
     if len(image.shape) != 2:
@@ -82,6 +84,11 @@ class ImageDisplay(QWidget):
         if self.current_image is None:
             return
 
+        with telemetry.measure('render'):
+            self._render()
+
+    def _render(self):
+
         # === Step 1: Prepare a full-size canvas ===
         canvas = np.full((self.height, self.width, 3), (240, 220, 230), dtype=np.uint8)  # Pinkish background
 
@@ -0,0 +1,86 @@
+from PySide6.QtCore import Signal, QRect
+from PySide6.QtGui import QImage, QPainter, QSurfaceFormat
+from PySide6.QtOpenGL import QOpenGLWindow
+
+
+class SLMWindow(QOpenGLWindow):
+    """
+    Full-screen output surface for an SLM driven as a monitor (EXULUS over HDMI/DisplayPort).
+
+    Frames are shown unscaled and switched on buffer swaps with vsync enabled, so every pattern is displayed
+    for an exact number of refreshes. The frame to show next is only a QImage wrapping an already rendered
+    8-bit array (see PatternEngine), which keeps the switching latency below one refresh.
+    """
+    pattern_shown = Signal(int)  # Index of the pattern of a sequence, emitted on the swap that displays it
+
+    def __init__(self, screen=None):
+        super().__init__(QOpenGLWindow.UpdateBehavior.NoPartialUpdate)
+        surface_format = QSurfaceFormat.defaultFormat()
+        surface_format.setSwapInterval(1)  # Swap on vsync
+        self.setFormat(surface_format)
+        if screen is not None:
+            self.setScreen(screen)
+            self.setGeometry(screen.geometry())
+
+        self._image = None
+        self._frame = None  # Keeps the array wrapped by _image alive
+        self._sequence = []
+        self._sequence_index = 0
+        self._refreshes_per_pattern = 1
+        self._refreshes = 0
+        self._loop = False
+        self.frameSwapped.connect(self._on_frame_swapped)
+
+    def show_frame(self, frame):
+        """Displays a (H, W) uint8 frame from the next refresh on, stops a running sequence."""
+        self._sequence = []
+        self._set_frame(frame)
+        self.update()
+
+    def _set_frame(self, frame):
+        height, width = frame.shape
+        self._frame = frame
+        self._image = QImage(frame.data, width, height, frame.strides[0], QImage.Format_Grayscale8)
+
+    def play_sequence(self, frames, refreshes_per_pattern=1, loop=False):
+        """
+        Shows `frames` one after the other, each for `refreshes_per_pattern` display refreshes.
+        Render the frames beforehand (PatternEngine.prerender) so the switching does not wait for generation.
+        """
+        if not frames:
+            return
+        self._sequence = list(frames)
+        self._sequence_index = 0
+        self._refreshes_per_pattern = max(1, int(refreshes_per_pattern))
+        self._refreshes = 0
+        self._loop = loop
+        self._set_frame(self._sequence[0])
+        self.update()
+
+    def stop_sequence(self):
+        self._sequence = []
+
+    def _on_frame_swapped(self):
+        if not self._sequence:
+            return
+        if self._refreshes == 0:
+            self.pattern_shown.emit(self._sequence_index)
+        self._refreshes += 1
+
+        if self._refreshes >= self._refreshes_per_pattern:
+            self._refreshes = 0
+            self._sequence_index += 1
+            if self._sequence_index >= len(self._sequence):
+                if not self._loop:
+                    self._sequence = []
+                    return
+                self._sequence_index = 0
+            self._set_frame(self._sequence[self._sequence_index])
+        # Keep swapping every refresh while a sequence runs so frameSwapped keeps counting refreshes
+        self.update()
+
+    def paintGL(self):
+        painter = QPainter(self)
+        if self._image is not None:
+            painter.drawImage(QRect(0, 0, self._image.width(), self._image.height()), self._image)
+        painter.end()
@@ -0,0 +1,36 @@
+import numpy as np
+
+from source.processing.defect_pixels import combine_defects, detect_defects
+
+
+def noise_map(shape=(96, 96), frames=200, spots=(), seed=0):
+    """Mean and variance of a shot-noise limited measurement with Gaussian spots (y, x, sigma, amplitude)."""
+    rng = np.random.default_rng(seed)
+    rows, columns = np.indices(shape)
+    truth = 1000.0 + 2.0 * columns  # Illumination gradient
+    for y, x, sigma, amplitude in spots:
+        truth += amplitude * np.exp(-((rows - y) ** 2 + (columns - x) ** 2) / (2 * sigma ** 2))
+    variance = truth * (1 + 0.1 * rng.standard_normal(shape))
+    mean = truth + rng.standard_normal(shape) * np.sqrt(truth / frames)
+    return mean, variance, frames
+
+
+def test_spots_are_not_flagged():
+    for sigma in (1.5, 3.0, 5.0, 7.0):
+        for amplitude in (-400.0, 100.0, 400.0):
+            mean, variance, frames = noise_map(spots=[(48, 48, sigma, amplitude)])
+            defects = detect_defects(mean, variance, frames)
+            assert not combine_defects(defects).any(), (sigma, amplitude)
+
+
+def test_single_pixel_defects_are_flagged():
+    mean, variance, frames = noise_map(spots=[(48, 48, 3.0, 400.0)])
+    mean[10, 20] += 200.0
+    mean[30, 70] *= 0.2
+    variance[80, 5] *= 5.0
+    mean[0, 50] += 200.0  # Border pixel
+    defects = detect_defects(mean, variance, frames)
+    assert defects['hot'][10, 20] and defects['hot'][0, 50]
+    assert defects['dead'][30, 70]
+    assert defects['noisy'][80, 5]
+    assert combine_defects(defects).sum() == 4